@@ -10,32 +10,48 @@ __license__ = ""
 __history__ = """ """
 __version__ = "1.21.G02.1 ($Rev: 2 $)"
 
-import threading
-import time
+import click
 from flask import Flask
 from flask_jwt_extended import JWTManager
 from apps.api_authentication.view_endpoints import authorization_api
-from apps.bancos.view_endpoints import bancos_api
-from apps.credenciales.view_endpoints import credenciales_api
 from apps.vehicle.view_endpoints import inversiones_api
-from apps.robot_bancario.view_endpoints import robot_api
+from apps.driver.view_endpoints import driver_api
+from apps.gas_manager.view_endpoints import gas_manager_api
+from apps.odometer.view_endpoints import odometer_api
+from apps.fuel_analytics.view_endpoints import fuel_analytics_api
 # from db_controller.database_backend import *
+from db_controller.database_backend import get_pool_metrics, bootstrap_schema, init_db_session, get_engine
+from handler_controller.json_encoder import init_json_encoder
+from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
+from db_controller.query_instrumentation import init_query_instrumentation, get_query_metrics
+from metrics_controller.prometheus_metrics import init_metrics
+from apps.api_authentication.credential_cache import get_credential_cache_metrics
+from auth_controller.jwt_middleware import init_jwt_middleware, get_jwt_metrics
+from scheduler_controller.task_scheduler import init_scheduler, get_scheduler_status
 from utilities.Utility import *
 
 cfg_db = get_config_settings_db()
 cfg_app = get_config_settings_app()
 
 
-def create_app():
+def create_app(bootstrap_db=None):
+    r"""
+    Create the Flask application of the API.
+
+    :param bootstrap_db: Run the schema bootstrap before serving, DB_BOOTSTRAP_ON_STARTUP setting by default.
+    :return app_api: The application configured.
+    """
+
     app_api = Flask(__name__, static_url_path='/static')
 
     app_api.config['JWT_SECRET_KEY'] = '4p1/g4s_$v3h1cl3&#m4n4g3r%$=2021-07-16/'
-    app_api.config['JWT_BLACKLIST_ENABLED'] = False
-    app_api.config['JWT_BLACKLIST_TOKEN_CHECKS'] = ['access', 'refresh']
     app_api.config['JWT_ERROR_MESSAGE_KEY'] = 'message'
     app_api.config['JWT_ACCESS_TOKEN_EXPIRES'] = 3600
     app_api.config['PROPAGATE_EXCEPTIONS'] = True
 
+    # Serialization of dates, Decimal and rows, with the JSON_BACKEND selected (orjson, ujson or stdlib)
+    init_json_encoder(app_api, cfg_app.json_backend)
+
     if not 'development' == cfg_app.flask_api_env:
         app_api.config['SQLALCHEMY_DATABASE_URI'] = cfg_db.Production.SQLALCHEMY_DATABASE_URI.__str__()
 
@@ -44,18 +60,96 @@ def create_app():
     # USER URL
     app_api.register_blueprint(authorization_api, url_prefix='/api/v1/manager/user/')
 
-    # CREDENCIALES URL
-    app_api.register_blueprint(credenciales_api, url_prefix='/api/v1/bancos/<int:IdBanco>/credenciales/')
-
     # INVERSIONES URL
     app_api.register_blueprint(inversiones_api, url_prefix='/api/v1/vehicle/')
     app_api.register_blueprint(inversiones_api, url_prefix='/api/v1/vehicle/flujo/datos/')
 
-    # # ROBOT CONFIGURATION URL
-    app_api.register_blueprint(robot_api, url_prefix='/api/v1/bancos/<int:IdBanco>/robot/configuraciones/')
+    # DRIVER URL
+    app_api.register_blueprint(driver_api, url_prefix='/api/v1/driver/')
+
+    # GAS MANAGER URL
+    app_api.register_blueprint(gas_manager_api, url_prefix='/api/v1/gas/')
+
+    # ODOMETER URL
+    app_api.register_blueprint(odometer_api, url_prefix='/api/v1/odometer/')
+
+    # FUEL ANALYTICS URL
+    app_api.register_blueprint(fuel_analytics_api, url_prefix='/api/v1/analytics/')
+
+    # Database and tables are created/migrated by `flask init-db` before the workers start; DB_BOOTSTRAP_ON_STARTUP
+    # runs it once per process instead, for a single-process development server
+    if bootstrap_db is None:
+        bootstrap_db = cfg_db.bootstrap_on_startup
+
+    if bootstrap_db:
+        bootstrap_schema()
+
+    @app_api.cli.command('init-db')
+    def init_db_command():
+        """Create the database and its objects and apply the pending schema migrations."""
+        schema_version = bootstrap_schema()
+
+        click.echo('Database schema version: {}'.format(schema_version))
+
+    @app_api.cli.command('create-user')
+    @click.argument('username')
+    @click.password_option()
+    @click.option('--staff', is_flag=True, help='Give the user the staff privileges.')
+    @click.option('--superuser', is_flag=True, help='Give the user the superuser privileges.')
+    def create_user_command(username, password, staff, superuser):
+        """Register a user of the API: the first ones, and the only way to register staff users and superusers."""
+        from sqlalchemy.orm import Session
+        from auth_controller.api_authentication import user_registration, api_password
+
+        session = Session(bind=get_engine())
+
+        try:
+            user_registered = user_registration(session, {'username': username,
+                                                          'password': api_password(username, password)},
+                                                is_staff=staff, is_superuser=superuser)
+            session.commit()
+        finally:
+            session.close()
+
+        click.echo('User registered: {}'.format(username) if user_registered else
+                   'User already registered: {}'.format(username))
+
+    # Prometheus metrics on GET /metrics: latency and status per blueprint/route, statements, pool and JSON time
+    init_metrics(app_api)
+
+    # Server-Timing header with the statements of the request. after_request functions run in reverse order, so
+    # registered before the session lifecycle it also times the commit of the request transaction.
+    init_query_instrumentation(app_api)
+
+    # One session, connection and transaction per request, released on teardown
+    init_db_session(app_api)
+
+    # Pool checkout and statement metrics of the worker process
+    app_api.extensions['db_pool_metrics'] = get_pool_metrics
+    app_api.extensions['db_query_metrics'] = get_query_metrics
+
+    # Hits/misses of the verified-credential cache of the logins
+    app_api.extensions['credential_cache_metrics'] = get_credential_cache_metrics
+
+    @app_api.route('/api/v1/metrics/db', methods=['GET'])
+    def get_db_metrics():
+        return HandlerResponse.response_success('Database metrics of the worker process', {
+            'pool': get_pool_metrics(),
+            'queries': get_query_metrics()
+        })
 
     jwt = JWTManager(app_api)
 
     jwt.init_app(app_api)
 
+    # Access token verified on every endpoint not marked @jwt_exempt; JWT_REVOCATION_ENABLED rejects tokens logged out
+    init_jwt_middleware(app_api, jwt)
+
+    app_api.extensions['jwt_token_cache_metrics'] = get_jwt_metrics
+
+    # Maintenance jobs, run by one worker per host once the workers serve requests
+    init_scheduler(app_api)
+
+    app_api.extensions['scheduler_status'] = get_scheduler_status
+
     return app_api
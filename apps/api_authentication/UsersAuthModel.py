@@ -23,14 +23,14 @@ __license__ = ""
 __history__ = """ """
 __version__ = "1.21.F21.1 ($Rev: 1 $)"
 
-import json
 import logging
 from datetime import datetime
-from pytz import timezone
 from sqlalchemy_filters import apply_filters
 from sqlalchemy import Column, Boolean, Integer, String, Date, Time, Sequence
 from db_controller.database_backend import *
+from db_controller.query_layer import lookup_one, lookup_by_id, keyset_page, page_result
 from db_controller import mvc_exceptions as mvc_exc
+from .credential_cache import credential_cache
 
 cfg_db = get_config_settings_db()
 
@@ -67,20 +67,22 @@ class UsersAuthModel(Base):
 
     def manage_user_authentication(self, session, data):
 
+        endpoint_response = None
+
         try:
 
-            user_verification = self.check_if_row_exists(session, data)
+            user_row = self.check_if_row_exists(session, data)
 
             # insert validation
-            if user_verification:
+            if user_row:
 
                 # update method
-                self.user_update_password(session, data)
+                endpoint_response = self.user_update_password(session, data, user_row)
 
             else:
                 # insert
 
-                self.insert_data(session, data)
+                endpoint_response = self.add_user(session, data)
 
         except SQLAlchemyError as e:
             logger.exception('An exception was occurred while execute transactions: %s', e)
@@ -90,6 +92,8 @@ class UsersAuthModel(Base):
                 )
             )
 
+        return endpoint_response
+
     # Transaction to looking for a user on db to authenticate
     def check_if_row_exists(self, session, data):
         r"""
@@ -97,44 +101,18 @@ class UsersAuthModel(Base):
 
         :param session: The session of the database.
         :param data: The data of User model to valid authentication on the API.
-        :return row_exists: Statement data row to valid if the user name exists to authenticate the API.
+        :return row_exists: The user row if the user name exists to authenticate the API, None otherwise.
         """
 
-        row_exists = None
-        user_id = 0
-
-        try:
-
-            user_row = self.get_user_by_id(session, data)
-
-            if user_row is not None:
-                user_id = user_row.user_id
-            else:
-                user_id = 0
-
-            logger.info('User Row object in DB: %s', str(user_row))
-
-            row_exists = session.query(UsersAuthModel).filter(UsersAuthModel.user_id == user_id). \
-                filter(UsersAuthModel.user_name == data.get('username')).scalar()
+        row_exists = self.get_user_by_id(session, data)
 
-            logger.info('Row to data: {}, Exists: %s'.format(data), str(row_exists))
-
-        except SQLAlchemyError as exc:
-            row_exists = None
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
-            raise mvc_exc.IntegrityError(
-                'Row not stored in "{}". IntegrityError: {}'.format(data.get('username'),
-                                                                    str(str(exc.args) + ':' + str(exc.code)))
-            )
-        finally:
-            session.close()
+        logger.info('Row to data: {}, Exists: %s'.format(data.get('username')), str(row_exists))
 
         return row_exists
 
     def insert_data(self, session, data):
         r"""
-        Looking for a user by name on the database to valid authentication.
+        Add the user to the database when the user name is not registered yet.
 
         :param session: The session of the database.
         :param data: The data of User model to valid authentication on the API.
@@ -143,106 +121,96 @@ class UsersAuthModel(Base):
         endpoint_response = None
 
         if not self.check_if_row_exists(session, data):
+            endpoint_response = self.add_user(session, data)
 
-            try:
-
-                self.creation_date = get_current_date(session)
-
-                data['creation_date'] = self.creation_date
+        return endpoint_response
 
-                new_row = UsersAuthModel(data)
+    def add_user(self, session, data):
+        r"""
+        Insert the user row, already known as not registered.
 
-                logger.info('New Row User name: %s', str(new_row.user_name))
+        :param session: The session of the database.
+        :param data: The data of User model to valid authentication on the API.
+        """
 
-                session.add(new_row)
+        endpoint_response = None
 
-                user_row = self.get_user_by_id(session, data)
+        try:
 
-                logger.info('User ID Inserted: %s', str(user_row.user_id))
+            new_row = UsersAuthModel(data)
 
-                session.flush()
+            new_row.creation_date = datetime.now().date()
 
-                data['user_id'] = user_row.user_id
+            logger.info('New Row User name: %s', str(new_row.user_name))
 
-                # check insert correct
-                row_inserted = self.get_one_user(session, data)
+            session.add(new_row)
 
-                logger.info('Data User inserted: %s, Original Data: {}'.format(data), str(row_inserted))
+            # The flush gets the user_id back from the INSERT, no need to read the row again
+            session.flush()
 
-                if row_inserted:
-                    logger.info('User inserted is: %s', 'Username: {}, '
-                                                        'IsActive: {} '
-                                                        'CreationDate: {}'.format(row_inserted.user_name,
-                                                                                  row_inserted.is_active,
-                                                                                  row_inserted.creation_date))
+            logger.info('User inserted is: %s', 'Username: {}, '
+                                                'IsActive: {} '
+                                                'CreationDate: {}'.format(new_row.user_name,
+                                                                          new_row.is_active,
+                                                                          new_row.creation_date))
 
-                    endpoint_response = json.dumps({
-                        "Username": row_inserted.user_name,
-                        "Password": row_inserted.password,
-                        "IsActive": row_inserted.is_active,
-                        "IsStaff": row_inserted.is_staff,
-                        "IsSuperUser": row_inserted.is_superuser,
-                        "CreationDate": row_inserted.creation_date
-                    })
+            endpoint_response = {
+                "Username": new_row.user_name,
+                "IsActive": new_row.is_active,
+                "IsStaff": new_row.is_staff,
+                "IsSuperUser": new_row.is_superuser,
+                "CreationDate": new_row.creation_date
+            }
 
-            except SQLAlchemyError as exc:
-                endpoint_response = None
-                session.rollback()
-                logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                                 str(exc.code)))
-                raise mvc_exc.IntegrityError(
-                    'Row not stored in "{}". IntegrityError: {}'.format(data.get('username'),
-                                                                        str(str(exc.args) + ':' + str(exc.code)))
-                )
-            finally:
-                session.close()
+        except SQLAlchemyError as exc:
+            endpoint_response = None
+            session.rollback()
+            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
+                                                                                             str(exc.code)))
+            raise mvc_exc.IntegrityError(
+                'Row not stored in "{}". IntegrityError: {}'.format(data.get('username'),
+                                                                    str(str(exc.args) + ':' + str(exc.code)))
+            )
 
         return endpoint_response
 
     # Transaction to update user' password  hashed on db to authenticate - PATCH
-    def user_update_password(self, session, data):
+    def user_update_password(self, session, data, user_row=None):
         r"""
         Transaction to update password hashed of a user to authenticate on the API correctly.
 
-        :param session: The user name to update password hashed.
-        :param data: The password hashed to authenticate on the API.
+        :param session: The session of the database.
+        :param data: The user name and the password hashed to authenticate on the API.
+        :param user_row: The user row when the caller already read it.
         """
 
         endpoint_response = None
 
-        if self.check_if_row_exists(session, data):
+        if user_row is None:
+            user_row = self.check_if_row_exists(session, data)
 
-            try:
-
-                self.last_update_date = get_current_date(session)
+        if user_row:
 
-                data['last_update_date'] = self.last_update_date
+            try:
 
-                # update row to database
-                session.query(UsersAuthModel).filter(UsersAuthModel.password == data.get('password')). \
-                    update({"password": data.get('password'),
-                            "last_update_date": data.get('last_update_date')},
-                           synchronize_session='fetch')
+                user_row.password = data.get('password')
+                user_row.last_update_date = datetime.now().date()
 
                 session.flush()
 
-                # check update correct
-                row_updated = self.get_one_user(session, data)
+                # The password verified and cached for the user is no longer valid
+                credential_cache.invalidate(user_row.user_name)
 
-                logger.info('Data Updated: %s', str(row_updated))
+                logger.info('Data User updated')
 
-                if row_updated:
-                    logger.info('Data User updated')
-
-                    endpoint_response = json.dumps({
-                        "Username": row_updated.user_name,
-                        "Password": row_updated.password,
-                        "IsActive": row_updated.is_active,
-                        "IsStaff": row_updated.is_staff,
-                        "IsSuperUser": row_updated.is_superuser,
-                        "CreationDate": row_updated.creation_date,
-                        "UpdatedDate": row_updated.last_update_date
-                    })
+                endpoint_response = {
+                    "Username": user_row.user_name,
+                    "IsActive": user_row.is_active,
+                    "IsStaff": user_row.is_staff,
+                    "IsSuperUser": user_row.is_superuser,
+                    "CreationDate": user_row.creation_date,
+                    "UpdatedDate": user_row.last_update_date
+                }
 
             except SQLAlchemyError as exc:
                 session.rollback()
@@ -255,89 +223,66 @@ class UsersAuthModel(Base):
                     'Row not stored in "{}". IntegrityError: {}'.format(data.get('username'),
                                                                         str(str(exc.args) + ':' + str(exc.code)))
                 )
-            finally:
-                session.close()
 
         return endpoint_response
 
     @staticmethod
     def get_user_by_id(session, data):
+        r"""
+        Get the user row by its user name, in a single query.
 
-        row = None
-
-        try:
-
-            row_exists = session.query(UsersAuthModel).filter(UsersAuthModel.user_name == data.get('username')). \
-                filter(UsersAuthModel.is_active == data.get('is_active')). \
-                filter(UsersAuthModel.is_superuser == data.get('is_superuser')).scalar()
-
-            if row_exists:
-                row = session.query(UsersAuthModel).filter(UsersAuthModel.user_name == data.get('username')).\
-                    filter(UsersAuthModel.is_active == data.get('is_active')).\
-                    filter(UsersAuthModel.is_superuser == data.get('is_superuser')).one()
-
-                logger.info('Data User on Db: %s',
-                            'Username: {}, Is_Active: {}'.format(row.user_name, row.is_activee))
-
-        except SQLAlchemyError as exc:
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
+        :param session: The session of the database.
+        :param data: The data with the username.
+        :return row: The user row or None.
+        """
 
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('username'), UsersAuthModel.__tablename__, str(str(exc.args) + ':' + str(exc.code))
-                )
-            )
+        row = lookup_one(session, UsersAuthModel, user_name=data.get('username'))
 
-        finally:
-            session.close()
+        if row:
+            logger.info('Data User on Db: %s',
+                        'Username: {}, Is_Active: {}'.format(row.user_name, row.is_active))
 
         return row
 
-    def get_one_user(self, session, data):
-
-        row_user = None
-
-        try:
-
-            user_row = self.get_user_by_id(session, data)
+    @staticmethod
+    def get_one_user(session, data):
+        r"""
+        Get the user row by its ID, from the session identity map when already loaded.
 
-            if session.query(UsersAuthModel).filter(UsersAuthModel.user_id == user_row.user_id).scalar():
+        :param session: The session of the database.
+        :param data: The data with the user_id.
+        :return row_user: The user row or None.
+        """
 
-                row_user = session.query(UsersAuthModel).filter(UsersAuthModel.user_id == user_row.user_id).one()
+        row_user = lookup_by_id(session, UsersAuthModel, data.get('user_id'))
 
-                if row_user:
-                    logger.info('Data Bank on Db: %s',
-                                'Bank Name: {}, Bank usaToken: {}, Bank Status: {}'.format(row_user.nombre_banco,
-                                                                                           row_user.usa_token,
-                                                                                           row_user.estatus_banco))
-
-        except SQLAlchemyError as exc:
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('user_id'), UsersAuthModel.__tablename__, str(str(exc.args) + ':' + str(exc.code))
-                )
-            )
-        finally:
-            session.close()
+        if row_user:
+            logger.info('Data User on Db: %s',
+                        'Username: {}, Is_Active: {}'.format(row_user.user_name, row_user.is_active))
 
         return row_user
 
     @staticmethod
-    def get_all_users(session):
+    def get_all_users(session, limit=None, cursor=None, with_total=False):
+        """
+        Get one page, keyset paginated on user_id, of the users registered on database.
+
+        :param session: Database session
+        :param limit: Number of users of the page
+        :param cursor: Token of the page to get, returned as next_cursor by the previous page
+        :param with_total: Include the count of all the users
+        :return: dict
+        """
 
-        all_users = None
         user_data = []
-        data = dict()
 
-        all_users = session.query(UsersAuthModel).all()
+        query = session.query(UsersAuthModel)
+
+        all_users, next_cursor, total = keyset_page(query, UsersAuthModel.user_id, limit, cursor, with_total)
 
         for user_rs in all_users:
             id_user = user_rs.user_id
             username = user_rs.user_name
-            password = user_rs.password
             is_active = user_rs.is_active
             is_staff = user_rs.is_staff
             is_superuser = user_rs.is_superuser
@@ -348,7 +293,6 @@ class UsersAuthModel(Base):
                 "AuthUser": {
                     "Id": id_user,
                     "Username": username,
-                    "Password": password,
                     "IsActive": is_active,
                     "IsStaff": is_staff,
                     "IsSuperuser": is_superuser,
@@ -357,11 +301,10 @@ class UsersAuthModel(Base):
                 }
             }]
 
-        return json.dumps(user_data)
+        return page_result(user_data, next_cursor, limit, total)
 
     def __repr__(self):
-        return "<AuthUserModel(id_user='%s', username='%s', password='%s', email='%s', " \
-               "first_name='%s', last_name='%s', is_active='%s', is_staff='%s', is_superuser='%s', " \
-               "date_joined='%s')>" % (self.user_id, self.username, self.password, self.email, self.first_name,
-                                       self.last_name, self.is_active, self.is_staff, self.is_superuser,
-                                       self.date_joined)
+        return "<AuthUserModel(id_user='%s', username='%s', is_active='%s', is_staff='%s', is_superuser='%s', " \
+               "creation_date='%s', last_update_date='%s')>" % (self.user_id, self.user_name, self.is_active,
+                                                                self.is_staff, self.is_superuser, self.creation_date,
+                                                                self.last_update_date)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Cache of the credentials already verified, to answer repeated logins without the KDF nor the user queries.
+
+An entry is kept per user name with an HMAC of the password verified (never the password itself) and the user data
+returned by the login. A login hits the cache only when its password gives the same HMAC before the entry expires
+(CREDENTIAL_CACHE_TTL seconds); the least recently used entries are evicted beyond CREDENTIAL_CACHE_SIZE users.
+user_update_password invalidates the entry of the user. The cache is per process: a password changed through another
+worker is honoured here once the entry expires, so the TTL must stay short.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import os
+import hmac
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from utilities.Utility import *
+
+cfg_app = get_config_settings_app()
+
+
+class CredentialCache:
+    r"""
+    Class to instance a size-bounded LRU cache, with TTL, of the credentials verified.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # Random per process: the HMAC of a password is worthless outside of this process
+        self._hmac_key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.ttl > 0
+
+    def _secret_digest(self, user_name, password):
+        message = '{}\x00{}'.format(user_name, password).encode('utf-8')
+
+        return hmac.new(self._hmac_key, message, hashlib.sha256).digest()
+
+    def get(self, user_name, password):
+        r"""
+        Get the user data of a login already verified with this password.
+
+        :param user_name: The user name of the login.
+        :param password: The password of the login.
+        :return user_data: The user data cached, None on a miss.
+        """
+
+        if not self.enabled:
+            return None
+
+        secret_digest = self._secret_digest(user_name, password)
+
+        with self._lock:
+            entry = self._entries.get(user_name)
+
+            if entry is not None and entry[2] < time.monotonic():
+                del self._entries[user_name]
+                entry = None
+
+            if entry is None or not hmac.compare_digest(entry[0], secret_digest):
+                self._stats['misses'] += 1
+
+                return None
+
+            self._entries.move_to_end(user_name)
+            self._stats['hits'] += 1
+
+            return entry[1]
+
+    def put(self, user_name, password, user_data):
+        r"""
+        Cache a login verified.
+
+        :param user_name: The user name of the login.
+        :param password: The password verified.
+        :param user_data: The user data returned by the login.
+        """
+
+        if not self.enabled:
+            return
+
+        entry = (self._secret_digest(user_name, password), user_data, time.monotonic() + self.ttl)
+
+        with self._lock:
+            self._entries[user_name] = entry
+            self._entries.move_to_end(user_name)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, user_name):
+        r"""
+        Forget the credentials of a user, its next login is verified again.
+
+        :param user_name: The user name.
+        """
+
+        with self._lock:
+            if self._entries.pop(user_name, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        r"""
+        Get the hit/miss counters and the size of the cache.
+
+        :return cache_metrics: Dictionary with the cache metrics.
+        """
+
+        with self._lock:
+            cache_metrics = dict(self._stats)
+            cache_metrics['size'] = len(self._entries)
+
+        lookups = cache_metrics['hits'] + cache_metrics['misses']
+
+        cache_metrics['hit_ratio'] = cache_metrics['hits'] / lookups if lookups else 0.0
+        cache_metrics['max_size'] = self.max_size
+        cache_metrics['ttl'] = self.ttl
+
+        return cache_metrics
+
+
+credential_cache = CredentialCache(cfg_app.credential_cache_size, cfg_app.credential_cache_ttl)
+
+
+def get_credential_cache_metrics():
+    return credential_cache.metrics()
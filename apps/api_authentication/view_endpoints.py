@@ -11,15 +11,12 @@ __history__ = """ """
 __version__ = "1.21.G02.1 ($Rev: 2 $)"
 
 import re
-import time
-import threading
 from flask import Blueprint, json, request, render_template, redirect
 from flask_jwt_extended import jwt_required
 from db_controller.database_backend import *
-from .UsersAuthModel import UsersAuthModel
 from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
 from handler_controller.messages import SuccessMsg, ErrorMsg
-from auth_controller.api_authentication import *
+from auth_controller.jwt_middleware import jwt_exempt, revoke_request_token
 from logger_controller.logger_control import *
 from utilities.Utility import *
 from datetime import datetime
@@ -29,35 +26,68 @@ authorization_api = Blueprint('authorization_api', __name__)
 # jwt = JWTManager(bancos_api)
 logger = configure_logger('ws')
 
-
-# Se inicializa la App con un hilo para evitar problemas de ejecución
-# (Falta validacion para cuando ya exista hilo corriendo)
-def activate_job():
-    def run_job():
-        while True:
-            time.sleep(2)
-
-    thread = threading.Thread(target=run_job)
-    thread.start()
+# The models are imported by the endpoints on their first call, not when the blueprint is registered: their
+# mappings and dependencies (sqlalchemy_filters, passlib) stay out of the start up of the workers.
 
 
 # Contiene la llamada al HTML que soporta la documentacion de la API,
 # sus metodos, y endpoints con los modelos de datos I/O
-@authorization_api.before_app_first_request(activate_job())
 @authorization_api.route('/')
+@jwt_exempt
 def main():
 
     return render_template('gas_manager_api.html')
 
 
-@authorization_api.route('/logout/')
+@authorization_api.route('/logout/', methods=['POST'])
 def logout():
-    return redirect('/')
+    r"""
+    Log out: the access token of the request, verified by the middleware, can no longer be used when
+    JWT_REVOCATION_ENABLED.
+    """
+
+    revoked = revoke_request_token()
+
+    return HandlerResponse.response_success(SuccessMsg.MSG_LOGGED_OUT, {'revoked': revoked})
+
+
+def valid_credentials(data):
+    r"""
+    Check the username (an email) and the password of a login or registration request.
+
+    :param data: The JSON body of the request.
+    :return valid: Whether both are strings of the expected format.
+    """
+
+    if not isinstance(data, dict):
+        return False
+
+    user_name = data.get('username')
+    password = data.get('password')
+
+    if not isinstance(user_name, str) or not isinstance(password, str):
+        return False
+
+    regex_username = r"^[(a-z0-9\_\-\.)]+@[(a-z0-9\_\-\.)]+\.[(a-z)]{2,15}$"
+
+    regex_passwd = r"^[(A-Za-z0-9\_\-\.\$\#\&\*)(A-Za-z0-9\_\-\.\$\#\&\*)]+"
+
+    # regex_rfc = r
+    # "^([A-ZÑ&]{3,4})?(?:-?)?(\d{2}(?:0[1-9]|1[0-2])(?:0[1-9]|[12]\d|3[01]))?(?:-?)?([A-Z\d]{2})([A\d])$"
+
+    match_username = re.match(regex_username, user_name, re.M | re.I)
+
+    match_passwd = re.match(regex_passwd, password, re.M | re.I)
+
+    return bool(match_username and match_passwd)
 
 
 @authorization_api.route('/login/', methods=['POST'])
+@jwt_exempt
 def get_authentication():
-    conn_db, session_db = init_db_connection()
+    from auth_controller.api_authentication import user_authentication, api_password
+
+    session_db = get_db_session()
 
     data = dict()
     json_token = dict()
@@ -66,73 +96,99 @@ def get_authentication():
         data = request.get_json(force=True)
 
         if not data or str(data) is None:
-            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT, data)
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+        if not valid_credentials(data):
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
 
         user_name = data['username']
-        password = data['password']
-        # rfc = data['rfc_client']
 
-        regex_username = r"^[(a-z0-9\_\-\.)]+@[(a-z0-9\_\-\.)]+\.[(a-z)]{2,15}$"
+        try:
+            json_token = user_authentication(session_db, {'username': user_name,
+                                                          'password': api_password(user_name, data['password'])})
+        except mvc_exc.TimeoutError:
+            return HandlerResponse.service_unavailable(ErrorMsg.ERROR_SERVICE_BUSY)
+
+        if not json_token:
+            return HandlerResponse.request_unauthorized(ErrorMsg.ERROR_WRONG_CREDENTIALS)
 
-        regex_passwd = r"^[(A-Za-z0-9\_\-\.\$\#\&\*)(A-Za-z0-9\_\-\.\$\#\&\*)]+"
+        logger.info('User authenticated: %s', user_name)
 
-        # regex_rfc = r
-        # "^([A-ZÑ&]{3,4})?(?:-?)?(\d{2}(?:0[1-9]|1[0-2])(?:0[1-9]|[12]\d|3[01]))?(?:-?)?([A-Z\d]{2})([A\d])$"
+        return HandlerResponse.response_success(SuccessMsg.MSG_LOGGED_IN, json_token)
 
-        match_username = re.match(regex_username, user_name, re.M | re.I)
+    else:
+        return HandlerResponse.request_not_found(ErrorMsg.ERROR_REQUEST_NOT_FOUND)
 
-        match_passwd = re.match(regex_passwd, password, re.M | re.I)
 
-        # match_rfc = re.match(regex_rfc, rfc, re.M | re.I)
+@authorization_api.route('/register/', methods=['POST'])
+def register_user():
+    r"""
+    Register a user of the API, by an authenticated user: active, without staff nor superuser privileges.
 
-        if match_username and match_passwd:
+    Only the username and the password of the body are read.
+    """
 
-            password = user_name + '_' + password + '_' + cfg_app.api_key
+    from auth_controller.api_authentication import user_registration, api_password
 
-            data['password'] = password
+    session_db = get_db_session()
 
-            json_token = user_registration(session_db, data)
+    data = request.get_json(force=True, silent=True)
 
-        else:
-            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT, data)
+    if not valid_credentials(data):
+        return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
 
-        logger.info('Data User to Register on DB: %s', str(data))
+    user_name = data['username']
 
-        if not json_token:
-            return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, json_token)
+    try:
 
-        return HandlerResponse.response_resource_created(SuccessMsg.MSG_CREATED_RECORD, json_token)
+        json_user = user_registration(session_db, {'username': user_name,
+                                                   'password': api_password(user_name, data['password'])})
 
-    else:
-        return HandlerResponse.request_not_found(ErrorMsg.ERROR_REQUEST_NOT_FOUND)
+    except mvc_exc.TimeoutError:
+        return HandlerResponse.service_unavailable(ErrorMsg.ERROR_SERVICE_BUSY)
+
+    except mvc_exc.IntegrityError as exc:
+        logger.error('User not registered: %s', str(exc))
+
+        return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+    if not json_user:
+        return HandlerResponse.request_conflict(SuccessMsg.MSG_RECORD_REGISTERED)
+
+    return HandlerResponse.response_resource_created(SuccessMsg.MSG_CREATED_RECORD, json_user)
 
 
 @authorization_api.route('/list', methods=['GET'])
 def get_list_users_auth():
-    conn_db, session_db = init_db_connection()
+    from .UsersAuthModel import UsersAuthModel
 
-    headers = request.headers
-    auth = headers.get('Authorization')
+    session_db = get_db_session()
 
-    if not auth and 'Bearer' not in auth:
-        return HandlerResponse.request_unauthorized(ErrorMsg.ERROR_REQUEST_UNAUTHORIZED, auth)
-    else:
-        data = dict()
-        json_token = dict()
+    data = dict()
+    json_token = dict()
+
+    if request.method == 'GET':
+        # To GET ALL Data of the Users:
+
+        users_on_db = None
 
-        if request.method == 'GET':
-            # To GET ALL Data of the Users:
+        user_model = UsersAuthModel(data)
 
-            users_on_db = None
+        try:
 
-            user_model = UsersAuthModel(data)
+            limit, cursor, with_total = get_pagination_args(request.args)
 
-            users_on_db = user_model.get_all_users(session_db)
+            users_on_db = user_model.get_all_users(session_db, limit, cursor, with_total)
 
-            if not bool(users_on_db) or not users_on_db or "[]" == users_on_db:
-                return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, users_on_db)
+        except ValueError as exc:
+            logger.error('Pagination params not valid: %s', str(exc))
 
-            return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, users_on_db)
+            return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
 
-        else:
-            return HandlerResponse.request_not_found(ErrorMsg.ERROR_REQUEST_NOT_FOUND)
+        if not bool(users_on_db) or not users_on_db.get('results'):
+            return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, users_on_db)
+
+        return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, users_on_db)
+
+    else:
+        return HandlerResponse.request_not_found(ErrorMsg.ERROR_REQUEST_NOT_FOUND)
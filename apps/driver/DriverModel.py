@@ -24,14 +24,15 @@ __license__ = ""
 __history__ = """ """
 __version__ = "1.21.F21.1 ($Rev: 1 $)"
 
-import json
 import logging
 from datetime import datetime
-from pytz import timezone
 from apps.vehicle.VehicleModel import VehicleModel
 from sqlalchemy_filters import apply_filters
-from sqlalchemy import Column, Numeric, Integer, String, Date, Time, Sequence
+from sqlalchemy import Column, Numeric, Integer, String, Date, Time, Sequence, Index, ForeignKey
+from sqlalchemy.orm import relationship
 from db_controller.database_backend import *
+from db_controller.query_layer import (lookup_one, lookup_by_id, model_values, insert_returning, keyset_page, page_result,
+                                       stream_query, EXPORT_CHUNK_SIZE)
 from db_controller import mvc_exceptions as mvc_exc
 
 cfg_db = get_config_settings_db()
@@ -64,7 +65,7 @@ class DriverModel(Base):
     vehicle_assignment = Column(
         cfg_db.GasDriver.vehicle_id_fk,
         Integer,
-        ForeignKey('VehicleModel.vehicle_id', onupdate='CASCADE', ondelete='CASCADE'),
+        ForeignKey(VehicleModel.__table__.c[cfg_db.GasVehicle.vehiculo_id], onupdate='CASCADE', ondelete='CASCADE'),
         nullable=False,
         unique=True
         # no need to add index=True, all FKs have indexes
@@ -88,46 +89,22 @@ class DriverModel(Base):
 
         :param session: Session database object
         :param data: Dictionary with data to make validation function
-        :return: row_exists: Object with boolean response from db
+        :return: row_exists: The driver row on database or None
         """
 
         row_exists = None
-        id_driver = 0
 
-        if 'activo' in data.get('estatus_conductor').lower():
+        if 'activo' in str(data.get('estatus_conductor')).lower():
 
-            try:
-                # for example to check if the insert on db is correct
-                row_driver = self.get_driver_id(session, data)
-
-                if row_driver is not None:
-                    id_driver = row_driver.driver_id
-                else:
-                    id_driver = 0
-
-                logger.info('Driver Row object in DB: %s', str(id_driver))
-
-                row_exists = session.query(DriverModel).filter(DriverModel.driver_id == id_driver).scalar()
+            row_exists = self.get_driver_id(session, data)
 
-                logger.info('Row to data: {}, Exists: %s'.format(data), str(row_exists))
-
-            except SQLAlchemyError as exc:
-                row_exists = None
-
-                logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                                 str(exc.code)))
-                raise mvc_exc.IntegrityError(
-                    'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_conductor'),
-                                                                        str(str(exc.args) + ':' + str(exc.code)))
-                )
-            finally:
-                session.close()
+            logger.info('Row to data: {}, Exists: %s'.format(data.get('nombre_conductor')), str(row_exists))
 
         return row_exists
 
     def insert_data(self, session, data):
         """
-        Function to insert new row on database
+        Function to insert new row on database, in a single INSERT ... ON CONFLICT DO NOTHING ... RETURNING statement
 
         :param session: Session database object
         :param data: Dictionary to insert new the data containing on the db
@@ -136,57 +113,30 @@ class DriverModel(Base):
 
         endpoint_response = None
 
-        if not self.check_if_row_exists(session, data):
-
-            try:
-
-                self.driver_registered = get_current_date(session)
-
-                data['driver_registered'] = self.driver_registered
-
-                new_row = DriverModel(data)
-
-                logger.info('New Row Driver: %s', str(new_row.driver_name))
-
-                session.add(new_row)
-
-                row_driver = self.get_driver_id(session, data)
-
-                logger.info('Driver ID Inserted: %s', str(row_driver.driver_id))
+        try:
 
-                session.flush()
+            self.driver_registered = datetime.now().date()
 
-                data['driver_id'] = row_driver.driver_id
+            logger.info('New Row Driver: %s', str(self.driver_name))
 
-                # check insert correct
-                row_inserted = self.get_one_driver(session, data)
+            row_inserted = insert_returning(session, DriverModel, model_values(self),
+                                            ['driver_name', 'driver_last_name'])
 
-                logger.info('Data Driver inserted: %s, Original Data: {}'.format(data), str(row_inserted))
+            if row_inserted:
+                logger.info('Driver ID Inserted: %s', str(row_inserted.driver_id))
 
-                if row_inserted:
-                    endpoint_response = json.dumps({
-                        "id_driver": row_inserted.driver_id,
-                        "name_driver": row_inserted.driver_name,
-                        "lastname_driver": row_inserted.driver_last_name,
-                        "lastname_last_driver": row_inserted.driver_last_name_last,
-                        "address_driver": row_inserted.driver_address,
-                        "driver_added_date": row_inserted.driver_registered,
-                        "status_driver": row_inserted.driver_status,
-                        "vehicle_driver": row_inserted.vehicle_assignment
-                    })
+                endpoint_response = DriverModel.to_dict(row_inserted)
 
-            except SQLAlchemyError as exc:
-                endpoint_response = None
-                session.rollback()
+        except SQLAlchemyError as exc:
+            endpoint_response = None
+            session.rollback()
 
-                logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                                 str(exc.code)))
-                raise mvc_exc.IntegrityError(
-                    'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_conductor'),
-                                                                        str(str(exc.args) + ':' + str(exc.code)))
-                )
-            finally:
-                session.close()
+            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
+                                                                                             str(exc.code)))
+            raise mvc_exc.IntegrityError(
+                'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_conductor'),
+                                                                    str(str(exc.args) + ':' + str(exc.code)))
+            )
 
         return endpoint_response
 
@@ -201,58 +151,27 @@ class DriverModel(Base):
 
         endpoint_response = None
 
-        if self.check_if_row_exists(session, data):
-
-            try:
+        row_driver = self.check_if_row_exists(session, data)
 
-                row_driver = self.get_driver_id(session, data)
+        if row_driver:
 
-                if row_driver is not None:
-                    id_driver = row_driver.driver_id
-                else:
-                    id_driver = 0
-
-                logger.info('Driver Row object in DB: %s', str(id_driver))
-
-                self.last_update_date = get_current_date(session)
-
-                data['last_update_date'] = self.last_update_date
+            try:
 
-                data['driver_id'] = id_driver
+                logger.info('Driver Row object in DB: %s', str(row_driver.driver_id))
 
-                # update row to database
-                session.query(DriverModel).filter(DriverModel.driver_id == id_driver).\
-                    update({"driver_name": data.get('nombre_conductor'),
-                            "driver_last_name": data.get('apellido_paterno_conductor'),
-                            "driver_last_name_last": data.get('apellido_materno_conductor'),
-                            "driver_address": data.get('apellido_materno_conductor'),
-                            "driver_registered": data.get('domicilio_conductor'),
-                            "driver_status": data.get('estatus_conductor'),
-                            "vehicle_assignment": data.get('vehiculo'),
-                            "last_update_date": data.get('last_update_date')},
-                           synchronize_session='fetch')
+                row_driver.driver_name = data.get('nombre_conductor')
+                row_driver.driver_last_name = data.get('apellido_paterno_conductor')
+                row_driver.driver_last_name_last = data.get('apellido_materno_conductor')
+                row_driver.driver_address = data.get('domicilio_conductor')
+                row_driver.driver_status = data.get('estatus_conductor')
+                row_driver.vehicle_assignment = data.get('vehiculo', row_driver.vehicle_assignment)
+                row_driver.last_update_date = datetime.now().date()
 
                 session.flush()
 
-                # check update correct
-                row_updated = self.get_one_driver(session, data)
+                logger.info('Data Driver updated')
 
-                logger.info('Data Updated: %s', str(row_updated))
-
-                if row_updated:
-                    logger.info('Data Driver updated')
-
-                    endpoint_response = json.dumps({
-                        "id_driver": row_updated.driver_id,
-                        "name_driver": row_updated.driver_name,
-                        "lastname_driver": row_updated.driver_last_name,
-                        "lastname_last_driver": row_updated.driver_last_name_last,
-                        "address_driver": row_updated.driver_address,
-                        "driver_added_date": str(row_updated.driver_registered),
-                        "status_driver": row_updated.driver_status,
-                        "vehicle_driver": row_updated.vehicle_assignment,
-                        "last_date_updated": str(row_updated.last_update_date)
-                    })
+                endpoint_response = DriverModel.to_dict(row_driver)
 
             except SQLAlchemyError as exc:
                 endpoint_response = None
@@ -263,8 +182,6 @@ class DriverModel(Base):
                     'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_conductor'),
                                                                         str(str(exc.args) + ':' + str(exc.code)))
                 )
-            finally:
-                session.close()
 
         return endpoint_response
 
@@ -279,147 +196,76 @@ class DriverModel(Base):
 
         endpoint_response = None
 
-        status_driver = self.get_status_driver(session, data)
-
-        if status_driver is not None:
+        row_driver = self.get_driver_id(session, data)
 
-            if 'inactivo' not in status_driver:
+        if row_driver is not None and 'inactivo' not in str(row_driver.driver_status).lower():
 
-                try:
-
-                    row_driver = self.get_driver_id(session, data)
-
-                    if row_driver is not None:
-                        id_driver = row_driver.driver_id
-                    else:
-                        id_driver = 0
-
-                    logger.info('Driver Row object in DB: %s', str(id_driver))
-
-                    data['driver_id'] = id_driver
+            try:
 
-                    session.query(DriverModel).filter(DriverModel.driver_id == id_driver).\
-                        update({"driver_status": "INACTIVO"},
-                               synchronize_session='fetch')
+                logger.info('Driver Row object in DB: %s', str(row_driver.driver_id))
 
-                    session.flush()
+                row_driver.driver_status = 'INACTIVO'
 
-                    # check update correct
-                    row_deleted = self.get_one_driver(session, data)
+                session.flush()
 
-                    if row_deleted:
-                        logger.info('Driver inactive')
+                logger.info('Driver inactive')
 
-                        endpoint_response = json.dumps({
-                            "id_driver": row_deleted.driver_id,
-                            "name_driver": row_deleted.driver_name,
-                            "lastname_driver": row_deleted.driver_last_name,
-                            "lastname_last_driver": row_deleted.driver_last_name_last,
-                            "address_driver": row_deleted.driver_address,
-                            "driver_added_date": row_deleted.driver_registered,
-                            "status_driver": row_deleted.driver_status,
-                            "vehicle_driver": row_deleted.vehicle_assignment
-                        })
+                endpoint_response = DriverModel.to_dict(row_driver)
 
-                except SQLAlchemyError as exc:
-                    endpoint_response = None
-                    session.rollback()
+            except SQLAlchemyError as exc:
+                endpoint_response = None
+                session.rollback()
 
-                    logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                                     str(exc.code)))
-                    raise mvc_exc.IntegrityError(
-                        'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_conductor'),
-                                                                            str(str(exc.args) + ':' + str(exc.code)))
-                    )
-                finally:
-                    session.close()
+                logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
+                                                                                                 str(exc.code)))
+                raise mvc_exc.IntegrityError(
+                    'Row not stored in "{}". IntegrityError: {}'.format(data.get('nombre_conductor'),
+                                                                        str(str(exc.args) + ':' + str(exc.code)))
+                )
 
         return endpoint_response
 
     @staticmethod
     def get_driver_id(session, data):
         """
-        Get Driver object row registered on database to get the ID
+        Get Driver object row registered on database to get the ID, in a single query
 
         :param session: Database session object
         :param data: Dictionary with data to get row
-        :return: row_driver: The row on database registered
+        :return: row_driver: The row on database registered or None
         """
 
-        row_driver = None
+        criteria = {
+            'driver_name': data.get('nombre_conductor'),
+            'driver_last_name': data.get('apellido_paterno_conductor')
+        }
 
-        try:
-
-            row_exists = session.query(DriverModel).filter(DriverModel.driver_name == data.get('nombre_conductor')).\
-                filter(DriverModel.driver_last_name == data.get('apellido_paterno_conductor')).scalar()
-
-            logger.info('Row Data Driver Exists on DB: %s', str(row_exists))
-
-            if row_exists:
+        if 'vehiculo' in data.keys():
+            criteria['vehicle_assignment'] = data.get('vehiculo')
 
-                row_driver = session.query(DriverModel).\
-                    filter(DriverModel.driver_name == data.get('nombre_conductor')).\
-                    filter(DriverModel.driver_last_name == data.get('apellido_paterno_conductor')).one()
+        row_driver = lookup_one(session, DriverModel, **criteria)
 
-                if 'vehiculo' in data.keys():
-
-                    row_driver = session.query(DriverModel). \
-                        filter(DriverModel.driver_name == data.get('nombre_conductor')). \
-                        filter(VehicleModel.vehicle_id == data.get('vehiculo')). \
-                        filter(DriverModel.driver_last_name == data.get('apellido_paterno_conductor')).one()
-
-                logger.info('Row ID Driver data from database object: {}'.format(str(row_driver)))
-
-        except SQLAlchemyError as exc:
-
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('nombre_conductor'), DriverModel.__tablename__, str(str(exc.args) + ':' +
-                                                                                 str(exc.code))
-                )
-            )
-
-        finally:
-            session.close()
+        logger.info('Row ID Driver data from database object: {}'.format(str(row_driver)))
 
         return row_driver
 
     @staticmethod
     def get_one_driver(session, data):
-        row = None
-
-        try:
-
-            if 'vehiculo' in data.keys():
-
-                row = session.query(DriverModel). \
-                    filter(DriverModel.driver_id == data.get('driver_id')). \
-                    filter(VehicleModel.vehicle_id == data.get('vehiculo')).one()
-
-            row = session.query(DriverModel).filter(DriverModel.driver_id == data.get('driver_id')).\
-                filter(DriverModel.driver_name == data.get('nombre_conductor')).one()
-
-            if row:
-                logger.info('Data Driver on Db: %s',
-                            'Nombre: {}, Apellido: {}, Estatus: {}'.format(row.driver_name,
-                                                                           row.driver_last_name,
-                                                                           row.driver_status))
+        """
+        Get the Driver row by its ID, from the session identity map when already loaded
 
-        except SQLAlchemyError as exc:
-            row = None
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
+        :param session: Database session object
+        :param data: Dictionary with the driver_id
+        :return: row: The row on database registered or None
+        """
 
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('nombre_conductor'), DriverModel.__tablename__, str(str(exc.args) + ':' + str(exc.code))
-                )
-            )
+        row = lookup_by_id(session, DriverModel, data.get('driver_id'))
 
-        finally:
-            session.close()
+        if row:
+            logger.info('Data Driver on Db: %s',
+                        'Nombre: {}, Apellido: {}, Estatus: {}'.format(row.driver_name,
+                                                                       row.driver_last_name,
+                                                                       row.driver_status))
 
         return row
 
@@ -433,135 +279,98 @@ class DriverModel(Base):
         """
 
         estatus_conductor = None
-        driver_row = None
 
-        try:
-            driver_row = self.get_driver_id(session, data)
+        driver_row = self.get_driver_id(session, data)
+
+        if driver_row:
+            estatus_conductor = driver_row.driver_status
 
-            logger.info('Driver Id: %s', str(driver_row.driver_id))
+            logger.info('Driver Status: %s', estatus_conductor)
 
-            if driver_row:
+        return estatus_conductor
 
-                row = session.query(DriverModel).filter(DriverModel.driver_id == driver_row.driver_id).one()
+    @staticmethod
+    def get_all_inversiones(session, limit=None, cursor=None, with_total=False):
+        """
+        Get one page of all the Driver objects data registered on database.
 
-                if row:
-                    estatus_conductor = row.driver_status
+        :param session: Database session
+        :param limit: Number of drivers of the page
+        :param cursor: Token of the page to get, returned as next_cursor by the previous page
+        :param with_total: Include the count of all the drivers
+        :return: dict
+        """
 
-                    logger.info('Driver Status: %s', estatus_conductor)
+        return DriverModel.get_inversiones_by_filters(session, None, limit, cursor, with_total)
 
-        except SQLAlchemyError as exc:
-            estatus_conductor = None
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
+    @staticmethod
+    def get_inversiones_by_filters(session, filter_spec=None, limit=None, cursor=None, with_total=False):
+        """
+        Get one page, keyset paginated on driver_id, of the Driver objects data registered on database matching
+        the filters.
 
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('nombre_conductor'), DriverModel.__tablename__, str(str(exc.args) + ':' + str(exc.code))
-                )
-            )
+        :param session: Database session
+        :param filter_spec: List of sqlalchemy_filters specifications over the DriverModel attributes
+        :param limit: Number of drivers of the page
+        :param cursor: Token of the page to get, returned as next_cursor by the previous page
+        :param with_total: Include the count of all the drivers matching the filters
+        :return: dict
+        """
 
-        finally:
-            session.close()
+        query = session.query(DriverModel)
 
-        return estatus_conductor
+        if filter_spec:
+            query = apply_filters(query, filter_spec)
+
+        query_result, next_cursor, total = keyset_page(query, DriverModel.driver_id, limit, cursor, with_total)
+
+        logger.info('Query filtered resultSet: %s rows, next cursor: %s', len(query_result), next_cursor)
+
+        drivers_data = [DriverModel.to_dict(driver) for driver in query_result]
+
+        return page_result(drivers_data, next_cursor, limit, total)
 
     @staticmethod
-    def get_all_inversiones(session):
+    def export_by_filters(filter_spec=None, chunk_size=EXPORT_CHUNK_SIZE):
         """
-        Get all Driver objects data registered on database.
+        Get all the Driver objects data registered on database matching the filters, read through a server-side
+        cursor while they are consumed.
 
-        :param session: Database session
-        :return: json.dumps dict
+        :param filter_spec: List of sqlalchemy_filters specifications over the DriverModel attributes
+        :param chunk_size: Number of drivers fetched from the cursor at a time
+        :return: Generator of the driver dictionaries, ordered by driver_id
         """
 
-        all_drivers = None
-        drivers_data = []
-
-        all_drivers = session.query(DriverModel).all()
-
-        for driver in all_drivers:
-            id_driver = driver.driver_id
-            name_driver = driver.driver_name
-            lastname_driver = driver.driver_last_name
-            lastname_last_driver = driver.driver_last_name_last
-            address_driver = driver.driver_address
-            registered_driver = driver.driver_registered
-            status_driver = driver.driver_status
-            assigment_vehicle = driver.vehicle_assignment
-            last_updated_date = driver.last_update_date
-
-            drivers_data += [{
-                "Driver": {
-                    "id_driver": id_driver,
-                    "name_driver": name_driver,
-                    "lastname_driver": lastname_driver,
-                    "lastname_last_driver": lastname_last_driver,
-                    "address_driver": address_driver,
-                    "driver_added_date": str(registered_driver),
-                    "status_driver": status_driver,
-                    "vehicle_driver": assigment_vehicle,
-                    "last_date_updated": str(last_updated_date)
-                }
-            }]
-
-        return json.dumps(drivers_data)
+        def build_query(session):
+            query = session.query(DriverModel)
+
+            if filter_spec:
+                query = apply_filters(query, filter_spec)
+
+            return query.order_by(DriverModel.driver_id)
+
+        return (DriverModel.to_dict(driver) for driver in stream_query(build_query, chunk_size))
 
     @staticmethod
-    def get_inversiones_by_filters(session, filter_spec=list):
-
-        query_result = None
-        inversiones_data = []
-
-        if filter_spec is None:
-            query_result = session.query(GinInversionesModel).all()
-
-        query = session.query(GinInversionesModel)
-
-        filtered_query = apply_filters(query, filter_spec)
-        query_result = filtered_query.all()
-
-        logger.info('Query filtered resultSet: %s', str(query_result))
-
-        for inversion in query_result:
-            inversion_id = inversion.invId
-            cuenta = inversion.cuenta
-            estatus = inversion.estatus
-            monto = inversion.monto
-            autorizacion = inversion.autorizacion
-            canal = inversion.canal
-            origen = inversion.origen
-            comisionistaId = inversion.comisionistaId
-            transaccionId = inversion.transaccionId
-            motivo = inversion.motivo
-            fechaRecepcion = inversion.fechaRecepcion
-            horaRecepcion = inversion.horaRecepcion
-            fechaAplicacion = inversion.fechaAplicacion
-            horaAplicacion = inversion.horaAplicacion
-            conciliacionId = inversion.conciliacionId
-            codigoBancario = inversion.codigoBancario
-            metodoDeposito = inversion.metodoDeposito
-
-            inversiones_data += [{
-                "invId": inversion_id,
-                "cuenta": cuenta,
-                "estatus": estatus,
-                "monto": str(monto),
-                "autorizacion": autorizacion,
-                "canal": canal,
-                "origen": origen,
-                "comisionistaId": comisionistaId,
-                "transaccionId": transaccionId,
-                "motivo": motivo,
-                "fechaRecepcion": str(fechaRecepcion),
-                "horaRecepcion": str(horaRecepcion),
-                "fechaAplicacion": str(fechaAplicacion),
-                "horaAplicacion": str(horaAplicacion),
-                "conciliacionId": conciliacionId,
-                "codigoBancario": codigoBancario,
-                "metodoDeposito": metodoDeposito
-            }]
-
-        return json.dumps(inversiones_data)
+    def to_dict(driver):
+        """
+        Get the response dictionary of a driver row, either a model instance or a row returned by an INSERT
+
+        :param driver: Object with the DriverModel attributes
+        :return: dict
+        """
+
+        return {
+            "id_driver": driver.driver_id,
+            "name_driver": driver.driver_name,
+            "lastname_driver": driver.driver_last_name,
+            "lastname_last_driver": driver.driver_last_name_last,
+            "address_driver": driver.driver_address,
+            "driver_added_date": driver.driver_registered,
+            "status_driver": driver.driver_status,
+            "vehicle_driver": driver.vehicle_assignment,
+            "last_date_updated": driver.last_update_date
+        }
 
     def __repr__(self):
         return "<DriverModel(driver_id='%s', " \
@@ -576,3 +385,12 @@ class DriverModel(Base):
                                                            self.driver_last_name_last, self.driver_address,
                                                            self.driver_registered, self.driver_status,
                                                            self.last_update_date, self.vehicle_assignment)
+
+
+# Natural key of the driver, target of the INSERT ... ON CONFLICT
+Index('uq_driver_name', DriverModel.driver_name, DriverModel.driver_last_name, unique=True)
+
+# Databases created before the natural key was declared get its unique index on the schema migration 2
+register_schema_migration(2, 'CREATE UNIQUE INDEX IF NOT EXISTS uq_driver_name ON "{}" ("{}", "{}")'.format(
+    DriverModel.__tablename__, DriverModel.driver_name.property.columns[0].name,
+    DriverModel.driver_last_name.property.columns[0].name))
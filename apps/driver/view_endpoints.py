@@ -13,23 +13,28 @@ __version__ = "1.21.G02.1 ($Rev: 2 $)"
 from flask import Blueprint, json, request
 # from flask_jwt_extended import jwt_required
 from db_controller.database_backend import *
-from .GinInversionesModel import GinInversionesModel
-from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
+from db_controller import mvc_exceptions as mvc_exc
+from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse, STREAM_FORMATS
 from handler_controller.messages import SuccessMsg, ErrorMsg
 from logger_controller.logger_control import *
 from utilities.Utility import *
 from datetime import datetime
 
 cfg_app = get_config_settings_app()
-inversiones_api = Blueprint('inversiones_api', __name__)
+driver_api = Blueprint('driver_api', __name__)
 # jwt = JWTManager(bancos_api)
 logger = configure_logger('ws')
 
+# The models are imported by the endpoints on their first call, not when the blueprint is registered: their
+# mappings and dependencies (sqlalchemy_filters) stay out of the start up of the workers.
 
-@inversiones_api.route('/', methods=['POST', 'GET', 'DELETE'])
+
+@driver_api.route('/', methods=['POST', 'GET', 'PUT', 'DELETE'])
 # @jwt_required
-def endpoint_processing_inversiones_data():
-    conn_db, session_db = init_db_connection()
+def endpoint_processing_driver_data():
+    from .DriverModel import DriverModel
+
+    session_db = get_db_session()
 
     headers = request.headers
     # auth = headers.get('Authorization')
@@ -41,162 +46,153 @@ def endpoint_processing_inversiones_data():
     query_string = request.query_string.decode('utf-8')
 
     if request.method == 'POST':
-        # APLICAR INVERSIONES
+        # REGISTRAR CONDUCTOR
 
         data = request.get_json(force=True)
 
-        gin_inv_model = GinInversionesModel(data)
-
         if not data or str(data) is None:
             return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
 
-        logger.info('Data Json Inversion to Manage on DB: %s', str(data))
+        driver_model = DriverModel(data)
 
-        fechaRecepcion = str()
-        horaRecepcion = str()
-        fechaAplicacion = str()
-        horaAplicacion = str()
+        logger.info('Data Json Driver to Manage on DB: %s', str(data))
 
-        fecha_recepcion = data.get('fechaRecepcion')
-        hora_recepcion = data.get('horaRecepcion')
+        try:
 
-        if fecha_recepcion and hora_recepcion:
-            fecha_hora_recepcion = str(datetime.strptime(str(fecha_recepcion), "%Y-%m-%d")) + " " + \
-                                   str(datetime.strptime(str(hora_recepcion), "%H:%M:%S"))
+            json_driver_added = driver_model.insert_data(session_db, data)
 
-            fechaRecepcion, horaRecepcion = set_utc_date_data(fecha_hora_recepcion, cfg_app.date_timezone)
+        except mvc_exc.IntegrityError as exc:
+            logger.error('Driver not stored: %s', str(exc))
 
-        fecha_aplicacion = data.get('fechaAplicacion')
-        hora_aplicacion = data.get('horaAplicacion')
-
-        if fecha_aplicacion and hora_aplicacion:
-            fecha_hora_aplicacion = str(datetime.strptime(str(fecha_aplicacion), "%Y-%m-%d")) + " " + \
-                                   str(datetime.strptime(str(hora_aplicacion), "%H:%M:%S"))
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
 
-            fechaAplicacion, horaAplicacion = set_utc_date_data(fecha_hora_aplicacion, cfg_app.date_timezone)
+        if not json_driver_added:
+            return HandlerResponse.response_success(SuccessMsg.MSG_RECORD_REGISTERED, {})
 
-        data_insert = {
-            'cuenta': data.get('cuenta'),
-            'estatus': data.get('estatus'),
-            'monto': data.get('monto'),
-            'autorizacion': data.get('autorizacion'),
-            'canal': data.get('canal'),
-            'origen': data.get('origen'),
-            'comisionistaId': data.get('comisionistaId'),
-            'transaccionId': data.get('transaccionId'),
-            'motivo': data.get('motivo'),
-            'fechaRecepcion': fechaRecepcion,
-            'horaRecepcion': horaRecepcion,
-            'fechaAplicacion': fechaAplicacion,
-            'horaAplicacion': horaAplicacion,
-            'conciliacionId': data.get('conciliacionId')
-        }
+        return HandlerResponse.response_success(SuccessMsg.MSG_CREATED_RECORD, json_driver_added)
 
-        json_bank_added = gin_inv_model.insert_data(session_db, data_insert)
+    elif request.method == 'GET':
+        # To GET ALL Data of the Drivers:
 
-        if not json_bank_added:
-            return HandlerResponse.resp_success(SuccessMsg.MSG_RECORD_REGISTERED, {})
+        filter_spec = driver_filter_spec(query_string)
 
-        return HandlerResponse.resp_success(SuccessMsg.MSG_CREATED_RECORD, json_bank_added)
+        try:
 
-    elif request.method == 'GET':
-        # To GET ALL Data of the Banks:
+            limit, cursor, with_total = get_pagination_args(request.args)
 
-        data = dict()
-        inversiones_on_db = None
+            drivers_on_db = DriverModel.get_inversiones_by_filters(session_db, filter_spec, limit, cursor, with_total)
 
-        filter_spec = []
+        except ValueError as exc:
+            logger.error('Pagination params not valid: %s', str(exc))
 
-        if 'canal' in query_string:
-            canal = request.args.get('canal')
+            return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
 
-            data['canal'] = canal
+        if not bool(drivers_on_db) or not drivers_on_db.get('results'):
+            return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
 
-            filter_spec.append({'field': 'canal', 'op': '==', 'value': canal})
+        return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, drivers_on_db)
 
-        if 'fecha' in query_string:
-            fecha = request.args.get('fecha')
+    elif request.method == 'PUT':
 
-            fecha_filter = datetime.strptime(str(fecha), "%Y-%m-%d")
+        data = request.get_json(force=True)
 
-            data['fechaRecepcion'] = fecha_filter
+        if not data:
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
 
-            filter_spec.append({'field': 'fechaRecepcion', 'op': '==', 'value': fecha_filter})
+        driver_model = DriverModel(data)
 
-        if 'estatus' in query_string:
-            status_inversion = request.args.get('estatus')
+        try:
 
-            data['estatus'] = status_inversion
+            json_data = driver_model.update_data(session_db, data)
 
-            filter_spec.append({'field': 'estatus', 'op': 'ilike', 'value': status_inversion})
+        except mvc_exc.IntegrityError as exc:
+            logger.error('Driver not updated: %s', str(exc))
 
-        gin_inv_model = GinInversionesModel(data)
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
 
-        inversiones_on_db = gin_inv_model.get_inversiones_by_filters(session_db, filter_spec)
+        logger.info('Driver updated Info: %s', str(json_data))
 
-        if not bool(inversiones_on_db) or not inversiones_on_db or "[]" == inversiones_on_db:
-            return HandlerResponse.resp_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+        if not json_data:
+            return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
 
-        return HandlerResponse.resp_success(SuccessMsg.MSG_GET_RECORD, inversiones_on_db)
+        return HandlerResponse.response_success(SuccessMsg.MSG_UPDATED_RECORD, json_data)
 
-    # elif request.method == 'PUT':
-    #
-    #     data = request.get_json(force=True)
-    #
-    #     gin_inv_model = GinInversionesModel(data)
-    #
-    #     if not data:
-    #         return HandlerResponse.request_conflict()
-    #
-    #     json_data = dict()
-    #
-    #     json_data = gin_inv_model.update_data(session_db, data)
-    #
-    #     logger.info('Bank updated Info: %s', str(json_data))
-    #
-    #     if not json_data:
-    #         return HandlerResponse.not_found()
-    #
-    #     return HandlerResponse.resp_success(json_data)
-    #
     elif request.method == 'DELETE':
 
         data = dict()
-        # data = request.get_json(force=True)
 
-        filter_spec = []
+        if not ('nombre' in query_string and 'apellido' in query_string):
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+        data['nombre_conductor'] = request.args.get('nombre')
+        data['apellido_paterno_conductor'] = request.args.get('apellido')
+
+        driver_model = DriverModel(data)
+
+        try:
+
+            json_response = driver_model.delete_data(session_db, data)
+
+        except mvc_exc.IntegrityError as exc:
+            logger.error('Driver not deleted: %s', str(exc))
 
-        if not ('cuenta' in query_string) and ('canal' in query_string) and ('autorizacion' in query_string):
             return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
-        else:
 
-            cuenta = request.args.get('cuenta')
+        logger.info('Driver deleted: %s', json_response)
 
-            data['cuenta'] = cuenta
+        if not json_response:
+            return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
 
-            canal = request.args.get('canal')
+        return HandlerResponse.response_success(SuccessMsg.MSG_DELETED_RECORD, json_response)
 
-            data['canal'] = canal
+    else:
+        return HandlerResponse.request_not_found(ErrorMsg.ERROR_REQUEST_NOT_FOUND)
 
-            autorizacion = request.args.get('autorizacion')
 
-            data['autorizacion'] = autorizacion
+def driver_filter_spec(query_string):
+    r"""
+    Build the sqlalchemy_filters specification of the driver list and export endpoints from the query params.
 
-        gin_inv_model = GinInversionesModel(data)
+    :param query_string: The decoded query string of the request.
+    :return filter_spec: List of filters over the DriverModel attributes.
+    """
 
-        json_data = []
+    filter_spec = []
 
-        if not data:
-            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+    if 'nombre' in query_string:
+        filter_spec.append({'field': 'driver_name', 'op': 'ilike', 'value': request.args.get('nombre')})
 
-        json_response = gin_inv_model.delete_data(session_db, data)
+    if 'estatus' in query_string:
+        filter_spec.append({'field': 'driver_status', 'op': 'ilike', 'value': request.args.get('estatus')})
 
-        logger.info('Inversion deleted: %s', json_response)
+    if 'vehiculo' in query_string:
+        filter_spec.append({'field': 'vehicle_assignment', 'op': '==', 'value': request.args.get('vehiculo')})
 
-        if not json_response:
-            return HandlerResponse.resp_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+    return filter_spec
 
-        return HandlerResponse.resp_success(SuccessMsg.MSG_DELETED_RECORD, json_response)
 
-    else:
-        return HandlerResponse.not_found(ErrorMsg.ERROR_REQUEST_NOT_FOUND)
\ No newline at end of file
+@driver_api.route('/export', methods=['GET'])
+def endpoint_export_drivers():
+    r"""
+    Stream all the drivers matching the list filters as a JSON array or NDJSON (?format=ndjson).
+
+    The rows are read through a server-side cursor on a connection of the export, the request session is not used.
+    """
+
+    from .DriverModel import DriverModel
+    from db_controller.query_layer import EXPORT_CHUNK_SIZE
+
+    export_format = request.args.get('format', 'json').lower()
+
+    if export_format not in STREAM_FORMATS:
+        return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+    filter_spec = driver_filter_spec(request.query_string.decode('utf-8'))
+
+    chunk_size = max(request.args.get('chunk_size', EXPORT_CHUNK_SIZE, type=int), 1)
+
+    logger.info('Export of drivers requested as %s, filters: %s', export_format, str(filter_spec))
+
+    drivers_rows = DriverModel.export_by_filters(filter_spec, chunk_size)
+
+    return HandlerResponse.response_stream(drivers_rows, export_format, 'conductores.{}'.format(export_format))
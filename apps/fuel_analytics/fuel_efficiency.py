@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Fuel efficiency of the vehicles and drivers: km/L, cost per km and anomalous fuel loads over a date range.
+
+Everything is computed by PostgreSQL in one statement, without loading the fuel loads nor the readings:
+ - the odometer of each fuel load is its vehicle's last reading at the time of the load, one LATERAL lookup on the
+   (vehicle, register date) index of the readings per load, never a scan of the time series;
+ - LAG over the loads of each vehicle gives the distance covered since the previous load of the range: with full
+   tank fills, the liters of a load are the fuel burnt over that distance;
+ - AVG/STDDEV over the intervals of each vehicle give its usual efficiency, an interval more than
+   FUEL_ANOMALY_ZSCORE deviations away from it (or outside FUEL_MIN_KM_LITER..FUEL_MAX_KM_LITER) is flagged.
+The efficiency and cost per km of a vehicle or driver are computed over the intervals not flagged. An interval is
+credited to the driver of the load which closes it.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+from datetime import date, timedelta
+from db_controller.database_backend import *
+from apps.gas_manager.GasManagerModel import GasManagerModel
+from apps.odometer.OdometerModel import OdometerModel, KM_PER_UNIT
+
+cfg_app = get_config_settings_app()
+
+logger = configure_logger('db')
+
+# Anomaly of a fuel load -> description
+FUEL_ANOMALIES = {
+    'no_odometer': 'No odometer reading of the vehicle before the fuel load',
+    'odometer_back': 'The odometer is lower than on the previous fuel load',
+    'no_distance': 'Fuel loaded without distance covered since the previous fuel load',
+    'low_efficiency': 'Efficiency below FUEL_MIN_KM_LITER',
+    'high_efficiency': 'Efficiency above FUEL_MAX_KM_LITER',
+    'efficiency_outlier': 'Efficiency too far from the usual efficiency of the vehicle',
+}
+
+_FLAGGED_FILLS_SQL = """
+WITH fills AS (
+    SELECT g."{gas_id}" AS fill_id, g."{gas_vehicle}" AS vehicle_id, g."{gas_driver}" AS driver_id,
+           g."{gas_date}" + g."{gas_hour}" AS fill_at, g."{gas_liters}" AS liters, g."{gas_cost}" AS cost,
+           odometer.km AS odometer_km
+    FROM "{gas_table}" g
+    LEFT JOIN LATERAL (
+        SELECT o."{odo_value}" * CASE o."{odo_unit}" {unit_factors} ELSE 1.0 END AS km
+        FROM "{odo_table}" o
+        WHERE o."{odo_vehicle}" = g."{gas_vehicle}" AND o."{odo_date}" <= g."{gas_date}" + g."{gas_hour}"
+        ORDER BY o."{odo_date}" DESC
+        LIMIT 1
+    ) odometer ON TRUE
+    WHERE g."{gas_date}" >= :date_from AND g."{gas_date}" < :date_to {vehicle_filter}
+),
+intervals AS (
+    SELECT fills.*,
+           odometer_km - LAG(odometer_km) OVER vehicle_fills AS distance_km,
+           EXTRACT(EPOCH FROM fill_at - LAG(fill_at) OVER vehicle_fills) / 3600.0 AS hours_since_previous
+    FROM fills
+    WINDOW vehicle_fills AS (PARTITION BY vehicle_id ORDER BY fill_at, fill_id)
+),
+efficiency AS (
+    SELECT intervals.*,
+           CASE WHEN distance_km > 0 AND liters > 0 THEN distance_km / liters END AS km_per_liter,
+           CASE WHEN distance_km > 0 THEN cost / distance_km END AS cost_per_km
+    FROM intervals
+),
+scored AS (
+    SELECT efficiency.*,
+           AVG(km_per_liter) OVER (PARTITION BY vehicle_id) AS vehicle_km_per_liter,
+           STDDEV_SAMP(km_per_liter) OVER (PARTITION BY vehicle_id) AS vehicle_km_per_liter_stddev,
+           COUNT(km_per_liter) OVER (PARTITION BY vehicle_id) AS vehicle_intervals
+    FROM efficiency
+),
+flagged AS (
+    SELECT scored.*,
+           CASE
+               WHEN odometer_km IS NULL THEN 'no_odometer'
+               WHEN distance_km < 0 THEN 'odometer_back'
+               WHEN distance_km = 0 THEN 'no_distance'
+               WHEN km_per_liter < :min_km_liter THEN 'low_efficiency'
+               WHEN km_per_liter > :max_km_liter THEN 'high_efficiency'
+               WHEN vehicle_intervals >= :min_fills AND vehicle_km_per_liter_stddev > 0
+                    AND ABS(km_per_liter - vehicle_km_per_liter) > :zscore * vehicle_km_per_liter_stddev
+                   THEN 'efficiency_outlier'
+           END AS anomaly
+    FROM scored
+)
+"""
+
+_SUMMARY_SQL = """
+SELECT {group_column} AS group_id,
+       COUNT(*) AS fuel_loads,
+       SUM(liters) AS liters,
+       SUM(cost) AS cost,
+       COUNT(anomaly) AS anomalies,
+       SUM(distance_km) FILTER (WHERE km_per_liter IS NOT NULL AND anomaly IS NULL) AS distance_km,
+       SUM(distance_km) FILTER (WHERE km_per_liter IS NOT NULL AND anomaly IS NULL) /
+           NULLIF(SUM(liters) FILTER (WHERE km_per_liter IS NOT NULL AND anomaly IS NULL), 0) AS km_per_liter,
+       SUM(cost) FILTER (WHERE km_per_liter IS NOT NULL AND anomaly IS NULL) /
+           NULLIF(SUM(distance_km) FILTER (WHERE km_per_liter IS NOT NULL AND anomaly IS NULL), 0) AS cost_per_km,
+       SUM(cost) / NULLIF(SUM(liters), 0) AS cost_per_liter,
+       MIN(fill_at) AS first_fuel_load,
+       MAX(fill_at) AS last_fuel_load
+FROM flagged
+WHERE {group_column} IS NOT NULL {group_filter}
+GROUP BY {group_column}
+ORDER BY {group_column}
+"""
+
+_ANOMALIES_SQL = """
+SELECT fill_id, vehicle_id, driver_id, fill_at, liters, cost, odometer_km, distance_km, hours_since_previous,
+       km_per_liter, cost_per_km, vehicle_km_per_liter, anomaly
+FROM flagged
+WHERE anomaly IS NOT NULL
+ORDER BY fill_at DESC, fill_id DESC
+LIMIT :limit
+"""
+
+
+def _flagged_fills_sql(vehicle_filter=''):
+    gas_columns = GasManagerModel.__mapper__.columns
+    odo_columns = OdometerModel.__mapper__.columns
+
+    unit_factors = ' '.join("WHEN '{}' THEN {}".format(unit, factor) for unit, factor in KM_PER_UNIT.items())
+
+    return _FLAGGED_FILLS_SQL.format(
+        gas_table=GasManagerModel.__tablename__, odo_table=OdometerModel.__tablename__,
+        gas_id=gas_columns['gas_record_id'].name, gas_vehicle=gas_columns['gas_vehicle_id'].name,
+        gas_driver=gas_columns['gas_driver_id'].name, gas_date=gas_columns['gas_record_date'].name,
+        gas_hour=gas_columns['gas_record_hour'].name, gas_liters=gas_columns['gas_record_liters'].name,
+        gas_cost=gas_columns['gas_record_cost'].name, odo_value=odo_columns['odometer_value'].name,
+        odo_unit=odo_columns['odometer_unit'].name, odo_vehicle=odo_columns['odometer_vehicle_id'].name,
+        odo_date=odo_columns['odometer_register_date'].name, unit_factors=unit_factors,
+        vehicle_filter=vehicle_filter
+    )
+
+
+def date_range(date_from=None, date_to=None):
+    r"""
+    Get the range of the analysis: up to date_to (excluded, tomorrow by default) and from date_from
+    (ANALYTICS_DEFAULT_DAYS before date_to by default).
+
+    :param date_from: First date included, ISO string or date.
+    :param date_to: Last date excluded, ISO string or date.
+    :return date_from, date_to: The dates of the range.
+    :raise ValueError: When a date is malformed or the range is empty.
+    """
+
+    date_to = date.fromisoformat(str(date_to)) if date_to else date.today() + timedelta(days=1)
+
+    if date_from:
+        date_from = date.fromisoformat(str(date_from))
+    else:
+        date_from = date_to - timedelta(days=cfg_app.analytics_default_days)
+
+    if date_from >= date_to:
+        raise ValueError('Empty date range: {} to {}'.format(date_from, date_to))
+
+    return date_from, date_to
+
+
+def _query_params(date_from, date_to, **params):
+    params.update({
+        'date_from': date_from,
+        'date_to': date_to,
+        'min_km_liter': cfg_app.fuel_min_km_liter,
+        'max_km_liter': cfg_app.fuel_max_km_liter,
+        'min_fills': cfg_app.fuel_anomaly_min_fills,
+        'zscore': cfg_app.fuel_anomaly_zscore
+    })
+
+    return params
+
+
+def _rounded(row):
+    return {key: round(value, 3) if isinstance(value, float) else value for key, value in row.items()}
+
+
+def _efficiency_summary(session, group_column, date_from, date_to, vehicle_id=None, driver_id=None):
+    vehicle_filter = 'AND g."{}" = :vehicle_id'.format(GasManagerModel.__mapper__.columns['gas_vehicle_id'].name) \
+        if vehicle_id is not None else ''
+
+    # The driver filter is applied after the windows: the intervals of a vehicle span the loads of every driver
+    group_filter = 'AND driver_id = :driver_id' if driver_id is not None else ''
+
+    statement = text(_flagged_fills_sql(vehicle_filter) + _SUMMARY_SQL.format(group_column=group_column,
+                                                                              group_filter=group_filter))
+
+    rows = session.execute(statement, _query_params(date_from, date_to, vehicle_id=vehicle_id, driver_id=driver_id))
+
+    summary = [_rounded(dict(row)) for row in rows]
+
+    logger.info('Fuel efficiency by %s from %s to %s: %s rows', group_column, date_from, date_to, len(summary))
+
+    return summary
+
+
+def get_efficiency_by_vehicle(session, date_from, date_to, vehicle_id=None):
+    r"""
+    Get the fuel efficiency of each vehicle over the date range.
+
+    :param session: Database session.
+    :param date_from: First date included.
+    :param date_to: Last date excluded.
+    :param vehicle_id: Only this vehicle, every vehicle when None.
+    :return summary: List of dictionaries: fuel loads, liters, cost, distance, km/L, cost per km and liter, anomalies.
+    """
+
+    return _efficiency_summary(session, 'vehicle_id', date_from, date_to, vehicle_id=vehicle_id)
+
+
+def get_efficiency_by_driver(session, date_from, date_to, driver_id=None):
+    r"""
+    Get the fuel efficiency of each driver over the date range, over the intervals closed by their fuel loads.
+
+    :param session: Database session.
+    :param date_from: First date included.
+    :param date_to: Last date excluded.
+    :param driver_id: Only this driver, every driver when None.
+    :return summary: List of dictionaries: fuel loads, liters, cost, distance, km/L, cost per km and liter, anomalies.
+    """
+
+    return _efficiency_summary(session, 'driver_id', date_from, date_to, driver_id=driver_id)
+
+
+def get_fuel_anomalies(session, date_from, date_to, vehicle_id=None, limit=100):
+    r"""
+    Get the fuel loads flagged over the date range, the most recent first.
+
+    :param session: Database session.
+    :param date_from: First date included.
+    :param date_to: Last date excluded.
+    :param vehicle_id: Only this vehicle, every vehicle when None.
+    :param limit: Maximum number of fuel loads returned.
+    :return anomalies: List of dictionaries with the fuel load, its interval and its anomaly.
+    """
+
+    vehicle_filter = 'AND g."{}" = :vehicle_id'.format(GasManagerModel.__mapper__.columns['gas_vehicle_id'].name) \
+        if vehicle_id is not None else ''
+
+    statement = text(_flagged_fills_sql(vehicle_filter) + _ANOMALIES_SQL)
+
+    rows = session.execute(statement, _query_params(date_from, date_to, vehicle_id=vehicle_id, limit=limit))
+
+    anomalies = []
+
+    for row in rows:
+        anomaly = _rounded(dict(row))
+        anomaly['description'] = FUEL_ANOMALIES.get(anomaly['anomaly'])
+
+        anomalies.append(anomaly)
+
+    return anomalies
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+from flask import Blueprint, request
+from db_controller.database_backend import *
+from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
+from handler_controller.messages import SuccessMsg, ErrorMsg
+from logger_controller.logger_control import *
+from utilities.Utility import *
+
+cfg_app = get_config_settings_app()
+fuel_analytics_api = Blueprint('fuel_analytics_api', __name__)
+logger = configure_logger('ws')
+
+# The analytics queries are imported by the endpoints on their first call, like the models of the other blueprints.
+
+
+@fuel_analytics_api.route('/efficiency/vehicles', methods=['GET'])
+def endpoint_efficiency_vehicles():
+    r"""
+    Fuel efficiency of each vehicle: km/L, cost per km and liter, anomalous fuel loads.
+
+    Query params: desde (included), hasta (excluded), vehiculo.
+    """
+
+    from .fuel_efficiency import date_range, get_efficiency_by_vehicle
+
+    session_db = get_db_session()
+
+    try:
+
+        date_from, date_to = date_range(request.args.get('desde'), request.args.get('hasta'))
+        vehicle_id = get_int_arg(request.args, 'vehiculo')
+
+    except ValueError as exc:
+        logger.error('Analytics params not valid: %s', str(exc))
+
+        return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+    efficiency = get_efficiency_by_vehicle(session_db, date_from, date_to, vehicle_id)
+
+    if not efficiency:
+        return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+    return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, {
+        'desde': date_from, 'hasta': date_to, 'results': efficiency
+    })
+
+
+@fuel_analytics_api.route('/efficiency/drivers', methods=['GET'])
+def endpoint_efficiency_drivers():
+    r"""
+    Fuel efficiency of each driver, over the intervals closed by their fuel loads.
+
+    Query params: desde (included), hasta (excluded), conductor.
+    """
+
+    from .fuel_efficiency import date_range, get_efficiency_by_driver
+
+    session_db = get_db_session()
+
+    try:
+
+        date_from, date_to = date_range(request.args.get('desde'), request.args.get('hasta'))
+        driver_id = get_int_arg(request.args, 'conductor')
+
+    except ValueError as exc:
+        logger.error('Analytics params not valid: %s', str(exc))
+
+        return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+    efficiency = get_efficiency_by_driver(session_db, date_from, date_to, driver_id)
+
+    if not efficiency:
+        return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+    return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, {
+        'desde': date_from, 'hasta': date_to, 'results': efficiency
+    })
+
+
+@fuel_analytics_api.route('/efficiency/anomalies', methods=['GET'])
+def endpoint_efficiency_anomalies():
+    r"""
+    Anomalous fuel loads, the most recent first.
+
+    Query params: desde (included), hasta (excluded), vehiculo, limit (100 by default).
+    """
+
+    from .fuel_efficiency import date_range, get_fuel_anomalies
+
+    session_db = get_db_session()
+
+    limit = request.args.get('limit', 100, type=int)
+
+    try:
+
+        date_from, date_to = date_range(request.args.get('desde'), request.args.get('hasta'))
+        vehicle_id = get_int_arg(request.args, 'vehiculo')
+
+    except ValueError as exc:
+        logger.error('Analytics params not valid: %s', str(exc))
+
+        return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+    anomalies = get_fuel_anomalies(session_db, date_from, date_to, vehicle_id, max(limit, 1))
+
+    if not anomalies:
+        return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+    return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, {
+        'desde': date_from, 'hasta': date_to, 'results': anomalies
+    })
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+PostgreSQL DB backend.
+
+Documentation:
+    About the anomalous fuel loads flagged by the fuel anomaly detection, kept for review:
+    - Insert data, once per fuel load and anomaly
+    - Search data by vehicle, driver, anomaly, review status and date
+    - Update the review status
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+from apps.vehicle.VehicleModel import VehicleModel
+from apps.driver.DriverModel import DriverModel
+from sqlalchemy_filters import apply_filters
+from sqlalchemy import Column, Integer, String, DateTime, Sequence, Float, Index, ForeignKey
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from db_controller.database_backend import *
+from db_controller.query_layer import lookup_by_id, keyset_page, page_result
+from .GasManagerModel import GasManagerModel
+
+cfg_db = get_config_settings_db()
+
+FUEL_ANOMALY_ID_SEQ = Sequence('fuel_anomaly_seq')  # define sequence explicitly
+
+# Review status of a fuel load flagged: pending until someone confirms or discards the abuse
+REVIEW_STATUSES = ('pendiente', 'confirmada', 'descartada')
+
+
+class FuelAnomalyModel(Base):
+    r"""
+    Class to instance the anomalous fuel loads (FuelAnomalyModel) on the database.
+    Transactions:
+     - Insert: Add the anomalies of the fuel loads, an anomaly of a fuel load is stored once.
+     - Update: Review status of the anomaly.
+     - Select: Pages of the anomalies.
+    """
+
+    __tablename__ = cfg_db.gas_manager_anomaly_table.__str__()
+    __table_args__ = (
+        Index('uq_fuel_anomaly_record_type', cfg_db.GasManagerAnomaly.anomaly_gas_record_id,
+              cfg_db.GasManagerAnomaly.anomaly_type, unique=True),
+        Index('ix_fuel_anomaly_vehicle_date', cfg_db.GasManagerAnomaly.anomaly_vehicle_id,
+              cfg_db.GasManagerAnomaly.anomaly_fill_date),
+    )
+
+    anomaly_id = Column(cfg_db.GasManagerAnomaly.anomaly_id, Integer, FUEL_ANOMALY_ID_SEQ,
+                        primary_key=True, server_default=FUEL_ANOMALY_ID_SEQ.next_value())
+    anomaly_type = Column(cfg_db.GasManagerAnomaly.anomaly_type, String, nullable=False)
+    anomaly_score = Column(cfg_db.GasManagerAnomaly.anomaly_score, Float, nullable=True)
+    anomaly_detail = Column(cfg_db.GasManagerAnomaly.anomaly_detail, String, nullable=True)
+    anomaly_fill_date = Column(cfg_db.GasManagerAnomaly.anomaly_fill_date, DateTime, nullable=False)
+    anomaly_detected_date = Column(cfg_db.GasManagerAnomaly.anomaly_detected_date, DateTime, nullable=False,
+                                   server_default=func.now())
+    anomaly_status = Column(cfg_db.GasManagerAnomaly.anomaly_status, String, nullable=False,
+                            server_default=REVIEW_STATUSES[0])
+
+    anomaly_gas_record_id = Column(
+        cfg_db.GasManagerAnomaly.anomaly_gas_record_id,
+        Integer,
+        ForeignKey(GasManagerModel.__table__.c[cfg_db.GasManager.gas_registro_id], onupdate='CASCADE',
+                   ondelete='CASCADE'),
+        nullable=False
+    )
+
+    anomaly_vehicle_id = Column(
+        cfg_db.GasManagerAnomaly.anomaly_vehicle_id,
+        Integer,
+        ForeignKey(VehicleModel.__table__.c[cfg_db.GasVehicle.vehiculo_id], onupdate='CASCADE', ondelete='CASCADE'),
+        nullable=False
+    )
+
+    anomaly_driver_id = Column(
+        cfg_db.GasManagerAnomaly.anomaly_driver_id,
+        Integer,
+        ForeignKey(DriverModel.__table__.c[cfg_db.GasDriver.driver_id], onupdate='CASCADE', ondelete='SET NULL'),
+        nullable=True
+    )
+
+    @staticmethod
+    def insert_events(session, events):
+        """
+        Store the anomalies flagged, in one INSERT ... ON CONFLICT DO NOTHING on (fuel load, anomaly)
+
+        :param session: Database session, the one which inserted the fuel loads
+        :param events: List of dictionaries keyed by the FuelAnomalyModel attributes
+        :return: int: Number of anomalies given
+        """
+
+        if not events:
+            return 0
+
+        mapper_columns = FuelAnomalyModel.__mapper__.columns
+
+        statement = pg_insert(FuelAnomalyModel.__table__).on_conflict_do_nothing(
+            index_elements=[mapper_columns['anomaly_gas_record_id'], mapper_columns['anomaly_type']]
+        )
+
+        session.execute(statement, [{mapper_columns[attr].key: value for attr, value in event.items()}
+                                    for event in events])
+
+        logger.info('Fuel anomalies flagged: %s', len(events))
+
+        return len(events)
+
+    @staticmethod
+    def get_anomalies_by_filters(session, filter_spec=None, limit=None, cursor=None, with_total=False):
+        """
+        Get one page, keyset paginated on anomaly_id, of the anomalies registered on database matching the filters.
+
+        :param session: Database session
+        :param filter_spec: List of sqlalchemy_filters specifications over the FuelAnomalyModel attributes
+        :param limit: Number of anomalies of the page
+        :param cursor: Token of the page to get, returned as next_cursor by the previous page
+        :param with_total: Include the count of all the anomalies matching the filters
+        :return: dict
+        """
+
+        query = session.query(FuelAnomalyModel)
+
+        if filter_spec:
+            query = apply_filters(query, filter_spec)
+
+        query_result, next_cursor, total = keyset_page(query, FuelAnomalyModel.anomaly_id, limit, cursor, with_total)
+
+        logger.info('Query filtered resultSet: %s rows, next cursor: %s', len(query_result), next_cursor)
+
+        anomalies_data = [FuelAnomalyModel.to_dict(anomaly) for anomaly in query_result]
+
+        return page_result(anomalies_data, next_cursor, limit, total)
+
+    @staticmethod
+    def update_status(session, anomaly_id, status):
+        """
+        Set the review status of an anomaly
+
+        :param session: Database session
+        :param anomaly_id: The anomaly to update
+        :param status: One of REVIEW_STATUSES
+        :return: dict: The anomaly updated, None when it does not exist
+        :raise ValueError: When the status is not supported
+        """
+
+        if status not in REVIEW_STATUSES:
+            raise ValueError('Invalid review status: {}'.format(status))
+
+        anomaly = lookup_by_id(session, FuelAnomalyModel, anomaly_id)
+
+        if anomaly is None:
+            return None
+
+        anomaly.anomaly_status = status
+
+        session.flush()
+
+        logger.info('Fuel anomaly %s reviewed: %s', anomaly_id, status)
+
+        return FuelAnomalyModel.to_dict(anomaly)
+
+    @staticmethod
+    def to_dict(anomaly):
+        """
+        Get the response dictionary of an anomaly
+
+        :param anomaly: Object with the FuelAnomalyModel attributes
+        :return: dict
+        """
+
+        return {
+            "id_anomaly": anomaly.anomaly_id,
+            "gas_record_anomaly": anomaly.anomaly_gas_record_id,
+            "vehicle_anomaly": anomaly.anomaly_vehicle_id,
+            "driver_anomaly": anomaly.anomaly_driver_id,
+            "type_anomaly": anomaly.anomaly_type,
+            "score_anomaly": anomaly.anomaly_score,
+            "detail_anomaly": anomaly.anomaly_detail,
+            "fill_date_anomaly": anomaly.anomaly_fill_date,
+            "detected_date_anomaly": anomaly.anomaly_detected_date,
+            "status_anomaly": anomaly.anomaly_status
+        }
+
+    def __repr__(self):
+        return "<FuelAnomalyModel(anomaly_id='%s', " \
+               "                  anomaly_gas_record_id='%s', " \
+               "                  anomaly_vehicle_id='%s', " \
+               "                  anomaly_type='%s', " \
+               "                  anomaly_score='%s', " \
+               "                  anomaly_status='%s')>" % (self.anomaly_id, self.anomaly_gas_record_id,
+                                                            self.anomaly_vehicle_id, self.anomaly_type,
+                                                            self.anomaly_score, self.anomaly_status)
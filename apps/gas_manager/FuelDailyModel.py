@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+PostgreSQL DB backend.
+
+Documentation:
+    About the daily totals of the fuel loads, per day, vehicle and gas station:
+    - Added up on the transaction which inserts the fuel loads
+    - Search data by date range, vehicle and gas station, rolled up by any of them
+
+The table is maintained incrementally: every statement inserting fuel loads is followed, on the same transaction,
+by one ``INSERT ... SELECT ... GROUP BY ... ON CONFLICT DO UPDATE`` adding the loads just inserted to the totals of
+their (day, vehicle, gas station). The totals are therefore exact and committed (or rolled back) with the loads, and
+the reports read O(days) rows instead of O(fuel loads). The cost of a load includes its tax, the tax of the totals is
+cost * rate / (100 + rate). Fuel loads without gas station are added up under the empty name.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+from apps.vehicle.VehicleModel import VehicleModel
+from sqlalchemy import Column, Integer, String, Date, Float, ForeignKey, select
+from db_controller.database_backend import *
+from .GasManagerModel import GasManagerModel
+
+cfg_db = get_config_settings_db()
+
+# Request name of each level of the roll ups -> FuelDailyModel attribute
+DAILY_GROUPS = {
+    'dia': 'daily_date',
+    'vehiculo': 'daily_vehicle_id',
+    'gasolinera': 'daily_station_name',
+}
+
+_ADD_LOADS_SQL = """
+INSERT INTO "{daily}" ("{date}", "{vehicle}", "{station}", "{loads}", "{liters}", "{cost}", "{tax}")
+SELECT g."{gas_date}", g."{gas_vehicle}", COALESCE(g."{gas_station}", ''), COUNT(*), SUM(g."{gas_liters}"),
+       SUM(g."{gas_cost}"),
+       SUM(g."{gas_cost}" * COALESCE(g."{gas_tax_rate}", 0) / (100 + COALESCE(g."{gas_tax_rate}", 0)))
+FROM "{gas}" g
+WHERE {gas_filter}
+GROUP BY 1, 2, 3
+ORDER BY 1, 2, 3
+ON CONFLICT ("{date}", "{vehicle}", "{station}") DO UPDATE SET
+    "{loads}" = "{daily}"."{loads}" + EXCLUDED."{loads}",
+    "{liters}" = "{daily}"."{liters}" + EXCLUDED."{liters}",
+    "{cost}" = "{daily}"."{cost}" + EXCLUDED."{cost}",
+    "{tax}" = "{daily}"."{tax}" + EXCLUDED."{tax}"
+"""
+
+
+class FuelDailyModel(Base):
+    r"""
+    Class to instance the daily totals of the fuel loads (FuelDailyModel) on the database.
+    Transactions:
+     - Insert: Add the fuel loads inserted to the totals of their day, vehicle and gas station.
+     - Select: Totals over a date range, rolled up by day, vehicle and/or gas station.
+    """
+
+    __tablename__ = cfg_db.gas_manager_daily_table.__str__()
+
+    daily_date = Column(cfg_db.GasManagerDaily.daily_date, Date, primary_key=True)
+    daily_vehicle_id = Column(
+        cfg_db.GasManagerDaily.daily_vehicle_id,
+        Integer,
+        ForeignKey(VehicleModel.__table__.c[cfg_db.GasVehicle.vehiculo_id], onupdate='CASCADE', ondelete='CASCADE'),
+        primary_key=True,
+        autoincrement=False
+    )
+    daily_station_name = Column(cfg_db.GasManagerDaily.daily_station_name, String, primary_key=True)
+    daily_loads = Column(cfg_db.GasManagerDaily.daily_loads, Integer, nullable=False)
+    daily_liters = Column(cfg_db.GasManagerDaily.daily_liters, Float, nullable=False)
+    daily_cost = Column(cfg_db.GasManagerDaily.daily_cost, Float, nullable=False)
+    daily_tax = Column(cfg_db.GasManagerDaily.daily_tax, Float, nullable=False)
+
+    @staticmethod
+    def add_fuel_loads(session, record_ids):
+        """
+        Add the fuel loads given to the daily totals, in one statement on the transaction of the session
+
+        :param session: Database session, the one which inserted the fuel loads
+        :param record_ids: List of the gas_record_id of the fuel loads inserted, each one added once
+        :return: int: Number of daily totals inserted or updated
+        """
+
+        if not record_ids:
+            return 0
+
+        gas_id_column = GasManagerModel.__mapper__.columns['gas_record_id'].name
+
+        result = session.execute(
+            text(_add_loads_sql('g."{}" = ANY(:record_ids)'.format(gas_id_column))),
+            {'record_ids': list(record_ids)}
+        )
+
+        return result.rowcount
+
+    @staticmethod
+    def get_totals(session, date_from, date_to, group_by=('dia', 'vehiculo', 'gasolinera'), vehicle_id=None,
+                   station_name=None):
+        """
+        Get the totals of the fuel loads over a date range, read from the daily totals and rolled up by the groups
+
+        :param session: Database session
+        :param date_from: First date included
+        :param date_to: Last date excluded
+        :param group_by: Levels of the roll up, names of DAILY_GROUPS; the totals of the whole range when empty
+        :param vehicle_id: Only this vehicle, every vehicle when None
+        :param station_name: Only this gas station, every gas station when None
+        :return: list: The totals ordered by the groups
+        :raise ValueError: When a group is not supported
+        """
+
+        unknown_groups = [group_name for group_name in group_by if group_name not in DAILY_GROUPS]
+
+        if unknown_groups:
+            raise ValueError('Invalid groups: {}'.format(', '.join(unknown_groups)))
+
+        group_columns = [getattr(FuelDailyModel, DAILY_GROUPS[group_name]).label(group_name)
+                         for group_name in group_by]
+
+        statement = select(group_columns + [
+            func.sum(FuelDailyModel.daily_loads).label('cargas'),
+            func.sum(FuelDailyModel.daily_liters).label('litros'),
+            func.sum(FuelDailyModel.daily_cost).label('costo'),
+            func.sum(FuelDailyModel.daily_tax).label('impuesto')
+        ]).where(FuelDailyModel.daily_date >= date_from).where(FuelDailyModel.daily_date < date_to)
+
+        if vehicle_id is not None:
+            statement = statement.where(FuelDailyModel.daily_vehicle_id == vehicle_id)
+
+        if station_name is not None:
+            statement = statement.where(FuelDailyModel.daily_station_name == station_name)
+
+        if group_columns:
+            statement = statement.group_by(*group_columns).order_by(*group_columns)
+
+        totals = [{key: round(value, 3) if isinstance(value, float) else value for key, value in row.items()}
+                  for row in session.execute(statement) if row['cargas']]
+
+        logger.info('Fuel daily totals from %s to %s by %s: %s rows', date_from, date_to, ', '.join(group_by),
+                    len(totals))
+
+        return totals
+
+    def __repr__(self):
+        return "<FuelDailyModel(daily_date='%s', " \
+               "                daily_vehicle_id='%s', " \
+               "                daily_station_name='%s', " \
+               "                daily_loads='%s', " \
+               "                daily_liters='%s', " \
+               "                daily_cost='%s', " \
+               "                daily_tax='%s')>" % (self.daily_date, self.daily_vehicle_id, self.daily_station_name,
+                                                     self.daily_loads, self.daily_liters, self.daily_cost,
+                                                     self.daily_tax)
+
+
+def _add_loads_sql(gas_filter):
+    gas_columns = GasManagerModel.__mapper__.columns
+    daily_columns = FuelDailyModel.__mapper__.columns
+
+    return _ADD_LOADS_SQL.format(
+        daily=FuelDailyModel.__tablename__, gas=GasManagerModel.__tablename__,
+        date=daily_columns['daily_date'].name, vehicle=daily_columns['daily_vehicle_id'].name,
+        station=daily_columns['daily_station_name'].name, loads=daily_columns['daily_loads'].name,
+        liters=daily_columns['daily_liters'].name, cost=daily_columns['daily_cost'].name,
+        tax=daily_columns['daily_tax'].name, gas_date=gas_columns['gas_record_date'].name,
+        gas_vehicle=gas_columns['gas_vehicle_id'].name, gas_station=gas_columns['gas_station_name'].name,
+        gas_liters=gas_columns['gas_record_liters'].name, gas_cost=gas_columns['gas_record_cost'].name,
+        gas_tax_rate=gas_columns['gas_record_tax_rate'].name, gas_filter=gas_filter
+    )
+
+
+# The fuel loads stored before the daily totals existed are added up once, when the database is migrated; on a new
+# database the fuel loads table is still empty.
+register_schema_migration(5, _add_loads_sql('TRUE'))
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+PostgreSQL DB backend.
+
+Documentation:
+    About the fuel loads (GasManager) data on the database to generate operations from endpoint of the API:
+    - Insert data, idempotent on the pump transaction id
+    - Search data
+
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+from datetime import date, datetime, time as time_of_day
+from apps.vehicle.VehicleModel import VehicleModel
+from apps.driver.DriverModel import DriverModel
+from sqlalchemy_filters import apply_filters
+from sqlalchemy import Column, Integer, String, Date, Time, Sequence, Float, Index, ForeignKey
+from db_controller.database_backend import *
+from db_controller.query_layer import (lookup_one, model_values, insert_returning, keyset_page, page_result,
+                                       stream_query, EXPORT_CHUNK_SIZE)
+from db_controller import mvc_exceptions as mvc_exc
+
+cfg_db = get_config_settings_db()
+
+GAS_MANAGER_ID_SEQ = Sequence('gas_manager_seq')  # define sequence explicitly
+
+
+class GasManagerModel(Base):
+    r"""
+    Class to instance the data of the fuel loads (GasManagerModel) on the database.
+    Transactions:
+     - Insert: Add the fuel load if its pump transaction is not registered yet.
+     - Select: Pages and exports of the fuel loads.
+    """
+
+    __tablename__ = cfg_db.gas_manager_vehicle_table.__str__()
+    __table_args__ = (
+        # Idempotency key: a pump transaction is stored once, whatever the number of times it is sent
+        Index('uq_gas_manager_transaction', cfg_db.GasManager.gas_transaction_id, unique=True),
+        # Fuel loads of a vehicle over a period of time
+        Index('ix_gas_manager_vehicle_date', cfg_db.GasManager.gas_vehicle_id, cfg_db.GasManager.gas_registro_date),
+    )
+
+    gas_record_id = Column(cfg_db.GasManager.gas_registro_id, Integer, GAS_MANAGER_ID_SEQ,
+                           primary_key=True, server_default=GAS_MANAGER_ID_SEQ.next_value())
+    gas_record_date = Column(cfg_db.GasManager.gas_registro_date, Date, nullable=False)
+    gas_record_hour = Column(cfg_db.GasManager.gas_registro_hour, Time, nullable=False)
+    gas_record_liters = Column(cfg_db.GasManager.gas_registro_liters, Float, nullable=False)
+    gas_record_cost = Column(cfg_db.GasManager.gas_registro_cost, Float, nullable=False)
+    gas_record_tax_rate = Column(cfg_db.GasManager.gas_registro_tax_rate, Float, nullable=True)
+    gas_station_name = Column(cfg_db.GasManager.gas_gasolinera_name, String, nullable=True)
+    gas_station_address = Column(cfg_db.GasManager.gas_gasolinera_address, String, nullable=True)
+    gas_document_id = Column(cfg_db.GasManager.gas_document_id, Integer, nullable=True)
+    gas_transaction_id = Column(cfg_db.GasManager.gas_transaction_id, String, nullable=False)
+
+    gas_vehicle_id = Column(
+        cfg_db.GasManager.gas_vehicle_id,
+        Integer,
+        ForeignKey(VehicleModel.__table__.c[cfg_db.GasVehicle.vehiculo_id], onupdate='CASCADE', ondelete='CASCADE'),
+        nullable=False
+    )
+
+    gas_driver_id = Column(
+        cfg_db.GasManager.gas_driver_id,
+        Integer,
+        ForeignKey(DriverModel.__table__.c[cfg_db.GasDriver.driver_id], onupdate='CASCADE', ondelete='SET NULL'),
+        nullable=True,
+        index=True
+    )
+
+    def __init__(self, data_gas):
+        self.gas_record_date = _parse_date(data_gas.get('gasolina_registro_fecha'))
+        self.gas_record_hour = _parse_time(data_gas.get('gasolina_registro_hora'))
+        self.gas_record_liters = data_gas.get('gasolina_registro_litros')
+        self.gas_record_cost = data_gas.get('gasolina_registro_costo')
+        self.gas_record_tax_rate = data_gas.get('gasolina_registro_impuesto')
+        self.gas_station_name = data_gas.get('gasolina_nombre_gasolinera')
+        self.gas_station_address = data_gas.get('gasolina_ubicacion_gasolinera')
+        self.gas_document_id = data_gas.get('gasolina_documento_id')
+        self.gas_transaction_id = data_gas.get('gasolina_transaccion_id')
+        self.gas_vehicle_id = data_gas.get('gasolina_vehiculo_id')
+        self.gas_driver_id = data_gas.get('gasolina_conductor_id')
+
+    def insert_data(self, session, data):
+        """
+        Function to insert the fuel load on database, in a single INSERT ... ON CONFLICT DO NOTHING ... RETURNING
+        statement on its pump transaction id. A transaction sent again gets the row stored the first time.
+        The fuel load inserted is added to its daily totals and scored by the fuel anomaly detection on the same
+        transaction.
+
+        :param session: Session database object
+        :param data: Dictionary to insert new the data containing on the db
+        :return: endpoint_response, inserted: The fuel load dictionary and whether it was inserted by this call
+        """
+
+        from .FuelDailyModel import FuelDailyModel
+        from .fuel_anomaly_detection import detect_fuel_anomalies
+
+        endpoint_response = None
+        inserted = False
+
+        try:
+
+            row_inserted = insert_returning(session, GasManagerModel, model_values(self), ['gas_transaction_id'])
+
+            if row_inserted:
+                logger.info('Fuel load ID Inserted: %s', str(row_inserted.gas_record_id))
+
+                FuelDailyModel.add_fuel_loads(session, [row_inserted.gas_record_id])
+
+                anomalies = detect_fuel_anomalies(session, [row_inserted.gas_record_id])
+
+                endpoint_response = GasManagerModel.to_dict(row_inserted)
+                endpoint_response['anomalies'] = anomalies.get(row_inserted.gas_record_id, [])
+                inserted = True
+            else:
+                row_stored = GasManagerModel.get_by_transaction(session, self.gas_transaction_id)
+
+                logger.info('Fuel load of the transaction %s already stored', str(self.gas_transaction_id))
+
+                if row_stored:
+                    endpoint_response = GasManagerModel.to_dict(row_stored)
+
+        except SQLAlchemyError as exc:
+            endpoint_response = None
+            session.rollback()
+
+            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
+                                                                                             str(exc.code)))
+            raise mvc_exc.IntegrityError(
+                'Row not stored in "{}". IntegrityError: {}'.format(data.get('gasolina_transaccion_id'),
+                                                                    str(str(exc.args) + ':' + str(exc.code)))
+            )
+
+        return endpoint_response, inserted
+
+    @staticmethod
+    def get_by_transaction(session, transaction_id):
+        """
+        Get the fuel load row of a pump transaction
+
+        :param session: Database session object
+        :param transaction_id: The pump transaction id (idempotency key)
+        :return: row: The row on database registered or None
+        """
+
+        return lookup_one(session, GasManagerModel, gas_transaction_id=transaction_id)
+
+    @staticmethod
+    def get_gas_records_by_filters(session, filter_spec=None, limit=None, cursor=None, with_total=False):
+        """
+        Get one page, keyset paginated on gas_record_id, of the fuel loads registered on database matching the
+        filters.
+
+        :param session: Database session
+        :param filter_spec: List of sqlalchemy_filters specifications over the GasManagerModel attributes
+        :param limit: Number of fuel loads of the page
+        :param cursor: Token of the page to get, returned as next_cursor by the previous page
+        :param with_total: Include the count of all the fuel loads matching the filters
+        :return: dict
+        """
+
+        query = session.query(GasManagerModel)
+
+        if filter_spec:
+            query = apply_filters(query, filter_spec)
+
+        query_result, next_cursor, total = keyset_page(query, GasManagerModel.gas_record_id, limit, cursor,
+                                                       with_total)
+
+        logger.info('Query filtered resultSet: %s rows, next cursor: %s', len(query_result), next_cursor)
+
+        gas_records_data = [GasManagerModel.to_dict(gas_record) for gas_record in query_result]
+
+        return page_result(gas_records_data, next_cursor, limit, total)
+
+    @staticmethod
+    def export_by_filters(filter_spec=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Get all the fuel loads registered on database matching the filters, read through a server-side cursor while
+        they are consumed.
+
+        :param filter_spec: List of sqlalchemy_filters specifications over the GasManagerModel attributes
+        :param chunk_size: Number of fuel loads fetched from the cursor at a time
+        :return: Generator of the fuel load dictionaries, ordered by gas_record_id
+        """
+
+        def build_query(session):
+            query = session.query(GasManagerModel)
+
+            if filter_spec:
+                query = apply_filters(query, filter_spec)
+
+            return query.order_by(GasManagerModel.gas_record_id)
+
+        return (GasManagerModel.to_dict(gas_record) for gas_record in stream_query(build_query, chunk_size))
+
+    @staticmethod
+    def to_dict(gas_record):
+        """
+        Get the response dictionary of a fuel load row, either a model instance or a row returned by an INSERT
+
+        :param gas_record: Object with the GasManagerModel attributes
+        :return: dict
+        """
+
+        return {
+            "id_gas_record": gas_record.gas_record_id,
+            "date_gas_record": gas_record.gas_record_date,
+            "hour_gas_record": gas_record.gas_record_hour,
+            "liters_gas_record": gas_record.gas_record_liters,
+            "cost_gas_record": gas_record.gas_record_cost,
+            "tax_rate_gas_record": gas_record.gas_record_tax_rate,
+            "station_name": gas_record.gas_station_name,
+            "station_address": gas_record.gas_station_address,
+            "vehicle_gas_record": gas_record.gas_vehicle_id,
+            "driver_gas_record": gas_record.gas_driver_id,
+            "document_gas_record": gas_record.gas_document_id,
+            "transaction_gas_record": gas_record.gas_transaction_id
+        }
+
+    def __repr__(self):
+        return "<GasManagerModel(gas_record_id='%s', " \
+               "                 gas_record_date='%s', " \
+               "                 gas_record_hour='%s', " \
+               "                 gas_record_liters='%s', " \
+               "                 gas_record_cost='%s', " \
+               "                 gas_vehicle_id='%s', " \
+               "                 gas_driver_id='%s', " \
+               "                 gas_transaction_id='%s')>" % (self.gas_record_id, self.gas_record_date,
+                                                               self.gas_record_hour, self.gas_record_liters,
+                                                               self.gas_record_cost, self.gas_vehicle_id,
+                                                               self.gas_driver_id, self.gas_transaction_id)
+
+
+def _parse_date(value):
+    if value is None or isinstance(value, date):
+        return value
+
+    return datetime.strptime(str(value), "%Y-%m-%d").date()
+
+
+def _parse_time(value):
+    if value is None or isinstance(value, time_of_day):
+        return value
+
+    return time_of_day.fromisoformat(str(value))
+
+
+# Databases created before the fuel loads were mapped get the pump transaction id, filled in with the record id on
+# the rows already stored, and the indexes on the schema migration 3
+register_schema_migration(3, 'ALTER TABLE "{}" ADD COLUMN IF NOT EXISTS "{}" VARCHAR'.format(
+    GasManagerModel.__tablename__, cfg_db.GasManager.gas_transaction_id))
+
+register_schema_migration(3, 'UPDATE "{0}" SET "{1}" = \'legacy-\' || "{2}" WHERE "{1}" IS NULL'.format(
+    GasManagerModel.__tablename__, cfg_db.GasManager.gas_transaction_id, cfg_db.GasManager.gas_registro_id))
+
+register_schema_migration(3, 'ALTER TABLE "{}" ALTER COLUMN "{}" SET NOT NULL'.format(
+    GasManagerModel.__tablename__, cfg_db.GasManager.gas_transaction_id))
+
+register_schema_migration(3, 'CREATE UNIQUE INDEX IF NOT EXISTS uq_gas_manager_transaction ON "{}" ("{}")'.format(
+    GasManagerModel.__tablename__, cfg_db.GasManager.gas_transaction_id))
+
+register_schema_migration(3, 'CREATE INDEX IF NOT EXISTS ix_gas_manager_vehicle_date ON "{}" ("{}", "{}")'.format(
+    GasManagerModel.__tablename__, cfg_db.GasManager.gas_vehicle_id, cfg_db.GasManager.gas_registro_date))
@@ -0,0 +1,485 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Streaming detection of fuel-card abuse over the fuel loads inserted by the ingestion.
+
+Each process keeps the rolling statistics of the vehicles it has seen in a VehicleFuelState: one slot per vehicle in
+numpy arrays (EWMA mean and variance of the km/L, odometer and time of the last fuel load, tank capacity), so each
+fuel load is scored in O(1), in the order of its vehicle's fuel loads, against:
+ - the tank capacity of the vehicle (FUEL_TANK_CAPACITY_LITERS when not registered) plus FUEL_TANK_TOLERANCE;
+ - the time since the previous fuel load of the vehicle, at least FUEL_MIN_FILL_INTERVAL_MINUTES;
+ - the distance covered since the previous fuel load, which can not be zero nor negative;
+ - the km/L of the interval, within FUEL_MIN_KM_LITER..FUEL_MAX_KM_LITER and less than FUEL_ANOMALY_ZSCORE
+   deviations (at least MIN_RELATIVE_DEVIATION of the mean) away from the EWMA of the vehicle once it has
+   FUEL_ANOMALY_MIN_FILLS intervals.
+The odometer of a fuel load is the last reading of its vehicle at the time of the load. The anomalies flagged are
+stored on FuelAnomalyModel, on the transaction which inserted the fuel loads, for review.
+
+The database is the source of the state: the state of a vehicle is rebuilt by replaying its fuel loads of the last
+FUEL_ANOMALY_HISTORY_DAYS the first time the process sees it (after a restart). Whenever the last fuel load stored is
+not the last one scored by the process (loaded by another worker), only the fuel loads stored after the last one
+scored are replayed; the vehicle is rebuilt when that fuel load is not stored (scored on a transaction rolled back) or
+a fuel load older than it was stored meanwhile. The check costs one indexed query per batch, the replays are queried
+before taking the lock of the state, which is only held to apply them and score the batch.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import os
+import math
+import threading
+import numpy as np
+from datetime import date, datetime, timedelta
+from db_controller.database_backend import *
+from apps.vehicle.VehicleModel import VehicleModel
+from apps.odometer.OdometerModel import OdometerModel, KM_PER_UNIT
+from .GasManagerModel import GasManagerModel
+from .FuelAnomalyModel import FuelAnomalyModel
+
+cfg_app = get_config_settings_app()
+
+logger = configure_logger('db')
+
+# Anomaly of a fuel load -> description
+FUEL_ANOMALY_TYPES = {
+    'over_tank_capacity': 'Liters above the tank capacity of the vehicle',
+    'fills_too_close': 'Fuel load too close to the previous fuel load of the vehicle',
+    'no_distance': 'No distance covered since the previous fuel load of the vehicle',
+    'efficiency_out_of_range': 'Efficiency outside FUEL_MIN_KM_LITER..FUEL_MAX_KM_LITER',
+    'efficiency_outlier': 'Efficiency too far from the usual efficiency of the vehicle',
+}
+
+# Anomaly of a fuel load -> unit of its score
+FUEL_ANOMALY_SCORES = {
+    'over_tank_capacity': 'liters loaded / tank capacity',
+    'fills_too_close': 'minutes since the previous fuel load',
+    'no_distance': 'km/L of the interval, zero or negative',
+    'efficiency_out_of_range': 'km/L of the interval',
+    'efficiency_outlier': 'deviations of the km/L of the interval away from the usual',
+}
+
+# Floor of the deviation of the km/L, relative to the mean: the km/L of a vehicle naturally varies with the routes
+# and the fills, a steady vehicle would otherwise get a deviation so small that ordinary intervals were outliers
+MIN_RELATIVE_DEVIATION = 0.1
+
+_EPOCH = datetime(1970, 1, 1)
+
+_FILLS_SQL = """
+SELECT g."{gas_id}" AS fill_id, g."{gas_vehicle}" AS vehicle_id, g."{gas_driver}" AS driver_id,
+       g."{gas_date}" + g."{gas_hour}" AS fill_at, g."{gas_liters}" AS liters, v."{tank_capacity}" AS tank_capacity,
+       odometer.km AS odometer_km
+FROM "{gas_table}" g
+JOIN "{vehicle_table}" v ON v."{vehicle_id}" = g."{gas_vehicle}"
+LEFT JOIN LATERAL (
+    SELECT o."{odo_value}" * CASE o."{odo_unit}" {unit_factors} ELSE 1.0 END AS km
+    FROM "{odo_table}" o
+    WHERE o."{odo_vehicle}" = g."{gas_vehicle}" AND o."{odo_date}" <= g."{gas_date}" + g."{gas_hour}"
+    ORDER BY o."{odo_date}" DESC
+    LIMIT 1
+) odometer ON TRUE
+WHERE {fills_filter}
+ORDER BY g."{gas_vehicle}", g."{gas_date}", g."{gas_hour}", g."{gas_id}"
+"""
+
+_LAST_FILLS_SQL = """
+SELECT DISTINCT ON (g."{gas_vehicle}") g."{gas_vehicle}" AS vehicle_id, g."{gas_id}" AS fill_id
+FROM "{gas_table}" g
+WHERE g."{gas_vehicle}" = ANY(:vehicle_ids) AND g."{gas_id}" <> ALL(:record_ids) AND g."{gas_date}" >= :since
+ORDER BY g."{gas_vehicle}", g."{gas_date}" DESC, g."{gas_hour}" DESC, g."{gas_id}" DESC
+"""
+
+
+def _sql_names():
+    gas_columns = GasManagerModel.__mapper__.columns
+    odo_columns = OdometerModel.__mapper__.columns
+    vehicle_columns = VehicleModel.__mapper__.columns
+
+    return dict(
+        gas_table=GasManagerModel.__tablename__, odo_table=OdometerModel.__tablename__,
+        vehicle_table=VehicleModel.__tablename__, vehicle_id=vehicle_columns['vehicle_id'].name,
+        tank_capacity=vehicle_columns['vehicle_tank_capacity'].name,
+        gas_id=gas_columns['gas_record_id'].name, gas_vehicle=gas_columns['gas_vehicle_id'].name,
+        gas_driver=gas_columns['gas_driver_id'].name, gas_date=gas_columns['gas_record_date'].name,
+        gas_hour=gas_columns['gas_record_hour'].name, gas_liters=gas_columns['gas_record_liters'].name,
+        odo_value=odo_columns['odometer_value'].name, odo_unit=odo_columns['odometer_unit'].name,
+        odo_vehicle=odo_columns['odometer_vehicle_id'].name, odo_date=odo_columns['odometer_register_date'].name,
+        unit_factors=' '.join("WHEN '{}' THEN {}".format(unit, factor) for unit, factor in KM_PER_UNIT.items())
+    )
+
+
+class VehicleFuelState:
+    r"""
+    Class to instance the rolling statistics of the vehicles, one slot of each array per vehicle.
+    """
+
+    __slots__ = ('slots', 'ewma_mean', 'ewma_var', 'samples', 'last_odometer', 'last_fill_at', 'last_fill_id',
+                 'tank_capacity')
+
+    def __init__(self, size=1024):
+        # Vehicle id -> slot of the vehicle on the arrays
+        self.slots = dict()
+        # EWMA mean and variance of the km/L and number of intervals in them
+        self.ewma_mean = np.zeros(size)
+        self.ewma_var = np.zeros(size)
+        self.samples = np.zeros(size, dtype=np.int32)
+        # Odometer (km, NaN when unknown), time (epoch seconds, -1 when none) and id of the last fuel load scored
+        self.last_odometer = np.full(size, np.nan)
+        self.last_fill_at = np.full(size, -1, dtype=np.int64)
+        self.last_fill_id = np.zeros(size, dtype=np.int64)
+        # Liters, NaN when not registered
+        self.tank_capacity = np.full(size, np.nan)
+
+    def slot(self, vehicle_id):
+        r"""
+        Get the slot of a vehicle, allocating an empty one (and growing the arrays) when it is new.
+        """
+
+        slot = self.slots.get(vehicle_id)
+
+        if slot is not None:
+            return slot
+
+        slot = len(self.slots)
+
+        if slot >= self.samples.size:
+            size = self.samples.size * 2
+
+            self.ewma_mean = np.resize(self.ewma_mean, size)
+            self.ewma_var = np.resize(self.ewma_var, size)
+            self.samples = np.resize(self.samples, size)
+            self.last_odometer = np.resize(self.last_odometer, size)
+            self.last_fill_at = np.resize(self.last_fill_at, size)
+            self.last_fill_id = np.resize(self.last_fill_id, size)
+            self.tank_capacity = np.resize(self.tank_capacity, size)
+
+        self.slots[vehicle_id] = slot
+
+        self.reset(slot)
+
+        return slot
+
+    def reset(self, slot):
+        r"""
+        Empty the statistics of a slot, before replaying the fuel loads of its vehicle.
+        """
+
+        self.ewma_mean[slot] = 0.0
+        self.ewma_var[slot] = 0.0
+        self.samples[slot] = 0
+        self.last_odometer[slot] = np.nan
+        self.last_fill_at[slot] = -1
+        self.last_fill_id[slot] = 0
+        self.tank_capacity[slot] = np.nan
+
+    def position(self, slot):
+        r"""
+        Get the time (epoch seconds, -1 when none) and id of the last fuel load scored on a slot, the order of the
+        fuel loads of a vehicle.
+        """
+
+        return int(self.last_fill_at[slot]), int(self.last_fill_id[slot])
+
+    def score(self, slot, fill_id, fill_at, liters, odometer_km, tank_capacity):
+        r"""
+        Score a fuel load of the vehicle of the slot and add it to the statistics, in O(1).
+
+        :param slot: Slot of the vehicle.
+        :param fill_id: The gas_record_id of the fuel load.
+        :param fill_at: Time of the fuel load, epoch seconds.
+        :param liters: Liters loaded.
+        :param odometer_km: Odometer of the vehicle at the time of the load, NaN when unknown.
+        :param tank_capacity: Tank capacity registered for the vehicle, NaN when not registered.
+        :return anomalies: List of tuples (anomaly, score, detail).
+        """
+
+        anomalies = []
+
+        self.tank_capacity[slot] = tank_capacity
+
+        capacity = cfg_app.fuel_tank_capacity_liters if math.isnan(tank_capacity) else tank_capacity
+
+        if liters > capacity * (1 + cfg_app.fuel_tank_tolerance):
+            anomalies.append(('over_tank_capacity', liters / capacity,
+                              '{:.2f} L loaded, tank of {:.2f} L'.format(liters, capacity)))
+
+        last_fill_at = int(self.last_fill_at[slot])
+
+        if last_fill_at >= 0:
+            minutes = abs(fill_at - last_fill_at) / 60.0
+
+            if minutes < cfg_app.fuel_min_fill_interval_minutes:
+                anomalies.append(('fills_too_close', minutes,
+                                  '{:.0f} minutes since the previous fuel load'.format(minutes)))
+
+        # A fuel load older than the last one scored does not close an interval and leaves the statistics as they are
+        if fill_at < last_fill_at:
+            return anomalies
+
+        last_odometer = float(self.last_odometer[slot])
+
+        if not math.isnan(odometer_km) and not math.isnan(last_odometer):
+            distance = odometer_km - last_odometer
+
+            if distance <= 0:
+                anomalies.append(('no_distance', distance / liters,
+                                  '{:.1f} km since the previous fuel load'.format(distance)))
+            else:
+                km_per_liter = distance / liters
+
+                samples = int(self.samples[slot])
+                mean = float(self.ewma_mean[slot])
+                variance = float(self.ewma_var[slot])
+
+                deviation = max(math.sqrt(variance), MIN_RELATIVE_DEVIATION * mean)
+
+                if not cfg_app.fuel_min_km_liter <= km_per_liter <= cfg_app.fuel_max_km_liter:
+                    anomalies.append(('efficiency_out_of_range', km_per_liter,
+                                      '{:.2f} km/L over {:.1f} km'.format(km_per_liter, distance)))
+
+                elif samples >= cfg_app.fuel_anomaly_min_fills and deviation > 0 and \
+                        abs(km_per_liter - mean) > cfg_app.fuel_anomaly_zscore * deviation:
+                    anomalies.append(('efficiency_outlier', (km_per_liter - mean) / deviation,
+                                      '{:.2f} km/L, usual {:.2f} +/- {:.2f} km/L'.format(km_per_liter, mean,
+                                                                                      deviation)))
+
+                else:
+                    # Only the intervals not flagged move the statistics, an abuse does not become the usual
+                    if samples:
+                        difference = km_per_liter - mean
+                        increment = cfg_app.fuel_ewma_alpha * difference
+
+                        self.ewma_mean[slot] = mean + increment
+                        self.ewma_var[slot] = (1 - cfg_app.fuel_ewma_alpha) * (variance + difference * increment)
+                    else:
+                        self.ewma_mean[slot] = km_per_liter
+                        self.ewma_var[slot] = 0.0
+
+                    self.samples[slot] = samples + 1
+
+        if not math.isnan(odometer_km):
+            self.last_odometer[slot] = odometer_km
+
+        self.last_fill_at[slot] = fill_at
+        self.last_fill_id[slot] = fill_id
+
+        return anomalies
+
+
+_state = None
+_state_pid = None
+_state_lock = threading.Lock()
+
+
+def get_fuel_state():
+    r"""
+    Get the rolling statistics of the process, a new empty one on a forked worker.
+    """
+
+    global _state, _state_pid
+
+    if _state is None or _state_pid != os.getpid():
+        _state = VehicleFuelState()
+        _state_pid = os.getpid()
+
+    return _state
+
+
+def _fill_values(row):
+    fill_at = int((row.fill_at - _EPOCH).total_seconds())
+
+    odometer_km = float(row.odometer_km) if row.odometer_km is not None else math.nan
+    tank_capacity = float(row.tank_capacity) if row.tank_capacity is not None else math.nan
+
+    return row.fill_id, fill_at, float(row.liters), odometer_km, tank_capacity
+
+
+def _query_replay(session, vehicle_ids=None, exclude_ids=(), positions=None):
+    names = _sql_names()
+
+    if positions:
+        # The fuel loads from the last one scored on, in order, and any fuel load stored after it
+        fills_filter = \
+            'g."{gas_vehicle}" = ANY(:vehicle_ids) AND EXISTS (' \
+            'SELECT 1 FROM unnest(:vehicle_ids, :positions_at, :positions_id) AS p(vehicle_id, fill_at, fill_id) ' \
+            'WHERE p.vehicle_id = g."{gas_vehicle}" AND (g."{gas_id}" >= p.fill_id OR ' \
+            '(g."{gas_date}" + g."{gas_hour}", g."{gas_id}") >= (p.fill_at, p.fill_id)))'.format(**names)
+
+        vehicle_ids = list(positions)
+    else:
+        fills_filter = 'g."{gas_date}" >= :since'.format(**names)
+
+        if vehicle_ids is not None:
+            fills_filter += ' AND g."{gas_vehicle}" = ANY(:vehicle_ids)'.format(**names)
+
+    if exclude_ids:
+        fills_filter += ' AND g."{gas_id}" <> ALL(:exclude_ids)'.format(**names)
+
+    return session.execute(text(_FILLS_SQL.format(fills_filter=fills_filter, **names)), {
+        'since': date.today() - timedelta(days=cfg_app.fuel_anomaly_history_days),
+        'exclude_ids': list(exclude_ids),
+        'vehicle_ids': list(vehicle_ids or ()),
+        'positions_at': [_EPOCH + timedelta(seconds=fill_at) for fill_at, _ in (positions or dict()).values()],
+        'positions_id': [fill_id for _, fill_id in (positions or dict()).values()]
+    }).fetchall()
+
+
+def _replay(state, rows, reset_vehicles=()):
+    for vehicle_id in reset_vehicles:
+        state.reset(state.slot(vehicle_id))
+
+    replayed = 0
+
+    for row in rows:
+        slot = state.slot(row.vehicle_id)
+        fill_values = _fill_values(row)
+
+        # Fuel loads already scored, by another thread meanwhile or as the start of the replay, are skipped
+        if (fill_values[1], fill_values[0]) <= state.position(slot):
+            continue
+
+        state.score(slot, *fill_values)
+
+        replayed += 1
+
+    return replayed
+
+
+def rebuild_fuel_state(session, vehicle_ids=None, exclude_ids=(), state=None):
+    r"""
+    Rebuild the statistics of the vehicles by replaying their fuel loads of the last FUEL_ANOMALY_HISTORY_DAYS.
+
+    :param session: Database session.
+    :param vehicle_ids: The vehicles to rebuild, every vehicle with fuel loads when None.
+    :param exclude_ids: The gas_record_id of fuel loads not replayed (the ones about to be scored).
+    :param state: The VehicleFuelState rebuilt, the one of the process by default.
+    :return replayed: Number of fuel loads replayed.
+    """
+
+    rows = _query_replay(session, vehicle_ids, exclude_ids)
+
+    if vehicle_ids is None:
+        vehicle_ids = sorted({row.vehicle_id for row in rows})
+
+    with _state_lock:
+        replayed = _replay(state or get_fuel_state(), rows, vehicle_ids)
+
+    logger.info('Fuel anomaly state rebuilt: %s fuel loads replayed', replayed)
+
+    return replayed
+
+
+def _catch_up_rows(session, positions, exclude_ids):
+    r"""
+    Get the fuel loads stored after the last one scored of each vehicle, and the vehicles to rebuild instead: the
+    ones whose last fuel load scored is not stored, or with a fuel load older than it stored after it.
+    """
+
+    rows = _query_replay(session, exclude_ids=exclude_ids, positions=positions)
+
+    anchored = set()
+    rebuild_vehicles = set()
+
+    for row in rows:
+        fill_id, fill_at = _fill_values(row)[:2]
+        position = positions[row.vehicle_id]
+
+        if fill_id == position[1]:
+            anchored.add(row.vehicle_id)
+        elif (fill_at, fill_id) < position:
+            rebuild_vehicles.add(row.vehicle_id)
+
+    rebuild_vehicles.update(vehicle_id for vehicle_id in positions if vehicle_id not in anchored)
+
+    return [row for row in rows if row.vehicle_id not in rebuild_vehicles], rebuild_vehicles
+
+
+def detect_fuel_anomalies(session, record_ids):
+    r"""
+    Score the fuel loads just inserted and store their anomalies, on the transaction of the session.
+
+    :param session: Database session, the one which inserted the fuel loads.
+    :param record_ids: List of the gas_record_id of the fuel loads inserted.
+    :return anomalies: Dictionary gas_record_id -> list of the anomalies of the fuel loads flagged.
+    """
+
+    if not record_ids or not cfg_app.fuel_anomaly_detection:
+        return dict()
+
+    names = _sql_names()
+    record_ids = list(record_ids)
+
+    fills = session.execute(
+        text(_FILLS_SQL.format(fills_filter='g."{gas_id}" = ANY(:record_ids)'.format(**names), **names)),
+        {'record_ids': record_ids}
+    ).fetchall()
+
+    vehicle_ids = sorted({row.vehicle_id for row in fills})
+
+    last_fills = dict(session.execute(text(_LAST_FILLS_SQL.format(**names)), {
+        'vehicle_ids': vehicle_ids,
+        'record_ids': record_ids,
+        'since': date.today() - timedelta(days=cfg_app.fuel_anomaly_history_days)
+    }).fetchall())
+
+    with _state_lock:
+        state = get_fuel_state()
+
+        positions = {vehicle_id: state.position(state.slots[vehicle_id]) for vehicle_id in vehicle_ids
+                     if vehicle_id in state.slots}
+
+    # Vehicles whose last fuel load stored is not the last one scored here: the ones never seen by the process are
+    # rebuilt, the others catch up with the fuel loads stored after their last one scored. The queries run without
+    # the lock, the fuel loads already scored meanwhile by another thread are skipped when replayed.
+    stale_positions = {vehicle_id: position for vehicle_id, position in positions.items()
+                       if position[1] and position[1] != last_fills.get(vehicle_id, 0)}
+
+    rebuild_vehicles = {vehicle_id for vehicle_id in vehicle_ids if vehicle_id not in positions or
+                        (positions[vehicle_id][1] == 0 and vehicle_id in last_fills)}
+
+    catch_up_rows = []
+
+    if stale_positions:
+        catch_up_rows, rebuild_positions = _catch_up_rows(session, stale_positions, record_ids)
+
+        rebuild_vehicles.update(rebuild_positions)
+
+    rebuild_rows = _query_replay(session, sorted(rebuild_vehicles), record_ids) if rebuild_vehicles else []
+
+    events = []
+    anomalies = dict()
+
+    with _state_lock:
+        state = get_fuel_state()
+
+        replayed = _replay(state, rebuild_rows, sorted(rebuild_vehicles)) + _replay(state, catch_up_rows)
+
+        for row in fills:
+            fill_values = _fill_values(row)
+
+            for anomaly, score, detail in state.score(state.slot(row.vehicle_id), *fill_values):
+                anomalies.setdefault(row.fill_id, []).append(anomaly)
+
+                events.append({
+                    'anomaly_gas_record_id': row.fill_id,
+                    'anomaly_vehicle_id': row.vehicle_id,
+                    'anomaly_driver_id': row.driver_id,
+                    'anomaly_type': anomaly,
+                    'anomaly_score': round(score, 3),
+                    'anomaly_detail': detail,
+                    'anomaly_fill_date': row.fill_at
+                })
+
+    if replayed:
+        logger.info('Fuel anomaly state of %s vehicles caught up: %s fuel loads replayed',
+                    len(rebuild_vehicles) + len(stale_positions), replayed)
+
+    FuelAnomalyModel.insert_events(session, events)
+
+    return anomalies
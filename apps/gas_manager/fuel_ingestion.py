@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Ingestion of the fuel loads sent by the pumps, the highest-volume write of the API.
+
+The fuel loads received (JSON array, NDJSON or CSV) are read in batches of FUEL_INGEST_BATCH_SIZE. Each batch is
+validated as a whole: its fields are converted to numpy columns and every rule (ranges, price per liter, dates,
+vehicles and drivers registered) is a vectorized comparison, the rows are only visited again to build the errors of
+the invalid ones. The vehicles and drivers of a batch are checked with one query each.
+
+The valid rows of a batch are stored with a single ``INSERT ... VALUES ... ON CONFLICT DO NOTHING RETURNING``
+(psycopg2 ``execute_values``) on the idempotency key of the pump transaction (gasolina_transaccion_id): a transaction
+sent again, on the same batch or on a retry, is reported as duplicated and never stored twice.
+The fuel loads inserted by a batch are then added to the daily totals (FuelDailyModel) with one more statement, on
+the same transaction, and scored by the streaming fuel anomaly detection (fuel_anomaly_detection).
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import time
+import psycopg2
+import numpy as np
+from datetime import date
+from psycopg2.extras import execute_values
+from db_controller.database_backend import *
+from db_controller.batch_validation import (float_column, datetime_column, missing_mask, text_mask, is_id,
+                                           registered_ids)
+from handler_controller.request_rows import parse_request_rows
+from db_controller import mvc_exceptions as mvc_exc
+from apps.vehicle.VehicleModel import VehicleModel
+from apps.driver.DriverModel import DriverModel
+from .GasManagerModel import GasManagerModel
+from .FuelDailyModel import FuelDailyModel
+from .fuel_anomaly_detection import detect_fuel_anomalies
+
+cfg_app = get_config_settings_app()
+
+logger = configure_logger('db')
+
+# Request field -> GasManagerModel attribute, the same mapping applied by GasManagerModel.__init__
+FUEL_INGEST_FIELDS = [
+    ('gasolina_transaccion_id', 'gas_transaction_id'),
+    ('gasolina_registro_fecha', 'gas_record_date'),
+    ('gasolina_registro_hora', 'gas_record_hour'),
+    ('gasolina_registro_litros', 'gas_record_liters'),
+    ('gasolina_registro_costo', 'gas_record_cost'),
+    ('gasolina_registro_impuesto', 'gas_record_tax_rate'),
+    ('gasolina_nombre_gasolinera', 'gas_station_name'),
+    ('gasolina_ubicacion_gasolinera', 'gas_station_address'),
+    ('gasolina_vehiculo_id', 'gas_vehicle_id'),
+    ('gasolina_conductor_id', 'gas_driver_id'),
+    ('gasolina_documento_id', 'gas_document_id'),
+]
+
+MAX_TRANSACTION_ID_LENGTH = 128
+
+_EPOCH_DAY = np.datetime64('1970-01-01T00:00:00', 's')
+
+
+class FuelBatch:
+    r"""
+    Class to instance a batch of fuel loads validated: the rows to store and the rows rejected.
+    """
+
+    __slots__ = ('rows', 'errors', 'duplicated')
+
+    def __init__(self, rows, errors, duplicated):
+        # Tuples (row number, values in FUEL_INGEST_FIELDS order)
+        self.rows = rows
+        # Row number -> list of errors
+        self.errors = errors
+        # Row number -> transaction id repeated on a previous row of the batch
+        self.duplicated = duplicated
+
+
+def parse_fuel_rows(content_type, stream):
+    r"""
+    Read the fuel loads of the request body: a JSON array (or {"cargas": [...]}), NDJSON or CSV.
+    """
+
+    return parse_request_rows(content_type, stream, 'cargas')
+
+
+def validate_fuel_batch(batch, first_row, vehicle_ids=None, driver_ids=None):
+    r"""
+    Validate and type-convert a batch of fuel loads, one vectorized comparison per rule over the whole batch.
+
+    :param batch: List of dictionaries with the request fields.
+    :param first_row: Number of the first row of the batch on the whole ingestion.
+    :param vehicle_ids: Array of the vehicle ids of the batch registered on database, not checked when None.
+    :param driver_ids: Array of the driver ids of the batch registered on database, not checked when None.
+    :return fuel_batch: The FuelBatch with the rows ready to insert and the rows rejected.
+    """
+
+    size = len(batch)
+    records = [data if isinstance(data, dict) else {} for data in batch]
+
+    columns = {field_name: [data.get(field_name) for data in records] for field_name, _ in FUEL_INGEST_FIELDS}
+
+    transaction_ids = np.array([str(value).strip() if value is not None else '' for value in
+                                columns['gasolina_transaccion_id']], dtype=object)
+    # The pump transaction id is sent as a string, or as a number by some pumps; never as a boolean, object or list
+    transaction_typed = np.array([value is None or isinstance(value, str) or
+                                  (isinstance(value, int) and not isinstance(value, bool))
+                                  for value in columns['gasolina_transaccion_id']], dtype=bool)
+    record_dates = datetime_column(columns['gasolina_registro_fecha'], 'D')
+    record_hours = datetime_column(columns['gasolina_registro_hora'], 's', '1970-01-01T')
+    liters = float_column(columns['gasolina_registro_litros'])
+    cost = float_column(columns['gasolina_registro_costo'])
+    tax_rate = float_column(columns['gasolina_registro_impuesto'])
+    vehicles = float_column(columns['gasolina_vehiculo_id'])
+    drivers = float_column(columns['gasolina_conductor_id'])
+    documents = float_column(columns['gasolina_documento_id'])
+
+    driver_missing = missing_mask(columns['gasolina_conductor_id'])
+    tax_missing = missing_mask(columns['gasolina_registro_impuesto'])
+    document_missing = missing_mask(columns['gasolina_documento_id'])
+
+    transaction_lengths = np.array([len(value) for value in transaction_ids], dtype=np.int64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        price_liter = cost / liters
+
+        # Rule name -> mask of the rows breaking it
+        rules = {
+            'Row is not an object': np.array([not isinstance(data, dict) for data in batch], dtype=bool),
+            'gasolina_transaccion_id is required': transaction_lengths == 0,
+            'gasolina_transaccion_id is too long': transaction_lengths > MAX_TRANSACTION_ID_LENGTH,
+            'gasolina_transaccion_id must be a string': ~transaction_typed,
+            'gasolina_registro_fecha must be a past date (YYYY-MM-DD)':
+                np.isnat(record_dates) | (record_dates > np.datetime64(date.today(), 'D')),
+            'gasolina_registro_hora must be a time (HH:MM[:SS])':
+                np.isnat(record_hours) | (record_hours - _EPOCH_DAY >= np.timedelta64(86400, 's')),
+            'gasolina_registro_litros out of range': ~((liters > 0) & (liters <= cfg_app.fuel_max_liters)),
+            'gasolina_registro_costo out of range': ~(np.isfinite(cost) & (cost > 0)),
+            'price per liter out of range': ~((price_liter >= cfg_app.fuel_min_price_liter) &
+                                              (price_liter <= cfg_app.fuel_max_price_liter)),
+            'gasolina_registro_impuesto out of range': ~(tax_missing | ((tax_rate >= 0) & (tax_rate <= 100))),
+            'gasolina_nombre_gasolinera must be a string': ~text_mask(columns['gasolina_nombre_gasolinera']),
+            'gasolina_ubicacion_gasolinera must be a string': ~text_mask(columns['gasolina_ubicacion_gasolinera']),
+            'gasolina_vehiculo_id is not valid': ~is_id(vehicles),
+            'gasolina_conductor_id is not valid': ~(driver_missing | is_id(drivers)),
+            'gasolina_documento_id is not valid': ~(document_missing | is_id(documents)),
+        }
+
+    if vehicle_ids is not None:
+        rules['gasolina_vehiculo_id is not registered'] = ~rules['gasolina_vehiculo_id is not valid'] & \
+                                                          ~np.isin(vehicles, vehicle_ids)
+
+    if driver_ids is not None:
+        rules['gasolina_conductor_id is not registered'] = ~driver_missing & \
+                                                           ~rules['gasolina_conductor_id is not valid'] & \
+                                                           ~np.isin(drivers, driver_ids)
+
+    invalid = np.zeros(size, dtype=bool)
+
+    for rule_mask in rules.values():
+        invalid |= rule_mask
+
+    # A transaction repeated inside the batch is kept on its first valid row only
+    duplicated_mask = np.zeros(size, dtype=bool)
+
+    valid_positions = np.flatnonzero(~invalid)
+
+    if valid_positions.size:
+        _, first_positions = np.unique(transaction_ids[valid_positions].astype(str), return_index=True)
+
+        duplicated_mask[valid_positions] = True
+        duplicated_mask[valid_positions[first_positions]] = False
+
+    errors = dict()
+
+    not_object = rules['Row is not an object']
+
+    for position in np.flatnonzero(invalid).tolist():
+        if not_object[position]:
+            errors[first_row + position] = ['Row is not an object']
+        else:
+            errors[first_row + position] = [message for message, rule_mask in rules.items() if rule_mask[position]]
+
+    duplicated = {first_row + position: transaction_ids[position] for position in
+                  np.flatnonzero(duplicated_mask).tolist()}
+
+    stored_positions = np.flatnonzero(~invalid & ~duplicated_mask)
+
+    hour_seconds = (record_hours[stored_positions] - _EPOCH_DAY).astype(np.int64).tolist()
+
+    def optional_int(column, missing):
+        return [None if is_missing else int(value) for value, is_missing in
+                zip(column[stored_positions].tolist(), missing[stored_positions].tolist())]
+
+    def optional_text(field_name):
+        return [columns[field_name][position] for position in stored_positions.tolist()]
+
+    rows = list(zip(
+        (first_row + stored_positions).tolist(),
+        transaction_ids[stored_positions].tolist(),
+        record_dates[stored_positions].tolist(),
+        ['{:02d}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60) for seconds in hour_seconds],
+        liters[stored_positions].tolist(),
+        cost[stored_positions].tolist(),
+        [None if is_missing else value for value, is_missing in
+         zip(tax_rate[stored_positions].tolist(), tax_missing[stored_positions].tolist())],
+        optional_text('gasolina_nombre_gasolinera'),
+        optional_text('gasolina_ubicacion_gasolinera'),
+        vehicles[stored_positions].astype(np.int64).tolist(),
+        optional_int(drivers, driver_missing),
+        optional_int(documents, document_missing),
+    ))
+
+    return FuelBatch(rows, errors, duplicated)
+
+
+def _insert_batch(cursor, column_names, rows):
+    r"""
+    Insert the rows of a batch in one statement, skipping the transactions already stored.
+
+    :return inserted: Dictionary transaction id -> gas_record_id of the fuel loads inserted.
+    """
+
+    id_column = GasManagerModel.__mapper__.columns['gas_record_id'].name
+    transaction_column = GasManagerModel.__mapper__.columns['gas_transaction_id'].name
+
+    inserted_rows = execute_values(
+        cursor,
+        'INSERT INTO "{table}" ({columns}) VALUES %s ON CONFLICT ("{transaction}") DO NOTHING '
+        'RETURNING "{id}", "{transaction}"'.format(
+            table=GasManagerModel.__tablename__, columns=', '.join('"{}"'.format(name) for name in column_names),
+            transaction=transaction_column, id=id_column
+        ),
+        [row[1:] for row in rows], page_size=max(len(rows), 1), fetch=True
+    )
+
+    return {transaction_id: record_id for record_id, transaction_id in inserted_rows}
+
+
+def ingest_fuel_loads(session, rows, batch_size=None):
+    r"""
+    Validate and store the fuel loads in batches on the transaction of the session.
+
+    :param session: Session database object.
+    :param rows: Iterable of dictionaries with the request fields of each fuel load.
+    :param batch_size: Number of fuel loads validated and inserted per batch, FUEL_INGEST_BATCH_SIZE by default.
+    :return summary: Dictionary with the per-row results and the aggregate throughput.
+    """
+
+    start_time = time.perf_counter()
+
+    batch_size = max(batch_size or cfg_app.fuel_batch_size, 1)
+
+    column_names = [GasManagerModel.__mapper__.columns[attr_name].name for _, attr_name in FUEL_INGEST_FIELDS]
+
+    results = []
+    total_rows = 0
+    inserted_rows = 0
+    duplicated_rows = 0
+    invalid_rows = 0
+    flagged_rows = 0
+
+    try:
+
+        cursor = session.connection().connection.cursor()
+
+        def process_batch(batch_rows, first_row):
+            nonlocal inserted_rows, duplicated_rows, invalid_rows, flagged_rows
+
+            records = [data if isinstance(data, dict) else {} for data in batch_rows]
+
+            vehicle_ids = registered_ids(cursor, VehicleModel, 'vehicle_id',
+                                         float_column([data.get('gasolina_vehiculo_id') for data in records]))
+            driver_ids = registered_ids(cursor, DriverModel, 'driver_id',
+                                        float_column([data.get('gasolina_conductor_id') for data in records]))
+
+            fuel_batch = validate_fuel_batch(batch_rows, first_row, vehicle_ids, driver_ids)
+
+            inserted = _insert_batch(cursor, column_names, fuel_batch.rows) if fuel_batch.rows else dict()
+
+            FuelDailyModel.add_fuel_loads(session, list(inserted.values()))
+
+            anomalies = detect_fuel_anomalies(session, list(inserted.values()))
+
+            for row_number, row_errors in fuel_batch.errors.items():
+                results.append({'row': row_number, 'status': 'invalid', 'errors': row_errors})
+
+            for row_number in fuel_batch.duplicated:
+                results.append({'row': row_number, 'status': 'duplicated'})
+
+            for row_values in fuel_batch.rows:
+                record_id = inserted.get(row_values[1])
+
+                if record_id is not None:
+                    results.append({'row': row_values[0], 'status': 'inserted', 'id_gas_record': record_id,
+                                    'anomalies': anomalies.get(record_id, [])})
+                else:
+                    results.append({'row': row_values[0], 'status': 'duplicated'})
+
+            batch_inserted = len(inserted)
+
+            inserted_rows += batch_inserted
+            duplicated_rows += len(fuel_batch.duplicated) + len(fuel_batch.rows) - batch_inserted
+            invalid_rows += len(fuel_batch.errors)
+            flagged_rows += len(anomalies)
+
+            logger.info('Fuel loads batch from row %s: %s inserted, %s duplicated, %s invalid', first_row,
+                        batch_inserted, len(fuel_batch.duplicated) + len(fuel_batch.rows) - batch_inserted,
+                        len(fuel_batch.errors))
+
+        batch = []
+
+        for data in rows:
+            batch.append(data)
+            total_rows += 1
+
+            if len(batch) >= batch_size:
+                process_batch(batch, total_rows - len(batch) + 1)
+                batch = []
+
+        if batch:
+            process_batch(batch, total_rows - len(batch) + 1)
+
+        cursor.close()
+
+    except (SQLAlchemyError, psycopg2.Error) as exc:
+        session.rollback()
+
+        logger.exception('An exception was occurred while execute transactions: %s', str(exc))
+        raise mvc_exc.IntegrityError(
+            'Rows not stored in "{}". IntegrityError: {}'.format(GasManagerModel.__tablename__, str(exc))
+        )
+
+    elapsed_time = time.perf_counter() - start_time
+
+    results.sort(key=lambda result: result['row'])
+
+    return {
+        'total': total_rows,
+        'inserted': inserted_rows,
+        'duplicated': duplicated_rows,
+        'invalid': invalid_rows,
+        'flagged': flagged_rows,
+        'elapsed_seconds': round(elapsed_time, 3),
+        'rows_per_second': round(total_rows / elapsed_time, 1) if elapsed_time else total_rows,
+        'results': results
+    }
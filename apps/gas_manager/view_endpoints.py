@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import csv
+from datetime import date, timedelta
+from flask import Blueprint, g, request
+from db_controller.database_backend import *
+from db_controller import mvc_exceptions as mvc_exc
+from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse, STREAM_FORMATS
+from handler_controller.messages import SuccessMsg, ErrorMsg
+from logger_controller.logger_control import *
+from utilities.Utility import *
+
+cfg_app = get_config_settings_app()
+gas_manager_api = Blueprint('gas_manager_api', __name__)
+logger = configure_logger('ws')
+
+# The models are imported by the endpoints on their first call, not when the blueprint is registered: their
+# mappings and dependencies (numpy, sqlalchemy_filters, psycopg2.extras) stay out of the start up of the workers.
+
+
+@gas_manager_api.route('/', methods=['POST', 'GET'])
+def endpoint_processing_gas_data():
+    from .GasManagerModel import GasManagerModel
+    from .fuel_ingestion import validate_fuel_batch, FUEL_INGEST_FIELDS
+
+    session_db = get_db_session()
+
+    query_string = request.query_string.decode('utf-8')
+
+    if request.method == 'POST':
+        # REGISTRAR CARGA DE GASOLINA
+
+        data = request.get_json(force=True)
+
+        if not data or not isinstance(data, dict):
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+        # The pump transaction id may also travel as the Idempotency-Key header
+        if not data.get('gasolina_transaccion_id') and request.headers.get('Idempotency-Key'):
+            data['gasolina_transaccion_id'] = request.headers.get('Idempotency-Key')
+
+        fuel_batch = validate_fuel_batch([data], 1)
+
+        if fuel_batch.errors:
+            return HandlerResponse.request_unprocessable(ErrorMsg.ERROR_DATA_NOT_VALID,
+                                                         {'errors': fuel_batch.errors[1]})
+
+        gas_data = dict(zip((field_name for field_name, _ in FUEL_INGEST_FIELDS), fuel_batch.rows[0][1:]))
+
+        gas_model = GasManagerModel(gas_data)
+
+        logger.info('Fuel load to Manage on DB, transaction: %s', gas_data.get('gasolina_transaccion_id'))
+
+        try:
+
+            json_gas_added, inserted = gas_model.insert_data(session_db, gas_data)
+
+        except mvc_exc.IntegrityError as exc:
+            logger.error('Fuel load not stored: %s', str(exc))
+
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+        g.fuel_ingestion_counts = {'inserted' if inserted else 'duplicated': 1}
+
+        if not inserted:
+            return HandlerResponse.response_success(SuccessMsg.MSG_RECORD_REGISTERED, json_gas_added)
+
+        return HandlerResponse.response_resource_created(SuccessMsg.MSG_CREATED_RECORD, json_gas_added)
+
+    elif request.method == 'GET':
+        # To GET ALL Data of the fuel loads:
+
+        filter_spec = gas_filter_spec(query_string)
+
+        try:
+
+            limit, cursor, with_total = get_pagination_args(request.args)
+
+            gas_on_db = GasManagerModel.get_gas_records_by_filters(session_db, filter_spec, limit, cursor, with_total)
+
+        except ValueError as exc:
+            logger.error('Pagination params not valid: %s', str(exc))
+
+            return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+        if not bool(gas_on_db) or not gas_on_db.get('results'):
+            return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+        return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, gas_on_db)
+
+    else:
+        return HandlerResponse.request_not_found(ErrorMsg.ERROR_REQUEST_NOT_FOUND)
+
+
+@gas_manager_api.route('/bulk', methods=['POST'])
+def endpoint_bulk_gas():
+    r"""
+    Ingest many fuel loads at once from a JSON array, NDJSON (application/x-ndjson) or CSV (text/csv) body.
+
+    Query params: batch_size (fuel loads validated and inserted per statement).
+    """
+
+    from .fuel_ingestion import parse_fuel_rows, ingest_fuel_loads
+
+    session_db = get_db_session()
+
+    batch_size = request.args.get('batch_size', cfg_app.fuel_batch_size, type=int)
+
+    try:
+
+        rows = parse_fuel_rows(request.content_type, request.stream)
+
+        ingest_summary = ingest_fuel_loads(session_db, rows, max(batch_size, 1))
+
+    except (ValueError, csv.Error) as exc:
+        logger.error('Bulk fuel loads payload can not be read: %s', str(exc))
+
+        return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_BODY_NOT_VALID)
+
+    except mvc_exc.IntegrityError as exc:
+        logger.error('Bulk fuel loads not stored: %s', str(exc))
+
+        return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+    logger.info('Fuel loads ingested: %s inserted, %s duplicated, %s invalid, %s rows/s',
+                ingest_summary.get('inserted'), ingest_summary.get('duplicated'),
+                ingest_summary.get('invalid'), ingest_summary.get('rows_per_second'))
+
+    g.fuel_ingestion_counts = {status: ingest_summary.get(status) for status in ('inserted', 'duplicated', 'invalid')}
+
+    if not ingest_summary.get('total'):
+        return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+    return HandlerResponse.response_success(SuccessMsg.MSG_CREATED_RECORD, ingest_summary)
+
+
+def gas_filter_spec(query_string):
+    r"""
+    Build the sqlalchemy_filters specification of the fuel loads list and export endpoints from the query params.
+
+    :param query_string: The decoded query string of the request.
+    :return filter_spec: List of filters over the GasManagerModel attributes.
+    """
+
+    filter_spec = []
+
+    if 'vehiculo' in query_string:
+        filter_spec.append({'field': 'gas_vehicle_id', 'op': '==', 'value': request.args.get('vehiculo')})
+
+    if 'conductor' in query_string:
+        filter_spec.append({'field': 'gas_driver_id', 'op': '==', 'value': request.args.get('conductor')})
+
+    if 'gasolinera' in query_string:
+        filter_spec.append({'field': 'gas_station_name', 'op': 'ilike', 'value': request.args.get('gasolinera')})
+
+    if 'fecha_inicio' in query_string:
+        filter_spec.append({'field': 'gas_record_date', 'op': '>=', 'value': request.args.get('fecha_inicio')})
+
+    if 'fecha_fin' in query_string:
+        filter_spec.append({'field': 'gas_record_date', 'op': '<=', 'value': request.args.get('fecha_fin')})
+
+    return filter_spec
+
+
+@gas_manager_api.route('/export', methods=['GET'])
+def endpoint_export_gas():
+    r"""
+    Stream all the fuel loads matching the list filters as a JSON array or NDJSON (?format=ndjson).
+
+    The rows are read through a server-side cursor on a connection of the export, the request session is not used.
+    """
+
+    from .GasManagerModel import GasManagerModel
+    from db_controller.query_layer import EXPORT_CHUNK_SIZE
+
+    export_format = request.args.get('format', 'json').lower()
+
+    if export_format not in STREAM_FORMATS:
+        return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+    filter_spec = gas_filter_spec(request.query_string.decode('utf-8'))
+
+    chunk_size = max(request.args.get('chunk_size', EXPORT_CHUNK_SIZE, type=int), 1)
+
+    logger.info('Export of fuel loads requested as %s, filters: %s', export_format, str(filter_spec))
+
+    gas_rows = GasManagerModel.export_by_filters(filter_spec, chunk_size)
+
+    return HandlerResponse.response_stream(gas_rows, export_format, 'cargas_gasolina.{}'.format(export_format))
+
+
+@gas_manager_api.route('/daily', methods=['GET'])
+def endpoint_daily_gas():
+    r"""
+    Liters, cost and tax of the fuel loads, read from the daily totals: O(days) rows whatever the number of loads.
+
+    Query params: fecha_inicio and fecha_fin (both included, the last ANALYTICS_DEFAULT_DAYS days by default),
+    vehiculo, gasolinera, agrupar (levels of the roll up among dia, vehiculo and gasolinera; dia by default).
+    """
+
+    from .FuelDailyModel import FuelDailyModel
+
+    session_db = get_db_session()
+
+    group_by = [group_name.strip().lower() for group_name in request.args.get('agrupar', 'dia').split(',')
+                if group_name.strip()]
+
+    try:
+
+        date_to = date.fromisoformat(request.args.get('fecha_fin')) if request.args.get('fecha_fin') \
+            else date.today()
+        date_from = date.fromisoformat(request.args.get('fecha_inicio')) if request.args.get('fecha_inicio') \
+            else date_to - timedelta(days=cfg_app.analytics_default_days - 1)
+
+        daily_totals = FuelDailyModel.get_totals(session_db, date_from, date_to + timedelta(days=1), group_by,
+                                                 get_int_arg(request.args, 'vehiculo'),
+                                                 request.args.get('gasolinera'))
+
+    except ValueError as exc:
+        logger.error('Daily totals params not valid: %s', str(exc))
+
+        return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+    if not daily_totals:
+        return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+    return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, {
+        'fecha_inicio': date_from, 'fecha_fin': date_to, 'results': daily_totals
+    })
+
+
+@gas_manager_api.route('/anomalies', methods=['GET'])
+def endpoint_gas_anomalies():
+    r"""
+    Fuel loads flagged by the fuel anomaly detection, for review.
+
+    Query params: vehiculo, conductor, tipo, estatus, fecha_inicio and fecha_fin (date of the fuel load).
+    """
+
+    from .FuelAnomalyModel import FuelAnomalyModel
+
+    session_db = get_db_session()
+
+    query_string = request.query_string.decode('utf-8')
+
+    filter_spec = []
+
+    if 'vehiculo' in query_string:
+        filter_spec.append({'field': 'anomaly_vehicle_id', 'op': '==', 'value': request.args.get('vehiculo')})
+
+    if 'conductor' in query_string:
+        filter_spec.append({'field': 'anomaly_driver_id', 'op': '==', 'value': request.args.get('conductor')})
+
+    if 'tipo' in query_string:
+        filter_spec.append({'field': 'anomaly_type', 'op': '==', 'value': request.args.get('tipo')})
+
+    if 'estatus' in query_string:
+        filter_spec.append({'field': 'anomaly_status', 'op': '==', 'value': request.args.get('estatus')})
+
+    if 'fecha_inicio' in query_string:
+        filter_spec.append({'field': 'anomaly_fill_date', 'op': '>=', 'value': request.args.get('fecha_inicio')})
+
+    if 'fecha_fin' in query_string:
+        filter_spec.append({'field': 'anomaly_fill_date', 'op': '<', 'value': request.args.get('fecha_fin')})
+
+    try:
+
+        limit, cursor, with_total = get_pagination_args(request.args)
+
+        anomalies_on_db = FuelAnomalyModel.get_anomalies_by_filters(session_db, filter_spec, limit, cursor,
+                                                                    with_total)
+
+    except ValueError as exc:
+        logger.error('Pagination params not valid: %s', str(exc))
+
+        return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+    if not bool(anomalies_on_db) or not anomalies_on_db.get('results'):
+        return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+    return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, anomalies_on_db)
+
+
+@gas_manager_api.route('/anomalies/<int:anomaly_id>', methods=['PUT'])
+def endpoint_review_gas_anomaly(anomaly_id):
+    r"""
+    Review an anomaly: {"estatus": "confirmada"} or {"estatus": "descartada"}.
+    """
+
+    from .FuelAnomalyModel import FuelAnomalyModel
+
+    session_db = get_db_session()
+
+    data = request.get_json(force=True)
+
+    if not data or not isinstance(data, dict):
+        return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+    try:
+
+        anomaly_reviewed = FuelAnomalyModel.update_status(session_db, anomaly_id, data.get('estatus'))
+
+    except ValueError as exc:
+        logger.error('Review status not valid: %s', str(exc))
+
+        return HandlerResponse.request_unprocessable(ErrorMsg.ERROR_DATA_NOT_VALID, {'errors': [str(exc)]})
+
+    if not anomaly_reviewed:
+        return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+    return HandlerResponse.response_success(SuccessMsg.MSG_UPDATED_RECORD, anomaly_reviewed)
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+PostgreSQL DB backend.
+
+Documentation:
+    About the odometer readings of the vehicles, an append-only time series:
+    - Insert data, once per vehicle and register date
+    - Search data by vehicle and time range
+    - Downsampled series (max/min per day, hour, week or month) computed by the database
+
+The readings are keyed by (vehicle, register date): the unique composite index serves the range queries of a
+vehicle and makes the inserts idempotent. With ODOMETER_PARTITIONING the table is created partitioned by month on
+the register date; the bootstrap creates the partitions of the current month and of ODOMETER_PARTITIONS_AHEAD months,
+the create_odometer_partitions job keeps creating the next ones and a default partition receives the rest.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+from datetime import date
+from types import SimpleNamespace
+from apps.vehicle.VehicleModel import VehicleModel
+from apps.driver.DriverModel import DriverModel
+from sqlalchemy_filters import apply_filters
+from sqlalchemy import Column, Integer, String, DateTime, Sequence, Float, Index, ForeignKey, select
+from db_controller.database_backend import *
+from db_controller.query_layer import keyset_page, page_result, stream_query, EXPORT_CHUNK_SIZE
+
+cfg_db = get_config_settings_db()
+
+ODOMETER_ID_SEQ = Sequence('odometer_seq')  # define sequence explicitly
+
+# Kilometers of each unit of measure accepted for the readings
+KM_PER_UNIT = {'km': 1.0, 'mi': 1.609344}
+
+# Buckets of the downsampled series, the date_trunc field of each
+SERIES_BUCKETS = ('hour', 'day', 'week', 'month')
+
+_partition_args = {'postgresql_partition_by': 'RANGE ("{}")'.format(cfg_db.GasOdometer.odometer_register_date)} \
+    if cfg_db.odometer_partitioning else {}
+
+
+class OdometerModel(Base):
+    r"""
+    Class to instance the odometer readings (OdometerModel) on the database.
+    Transactions:
+     - Insert: Append the readings, a reading of a vehicle at a register date is stored once.
+     - Select: Pages, exports, last reading and downsampled series of the readings.
+    """
+
+    __tablename__ = cfg_db.gas_odometer_vehicle_table.__str__()
+    __table_args__ = (
+        # Time series of each vehicle, target of the INSERT ... ON CONFLICT; includes the partition key
+        Index('uq_odometer_vehicle_date', cfg_db.GasOdometer.odometer_vehicle_id,
+              cfg_db.GasOdometer.odometer_register_date, unique=True),
+        _partition_args
+    )
+
+    # The register date is part of the primary key: the key of a partitioned table must contain the partition key
+    odometer_id = Column(cfg_db.GasOdometer.odometer_id, Integer, ODOMETER_ID_SEQ,
+                         primary_key=True, server_default=ODOMETER_ID_SEQ.next_value())
+    odometer_register_date = Column(cfg_db.GasOdometer.odometer_register_date, DateTime, primary_key=True,
+                                    autoincrement=False)
+    odometer_value = Column(cfg_db.GasOdometer.odometer_value, Float, nullable=False)
+    odometer_unit = Column(cfg_db.GasOdometer.odometer_unit_mesure, String, nullable=False)
+
+    odometer_vehicle_id = Column(
+        cfg_db.GasOdometer.odometer_vehicle_id,
+        Integer,
+        ForeignKey(VehicleModel.__table__.c[cfg_db.GasVehicle.vehiculo_id], onupdate='CASCADE', ondelete='CASCADE'),
+        nullable=False
+    )
+
+    odometer_driver_id = Column(
+        cfg_db.GasOdometer.odometer_driver_id,
+        Integer,
+        ForeignKey(DriverModel.__table__.c[cfg_db.GasDriver.driver_id], onupdate='CASCADE', ondelete='SET NULL'),
+        nullable=True
+    )
+
+    @staticmethod
+    def get_readings_by_filters(session, filter_spec=None, limit=None, cursor=None, with_total=False):
+        """
+        Get one page, keyset paginated on odometer_id, of the readings registered on database matching the filters.
+
+        :param session: Database session
+        :param filter_spec: List of sqlalchemy_filters specifications over the OdometerModel attributes
+        :param limit: Number of readings of the page
+        :param cursor: Token of the page to get, returned as next_cursor by the previous page
+        :param with_total: Include the count of all the readings matching the filters
+        :return: dict
+        """
+
+        query = session.query(OdometerModel)
+
+        if filter_spec:
+            query = apply_filters(query, filter_spec)
+
+        query_result, next_cursor, total = keyset_page(query, OdometerModel.odometer_id, limit, cursor, with_total)
+
+        logger.info('Query filtered resultSet: %s rows, next cursor: %s', len(query_result), next_cursor)
+
+        readings_data = [OdometerModel.to_dict(reading) for reading in query_result]
+
+        return page_result(readings_data, next_cursor, limit, total)
+
+    @staticmethod
+    def export_by_filters(filter_spec=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Get all the readings registered on database matching the filters, read through a server-side cursor while
+        they are consumed.
+
+        :param filter_spec: List of sqlalchemy_filters specifications over the OdometerModel attributes
+        :param chunk_size: Number of readings fetched from the cursor at a time
+        :return: Generator of the reading dictionaries, ordered by vehicle and register date
+        """
+
+        def build_query(session):
+            query = session.query(OdometerModel)
+
+            if filter_spec:
+                query = apply_filters(query, filter_spec)
+
+            return query.order_by(OdometerModel.odometer_vehicle_id, OdometerModel.odometer_register_date)
+
+        return (OdometerModel.to_dict(reading) for reading in stream_query(build_query, chunk_size))
+
+    @staticmethod
+    def get_last_readings(session, vehicle_ids=None):
+        """
+        Get the last reading of each vehicle, with one DISTINCT ON query walking the (vehicle, date) index backwards
+
+        :param session: Database session
+        :param vehicle_ids: List of the vehicle ids, every vehicle when None
+        :return: list: The last reading dictionary of each vehicle with readings
+        """
+
+        table = OdometerModel.__table__
+        vehicle_column = table.c[cfg_db.GasOdometer.odometer_vehicle_id]
+        date_column = table.c[cfg_db.GasOdometer.odometer_register_date]
+
+        statement = select([table]).distinct(vehicle_column).order_by(vehicle_column, date_column.desc())
+
+        if vehicle_ids is not None:
+            statement = statement.where(vehicle_column.in_(vehicle_ids))
+
+        return [OdometerModel.to_dict(OdometerModel.row_attributes(row)) for row in session.execute(statement)]
+
+    @staticmethod
+    def get_series(session, vehicle_id=None, date_from=None, date_to=None, bucket='day'):
+        """
+        Get the readings downsampled by the database to one point per vehicle and bucket (hour, day, week, month):
+        the max and min reading, the distance covered within the bucket and the number of readings.
+
+        :param session: Database session
+        :param vehicle_id: The vehicle of the series, every vehicle when None
+        :param date_from: First register date included
+        :param date_to: Last register date excluded
+        :param bucket: Size of the buckets, one of SERIES_BUCKETS
+        :return: list: The points of the series ordered by vehicle and bucket
+        :raise ValueError: When the bucket is not supported
+        """
+
+        if bucket not in SERIES_BUCKETS:
+            raise ValueError('Invalid series bucket: {}'.format(bucket))
+
+        table = OdometerModel.__table__
+        vehicle_column = table.c[cfg_db.GasOdometer.odometer_vehicle_id]
+        date_column = table.c[cfg_db.GasOdometer.odometer_register_date]
+        value_column = table.c[cfg_db.GasOdometer.odometer_value]
+        unit_column = table.c[cfg_db.GasOdometer.odometer_unit_mesure]
+
+        bucket_column = func.date_trunc(bucket, date_column).label('bucket')
+
+        statement = select([
+            vehicle_column.label('vehicle_id'),
+            bucket_column,
+            func.max(value_column).label('max_value'),
+            func.min(value_column).label('min_value'),
+            func.count().label('readings'),
+            func.max(unit_column).label('unit')
+        ]).group_by(vehicle_column, bucket_column).order_by(vehicle_column, bucket_column)
+
+        if vehicle_id is not None:
+            statement = statement.where(vehicle_column == vehicle_id)
+
+        if date_from is not None:
+            statement = statement.where(date_column >= date_from)
+
+        if date_to is not None:
+            statement = statement.where(date_column < date_to)
+
+        return [{
+            "vehicle_odometer": row.vehicle_id,
+            "bucket": row.bucket,
+            "max_value": row.max_value,
+            "min_value": row.min_value,
+            "distance": row.max_value - row.min_value,
+            "readings": row.readings,
+            "unit": row.unit
+        } for row in session.execute(statement)]
+
+    @staticmethod
+    def row_attributes(row):
+        """
+        Get a row of the table, read with a Core statement, keyed by the model attributes
+
+        :param row: The row of the table
+        :return: Namespace with the OdometerModel attributes
+        """
+
+        return SimpleNamespace(**{attr: row[column] for attr, column in OdometerModel.__mapper__.columns.items()})
+
+    @staticmethod
+    def to_dict(reading):
+        """
+        Get the response dictionary of a reading, either a model instance or a row read with a Core statement
+
+        :param reading: Object with the OdometerModel attributes
+        :return: dict
+        """
+
+        return {
+            "id_odometer": reading.odometer_id,
+            "date_odometer": reading.odometer_register_date,
+            "value_odometer": reading.odometer_value,
+            "unit_odometer": reading.odometer_unit,
+            "vehicle_odometer": reading.odometer_vehicle_id,
+            "driver_odometer": reading.odometer_driver_id
+        }
+
+    def __repr__(self):
+        return "<OdometerModel(odometer_id='%s', " \
+               "               odometer_register_date='%s', " \
+               "               odometer_value='%s', " \
+               "               odometer_unit='%s', " \
+               "               odometer_vehicle_id='%s', " \
+               "               odometer_driver_id='%s')>" % (self.odometer_id, self.odometer_register_date,
+                                                             self.odometer_value, self.odometer_unit,
+                                                             self.odometer_vehicle_id, self.odometer_driver_id)
+
+
+def _month_start(year, month):
+    return date(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+
+def monthly_partition_statements(first_month, months):
+    r"""
+    Get the DDL creating the monthly partitions of the readings, and the default partition.
+
+    :param first_month: Date of the first month.
+    :param months: Number of months from the first one.
+    :return statements: List of idempotent DDL statements.
+    """
+
+    table_name = OdometerModel.__tablename__
+
+    statements = ['CREATE TABLE IF NOT EXISTS "{0}_default" PARTITION OF "{0}" DEFAULT'.format(table_name)]
+
+    for offset in range(months):
+        month_start = _month_start(first_month.year, first_month.month + offset)
+        month_end = _month_start(first_month.year, first_month.month + offset + 1)
+
+        statements.append(
+            'CREATE TABLE IF NOT EXISTS "{0}_{1:%Y_%m}" PARTITION OF "{0}" FOR VALUES FROM (\'{1}\') TO (\'{2}\')'.format(
+                table_name, month_start, month_end
+            )
+        )
+
+    return statements
+
+
+def create_monthly_partitions(connection, months_ahead=None):
+    r"""
+    Create the partitions of the current month and of the months ahead, when the table is partitioned.
+
+    :param connection: Connection to the database, in a transaction.
+    :param months_ahead: Months created in advance, ODOMETER_PARTITIONS_AHEAD by default.
+    :return created: Number of partitions checked, 0 when the table is not partitioned.
+    """
+
+    months_ahead = cfg_db.odometer_partitions_ahead if months_ahead is None else months_ahead
+
+    is_partitioned = connection.execute(
+        text('SELECT relkind = \'p\' FROM pg_class WHERE relname = :table_name'),
+        table_name=OdometerModel.__tablename__
+    ).scalar()
+
+    if not is_partitioned:
+        return 0
+
+    statements = monthly_partition_statements(date.today(), months_ahead + 1)
+
+    for ddl_statement in statements:
+        connection.execute(text(ddl_statement))
+
+    logger.info('Odometer partitions checked up to %s months ahead', months_ahead)
+
+    return len(statements) - 1
+
+
+if cfg_db.odometer_partitioning:
+    # The table is only partitioned when created, the partitions up to the date of the bootstrap are created with it
+    for partition_statement in monthly_partition_statements(date.today(), cfg_db.odometer_partitions_ahead + 1):
+        register_schema_migration(4, partition_statement)
+
+register_schema_migration(4, 'CREATE UNIQUE INDEX IF NOT EXISTS uq_odometer_vehicle_date ON "{}" ("{}", "{}")'.format(
+    OdometerModel.__tablename__, cfg_db.GasOdometer.odometer_vehicle_id, cfg_db.GasOdometer.odometer_register_date))
@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Ingestion of the odometer readings reported by the telematics of the vehicles.
+
+The readings received (JSON array, NDJSON or CSV) are read in batches of ODOMETER_INGEST_BATCH_SIZE and validated
+as a whole with numpy. The batch is sorted once by (vehicle, register date) and the time series rules become
+comparisons between each reading and the previous ones of its vehicle, the first reading of a vehicle being compared
+with the last one stored (one DISTINCT ON query per batch):
+ - the odometer never goes back: a reading must not be lower than any previous reading of the vehicle;
+ - the store is append-only: a reading older than the last one stored is rejected;
+ - the distance between two consecutive readings must be possible at ODOMETER_MAX_SPEED_KMH.
+The readings are compared in kilometers, whatever the unit reported; a reading above ODOMETER_MAX_VALUE (in the unit
+reported) is rejected before.
+
+The batches appending to the same vehicle are serialized with a transaction-level advisory lock per vehicle, taken
+before its last reading stored is read and held until the ingestion commits, so two requests can not both validate
+against the same last reading. The ingestion runs in READ COMMITTED (INGEST_ISOLATION_LEVEL): once the lock is
+granted, the last reading is read from the data committed by the ingestion which held it, not from a snapshot taken
+before the wait.
+
+The valid readings of a batch are stored with a single ``INSERT ... VALUES ... ON CONFLICT DO NOTHING RETURNING``
+on (vehicle, register date): a reading sent again is reported as duplicated and never stored twice.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import time
+import psycopg2
+import numpy as np
+from datetime import datetime
+from psycopg2.extras import execute_values
+from db_controller.database_backend import *
+from db_controller.batch_validation import float_column, datetime_column, missing_mask, is_id, registered_ids
+from handler_controller.request_rows import parse_request_rows
+from db_controller import mvc_exceptions as mvc_exc
+from apps.vehicle.VehicleModel import VehicleModel
+from apps.driver.DriverModel import DriverModel
+from .OdometerModel import OdometerModel, KM_PER_UNIT
+
+cfg_app = get_config_settings_app()
+
+logger = configure_logger('db')
+
+# Request field -> OdometerModel attribute
+ODOMETER_INGEST_FIELDS = [
+    ('odometro_vehiculo_id', 'odometer_vehicle_id'),
+    ('odometro_fecha_registro', 'odometer_register_date'),
+    ('odometro_valor', 'odometer_value'),
+    ('odometro_unidad_medida', 'odometer_unit'),
+    ('odometro_conductor_id', 'odometer_driver_id'),
+]
+
+DEFAULT_UNIT = 'km'
+
+# Readings dated up to this many seconds in the future are accepted, for the clock drift of the devices
+CLOCK_SKEW_SECONDS = 300
+
+# Isolation level of the transactions of the ingestion, see the module documentation
+INGEST_ISOLATION_LEVEL = 'READ COMMITTED'
+
+
+class LastReadings:
+    r"""
+    Class to instance the last reading stored of each vehicle of a batch, as sorted numpy columns.
+    """
+
+    __slots__ = ('vehicles', 'timestamps', 'kilometers')
+
+    def __init__(self, vehicles=(), timestamps=(), kilometers=()):
+        order = np.argsort(np.asarray(vehicles, dtype=np.float64), kind='stable')
+
+        self.vehicles = np.asarray(vehicles, dtype=np.float64)[order]
+        self.timestamps = np.asarray(timestamps, dtype='datetime64[s]')[order]
+        self.kilometers = np.asarray(kilometers, dtype=np.float64)[order]
+
+    def lookup(self, vehicles):
+        r"""
+        Get, for each vehicle given, the register date and the kilometers of its last reading stored.
+
+        :param vehicles: Float array of vehicle ids.
+        :return timestamps, kilometers: Arrays aligned with the vehicles, NaT and -inf without readings stored.
+        """
+
+        timestamps = np.full(len(vehicles), np.datetime64('NaT'), dtype='datetime64[s]')
+        kilometers = np.full(len(vehicles), -np.inf)
+
+        if not self.vehicles.size:
+            return timestamps, kilometers
+
+        positions = np.minimum(np.searchsorted(self.vehicles, vehicles), self.vehicles.size - 1)
+        found = self.vehicles[positions] == vehicles
+
+        timestamps[found] = self.timestamps[positions[found]]
+        kilometers[found] = self.kilometers[positions[found]]
+
+        return timestamps, kilometers
+
+
+class OdometerBatch:
+    r"""
+    Class to instance a batch of readings validated: the rows to store and the rows rejected.
+    """
+
+    __slots__ = ('rows', 'errors', 'duplicated')
+
+    def __init__(self, rows, errors, duplicated):
+        # Tuples (row number, values in ODOMETER_INGEST_FIELDS order)
+        self.rows = rows
+        # Row number -> list of errors
+        self.errors = errors
+        # Row numbers of the readings repeated on a previous row of the batch
+        self.duplicated = duplicated
+
+
+def parse_odometer_rows(content_type, stream):
+    r"""
+    Read the readings of the request body: a JSON array (or {"lecturas": [...]}), NDJSON or CSV.
+    """
+
+    return parse_request_rows(content_type, stream, 'lecturas')
+
+
+def _segmented_running_max(values, first_in_group):
+    r"""
+    Running max of the values restarted on each group of a sorted array: one np.maximum.accumulate per group (the
+    vehicles of the batch).
+    """
+
+    if not values.size:
+        return values
+
+    groups = np.split(values, np.flatnonzero(first_in_group[1:]) + 1)
+
+    return np.concatenate([np.maximum.accumulate(group) for group in groups])
+
+
+def validate_odometer_batch(batch, first_row, last_readings=None, vehicle_ids=None, driver_ids=None):
+    r"""
+    Validate and type-convert a batch of readings, one vectorized comparison per rule over the whole batch.
+
+    :param batch: List of dictionaries with the request fields.
+    :param first_row: Number of the first row of the batch on the whole ingestion.
+    :param last_readings: LastReadings of the vehicles of the batch, none stored when None.
+    :param vehicle_ids: Array of the vehicle ids of the batch registered on database, not checked when None.
+    :param driver_ids: Array of the driver ids of the batch registered on database, not checked when None.
+    :return odometer_batch: The OdometerBatch with the rows ready to insert and the rows rejected.
+    """
+
+    size = len(batch)
+    records = [data if isinstance(data, dict) else {} for data in batch]
+
+    columns = {field_name: [data.get(field_name) for data in records] for field_name, _ in ODOMETER_INGEST_FIELDS}
+
+    vehicles = float_column(columns['odometro_vehiculo_id'])
+    drivers = float_column(columns['odometro_conductor_id'])
+    timestamps = datetime_column(columns['odometro_fecha_registro'], 's')
+    values = float_column(columns['odometro_valor'])
+
+    units = np.array([str(value).strip().lower() if value is not None else DEFAULT_UNIT for value in
+                      columns['odometro_unidad_medida']], dtype=object)
+    km_per_unit = np.array([KM_PER_UNIT.get(unit, np.nan) for unit in units], dtype=np.float64)
+
+    driver_missing = missing_mask(columns['odometro_conductor_id'])
+
+    latest_accepted = np.datetime64(datetime.now(), 's') + np.timedelta64(CLOCK_SKEW_SECONDS, 's')
+
+    with np.errstate(invalid='ignore'):
+        # Rule name -> mask of the rows breaking it
+        rules = {
+            'Row is not an object': np.array([not isinstance(data, dict) for data in batch], dtype=bool),
+            'odometro_vehiculo_id is not valid': ~is_id(vehicles),
+            'odometro_conductor_id is not valid': ~(driver_missing | is_id(drivers)),
+            'odometro_fecha_registro must be a past date and time (YYYY-MM-DDTHH:MM:SS)':
+                np.isnat(timestamps) | (timestamps > latest_accepted),
+            'odometro_valor out of range': ~((values >= 0) & (values <= cfg_app.odometer_max_value)),
+            'odometro_unidad_medida must be one of: {}'.format(', '.join(KM_PER_UNIT)): np.isnan(km_per_unit),
+        }
+
+    if vehicle_ids is not None:
+        rules['odometro_vehiculo_id is not registered'] = ~rules['odometro_vehiculo_id is not valid'] & \
+                                                          ~np.isin(vehicles, vehicle_ids)
+
+    if driver_ids is not None:
+        rules['odometro_conductor_id is not registered'] = ~driver_missing & \
+                                                           ~rules['odometro_conductor_id is not valid'] & \
+                                                           ~np.isin(drivers, driver_ids)
+
+    invalid = np.zeros(size, dtype=bool)
+
+    for rule_mask in rules.values():
+        invalid |= rule_mask
+
+    # Time series of each vehicle: the readings with valid fields sorted by (vehicle, register date, row)
+    candidates = np.flatnonzero(~invalid)
+    candidates = candidates[np.lexsort((candidates, timestamps[candidates], vehicles[candidates]))]
+
+    same_vehicle = np.zeros(candidates.size, dtype=bool)
+    same_vehicle[1:] = vehicles[candidates[1:]] == vehicles[candidates[:-1]]
+
+    # A reading repeated (same vehicle and register date) inside the batch is kept on its first row only
+    repeated = np.zeros(candidates.size, dtype=bool)
+    repeated[1:] = same_vehicle[1:] & (timestamps[candidates[1:]] == timestamps[candidates[:-1]])
+
+    duplicated = sorted((first_row + candidates[repeated]).tolist())
+
+    series = candidates[~repeated]
+
+    stored_timestamps, stored_km = (last_readings or LastReadings()).lookup(vehicles[series])
+
+    # The readings older than the last one stored are rejected before the series is compared, they never count as
+    # a previous reading of the batch
+    stale = timestamps[series] < stored_timestamps
+
+    rule_mask = np.zeros(size, dtype=bool)
+    rule_mask[series[stale]] = True
+
+    rules['odometro_fecha_registro older than the last reading stored of the vehicle'] = rule_mask
+    invalid |= rule_mask
+
+    series = series[~stale]
+    stored_timestamps = stored_timestamps[~stale]
+    stored_km = stored_km[~stale]
+
+    series_vehicles = vehicles[series]
+    series_timestamps = timestamps[series]
+    series_km = values[series] * km_per_unit[series]
+
+    first_in_group = np.ones(series.size, dtype=bool)
+    first_in_group[1:] = series_vehicles[1:] != series_vehicles[:-1]
+
+    # Highest reading before each one: the previous readings of the batch and the last one stored
+    previous_max = np.full(series.size, -np.inf)
+
+    if series.size:
+        running_max = _segmented_running_max(series_km, first_in_group)
+
+        previous_max[1:] = running_max[:-1]
+        previous_max[first_in_group] = -np.inf
+
+    previous_max = np.maximum(previous_max, stored_km)
+
+    # Previous reading of each one, for the speed between them
+    previous_km = np.empty(series.size)
+    previous_timestamps = np.empty(series.size, dtype='datetime64[s]')
+
+    if series.size:
+        previous_km[1:] = series_km[:-1]
+        previous_timestamps[1:] = series_timestamps[:-1]
+
+    previous_km[first_in_group] = stored_km[first_in_group]
+    previous_timestamps[first_in_group] = stored_timestamps[first_in_group]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        elapsed_hours = (series_timestamps - previous_timestamps) / np.timedelta64(1, 'h')
+        speed = (series_km - previous_km) / elapsed_hours
+
+        series_rules = {
+            'odometro_valor lower than a previous reading of the vehicle': series_km < previous_max,
+            'odometro_valor too far from the previous reading of the vehicle':
+                (elapsed_hours > 0) & (speed > cfg_app.odometer_max_speed_kmh),
+        }
+
+    for message, series_mask in series_rules.items():
+        rule_mask = np.zeros(size, dtype=bool)
+        rule_mask[series[series_mask]] = True
+
+        rules[message] = rule_mask
+        invalid |= rule_mask
+
+    errors = dict()
+
+    not_object = rules['Row is not an object']
+
+    for position in np.flatnonzero(invalid).tolist():
+        if not_object[position]:
+            errors[first_row + position] = ['Row is not an object']
+        else:
+            errors[first_row + position] = [message for message, rule_mask in rules.items() if rule_mask[position]]
+
+    stored_positions = series[~invalid[series]]
+
+    rows = list(zip(
+        (first_row + stored_positions).tolist(),
+        vehicles[stored_positions].astype(np.int64).tolist(),
+        timestamps[stored_positions].tolist(),
+        values[stored_positions].tolist(),
+        units[stored_positions].tolist(),
+        [None if is_missing else int(value) for value, is_missing in
+         zip(drivers[stored_positions].tolist(), driver_missing[stored_positions].tolist())],
+    ))
+
+    return OdometerBatch(rows, errors, duplicated)
+
+
+def _last_readings(cursor, vehicles):
+    r"""
+    Lock the time series of the vehicles of the batch and get the last reading stored of each one, with one
+    DISTINCT ON query.
+
+    The advisory locks are taken in vehicle order and released when the transaction ends: a concurrent ingestion
+    of the same vehicles waits here and then reads the readings committed by this one.
+
+    :return last_readings: The LastReadings of the vehicles.
+    """
+
+    candidate_ids = np.unique(vehicles[is_id(vehicles)]).astype(np.int64).tolist()
+
+    if not candidate_ids:
+        return LastReadings()
+
+    cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s), vehicle_id) FROM unnest(%s::integer[]) AS vehicle_id',
+                   (OdometerModel.__tablename__, candidate_ids))
+
+    columns = OdometerModel.__mapper__.columns
+
+    cursor.execute(
+        'SELECT DISTINCT ON ("{vehicle}") "{vehicle}", "{date}", "{value}", "{unit}" FROM "{table}" '
+        'WHERE "{vehicle}" = ANY(%s) ORDER BY "{vehicle}", "{date}" DESC'.format(
+            vehicle=columns['odometer_vehicle_id'].name, date=columns['odometer_register_date'].name,
+            value=columns['odometer_value'].name, unit=columns['odometer_unit'].name,
+            table=OdometerModel.__tablename__
+        ),
+        (candidate_ids,)
+    )
+
+    stored_rows = cursor.fetchall()
+
+    return LastReadings([row[0] for row in stored_rows], [row[1] for row in stored_rows],
+                        [row[2] * KM_PER_UNIT.get(row[3], 1.0) for row in stored_rows])
+
+
+def _insert_batch(cursor, column_names, rows):
+    r"""
+    Insert the rows of a batch in one statement, skipping the readings already stored.
+
+    :return inserted: Number of readings inserted.
+    """
+
+    columns = OdometerModel.__mapper__.columns
+
+    inserted_rows = execute_values(
+        cursor,
+        'INSERT INTO "{table}" ({columns}) VALUES %s ON CONFLICT ("{vehicle}", "{date}") DO NOTHING '
+        'RETURNING "{id}"'.format(
+            table=OdometerModel.__tablename__, columns=', '.join('"{}"'.format(name) for name in column_names),
+            vehicle=columns['odometer_vehicle_id'].name, date=columns['odometer_register_date'].name,
+            id=columns['odometer_id'].name
+        ),
+        [row[1:] for row in rows], page_size=max(len(rows), 1), fetch=True
+    )
+
+    return len(inserted_rows)
+
+
+def ingest_odometer_readings(session, rows, batch_size=None):
+    r"""
+    Validate and append the readings in batches on the transaction of the session.
+
+    :param session: Session database object.
+    :param rows: Iterable of dictionaries with the request fields of each reading.
+    :param batch_size: Number of readings validated and inserted per batch, ODOMETER_INGEST_BATCH_SIZE by default.
+    :return summary: Dictionary with the counters, the errors of the invalid rows and the aggregate throughput.
+    """
+
+    start_time = time.perf_counter()
+
+    batch_size = max(batch_size or cfg_app.odometer_batch_size, 1)
+
+    column_names = [OdometerModel.__mapper__.columns[attr_name].name for _, attr_name in ODOMETER_INGEST_FIELDS]
+
+    errors = []
+    total_rows = 0
+    inserted_rows = 0
+    duplicated_rows = 0
+    invalid_rows = 0
+
+    try:
+
+        cursor = session.connection().connection.cursor()
+
+        def process_batch(batch_rows, first_row):
+            nonlocal inserted_rows, duplicated_rows, invalid_rows
+
+            records = [data if isinstance(data, dict) else {} for data in batch_rows]
+
+            vehicles = float_column([data.get('odometro_vehiculo_id') for data in records])
+
+            vehicle_ids = registered_ids(cursor, VehicleModel, 'vehicle_id', vehicles)
+            driver_ids = registered_ids(cursor, DriverModel, 'driver_id',
+                                        float_column([data.get('odometro_conductor_id') for data in records]))
+
+            odometer_batch = validate_odometer_batch(batch_rows, first_row, _last_readings(cursor, vehicles),
+                                                     vehicle_ids, driver_ids)
+
+            batch_inserted = _insert_batch(cursor, column_names, odometer_batch.rows) if odometer_batch.rows else 0
+
+            for row_number, row_errors in odometer_batch.errors.items():
+                errors.append({'row': row_number, 'errors': row_errors})
+
+            inserted_rows += batch_inserted
+            duplicated_rows += len(odometer_batch.duplicated) + len(odometer_batch.rows) - batch_inserted
+            invalid_rows += len(odometer_batch.errors)
+
+            logger.info('Odometer batch from row %s: %s inserted, %s duplicated, %s invalid', first_row,
+                        batch_inserted, len(odometer_batch.duplicated) + len(odometer_batch.rows) - batch_inserted,
+                        len(odometer_batch.errors))
+
+        batch = []
+
+        for data in rows:
+            batch.append(data)
+            total_rows += 1
+
+            if len(batch) >= batch_size:
+                process_batch(batch, total_rows - len(batch) + 1)
+                batch = []
+
+        if batch:
+            process_batch(batch, total_rows - len(batch) + 1)
+
+        cursor.close()
+
+    except (SQLAlchemyError, psycopg2.Error) as exc:
+        session.rollback()
+
+        logger.exception('An exception was occurred while execute transactions: %s', str(exc))
+        raise mvc_exc.IntegrityError(
+            'Rows not stored in "{}". IntegrityError: {}'.format(OdometerModel.__tablename__, str(exc))
+        )
+
+    elapsed_time = time.perf_counter() - start_time
+
+    errors.sort(key=lambda error: error['row'])
+
+    return {
+        'total': total_rows,
+        'inserted': inserted_rows,
+        'duplicated': duplicated_rows,
+        'invalid': invalid_rows,
+        'elapsed_seconds': round(elapsed_time, 3),
+        'rows_per_second': round(total_rows / elapsed_time, 1) if elapsed_time else total_rows,
+        'errors': errors
+    }
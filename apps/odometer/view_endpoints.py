@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import csv
+from flask import Blueprint, request
+from db_controller.database_backend import *
+from db_controller import mvc_exceptions as mvc_exc
+from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse, STREAM_FORMATS
+from handler_controller.messages import SuccessMsg, ErrorMsg
+from logger_controller.logger_control import *
+from utilities.Utility import *
+
+cfg_app = get_config_settings_app()
+odometer_api = Blueprint('odometer_api', __name__)
+logger = configure_logger('ws')
+
+# The models are imported by the endpoints on their first call, not when the blueprint is registered: their
+# mappings and dependencies (numpy, sqlalchemy_filters, psycopg2.extras) stay out of the start up of the workers.
+
+
+@odometer_api.route('/', methods=['POST', 'GET'])
+def endpoint_processing_odometer_data():
+    from .OdometerModel import OdometerModel
+    from .odometer_ingestion import ingest_odometer_readings, INGEST_ISOLATION_LEVEL
+
+    session_db = get_db_session(INGEST_ISOLATION_LEVEL if request.method == 'POST' else None)
+
+    query_string = request.query_string.decode('utf-8')
+
+    if request.method == 'POST':
+        # REGISTRAR LECTURA DE ODOMETRO
+
+        data = request.get_json(force=True)
+
+        if not data or not isinstance(data, dict):
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+        try:
+
+            ingest_summary = ingest_odometer_readings(session_db, [data])
+
+        except mvc_exc.IntegrityError as exc:
+            logger.error('Odometer reading not stored: %s', str(exc))
+
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+        if ingest_summary.get('invalid'):
+            return HandlerResponse.request_unprocessable(ErrorMsg.ERROR_DATA_NOT_VALID,
+                                                         {'errors': ingest_summary['errors'][0]['errors']})
+
+        if not ingest_summary.get('inserted'):
+            return HandlerResponse.response_success(SuccessMsg.MSG_RECORD_REGISTERED, {})
+
+        return HandlerResponse.response_resource_created(SuccessMsg.MSG_CREATED_RECORD, ingest_summary)
+
+    elif request.method == 'GET':
+        # To GET the readings of a time range:
+
+        filter_spec = odometer_filter_spec(query_string)
+
+        try:
+
+            limit, cursor, with_total = get_pagination_args(request.args)
+
+            readings_on_db = OdometerModel.get_readings_by_filters(session_db, filter_spec, limit, cursor,
+                                                                   with_total)
+
+        except ValueError as exc:
+            logger.error('Pagination params not valid: %s', str(exc))
+
+            return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+        if not bool(readings_on_db) or not readings_on_db.get('results'):
+            return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+        return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, readings_on_db)
+
+    else:
+        return HandlerResponse.request_not_found(ErrorMsg.ERROR_REQUEST_NOT_FOUND)
+
+
+@odometer_api.route('/bulk', methods=['POST'])
+def endpoint_bulk_odometer():
+    r"""
+    Append many readings at once from a JSON array, NDJSON (application/x-ndjson) or CSV (text/csv) body.
+
+    Query params: batch_size (readings validated and inserted per statement).
+    """
+
+    from .odometer_ingestion import parse_odometer_rows, ingest_odometer_readings, INGEST_ISOLATION_LEVEL
+
+    session_db = get_db_session(INGEST_ISOLATION_LEVEL)
+
+    batch_size = request.args.get('batch_size', cfg_app.odometer_batch_size, type=int)
+
+    try:
+
+        rows = parse_odometer_rows(request.content_type, request.stream)
+
+        ingest_summary = ingest_odometer_readings(session_db, rows, max(batch_size, 1))
+
+    except (ValueError, csv.Error) as exc:
+        logger.error('Bulk odometer payload can not be read: %s', str(exc))
+
+        return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_BODY_NOT_VALID)
+
+    except mvc_exc.IntegrityError as exc:
+        logger.error('Bulk odometer readings not stored: %s', str(exc))
+
+        return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+    logger.info('Odometer readings ingested: %s inserted, %s duplicated, %s invalid, %s rows/s',
+                ingest_summary.get('inserted'), ingest_summary.get('duplicated'),
+                ingest_summary.get('invalid'), ingest_summary.get('rows_per_second'))
+
+    if not ingest_summary.get('total'):
+        return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+    return HandlerResponse.response_success(SuccessMsg.MSG_CREATED_RECORD, ingest_summary)
+
+
+@odometer_api.route('/series', methods=['GET'])
+def endpoint_odometer_series():
+    r"""
+    Readings downsampled by the database: max, min, distance and count per vehicle and bucket.
+
+    Query params: vehiculo, desde (included), hasta (excluded), intervalo (hour, day, week or month; day by default).
+    """
+
+    from .OdometerModel import OdometerModel
+
+    session_db = get_db_session()
+
+    try:
+
+        series = OdometerModel.get_series(session_db, get_int_arg(request.args, 'vehiculo'),
+                                          request.args.get('desde'), request.args.get('hasta'),
+                                          request.args.get('intervalo', 'day').lower())
+
+    except ValueError as exc:
+        logger.error('Series params not valid: %s', str(exc))
+
+        return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+    if not series:
+        return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+    return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, series)
+
+
+@odometer_api.route('/latest', methods=['GET'])
+def endpoint_odometer_latest():
+    r"""
+    Last reading of each vehicle, or of the vehicles given as vehiculo=1,2,3.
+    """
+
+    from .OdometerModel import OdometerModel
+
+    session_db = get_db_session()
+
+    vehicle_ids = None
+
+    if request.args.get('vehiculo'):
+        try:
+            vehicle_ids = [int(vehicle_id) for vehicle_id in request.args.get('vehiculo').split(',')]
+        except ValueError:
+            return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+    last_readings = OdometerModel.get_last_readings(session_db, vehicle_ids)
+
+    if not last_readings:
+        return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+    return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, last_readings)
+
+
+def odometer_filter_spec(query_string):
+    r"""
+    Build the sqlalchemy_filters specification of the readings list and export endpoints from the query params.
+
+    :param query_string: The decoded query string of the request.
+    :return filter_spec: List of filters over the OdometerModel attributes.
+    """
+
+    filter_spec = []
+
+    if 'vehiculo' in query_string:
+        filter_spec.append({'field': 'odometer_vehicle_id', 'op': '==', 'value': request.args.get('vehiculo')})
+
+    if 'conductor' in query_string:
+        filter_spec.append({'field': 'odometer_driver_id', 'op': '==', 'value': request.args.get('conductor')})
+
+    if 'desde' in query_string:
+        filter_spec.append({'field': 'odometer_register_date', 'op': '>=', 'value': request.args.get('desde')})
+
+    if 'hasta' in query_string:
+        filter_spec.append({'field': 'odometer_register_date', 'op': '<', 'value': request.args.get('hasta')})
+
+    return filter_spec
+
+
+@odometer_api.route('/export', methods=['GET'])
+def endpoint_export_odometer():
+    r"""
+    Stream all the readings matching the list filters as a JSON array or NDJSON (?format=ndjson).
+
+    The rows are read through a server-side cursor on a connection of the export, the request session is not used.
+    """
+
+    from .OdometerModel import OdometerModel
+    from db_controller.query_layer import EXPORT_CHUNK_SIZE
+
+    export_format = request.args.get('format', 'json').lower()
+
+    if export_format not in STREAM_FORMATS:
+        return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+    filter_spec = odometer_filter_spec(request.query_string.decode('utf-8'))
+
+    chunk_size = max(request.args.get('chunk_size', EXPORT_CHUNK_SIZE, type=int), 1)
+
+    logger.info('Export of odometer readings requested as %s, filters: %s', export_format, str(filter_spec))
+
+    readings_rows = OdometerModel.export_by_filters(filter_spec, chunk_size)
+
+    return HandlerResponse.response_stream(readings_rows, export_format, 'odometro.{}'.format(export_format))
@@ -10,7 +10,7 @@ Each one of the CRUD operations should be able to open a database connection if
 there isn't already one available (check if there are any issues with this).
 
 Documentation:
-    About the Bank Bot data on the database to generate CRUD operations from endpoint of the API:
+    About the Vehicle data on the database to generate CRUD operations from endpoint of the API:
     - Insert data
     - Update data
     - Delete data
@@ -24,13 +24,13 @@ __license__ = ""
 __history__ = """ """
 __version__ = "1.21.F21.1 ($Rev: 1 $)"
 
-import json
 import logging
 from datetime import datetime
-from pytz import timezone
 from sqlalchemy_filters import apply_filters
-from sqlalchemy import Column, Numeric, Integer, String, Date, Time, Sequence, Float
+from sqlalchemy import Column, Numeric, Integer, String, Date, Time, Sequence, Float, Index
 from db_controller.database_backend import *
+from db_controller.query_layer import (lookup_one, lookup_by_id, model_values, insert_returning, keyset_page, page_result,
+                                       stream_query, EXPORT_CHUNK_SIZE)
 from db_controller import mvc_exceptions as mvc_exc
 
 cfg_db = get_config_settings_db()
@@ -49,6 +49,10 @@ class VehicleModel(Base):
     """
 
     __tablename__ = cfg_db.gas_vehicle_table.__str__()
+    __table_args__ = (
+        # Natural key of the vehicle, target of the INSERT ... ON CONFLICT
+        Index('uq_vehicle_plate', cfg_db.GasVehicle.vehiculo_matricula, unique=True),
+    )
 
     vehicle_id = Column(cfg_db.GasVehicle.vehiculo_id, Integer, VEHICLE_ID_SEQ,
                         primary_key=True, server_default=VEHICLE_ID_SEQ.next_value())
@@ -73,6 +77,7 @@ class VehicleModel(Base):
     vehicle_tax_cost = Column(cfg_db.GasVehicle.vehiculo_costo_impuesto, Integer, nullable=False)
     vehicle_register_date = Column(cfg_db.GasVehicle.vehiculo_fecha_registro, Date, nullable=True)
     vehicle_low_register_date = Column(cfg_db.GasVehicle.vehiculo_fecha_baja, Date, nullable=False)
+    vehicle_tank_capacity = Column(cfg_db.GasVehicle.vehiculo_capacidad_tanque, Float, nullable=True)
 
     def __init__(self, data_vehicle):
 
@@ -87,7 +92,7 @@ class VehicleModel(Base):
         self.vehicle_anio_motor = data_vehicle.get('vehiculo_anio_motor')
         self.vehicle_chasis_number = data_vehicle.get('vehiculo_numero_chasis')
         self.vehicle_transmision = data_vehicle.get('vehiculo_transmision')
-        self.vehicle_gas_type = data_vehicle.get('vehiculo_tipo_transmision')
+        self.vehicle_gas_type = data_vehicle.get('vehiculo_tipo_combustible')
         self.vehicle_co2_emisions = data_vehicle.get('vehiculo_emisiones_co2')
         self.vehicle_horse_power = data_vehicle.get('vehiculo_caballos_fuerza')
         self.vehicle_potence = data_vehicle.get('vehiculo_potencia')
@@ -97,510 +102,265 @@ class VehicleModel(Base):
         self.vehicle_tax_cost = data_vehicle.get('vehiculo_costo_impuesto')
         self.vehicle_register_date = data_vehicle.get('vehiculo_fecha_registro')
         self.vehicle_low_register_date = data_vehicle.get('vehiculo_fecha_baja')
+        self.vehicle_tank_capacity = data_vehicle.get('vehiculo_capacidad_tanque')
 
     def check_if_row_exists(self, session, data):
+        """
+        Validate if the vehicle exists on database from dictionary data, by its plate
 
-        row_exists = None
-        inversion_id = 0
+        :param session: Session database object
+        :param data: Dictionary with data to make validation function
+        :return: row_exists: The vehicle row on database or None
+        """
 
-        try:
-            # for example to check if the insert on db is correct
-            inv_id = self.get_inversion_id(session, data)
+        row_exists = self.get_vehicle_by_plate(session, data.get('vehiculo_matricula'))
 
-            if inv_id is not None:
-                inversion_id = inv_id.invId
-            else:
-                inversion_id = 0
+        logger.info('Row to data: {}, Exists: %s'.format(data.get('vehiculo_matricula')), str(row_exists))
 
-            logger.info('Inversion Row object in DB: %s', str(inversion_id))
+        return row_exists
 
-            row_exists = session.query(GinInversionesModel).filter(GinInversionesModel.invId == inversion_id).\
-                filter(GinInversionesModel.cuenta == data.get('cuenta')).scalar()
+    def insert_data(self, session, data, update_existing=False):
+        """
+        Function to insert new vehicle on database, in a single INSERT ... ON CONFLICT ... RETURNING statement
 
-            logger.info('Row to data: {}, Exists: %s'.format(data), str(row_exists))
+        :param session: Session database object
+        :param data: Dictionary to insert new the data containing on the db
+        :param update_existing: Overwrite the vehicle registered with the same plate instead of skipping it
+        :return: endpoint_response
+        """
 
-        except SQLAlchemyError as exc:
-            row_exists = None
+        endpoint_response = None
 
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
-            raise mvc_exc.IntegrityError(
-                'Row not stored in "{}". IntegrityError: {}'.format(data.get('cuenta'),
-                                                                    str(str(exc.args) + ':' + str(exc.code)))
-            )
-        finally:
-            session.close()
+        try:
 
-        return row_exists
+            values = model_values(self)
 
-    def insert_data(self, session, data):
+            logger.info('New Row Vehicle Plate: %s', str(self.vehicle_plate))
 
-        endpoint_response = None
+            update_attrs = [attr for attr in values if attr != 'vehicle_plate'] if update_existing else None
 
-        if not self.check_if_row_exists(session, data):
+            row_inserted = insert_returning(session, VehicleModel, values, ['vehicle_plate'], update_attrs)
 
-            try:
+            if row_inserted:
+                logger.info('Vehicle ID Inserted: %s', str(row_inserted.vehicle_id))
 
-                new_row = GinInversionesModel(data)
+                endpoint_response = VehicleModel.to_dict(row_inserted)
 
-                logger.info('New Row Inversion Cuenta: %s', str(new_row.cuenta))
+        except SQLAlchemyError as exc:
 
-                session.add(new_row)
+            endpoint_response = None
 
-                inv_id = self.get_inversion_id(session, data).invId
+            session.rollback()
 
-                logger.info('Inversion ID Inserted: %s', str(inv_id))
+            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
+                                                                                             str(exc.code)))
+            raise mvc_exc.IntegrityError(
+                'Row not stored in "{}". IntegrityError: {}'.format(data.get('vehiculo_matricula'),
+                                                                    str(str(exc.args) + ':' + str(exc.code)))
+            )
 
-                session.flush()
+        return endpoint_response
 
-                data['invId'] = inv_id
-
-                # check insert correct
-                row_inserted = self.get_one_inversion(session, data)
-
-                logger.info('Data Bank inserted: %s, Original Data: {}'.format(data), str(row_inserted))
-
-                if row_inserted:
-                    endpoint_response = json.dumps({
-                        "invId": inv_id,
-                        "cuenta": row_inserted.cuenta,
-                        "monto": str(row_inserted.monto),
-                        "estatus": row_inserted.estatus,
-                        "canal": row_inserted.canal,
-                        "origen": row_inserted.origen,
-                        "autorizacion": row_inserted.autorizacion,
-                        "motivo": row_inserted.motivo,
-                        "comisionistaId": row_inserted.comisionistaId,
-                        "transaccionId": row_inserted.transaccionId,
-                        "fechaRecepcion": str(row_inserted.fechaRecepcion),
-                        "horaRecepcion": str(row_inserted.horaRecepcion),
-                        "conciliacionId": str(row_inserted.conciliacionId)
-                    })
+    def save_inversion(self, session, data):
+        """
+        Function to save a vehicle received from the data flow endpoint, updating it when already registered
 
-            except SQLAlchemyError as exc:
+        :param session: Session database object
+        :param data: Dictionary to insert new the data containing on the db
+        :return: endpoint_response
+        """
 
-                endpoint_response = None
+        return self.insert_data(session, data, update_existing=True)
 
-                session.rollback()
+    def delete_data(self, session, data):
+        """
+        Inactivate the vehicle setting its low register date to today, to do not show it anymore
 
-                logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                                 str(exc.code)))
-                raise mvc_exc.IntegrityError(
-                    'Row not stored in "{}". IntegrityError: {}'.format(data.get('cuenta'),
-                                                                        str(str(exc.args) + ':' + str(exc.code)))
-                )
-            finally:
-                session.close()
+        :param session: Session database object
+        :param data: Dictionary with the plate of the vehicle to inactivate
+        :return: endpoint_response
+        """
 
-        return endpoint_response
+        endpoint_response = None
 
-    def save_inversion(self, session, data):
+        row_vehicle = self.get_vehicle_by_plate(session, data.get('vehiculo_matricula'))
 
-        endpoint_response = None
+        today = datetime.now().date()
 
-        if not self.check_if_row_exists(session, data):
+        if row_vehicle is not None and not (row_vehicle.vehicle_low_register_date and
+                                            row_vehicle.vehicle_low_register_date <= today):
 
             try:
 
-                new_row = GinInversionesModel(data)
+                logger.info('Vehicle Id: %s', str(row_vehicle.vehicle_id))
 
-                logger.info('New Row Inversion Cuenta: %s', str(new_row.cuenta))
+                row_vehicle.vehicle_low_register_date = today
 
-                session.add(new_row)
+                session.flush()
 
-                inv_id = self.get_inversion_id(session, data).invId
+                logger.info('Vehicle inactive')
 
-                logger.info('Inversion ID Inserted: %s', str(inv_id))
+                endpoint_response = VehicleModel.to_dict(row_vehicle)
 
-                session.flush()
+            except SQLAlchemyError as exc:
 
-                data['invId'] = inv_id
-
-                # check insert correct
-                row_inserted = self.get_one_inversion(session, data)
-
-                logger.info('Data Bank inserted: %s, Original Data: {}'.format(data), str(row_inserted))
-
-                if row_inserted:
-
-                    endpoint_response = json.dumps({
-                        "invId": inv_id,
-                        "cuenta": row_inserted.cuenta,
-                        "monto": str(row_inserted.monto),
-                        "estatus": row_inserted.estatus,
-                        "canal": row_inserted.canal,
-                        "origen": row_inserted.origen,
-                        "autorizacion": row_inserted.autorizacion,
-                        "motivo": row_inserted.motivo,
-                        "comisionistaId": row_inserted.comisionistaId,
-                        "transaccionId": row_inserted.transaccionId,
-                        "fechaRecepcion": str(row_inserted.fechaRecepcion),
-                        "horaRecepcion": str(row_inserted.horaRecepcion),
-                        "fechaAplicacion": str(row_inserted.fechaAplicacion),
-                        "horaAplicacion": str(row_inserted.horaAplicacion),
-                        "conciliacionId": str(row_inserted.conciliacionId),
-                        "codigoBancario": str(row_inserted.codigoBancario),
-                        "metodoDeposito": str(row_inserted.metodoDeposito),
-                    })
+                endpoint_response = None
 
-            except SQLAlchemyError as exc:
                 session.rollback()
+
                 logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
                                                                                                  str(exc.code)))
                 raise mvc_exc.IntegrityError(
-                    'Row not stored in "{}". IntegrityError: {}'.format(data.get('cuenta'),
+                    'Row not stored in "{}". IntegrityError: {}'.format(data.get('vehiculo_matricula'),
                                                                         str(str(exc.args) + ':' + str(exc.code)))
                 )
-            finally:
-                session.close()
-
-        return endpoint_response
-
-    def delete_data(self, session, data):
-
-        endpoint_response = None
-
-        estatus_inversion = self.get_status_inversion(session, data)
-
-        if estatus_inversion:
-
-            if 'CANCELADO' not in estatus_inversion:
-
-                try:
-
-                    inv_id = self.get_inversion_id_delete(session,
-                                                          data.get('cuenta'),
-                                                          data.get('canal'),
-                                                          data.get('autorizacion')).invId
-
-                    logger.info('Inversion Id: %s', str(inv_id))
-
-                    # update row to database to inactivate Bank
-                    # session.query(GinInversionesModel).filter(GinInversionesModel.invId == inv_id). \
-                    #     filter(GinInversionesModel.cuenta == data.get('cuenta')).\
-                    #     filter(GinInversionesModel.autorizacion == data.get('autorizacion')).\
-                    #     update({"estatus": "CANCELADO"},
-                    #            synchronize_session='fetch')
-
-                    session.query(GinInversionesModel).filter(GinInversionesModel.invId == inv_id).\
-                        update({"estatus": "CANCELADO"},
-                               synchronize_session='fetch')
-
-                    session.flush()
-
-                    data['invId'] = inv_id
-
-                    # check update correct
-                    row_deleted = self.get_one_inversion(session, data)
-
-                    if row_deleted:
-                        logger.info('Bank inactive')
-
-                        endpoint_response = json.dumps({
-                            "invId": inv_id,
-                            "cuenta": row_deleted.cuenta,
-                            "monto": str(row_deleted.monto),
-                            "estatus": row_deleted.estatus,
-                            "canal": row_deleted.canal,
-                            "origen": row_deleted.origen,
-                            "autorizacion": row_deleted.autorizacion,
-                            "motivo": row_deleted.motivo,
-                            "comisionistaId": row_deleted.comisionistaId,
-                            "transaccionId": row_deleted.transaccionId,
-                            "fechaRecepcion": str(row_deleted.fechaRecepcion),
-                            "horaRecepcion": str(row_deleted.horaRecepcion),
-                            "fechaAplicacion": str(row_deleted.fechaAplicacion),
-                            "horaAplicacion": str(row_deleted.horaAplicacion),
-                            "conciliacionId": str(row_deleted.conciliacionId),
-                            "codigoBancario": str(row_deleted.codigoBancario),
-                            "metodoDeposito": str(row_deleted.metodoDeposito),
-                        })
-
-                except SQLAlchemyError as exc:
-
-                    endpoint_response = None
-
-                    session.rollback()
-
-                    logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                                     str(exc.code)))
-                    raise mvc_exc.IntegrityError(
-                        'Row not stored in "{}". IntegrityError: {}'.format(data.get('cuenta'),
-                                                                            str(str(exc.args) + ':' + str(exc.code)))
-                    )
-                finally:
-                    session.close()
 
         return endpoint_response
 
     @staticmethod
-    def get_inversion_id(session, data):
+    def get_vehicle_by_plate(session, vehicle_plate):
+        """
+        Get the Vehicle row registered on database by its plate, in a single query
 
-        row_inversion = None
-
-        try:
+        :param session: Database session object
+        :param vehicle_plate: The plate (matricula) of the vehicle
+        :return: row_vehicle: The row on database registered or None
+        """
 
-            row_exists = session.query(GinInversionesModel).filter(GinInversionesModel.cuenta == data.get('cuenta')).\
-                filter(GinInversionesModel.autorizacion == data.get('autorizacion')).\
-                filter(GinInversionesModel.transaccionId == data.get('transaccionId')).\
-                filter(GinInversionesModel.comisionistaId == data.get('comisionistaId')).scalar()
+        row_vehicle = lookup_one(session, VehicleModel, vehicle_plate=vehicle_plate)
 
-            logger.info('Row Data Inversion Exists on DB: %s', str(row_exists))
+        logger.info('Row ID Vehicle data from database object: {}'.format(str(row_vehicle)))
 
-            if row_exists:
-
-                row_inversion = session.query(GinInversionesModel).\
-                    filter(GinInversionesModel.cuenta == data.get('cuenta')).\
-                    filter(GinInversionesModel.autorizacion == data.get('autorizacion')).\
-                    filter(GinInversionesModel.transaccionId == data.get('transaccionId')).\
-                    filter(GinInversionesModel.comisionistaId == data.get('comisionistaId')).one()
-
-                logger.info('Row ID Inversion data from database object: {}'.format(str(row_inversion)))
-
-        except SQLAlchemyError as exc:
-
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('transaccionId'), GinInversionesModel.__tablename__, str(str(exc.args) + ':' +
-                                                                                      str(exc.code))
-                )
-            )
-
-        finally:
-            session.close()
-
-        return row_inversion
+        return row_vehicle
 
     @staticmethod
-    def get_inversion_id_delete(session, cuenta, canal, autorizacion):
-
-        row_inversion = None
-
-        try:
-
-            row_exists = session.query(GinInversionesModel).filter(GinInversionesModel.cuenta == str(cuenta)). \
-                filter(GinInversionesModel.canal == str(canal)).\
-                filter(GinInversionesModel.autorizacion == str(autorizacion)).scalar()
-
-            logger.info('Row Data Inversion Exists to InvId: %s', str(row_exists))
-
-            if row_exists:
-                row_inversion = session.query(GinInversionesModel).filter(GinInversionesModel.cuenta == str(cuenta)). \
-                    filter(GinInversionesModel.canal == str(canal)).\
-                    filter(GinInversionesModel.autorizacion == autorizacion).one()
-
-                logger.info('Row ID Inversion data from database object: {}'.format(str(row_inversion)))
-
-        except SQLAlchemyError as exc:
-
-            row_inversion = None
+    def get_one_vehicle(session, vehicle_id):
+        """
+        Get the Vehicle row by its ID, from the session identity map when already loaded
 
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    cuenta, GinInversionesModel.__tablename__, str(str(exc.args) + ':' + str(exc.code))
-                )
-            )
+        :param session: Database session object
+        :param vehicle_id: The ID of the vehicle
+        :return: row: The row on database registered or None
+        """
 
-        finally:
-            session.close()
+        row = lookup_by_id(session, VehicleModel, vehicle_id)
 
-        return row_inversion
+        if row:
+            logger.info('Data Vehicle on Db: %s',
+                        'Matricula: {}, Marca: {}, Modelo: {}'.format(row.vehicle_plate,
+                                                                      row.vehicle_brand,
+                                                                      row.vehicle_model))
 
-    @staticmethod
-    def get_all_inversiones(session):
-
-        all_inversiones = None
-        inversiones_data = []
-
-        all_inversiones = session.query(GinInversionesModel).all()
-
-        for inversion in all_inversiones:
-            cuenta = inversion.cuenta
-            estatus = inversion.estatus
-            monto = inversion.monto
-            autorizacion = inversion.autorizacion
-            canal = inversion.canal
-            origen = inversion.origen
-            comisionistaId = inversion.comisionistaId
-            transaccionId = inversion.transaccionId
-            motivo = inversion.motivo
-            fechaRecepcion = inversion.fechaRecepcion
-            horaRecepcion = inversion.horaRecepcion
-            fechaAplicacion = inversion.fechaAplicacion
-            horaAplicacion = inversion.horaAplicacion
-            conciliacionId = inversion.conciliacionId
-            codigoBancario = inversion.codigoBancario
-            metodoDeposito = inversion.metodoDeposito
-
-            inversiones_data += [{
-                "Inversion": {
-                    "invId": inversion.invId,
-                    "cuenta": cuenta,
-                    "estatus": estatus,
-                    "monto": str(monto),
-                    "autorizacion": autorizacion,
-                    "canal": canal,
-                    "origen": origen,
-                    "comisionistaId": comisionistaId,
-                    "transaccionId": transaccionId,
-                    "motivo": motivo,
-                    "fechaRecepcion": str(fechaRecepcion),
-                    "horaRecepcion": str(horaRecepcion),
-                    "fechaAplicacion": str(fechaAplicacion),
-                    "horaAplicacion": str(horaAplicacion),
-                    "conciliacionId": conciliacionId,
-                    "codigoBancario": codigoBancario,
-                    "metodoDeposito": metodoDeposito
-                }
-            }]
-
-        return json.dumps(inversiones_data)
+        return row
 
     @staticmethod
-    def get_one_inversion(session, data):
-        row = None
+    def get_all_inversiones(session, limit=None, cursor=None, with_total=False):
+        """
+        Get one page of all the Vehicle objects data registered on database.
 
-        try:
-            row = session.query(GinInversionesModel).filter(GinInversionesModel.cuenta == data.get('cuenta')).\
-                filter(GinInversionesModel.invId == data.get('invId')).one()
+        :param session: Database session
+        :param limit: Number of vehicles of the page
+        :param cursor: Token of the page to get, returned as next_cursor by the previous page
+        :param with_total: Include the count of all the vehicles
+        :return: dict
+        """
 
-            if row:
-                logger.info('Data Inversion on Db: %s',
-                            'Cuenta: {}, Monto inversion: {}, Inversion Estatus: {}'.format(row.cuenta,
-                                                                                            row.monto,
-                                                                                            row.estatus))
+        return VehicleModel.get_inversiones_by_filters(session, None, limit, cursor, with_total)
 
-        except SQLAlchemyError as exc:
-
-            row = None
-
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
-
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('cuenta'), GinInversionesModel.__tablename__, str(str(exc.args) + ':' + str(exc.code))
-                )
-            )
-
-        finally:
-            session.close()
+    @staticmethod
+    def get_inversiones_by_filters(session, filter_spec=None, limit=None, cursor=None, with_total=False):
+        """
+        Get one page, keyset paginated on vehicle_id, of the Vehicle objects data registered on database matching
+        the filters.
 
-        return row
+        :param session: Database session
+        :param filter_spec: List of sqlalchemy_filters specifications over the VehicleModel attributes
+        :param limit: Number of vehicles of the page
+        :param cursor: Token of the page to get, returned as next_cursor by the previous page
+        :param with_total: Include the count of all the vehicles matching the filters
+        :return: dict
+        """
 
-    def get_status_inversion(self, session, data):
+        query = session.query(VehicleModel)
 
-        estatus_inv = None
+        if filter_spec:
+            query = apply_filters(query, filter_spec)
 
-        try:
-            inv_id = self.get_inversion_id_delete(session,
-                                                  data.get('cuenta'),
-                                                  data.get('canal'),
-                                                  data.get('autorizacion')).invId
+        query_result, next_cursor, total = keyset_page(query, VehicleModel.vehicle_id, limit, cursor, with_total)
 
-            logger.info('Inversion Id: %s', str(inv_id))
+        logger.info('Query filtered resultSet: %s rows, next cursor: %s', len(query_result), next_cursor)
 
-            if inv_id:
+        vehicles_data = [VehicleModel.to_dict(vehicle) for vehicle in query_result]
 
-                row = session.query(GinInversionesModel).filter(GinInversionesModel.invId == inv_id).\
-                    filter(GinInversionesModel.cuenta == data.get('cuenta')).one()
+        return page_result(vehicles_data, next_cursor, limit, total)
 
-                if row:
-                    estatus_inv = row.estatus
-
-                    logger.info('Inversion Estatus: %s', estatus_inv)
+    @staticmethod
+    def export_by_filters(filter_spec=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Get all the Vehicle objects data registered on database matching the filters, read through a server-side
+        cursor while they are consumed.
 
-        except SQLAlchemyError as exc:
-            estatus_inv = None
+        :param filter_spec: List of sqlalchemy_filters specifications over the VehicleModel attributes
+        :param chunk_size: Number of vehicles fetched from the cursor at a time
+        :return: Generator of the vehicle dictionaries, ordered by vehicle_id
+        """
 
-            logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
-                                                                                             str(exc.code)))
+        def build_query(session):
+            query = session.query(VehicleModel)
 
-            raise mvc_exc.ItemNotStored(
-                'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
-                    data.get('cuenta'), GinInversionesModel.__tablename__, str(str(exc.args) + ':' + str(exc.code))
-                )
-            )
+            if filter_spec:
+                query = apply_filters(query, filter_spec)
 
-        finally:
-            session.close()
+            return query.order_by(VehicleModel.vehicle_id)
 
-        return estatus_inv
+        return (VehicleModel.to_dict(vehicle) for vehicle in stream_query(build_query, chunk_size))
 
     @staticmethod
-    def get_inversiones_by_filters(session, filter_spec=list):
-
-        query_result = None
-        inversiones_data = []
-
-        if filter_spec is None:
-            query_result = session.query(GinInversionesModel).all()
-
-        query = session.query(GinInversionesModel)
-
-        filtered_query = apply_filters(query, filter_spec)
-        query_result = filtered_query.all()
-
-        logger.info('Query filtered resultSet: %s', str(query_result))
-
-        for inversion in query_result:
-            inversion_id = inversion.invId
-            cuenta = inversion.cuenta
-            estatus = inversion.estatus
-            monto = inversion.monto
-            autorizacion = inversion.autorizacion
-            canal = inversion.canal
-            origen = inversion.origen
-            comisionistaId = inversion.comisionistaId
-            transaccionId = inversion.transaccionId
-            motivo = inversion.motivo
-            fechaRecepcion = inversion.fechaRecepcion
-            horaRecepcion = inversion.horaRecepcion
-            fechaAplicacion = inversion.fechaAplicacion
-            horaAplicacion = inversion.horaAplicacion
-            conciliacionId = inversion.conciliacionId
-            codigoBancario = inversion.codigoBancario
-            metodoDeposito = inversion.metodoDeposito
-
-            inversiones_data += [{
-                "invId": inversion_id,
-                "cuenta": cuenta,
-                "estatus": estatus,
-                "monto": str(monto),
-                "autorizacion": autorizacion,
-                "canal": canal,
-                "origen": origen,
-                "comisionistaId": comisionistaId,
-                "transaccionId": transaccionId,
-                "motivo": motivo,
-                "fechaRecepcion": str(fechaRecepcion),
-                "horaRecepcion": str(horaRecepcion),
-                "fechaAplicacion": str(fechaAplicacion),
-                "horaAplicacion": str(horaAplicacion),
-                "conciliacionId": conciliacionId,
-                "codigoBancario": codigoBancario,
-                "metodoDeposito": metodoDeposito
-            }]
-
-        return json.dumps(inversiones_data)
+    def to_dict(vehicle):
+        """
+        Get the response dictionary of a vehicle row, either a model instance or a row returned by an INSERT
+
+        :param vehicle: Object with the VehicleModel attributes
+        :return: dict
+        """
+
+        return {
+            "vehiculo_id": vehicle.vehicle_id,
+            "vehiculo_modelo": vehicle.vehicle_model,
+            "vehiculo_marca": vehicle.vehicle_brand,
+            "vehiculo_matricula": vehicle.vehicle_plate,
+            "vehiculo_numero_asientos": vehicle.vehicle_num_seats,
+            "vehiculo_numero_puertas": vehicle.vehicle_num_doors,
+            "vehiculo_color": vehicle.vehicle_color,
+            "vehiculo_modelo_anio": vehicle.vehicle_anio_model,
+            "vehiculo_modelo_motor": vehicle.vehicle_model_motor,
+            "vehiculo_anio_motor": vehicle.vehicle_anio_motor,
+            "vehiculo_numero_chasis": vehicle.vehicle_chasis_number,
+            "vehiculo_transmision": vehicle.vehicle_transmision,
+            "vehiculo_tipo_combustible": vehicle.vehicle_gas_type,
+            "vehiculo_emisiones_co2": vehicle.vehicle_co2_emisions,
+            "vehiculo_caballos_fuerza": vehicle.vehicle_horse_power,
+            "vehiculo_potencia": vehicle.vehicle_potence,
+            "vehiculo_descripcion": vehicle.vehicle_description,
+            "vehiculo_costo_catalogo": vehicle.vehicle_catalog_cost,
+            "vehiculo_costo_compra": vehicle.vehicle_purchase_cost,
+            "vehiculo_costo_impuesto": vehicle.vehicle_tax_cost,
+            "vehiculo_fecha_registro": vehicle.vehicle_register_date,
+            "vehiculo_fecha_baja": vehicle.vehicle_low_register_date,
+            "vehiculo_capacidad_tanque": vehicle.vehicle_tank_capacity
+        }
 
     def __repr__(self):
-        return "<GinInversionesModel(" \
-               "invId='%s', " \
-               "cuenta='%s', " \
-               "estatus='%s', " \
-               "canal='%s', " \
-               "origen='%s', " \
-               "fechaRecepcion='%s')>" % (self.invId,
-                                          self.cuenta,
-                                          self.estatus,
-                                          self.canal,
-                                          self.origen,
-                                          self.fechaRecepcion
+        return "<VehicleModel(" \
+               "vehicle_id='%s', " \
+               "vehicle_plate='%s', " \
+               "vehicle_brand='%s', " \
+               "vehicle_model='%s', " \
+               "vehicle_register_date='%s')>" % (self.vehicle_id,
+                                                 self.vehicle_plate,
+                                                 self.vehicle_brand,
+                                                 self.vehicle_model,
+                                                 self.vehicle_register_date
         )
 
     # DEPRECATED - NOT USE by API
@@ -678,3 +438,12 @@ class VehicleModel(Base):
     #             )
     #         finally:
     #             session.close()
+
+
+# Databases created before the natural key was declared get its unique index on the schema migration 2
+register_schema_migration(2, 'CREATE UNIQUE INDEX IF NOT EXISTS uq_vehicle_plate ON "{}" ("{}")'.format(
+    VehicleModel.__tablename__, cfg_db.GasVehicle.vehiculo_matricula))
+
+# The tank capacity, read by the fuel anomaly detection, is added to the vehicles on the schema migration 6
+register_schema_migration(6, 'ALTER TABLE "{}" ADD COLUMN IF NOT EXISTS "{}" DOUBLE PRECISION'.format(
+    VehicleModel.__tablename__, cfg_db.GasVehicle.vehiculo_capacidad_tanque))
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Bulk import of vehicles.
+
+The rows received (JSON array, NDJSON or CSV) are validated in batches and streamed into a temporary staging
+table with psycopg2 ``copy_expert`` (``execute_values`` when COPY is not available); a single
+``INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING`` per batch then moves them to the vehicle table.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import io
+import csv
+import math
+import time
+import psycopg2
+from datetime import date, datetime
+from psycopg2.extras import execute_values
+from db_controller.database_backend import *
+from db_controller import mvc_exceptions as mvc_exc
+from handler_controller.request_rows import parse_request_rows
+from .VehicleModel import VehicleModel
+
+logger = configure_logger('db')
+
+IMPORT_BATCH_SIZE = 5000
+
+STAGING_TABLE = 'vehicle_import_staging'
+
+# Range of the INTEGER (int4) columns
+INT4_MIN, INT4_MAX = -2 ** 31, 2 ** 31 - 1
+
+# Request field -> VehicleModel attribute, the same mapping applied by VehicleModel.__init__
+VEHICLE_IMPORT_FIELDS = [
+    ('vehiculo_modelo', 'vehicle_model'),
+    ('vehiculo_marca', 'vehicle_brand'),
+    ('vehiculo_matricula', 'vehicle_plate'),
+    ('vehiculo_numero_asientos', 'vehicle_num_seats'),
+    ('vehiculo_numero_puertas', 'vehicle_num_doors'),
+    ('vehiculo_color', 'vehicle_color'),
+    ('vehiculo_modelo_anio', 'vehicle_anio_model'),
+    ('vehiculo_modelo_motor', 'vehicle_model_motor'),
+    ('vehiculo_anio_motor', 'vehicle_anio_motor'),
+    ('vehiculo_numero_chasis', 'vehicle_chasis_number'),
+    ('vehiculo_transmision', 'vehicle_transmision'),
+    ('vehiculo_tipo_combustible', 'vehicle_gas_type'),
+    ('vehiculo_emisiones_co2', 'vehicle_co2_emisions'),
+    ('vehiculo_caballos_fuerza', 'vehicle_horse_power'),
+    ('vehiculo_potencia', 'vehicle_potence'),
+    ('vehiculo_descripcion', 'vehicle_description'),
+    ('vehiculo_costo_catalogo', 'vehicle_catalog_cost'),
+    ('vehiculo_costo_compra', 'vehicle_purchase_cost'),
+    ('vehiculo_costo_impuesto', 'vehicle_tax_cost'),
+    ('vehiculo_fecha_registro', 'vehicle_register_date'),
+    ('vehiculo_fecha_baja', 'vehicle_low_register_date'),
+    ('vehiculo_capacidad_tanque', 'vehicle_tank_capacity'),
+]
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+
+    if isinstance(value, date):
+        return value
+
+    if not isinstance(value, str):
+        raise TypeError('Not a date: {!r}'.format(value))
+
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _parse_text(value):
+    if not isinstance(value, str):
+        raise TypeError('Not a string: {!r}'.format(value))
+
+    return value
+
+
+def _parse_integer(value):
+    # Booleans are not 0 and 1, and a number with decimals is not truncated
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise TypeError('Not an integer: {!r}'.format(value))
+
+    number = value if isinstance(value, int) else float(value)
+
+    if isinstance(number, float):
+        if not number.is_integer():
+            raise ValueError('Not an integer: {!r}'.format(value))
+
+        number = int(number)
+
+    if not INT4_MIN <= number <= INT4_MAX:
+        raise ValueError('Integer out of range: {!r}'.format(value))
+
+    return number
+
+
+def _parse_float(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise TypeError('Not a number: {!r}'.format(value))
+
+    number = float(value)
+
+    if not math.isfinite(number):
+        raise ValueError('Not a finite number: {!r}'.format(value))
+
+    return number
+
+
+# Python type of a column -> converter of the values received, strict on the types: a value of another JSON type is
+# invalid instead of being coerced (str() of an object, int() of a boolean or of a number with decimals)
+_CONVERTERS = {
+    str: _parse_text,
+    int: _parse_integer,
+    float: _parse_float,
+    date: _parse_date,
+}
+
+
+def _import_columns():
+    r"""
+    Get, for each imported field, the table column and the converter of its value.
+
+    :return import_columns: List of (request field, column name, converter, required).
+    """
+
+    import_columns = []
+
+    for field_name, attr_name in VEHICLE_IMPORT_FIELDS:
+        column = VehicleModel.__mapper__.columns[attr_name]
+
+        converter = _CONVERTERS[column.type.python_type]
+
+        import_columns.append((field_name, column.name, converter, not column.nullable))
+
+    return import_columns
+
+
+def parse_vehicle_rows(content_type, stream):
+    r"""
+    Read the vehicles of the request body: a JSON array (or {"vehiculos": [...]}), NDJSON or CSV.
+    """
+
+    return parse_request_rows(content_type, stream, 'vehiculos')
+
+
+def validate_batch(batch, import_columns, first_row):
+    r"""
+    Validate and type-convert a batch of vehicles.
+
+    :param batch: List of dictionaries with the request fields.
+    :param import_columns: The columns returned by _import_columns().
+    :param first_row: Number of the first row of the batch on the whole import.
+    :return valid_rows, errors: Tuples (row number, values...) ready to COPY and dictionary row number -> errors.
+    """
+
+    valid_rows = []
+    errors = dict()
+
+    for row_number, data in enumerate(batch, start=first_row):
+        row_values = [row_number]
+        row_errors = []
+
+        if not isinstance(data, dict):
+            errors[row_number] = ['Row is not an object']
+            continue
+
+        for field_name, column_name, converter, required in import_columns:
+            value = data.get(field_name)
+
+            if value is None or value == '':
+                if required:
+                    row_errors.append('{} is required'.format(field_name))
+
+                row_values.append(None)
+                continue
+
+            try:
+                row_values.append(converter(value))
+            except (TypeError, ValueError):
+                row_errors.append('{} has an invalid value: {}'.format(field_name, value))
+                row_values.append(None)
+
+        if row_errors:
+            errors[row_number] = row_errors
+        else:
+            valid_rows.append(tuple(row_values))
+
+    return valid_rows, errors
+
+
+def _create_staging_table(cursor, column_names):
+    cursor.execute(
+        'CREATE TEMP TABLE IF NOT EXISTS {} ON COMMIT DROP AS '
+        'SELECT 0::integer AS import_row, {} FROM "{}" WITH NO DATA'.format(
+            STAGING_TABLE, ', '.join('"{}"'.format(name) for name in column_names), VehicleModel.__tablename__
+        )
+    )
+
+
+def _load_staging(cursor, column_names, valid_rows, use_copy):
+    r"""
+    Stream the validated rows into the staging table, COPY by default, execute_values as fallback.
+    """
+
+    staging_columns = 'import_row, {}'.format(', '.join('"{}"'.format(name) for name in column_names))
+
+    cursor.execute('TRUNCATE {}'.format(STAGING_TABLE))
+
+    if use_copy and hasattr(cursor, 'copy_expert'):
+        buffer = io.StringIO()
+
+        writer = csv.writer(buffer)
+        writer.writerows(valid_rows)
+
+        buffer.seek(0)
+
+        cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(STAGING_TABLE, staging_columns),
+                           buffer)
+    else:
+        execute_values(cursor, 'INSERT INTO {} ({}) VALUES %s'.format(STAGING_TABLE, staging_columns),
+                       valid_rows, page_size=1000)
+
+
+def _move_staging(cursor, column_names):
+    r"""
+    Insert the staged vehicles whose plate is not registered yet.
+
+    :return inserted: Dictionary plate -> vehicle_id of the vehicles inserted.
+    """
+
+    quoted_columns = ', '.join('"{}"'.format(name) for name in column_names)
+
+    id_column = VehicleModel.__mapper__.columns['vehicle_id'].name
+    plate_column = VehicleModel.__mapper__.columns['vehicle_plate'].name
+
+    cursor.execute(
+        'INSERT INTO "{table}" ({columns}) SELECT {columns} FROM {staging} ORDER BY import_row '
+        'ON CONFLICT ("{plate}") DO NOTHING RETURNING "{id}", "{plate}"'.format(
+            table=VehicleModel.__tablename__, columns=quoted_columns, staging=STAGING_TABLE,
+            plate=plate_column, id=id_column
+        )
+    )
+
+    return {plate: vehicle_id for vehicle_id, plate in cursor.fetchall()}
+
+
+def import_vehicles(session, rows, batch_size=IMPORT_BATCH_SIZE, use_copy=True):
+    r"""
+    Import the vehicles in batches on the transaction of the session.
+
+    :param session: Session database object.
+    :param rows: Iterable of dictionaries with the request fields of each vehicle.
+    :param batch_size: Number of rows validated and loaded per batch.
+    :param use_copy: Load the batches with COPY, otherwise with execute_values.
+    :return summary: Dictionary with the per-row results and the aggregate throughput.
+    """
+
+    start_time = time.perf_counter()
+
+    import_columns = _import_columns()
+    column_names = [column_name for _, column_name, _, _ in import_columns]
+    plate_index = [field_name for field_name, _, _, _ in import_columns].index('vehiculo_matricula') + 1
+
+    results = []
+    total_rows = 0
+    inserted_rows = 0
+    duplicated_rows = 0
+    invalid_rows = 0
+
+    try:
+
+        cursor = session.connection().connection.cursor()
+
+        _create_staging_table(cursor, column_names)
+
+        batch = []
+
+        def process_batch(batch_rows, first_row):
+            nonlocal inserted_rows, duplicated_rows, invalid_rows
+
+            valid_rows, errors = validate_batch(batch_rows, import_columns, first_row)
+
+            inserted = dict()
+
+            if valid_rows:
+                _load_staging(cursor, column_names, valid_rows, use_copy)
+
+                inserted = _move_staging(cursor, column_names)
+
+            for row_number, row_errors in errors.items():
+                results.append({'row': row_number, 'status': 'invalid', 'errors': row_errors})
+
+            invalid_rows += len(errors)
+
+            for row_values in valid_rows:
+                # Only the first row of a plate repeated in the batch takes its vehicle_id
+                vehicle_id = inserted.pop(row_values[plate_index], None)
+
+                if vehicle_id is not None:
+                    results.append({'row': row_values[0], 'status': 'inserted', 'vehiculo_id': vehicle_id})
+                    inserted_rows += 1
+                else:
+                    results.append({'row': row_values[0], 'status': 'duplicated'})
+                    duplicated_rows += 1
+
+            logger.info('Vehicles batch imported from row %s: %s valid, %s invalid',
+                        first_row, len(valid_rows), len(errors))
+
+        for data in rows:
+            batch.append(data)
+            total_rows += 1
+
+            if len(batch) >= batch_size:
+                process_batch(batch, total_rows - len(batch) + 1)
+                batch = []
+
+        if batch:
+            process_batch(batch, total_rows - len(batch) + 1)
+
+        cursor.close()
+
+    except (SQLAlchemyError, psycopg2.Error) as exc:
+        session.rollback()
+
+        logger.exception('An exception was occurred while execute transactions: %s', str(exc))
+        raise mvc_exc.IntegrityError(
+            'Rows not stored in "{}". IntegrityError: {}'.format(VehicleModel.__tablename__, str(exc))
+        )
+
+    elapsed_time = time.perf_counter() - start_time
+
+    results.sort(key=lambda result: result['row'])
+
+    return {
+        'total': total_rows,
+        'inserted': inserted_rows,
+        'duplicated': duplicated_rows,
+        'invalid': invalid_rows,
+        'elapsed_seconds': round(elapsed_time, 3),
+        'rows_per_second': round(total_rows / elapsed_time, 1) if elapsed_time else total_rows,
+        'results': results
+    }
@@ -10,11 +10,12 @@ __license__ = ""
 __history__ = """ """
 __version__ = "1.21.G02.1 ($Rev: 2 $)"
 
+import csv
 from flask import Blueprint, json, request
 # from flask_jwt_extended import jwt_required
 from db_controller.database_backend import *
-from .VehicleModel import GinInversionesModel
-from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
+from db_controller import mvc_exceptions as mvc_exc
+from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse, STREAM_FORMATS
 from handler_controller.messages import SuccessMsg, ErrorMsg
 from logger_controller.logger_control import *
 from utilities.Utility import *
@@ -25,11 +26,16 @@ inversiones_api = Blueprint('inversiones_api', __name__)
 # jwt = JWTManager(bancos_api)
 logger = configure_logger('ws')
 
+# The models are imported by the endpoints on their first call, not when the blueprint is registered: their
+# mappings and dependencies (sqlalchemy_filters, psycopg2.extras) stay out of the start up of the workers.
+
 
 @inversiones_api.route('/', methods=['POST', 'GET', 'DELETE'])
 # @jwt_required
 def endpoint_processing_inversiones_data():
-    conn_db, session_db = init_db_connection()
+    from .VehicleModel import VehicleModel
+
+    session_db = get_db_session()
 
     headers = request.headers
     # auth = headers.get('Authorization')
@@ -41,193 +47,212 @@ def endpoint_processing_inversiones_data():
     query_string = request.query_string.decode('utf-8')
 
     if request.method == 'POST':
-        # APLICAR INVERSIONES
+        # REGISTRAR VEHICULO
 
         data = request.get_json(force=True)
 
-        gin_inv_model = GinInversionesModel(data)
-
         if not data or str(data) is None:
             return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
 
-        logger.info('Data Json Inversion to Manage on DB: %s', str(data))
+        vehicle_model = VehicleModel(data)
+
+        logger.info('Data Json Vehicle to Manage on DB: %s', str(data))
 
-        fechaRecepcion = str()
-        horaRecepcion = str()
-        fechaAplicacion = str()
-        horaAplicacion = str()
+        try:
 
-        fecha_recepcion = data.get('fechaRecepcion')
-        hora_recepcion = data.get('horaRecepcion')
+            json_vehicle_added = vehicle_model.insert_data(session_db, data)
 
-        if fecha_recepcion and hora_recepcion:
-            fecha_hora_recepcion = str(datetime.strptime(str(fecha_recepcion), "%Y-%m-%d")) + " " + \
-                                   str(datetime.strptime(str(hora_recepcion), "%H:%M:%S"))
+        except mvc_exc.IntegrityError as exc:
+            logger.error('Vehicle not stored: %s', str(exc))
 
-            fechaRecepcion, horaRecepcion = set_utc_date_data(fecha_hora_recepcion, cfg_app.date_timezone)
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+        if not json_vehicle_added:
+            return HandlerResponse.response_success(SuccessMsg.MSG_RECORD_REGISTERED, {})
 
-        fecha_aplicacion = data.get('fechaAplicacion')
-        hora_aplicacion = data.get('horaAplicacion')
+        return HandlerResponse.response_success(SuccessMsg.MSG_CREATED_RECORD, json_vehicle_added)
 
-        if fecha_aplicacion and hora_aplicacion:
-            fecha_hora_aplicacion = str(datetime.strptime(str(fecha_aplicacion), "%Y-%m-%d")) + " " + \
-                                   str(datetime.strptime(str(hora_aplicacion), "%H:%M:%S"))
+    elif request.method == 'GET':
+        # To GET ALL Data of the Vehicles:
 
-            fechaAplicacion, horaAplicacion = set_utc_date_data(fecha_hora_aplicacion, cfg_app.date_timezone)
+        filter_spec = vehicle_filter_spec(query_string)
 
-        data_insert = {
-            'cuenta': data.get('cuenta'),
-            'estatus': data.get('estatus'),
-            'monto': data.get('monto'),
-            'autorizacion': data.get('autorizacion'),
-            'canal': data.get('canal'),
-            'origen': data.get('origen'),
-            'comisionistaId': data.get('comisionistaId'),
-            'transaccionId': data.get('transaccionId'),
-            'motivo': data.get('motivo'),
-            'fechaRecepcion': fechaRecepcion,
-            'horaRecepcion': horaRecepcion,
-            'fechaAplicacion': fechaAplicacion,
-            'horaAplicacion': horaAplicacion,
-            'conciliacionId': data.get('conciliacionId')
-        }
+        try:
 
-        json_bank_added = gin_inv_model.insert_data(session_db, data_insert)
+            limit, cursor, with_total = get_pagination_args(request.args)
 
-        if not json_bank_added:
-            return HandlerResponse.resp_success(SuccessMsg.MSG_RECORD_REGISTERED, {})
+            vehicles_on_db = VehicleModel.get_inversiones_by_filters(session_db, filter_spec, limit, cursor, with_total)
 
-        return HandlerResponse.resp_success(SuccessMsg.MSG_CREATED_RECORD, json_bank_added)
+        except ValueError as exc:
+            logger.error('Pagination params not valid: %s', str(exc))
 
-    elif request.method == 'GET':
-        # To GET ALL Data of the Banks:
+            return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+        if not bool(vehicles_on_db) or not vehicles_on_db.get('results'):
+            return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+        return HandlerResponse.response_success(SuccessMsg.MSG_GET_RECORD, vehicles_on_db)
+
+    elif request.method == 'DELETE':
 
         data = dict()
-        inversiones_on_db = None
 
-        filter_spec = []
+        if 'matricula' not in query_string:
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
 
-        if 'canal' in query_string:
-            canal = request.args.get('canal')
+        data['vehiculo_matricula'] = request.args.get('matricula')
 
-            data['canal'] = canal
+        vehicle_model = VehicleModel(data)
 
-            filter_spec.append({'field': 'canal', 'op': '==', 'value': canal})
+        try:
 
-        if 'fecha' in query_string:
-            fecha = request.args.get('fecha')
+            json_response = vehicle_model.delete_data(session_db, data)
 
-            fecha_filter = datetime.strptime(str(fecha), "%Y-%m-%d")
+        except mvc_exc.IntegrityError as exc:
+            logger.error('Vehicle not deleted: %s', str(exc))
 
-            data['fechaRecepcion'] = fecha_filter
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
 
-            filter_spec.append({'field': 'fechaRecepcion', 'op': '==', 'value': fecha_filter})
+        logger.info('Vehicle deleted: %s', json_response)
 
-        if 'estatus' in query_string:
-            status_inversion = request.args.get('estatus')
+        if not json_response:
+            return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
 
-            data['estatus'] = status_inversion
+        return HandlerResponse.response_success(SuccessMsg.MSG_DELETED_RECORD, json_response)
 
-            filter_spec.append({'field': 'estatus', 'op': 'ilike', 'value': status_inversion})
+    else:
+        return HandlerResponse.request_not_found(ErrorMsg.ERROR_REQUEST_NOT_FOUND)
 
-        gin_inv_model = GinInversionesModel(data)
 
-        inversiones_on_db = gin_inv_model.get_inversiones_by_filters(session_db, filter_spec)
+@inversiones_api.route('/flujo/datos', methods=['POST'])
+def endpoint_flujo_datos():
+    from .VehicleModel import VehicleModel
 
-        if not bool(inversiones_on_db) or not inversiones_on_db or "[]" == inversiones_on_db:
-            return HandlerResponse.resp_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+    session_db = get_db_session()
 
-        return HandlerResponse.resp_success(SuccessMsg.MSG_GET_RECORD, inversiones_on_db)
+    headers = request.headers
+    # auth = headers.get('Authorization')
 
-    # elif request.method == 'PUT':
-    #
-    #     data = request.get_json(force=True)
-    #
-    #     gin_inv_model = GinInversionesModel(data)
-    #
-    #     if not data:
-    #         return HandlerResponse.request_conflict()
-    #
-    #     json_data = dict()
-    #
-    #     json_data = gin_inv_model.update_data(session_db, data)
-    #
-    #     logger.info('Bank updated Info: %s', str(json_data))
-    #
-    #     if not json_data:
-    #         return HandlerResponse.not_found()
-    #
-    #     return HandlerResponse.resp_success(json_data)
-    #
-    elif request.method == 'DELETE':
+    # if not auth and 'Bearer' not in auth:
+    #     return HandlerResponse.request_unauthorized()
+    # else:
 
-        data = dict()
-        # data = request.get_json(force=True)
+    if request.method == 'POST':
+        # GUARDAR DATOS DE VEHICULOS
 
-        filter_spec = []
+        data = request.get_json(force=True)
 
-        if not ('cuenta' in query_string) and ('canal' in query_string) and ('autorizacion' in query_string):
+        if not data or str(data) is None:
             return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
-        else:
 
-            cuenta = request.args.get('cuenta')
+        vehicle_model = VehicleModel(data)
 
-            data['cuenta'] = cuenta
+        logger.info('Data Json Vehicle to Manage on DB: %s', str(data))
 
-            canal = request.args.get('canal')
+        try:
 
-            data['canal'] = canal
+            json_vehicle_added = vehicle_model.save_inversion(session_db, data)
 
-            autorizacion = request.args.get('autorizacion')
+        except mvc_exc.IntegrityError as exc:
+            logger.error('Vehicle not stored: %s', str(exc))
 
-            data['autorizacion'] = autorizacion
+            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
 
-        gin_inv_model = GinInversionesModel(data)
+        if not json_vehicle_added:
+            return HandlerResponse.response_success(SuccessMsg.MSG_RECORD_REGISTERED, {})
 
-        json_data = []
+        return HandlerResponse.response_success(SuccessMsg.MSG_CREATED_RECORD, json_vehicle_added)
 
-        if not data:
-            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
 
-        json_response = gin_inv_model.delete_data(session_db, data)
+@inversiones_api.route('/bulk', methods=['POST'])
+def endpoint_bulk_vehicles():
+    r"""
+    Import many vehicles at once from a JSON array, NDJSON (application/x-ndjson) or CSV (text/csv) body.
 
-        logger.info('Inversion deleted: %s', json_response)
+    Query params: batch_size (rows per COPY batch), method ('copy' or 'values').
+    """
 
-        if not json_response:
-            return HandlerResponse.resp_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+    from .bulk_import import parse_vehicle_rows, import_vehicles, IMPORT_BATCH_SIZE
 
-        return HandlerResponse.resp_success(SuccessMsg.MSG_DELETED_RECORD, json_response)
+    session_db = get_db_session()
 
-    else:
-        return HandlerResponse.not_found(ErrorMsg.ERROR_REQUEST_NOT_FOUND)
+    batch_size = request.args.get('batch_size', IMPORT_BATCH_SIZE, type=int)
 
+    use_copy = request.args.get('method', 'copy') != 'values'
 
-@inversiones_api.route('/flujo/datos', methods=['POST'])
-def endpoint_flujo_datos():
-    conn_db, session_db = init_db_connection()
+    try:
 
-    headers = request.headers
-    # auth = headers.get('Authorization')
+        rows = parse_vehicle_rows(request.content_type, request.stream)
 
-    # if not auth and 'Bearer' not in auth:
-    #     return HandlerResponse.request_unauthorized()
-    # else:
+        import_summary = import_vehicles(session_db, rows, max(batch_size, 1), use_copy)
 
-    if request.method == 'POST':
-        # GUARDAR DATOS DE INVERSIONES
+    except (ValueError, csv.Error) as exc:
+        logger.error('Bulk vehicle payload can not be read: %s', str(exc))
 
-        data = request.get_json(force=True)
+        return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_BODY_NOT_VALID)
 
-        gin_inv_model = GinInversionesModel(data)
+    except mvc_exc.IntegrityError as exc:
+        logger.error('Bulk vehicles not stored: %s', str(exc))
 
-        if not data or str(data) is None:
-            return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+        return HandlerResponse.request_conflict(ErrorMsg.ERROR_REQUEST_DATA_CONFLICT)
+
+    logger.info('Vehicles imported: %s inserted, %s duplicated, %s invalid, %s rows/s',
+                import_summary.get('inserted'), import_summary.get('duplicated'),
+                import_summary.get('invalid'), import_summary.get('rows_per_second'))
+
+    if not import_summary.get('total'):
+        return HandlerResponse.response_success(ErrorMsg.ERROR_DATA_NOT_FOUND, {})
+
+    return HandlerResponse.response_success(SuccessMsg.MSG_CREATED_RECORD, import_summary)
+
+
+def vehicle_filter_spec(query_string):
+    r"""
+    Build the sqlalchemy_filters specification of the vehicle list and export endpoints from the query params.
+
+    :param query_string: The decoded query string of the request.
+    :return filter_spec: List of filters over the VehicleModel attributes.
+    """
+
+    filter_spec = []
+
+    if 'marca' in query_string:
+        filter_spec.append({'field': 'vehicle_brand', 'op': 'ilike', 'value': request.args.get('marca')})
+
+    if 'modelo' in query_string:
+        filter_spec.append({'field': 'vehicle_model', 'op': 'ilike', 'value': request.args.get('modelo')})
+
+    if 'matricula' in query_string:
+        filter_spec.append({'field': 'vehicle_plate', 'op': '==', 'value': request.args.get('matricula')})
+
+    if 'combustible' in query_string:
+        filter_spec.append({'field': 'vehicle_gas_type', 'op': 'ilike', 'value': request.args.get('combustible')})
+
+    return filter_spec
+
+
+@inversiones_api.route('/export', methods=['GET'])
+def endpoint_export_vehicles():
+    r"""
+    Stream all the vehicles matching the list filters as a JSON array or NDJSON (?format=ndjson).
+
+    The rows are read through a server-side cursor on a connection of the export, the request session is not used.
+    """
+
+    from .VehicleModel import VehicleModel
+    from db_controller.query_layer import EXPORT_CHUNK_SIZE
+
+    export_format = request.args.get('format', 'json').lower()
+
+    if export_format not in STREAM_FORMATS:
+        return HandlerResponse.bad_request(ErrorMsg.ERROR_REQUEST_PARAMS_NOT_VALID)
+
+    filter_spec = vehicle_filter_spec(request.query_string.decode('utf-8'))
 
-        logger.info('Data Json Inversion to Manage on DB: %s', str(data))
+    chunk_size = max(request.args.get('chunk_size', EXPORT_CHUNK_SIZE, type=int), 1)
 
-        json_inversion_added = gin_inv_model.save_inversion(session_db, data)
+    logger.info('Export of vehicles requested as %s, filters: %s', export_format, str(filter_spec))
 
-        if not json_inversion_added:
-            return HandlerResponse.resp_success(SuccessMsg.MSG_RECORD_REGISTERED, {})
+    vehicles_rows = VehicleModel.export_by_filters(filter_spec, chunk_size)
 
-        return HandlerResponse.resp_success(SuccessMsg.MSG_CREATED_RECORD, json_inversion_added)
+    return HandlerResponse.response_stream(vehicles_rows, export_format, 'vehiculos.{}'.format(export_format))
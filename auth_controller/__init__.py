@@ -1,3 +1,4 @@
 # -*- coding: utf-8 -*-
 
-from . import api_authentication
+from . import token_revocation
+from . import jwt_middleware
@@ -1,6 +1,21 @@
 # -*- coding: utf-8 -*-
 """
 Requires Python 3.8 or later
+
+
+Authentication of the users of the API.
+
+The password received is verified against the hash stored for the user; the hash is computed again only when the
+user is registered or when its hash no longer meets the round policy (PASSWORD_HASH_ROUNDS), in which case the stored
+hash is upgraded. A login never registers a user: the users are registered by an authenticated user of the API, or
+with the create-user command of flask, and only the username and the password are taken from the request.
+
+The KDF runs on a worker pool of PASSWORD_HASH_WORKERS threads (hashlib releases the GIL while hashing) with at most
+PASSWORD_HASH_QUEUE logins waiting: a burst of logins is rejected with TimeoutError instead of holding every request
+thread of the worker.
+
+A login repeated with the same password within CREDENTIAL_CACHE_TTL seconds is answered from the credential cache,
+without the KDF nor the user query.
 """
 
 __author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
@@ -9,8 +24,14 @@ __license__ = ""
 __history__ = """ """
 __version__ = "1.1.A19.1 ($Rev: 1 $)"
 
+import os
+import hmac
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import g
 from apps.api_authentication.UsersAuthModel import UsersAuthModel
-from passlib.hash import pbkdf2_sha256 as sha256
+from apps.api_authentication.credential_cache import credential_cache
+from passlib.context import CryptContext
 from flask_jwt_extended import (create_access_token, create_refresh_token, jwt_required, get_jwt_identity)
 from logger_controller.logger_control import *
 from db_controller.database_backend import *
@@ -24,53 +45,214 @@ cfg_app = get_config_settings_app()
 logger_type = 'ws'
 log = configure_logger(logger_type)
 
+# Hashes with less rounds than the policy are reported by verify_and_update() to be upgraded
+pwd_context = CryptContext(schemes=['pbkdf2_sha256'],
+                           deprecated='auto',
+                           pbkdf2_sha256__default_rounds=cfg_app.password_hash_rounds,
+                           pbkdf2_sha256__min_rounds=cfg_app.password_hash_rounds)
+
+# One KDF pool per worker process, created on first use
+_kdf_executor = None
+_kdf_executor_pid = None
+_kdf_executor_lock = threading.Lock()
+_kdf_slots = None
+
 
-def generate_hash(password):
-    return sha256.hash(password)
+def _get_kdf_executor():
+    r"""
+    Get the KDF pool of the current process and the semaphore bounding the logins running or waiting on it.
 
+    :return executor, slots: The thread pool and its semaphore.
+    """
 
-def verify_hash(password, hash_passwd):
-    return sha256.verify(password, hash_passwd)
+    global _kdf_executor, _kdf_executor_pid, _kdf_slots
 
+    current_pid = os.getpid()
 
-def user_registration(session, data):
-    user_process_reponse = None
-    response_login = None
+    if _kdf_executor is None or _kdf_executor_pid != current_pid:
+        with _kdf_executor_lock:
+            if _kdf_executor is None or _kdf_executor_pid != current_pid:
+                workers = max(1, cfg_app.password_hash_workers)
 
-    password_hash = generate_hash(data.get('password'))
+                _kdf_slots = threading.BoundedSemaphore(workers + max(0, cfg_app.password_hash_queue))
+                _kdf_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-kdf')
+                _kdf_executor_pid = current_pid
+
+    return _kdf_executor, _kdf_slots
+
+
+def run_kdf(function, *args):
+    r"""
+    Run a hash/verify call on the KDF pool and wait for its result.
+
+    :param function: The passlib call.
+    :param args: Its arguments.
+    :return result: What the call returns.
+    :raise TimeoutError: When the pool stays saturated for PASSWORD_HASH_TIMEOUT seconds.
+    """
+
+    executor, slots = _get_kdf_executor()
+
+    if not slots.acquire(timeout=cfg_app.password_hash_timeout):
+        log.warning('Password KDF pool saturated, login rejected')
+        raise mvc_exc.TimeoutError('Password KDF pool saturated, try again later')
 
     try:
+        future = executor.submit(function, *args)
+    except RuntimeError:
+        slots.release()
+        raise
+
+    future.add_done_callback(lambda _: slots.release())
 
-        if verify_hash(data.get('password'), password_hash):
+    return future.result()
 
-            access_token = create_access_token(identity=data.get('username'))
 
-            refresh_token = create_refresh_token(identity=data.get('username'))
+def api_password(user_name, password):
+    r"""
+    Get the secret hashed for a user: its password bound to its user name and to the API_KEY of the application.
+    """
 
-            # id_user = uuid.uuid1()
+    return user_name + '_' + password + '_' + cfg_app.api_key
 
-            user_process_reponse = UsersAuthModel(data).manage_user_authentication(session, data)
 
-            # UsersAuth.manage_user_authentication('', user_name, user_password, password_hash)
+def hash_password(password):
+    return run_kdf(pwd_context.hash, password)
 
-            log.info('User inserted/updated in database: %s',
-                     ' User_Name: "{}", Password_Hash: "{}" '.format(data.get('username'),
-                                                                     password_hash))
-            response_login = json.dumps({
-                'message_login': 'Logged in as {}'.format(data.get('username')),
-                'access_token': access_token,
-                'refresh_token': refresh_token,
-                'data': user_process_reponse
-            })
 
-        else:
-            response_login = json.dumps({'message_login': 'Wrong credentials'})
+def verify_password(password, password_hash):
+    r"""
+    Verify a password against its stored hash.
+
+    :param password: The password received.
+    :param password_hash: The hash stored for the user.
+    :return valid, new_hash: Whether the password matches and, when the hash must be upgraded, the new hash.
+    """
+
+    if not password_hash:
+        return False, None
+
+    if pwd_context.identify(password_hash) is None:
+        # Rows stored before the passwords were hashed: compared once and upgraded to a hash
+        if hmac.compare_digest(password.encode('utf-8'), password_hash.encode('utf-8')):
+            return True, hash_password(password)
+
+        return False, None
+
+    return run_kdf(pwd_context.verify_and_update, password, password_hash)
+
+
+def user_authentication(session, data):
+    r"""
+    Authenticate a registered and active user.
+
+    :param session: The session of the database.
+    :param data: The username and the password of the request.
+    :return response_login: The tokens and the user data, None when the credentials are wrong.
+    :raise TimeoutError: When the password can not be verified because the KDF pool is saturated.
+    """
+
+    user_name = data.get('username')
+    password = data.get('password')
+
+    user_process_reponse = credential_cache.get(user_name, password)
+
+    # Read by the metrics of the request (credential cache lookups)
+    g.credential_cache_result = 'miss' if user_process_reponse is None else 'hit'
+
+    if user_process_reponse is not None:
+        return login_response(user_name, user_process_reponse)
+
+    try:
+
+        user_row = UsersAuthModel.get_user_by_id(session, data)
+
+        if user_row is None or not user_row.is_active:
+            log.info('Login of a user not registered or not active: %s', user_name)
+
+            return None
+
+        valid, new_hash = verify_password(password, user_row.password)
+
+        if not valid:
+            log.info('Wrong credentials of the user: %s', user_name)
+
+            return None
+
+        user_process_reponse = {
+            "Username": user_row.user_name,
+            "IsActive": user_row.is_active,
+            "IsStaff": user_row.is_staff,
+            "IsSuperUser": user_row.is_superuser
+        }
+
+        if new_hash is not None:
+            user_process_reponse = user_row.user_update_password(
+                session, {'username': user_name, 'password': new_hash}, user_row
+            )
+
+            log.info('Password hash of the user upgraded to the current policy: %s', user_name)
 
     except SQLAlchemyError as error:
         raise mvc_exc.ConnectionError(
             '"{}@{}" Can\'t connect to database, verify data connection to "{}".\nOriginal Exception raised: {}'.format(
-                data.get('username'), 'user_auth', 'user_auth', error
+                user_name, 'user_auth', 'user_auth', error
             )
         )
 
-    return response_login
+    credential_cache.put(user_name, password, user_process_reponse)
+
+    return login_response(user_name, user_process_reponse)
+
+
+def user_registration(session, data, is_staff=False, is_superuser=False):
+    r"""
+    Register a user of the API, active. Only the username and the password are read from the data: the privileges
+    are set by the caller, never by the request.
+
+    :param session: The session of the database.
+    :param data: The username and the password (as given by api_password) of the user.
+    :param is_staff: Register a staff user.
+    :param is_superuser: Register a superuser.
+    :return user_data: The user registered, None when the user name is already registered.
+    :raise TimeoutError: When the password can not be hashed because the KDF pool is saturated.
+    :raise IntegrityError: When the user can not be stored.
+    """
+
+    user_name = data.get('username')
+
+    if UsersAuthModel.get_user_by_id(session, data) is not None:
+        log.info('User already registered: %s', user_name)
+
+        return None
+
+    user_data = {
+        'username': user_name,
+        'password': hash_password(data.get('password')),
+        'is_active': True,
+        'is_staff': bool(is_staff),
+        'is_superuser': bool(is_superuser)
+    }
+
+    user_process_reponse = UsersAuthModel(user_data).add_user(session, user_data)
+
+    log.info('User registered: %s', user_name)
+
+    return user_process_reponse
+
+
+def login_response(user_name, user_data):
+    r"""
+    Build the response of a successful login with its access and refresh tokens.
+
+    :param user_name: The user name authenticated, identity of the tokens.
+    :param user_data: The user data returned.
+    :return response_login: Dictionary with the tokens and the user data.
+    """
+
+    return {
+        'message_login': 'Logged in as {}'.format(user_name),
+        'access_token': create_access_token(identity=user_name),
+        'refresh_token': create_refresh_token(identity=user_name),
+        'data': user_data
+    }
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Authentication of every request of the API with the access tokens of flask_jwt_extended.
+
+A single before_request hook protects the endpoints of every blueprint, except the ones marked with @jwt_exempt
+(documentation page, login, metrics). The tokens are stateless: the signature and the claims are verified
+once, the header and the claims decoded are then cached by token until the token expires, and no user is read from
+the database. The identity is exposed as flask_jwt_extended does (get_jwt_identity(), get_jwt()), so the endpoints
+keep using its helpers.
+
+With JWT_REVOCATION_ENABLED the tokens revoked on logout are rejected, also by the decorators of flask_jwt_extended
+through its token_in_blocklist_loader.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import re
+import time
+import threading
+from collections import OrderedDict
+from flask import _request_ctx_stack, current_app, request
+from jwt.exceptions import PyJWTError
+from flask_jwt_extended import decode_token, get_unverified_jwt_headers
+from flask_jwt_extended.config import config
+from flask_jwt_extended.exceptions import JWTExtendedException
+from handler_controller.ResponsesHandler import ResponsesHandler as HandlerResponse
+from handler_controller.messages import ErrorMsg
+from logger_controller.logger_control import *
+from utilities.Utility import *
+from .token_revocation import create_revocation_set
+
+cfg_app = get_config_settings_app()
+
+logger = configure_logger('ws')
+
+# Endpoints of the application (outside of the blueprints) which do not need a token: the Prometheus scrape. The
+# database metrics carry the text of the slowest statements, they need a token like the rest of the API
+EXEMPT_ENDPOINTS = {'static', 'metrics'}
+
+
+class InvalidTokenError(Exception):
+    pass
+
+
+class DecodedTokenCache:
+    r"""
+    Class to instance a size-bounded LRU cache of the tokens already verified: token -> (header, claims).
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def get(self, encoded_token):
+        with self._lock:
+            entry = self._entries.get(encoded_token)
+
+            # The claims were verified when cached, only the expiration moves with time
+            if entry is not None and entry[1].get('exp', float('inf')) <= time.time():
+                del self._entries[encoded_token]
+                entry = None
+
+            if entry is None:
+                self._stats['misses'] += 1
+
+                return None
+
+            self._entries.move_to_end(encoded_token)
+            self._stats['hits'] += 1
+
+            return entry
+
+    def put(self, encoded_token, jwt_header, jwt_data):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[encoded_token] = (jwt_header, jwt_data)
+            self._entries.move_to_end(encoded_token)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def metrics(self):
+        with self._lock:
+            cache_metrics = dict(self._stats)
+            cache_metrics['size'] = len(self._entries)
+
+        return cache_metrics
+
+
+token_cache = DecodedTokenCache(cfg_app.jwt_token_cache_size)
+
+revocation_set = create_revocation_set(cfg_app.jwt_revocation_url) if cfg_app.jwt_revocation_enabled else None
+
+
+def jwt_exempt(view_function):
+    r"""
+    Mark an endpoint as public: the authentication middleware does not ask it for a token.
+    """
+
+    view_function.jwt_exempt = True
+
+    return view_function
+
+
+def _request_token():
+    r"""
+    Get the encoded token of the Authorization header: '<JWT_HEADER_TYPE> <token>'.
+
+    :return encoded_token: The token, None when the header is missing.
+    :raise InvalidTokenError: When the header is malformed.
+    """
+
+    auth_header = request.headers.get(config.header_name)
+
+    if not auth_header:
+        return None
+
+    header_type = config.header_type
+
+    for field_value in re.split(r',\s*', auth_header):
+        parts = field_value.split()
+
+        if not header_type and len(parts) == 1:
+            return parts[0]
+
+        if header_type and len(parts) == 2 and parts[0] == header_type:
+            return parts[1]
+
+    raise InvalidTokenError('Bad {} header'.format(config.header_name))
+
+
+def verify_token(encoded_token):
+    r"""
+    Verify an access token, from the cache of the tokens already verified when possible.
+
+    :param encoded_token: The encoded JWT.
+    :return jwt_header, jwt_data: The header and the claims of the token.
+    :raise InvalidTokenError: When the token is invalid, expired, not an access token or revoked.
+    """
+
+    cached_token = token_cache.get(encoded_token)
+
+    if cached_token is not None:
+        jwt_header, jwt_data = cached_token
+    else:
+        try:
+            jwt_data = decode_token(encoded_token)
+            jwt_header = get_unverified_jwt_headers(encoded_token)
+        except (PyJWTError, JWTExtendedException) as exc:
+            raise InvalidTokenError(str(exc))
+
+        if jwt_data.get('type') != 'access':
+            raise InvalidTokenError('Only access tokens are allowed')
+
+        token_cache.put(encoded_token, jwt_header, jwt_data)
+
+    if revocation_set is not None and revocation_set.is_revoked(jwt_data.get('jti')):
+        raise InvalidTokenError('Token has been revoked')
+
+    return jwt_header, jwt_data
+
+
+def authenticate_request():
+    r"""
+    before_request hook: verify the access token of the request unless the endpoint is exempt.
+
+    :return response: The 401 response when the token is missing or invalid, None to serve the request.
+    """
+
+    if request.endpoint is None or request.endpoint in EXEMPT_ENDPOINTS or request.method in config.exempt_methods:
+        return None
+
+    view_function = current_app.view_functions.get(request.endpoint)
+
+    if getattr(view_function, 'jwt_exempt', False):
+        return None
+
+    try:
+        encoded_token = _request_token()
+
+        if encoded_token is None:
+            return HandlerResponse.request_unauthorized(ErrorMsg.ERROR_REQUEST_UNAUTHORIZED)
+
+        jwt_header, jwt_data = verify_token(encoded_token)
+
+    except InvalidTokenError as exc:
+        logger.info('Request rejected, %s: %s %s', str(exc), request.method, request.path)
+
+        return HandlerResponse.request_unauthorized(ErrorMsg.ERROR_REQUEST_UNAUTHORIZED)
+
+    # The same request context values verify_jwt_in_request() sets, read by get_jwt_identity() and get_jwt()
+    request_context = _request_ctx_stack.top
+    request_context.jwt_header = jwt_header
+    request_context.jwt = jwt_data
+    request_context.jwt_user = {'loaded_user': None}
+
+    return None
+
+
+def revoke_request_token():
+    r"""
+    Revoke the access token of the request (logout), when revocation is enabled and the token is valid.
+
+    :return revoked: Whether a token was revoked.
+    """
+
+    if revocation_set is None:
+        return False
+
+    try:
+        encoded_token = _request_token()
+
+        if encoded_token is None:
+            return False
+
+        _, jwt_data = verify_token(encoded_token)
+
+    except InvalidTokenError:
+        return False
+
+    revocation_set.revoke(jwt_data['jti'], jwt_data.get('exp', time.time() + 3600))
+
+    return True
+
+
+def get_jwt_metrics():
+    return token_cache.metrics()
+
+
+def init_jwt_middleware(app, jwt_manager):
+    r"""
+    Protect every endpoint of the application with the authentication middleware.
+
+    :param app: The Flask application.
+    :param jwt_manager: The JWTManager of the application.
+    """
+
+    if revocation_set is not None:
+        @jwt_manager.token_in_blocklist_loader
+        def check_if_token_revoked(jwt_header, jwt_data):
+            return revocation_set.is_revoked(jwt_data.get('jti'))
+
+    if not cfg_app.jwt_auth_required:
+        logger.warning('JWT_AUTH_REQUIRED is disabled, the endpoints are served without a token')
+
+        return
+
+    app.before_request(authenticate_request)
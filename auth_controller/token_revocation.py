@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Revocation set of the JWT issued by the API (logout).
+
+The identifiers (jti) of the tokens revoked are kept until the token would have expired anyway, so the set never
+grows beyond the tokens still valid. JWT_REVOCATION_URL selects the store: empty for the in-memory store of the
+process or a redis:// URL for a Redis server shared by every worker. Any client with the ``setex`` and ``exists``
+methods of redis-py can stand in for Redis.
+
+The in-memory store is for a single process only (development server, tests, one gunicorn worker): a token revoked
+on a worker would still be accepted by the others, so gunicorn refuses to start more than one worker with
+JWT_REVOCATION_ENABLED and no JWT_REVOCATION_URL (gunicorn.conf.py).
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import time
+import threading
+from logger_controller.logger_control import *
+from utilities.Utility import *
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is optional
+    redis = None
+
+cfg_app = get_config_settings_app()
+
+logger = configure_logger('ws')
+
+REVOKED_KEY_PREFIX = 'jwt:revoked:'
+
+
+class InMemoryRevocationStore:
+    r"""
+    Class to instance the revocation set in the memory of the process, with the interface of the Redis client.
+    Single process only: the other processes do not see the tokens revoked here.
+    """
+
+    def __init__(self):
+        self._expiry = dict()
+        self._lock = threading.Lock()
+
+    def setex(self, name, seconds, value):
+        with self._lock:
+            now = time.time()
+
+            # Entries of the tokens already expired are dropped as new ones are added
+            for expired_name in [key for key, expires_at in self._expiry.items() if expires_at <= now]:
+                del self._expiry[expired_name]
+
+            self._expiry[name] = now + seconds
+
+    def exists(self, name):
+        expires_at = self._expiry.get(name)
+
+        return int(expires_at is not None and expires_at > time.time())
+
+
+class TokenRevocationSet:
+    r"""
+    Class to instance the set of token identifiers revoked, over the in-memory store or a Redis client.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def revoke(self, jti, expires_at):
+        r"""
+        Revoke a token until it expires.
+
+        :param jti: The unique identifier of the token.
+        :param expires_at: The exp claim of the token (UNIX time).
+        """
+
+        seconds = max(1, int(expires_at - time.time()) + 1)
+
+        self.client.setex(REVOKED_KEY_PREFIX + jti, seconds, 1)
+
+        logger.info('Token revoked: %s', jti)
+
+    def is_revoked(self, jti):
+        return bool(self.client.exists(REVOKED_KEY_PREFIX + jti))
+
+
+def create_revocation_set(revocation_url=None):
+    r"""
+    Build the revocation set of the JWT_REVOCATION_URL given.
+
+    :param revocation_url: Empty for the in-memory store, redis:// URL for a Redis server.
+    :return revocation_set: The TokenRevocationSet.
+    :raise RuntimeError: When a Redis URL is given and the redis package is not installed.
+    """
+
+    if not revocation_url:
+        return TokenRevocationSet(InMemoryRevocationStore())
+
+    if redis is None:
+        raise RuntimeError('JWT_REVOCATION_URL needs the redis package: {}'.format(revocation_url))
+
+    return TokenRevocationSet(redis.Redis.from_url(revocation_url))
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Load benchmark of the fuel loads ingestion, in fuel loads per second.
+
+Generates pump transactions (a share of them invalid and of them sent twice) and measures:
+ - the validation of the batches, per row (one Python check per field of each row) against the vectorized
+   validation of fuel_ingestion, without database;
+ - with --insert, the whole ingestion (validation, vehicle/driver checks and INSERT ... ON CONFLICT per batch) on the
+   database of DATABASE_URL, sending every transaction twice to measure the idempotent retries. The transaction is
+   rolled back, nothing is left on the database. The vehicles 1..--vehicles must be registered.
+
+Usage:
+    python -m benchmarks.fuel_ingestion [--rows 100000] [--batch-sizes 500,2000,5000] [--insert] [--vehicles 50]
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import time
+import random
+import argparse
+from datetime import date, datetime, timedelta
+from apps.gas_manager.fuel_ingestion import validate_fuel_batch, ingest_fuel_loads, cfg_app
+
+INVALID_SHARE = 0.02
+
+RETRIED_SHARE = 0.05
+
+
+def generate_fuel_loads(rows, vehicles, seed=2021):
+    r"""
+    Build the request bodies of `rows` pump transactions over the last 90 days.
+    """
+
+    generator = random.Random(seed)
+
+    today = date.today()
+
+    fuel_loads = []
+
+    for row_number in range(rows):
+        liters = round(generator.uniform(10, 80), 2)
+
+        fuel_load = {
+            'gasolina_transaccion_id': 'PUMP-{:04d}-{:09d}'.format(generator.randint(1, 200), row_number),
+            'gasolina_registro_fecha': (today - timedelta(days=generator.randint(0, 90))).isoformat(),
+            'gasolina_registro_hora': '{:02d}:{:02d}:{:02d}'.format(generator.randint(0, 23), generator.randint(0, 59),
+                                                                    generator.randint(0, 59)),
+            'gasolina_registro_litros': liters,
+            'gasolina_registro_costo': round(liters * generator.uniform(19.5, 23.5), 2),
+            'gasolina_registro_impuesto': 16,
+            'gasolina_nombre_gasolinera': 'Estacion {}'.format(generator.randint(1, 40)),
+            'gasolina_vehiculo_id': generator.randint(1, vehicles),
+        }
+
+        if generator.random() < INVALID_SHARE:
+            fuel_load['gasolina_registro_litros'] = -fuel_load['gasolina_registro_litros']
+
+        fuel_loads.append(fuel_load)
+
+        if generator.random() < RETRIED_SHARE:
+            fuel_loads.append(dict(fuel_load))
+
+    return fuel_loads[:rows]
+
+
+def validate_row(data):
+    r"""
+    Per row validation of the former ingestion, the baseline: the same rules, one row and one field at a time.
+    """
+
+    errors = []
+
+    try:
+        record_date = datetime.strptime(str(data.get('gasolina_registro_fecha')), '%Y-%m-%d').date()
+
+        if record_date > date.today():
+            errors.append('gasolina_registro_fecha must be a past date (YYYY-MM-DD)')
+    except ValueError:
+        errors.append('gasolina_registro_fecha must be a past date (YYYY-MM-DD)')
+
+    try:
+        datetime.strptime(str(data.get('gasolina_registro_hora')), '%H:%M:%S')
+    except ValueError:
+        errors.append('gasolina_registro_hora must be a time (HH:MM[:SS])')
+
+    try:
+        liters = float(data.get('gasolina_registro_litros'))
+        cost = float(data.get('gasolina_registro_costo'))
+
+        if not 0 < liters <= cfg_app.fuel_max_liters:
+            errors.append('gasolina_registro_litros out of range')
+        elif not cfg_app.fuel_min_price_liter <= cost / liters <= cfg_app.fuel_max_price_liter:
+            errors.append('price per liter out of range')
+    except (TypeError, ValueError):
+        errors.append('gasolina_registro_litros out of range')
+
+    if not str(data.get('gasolina_transaccion_id') or '').strip():
+        errors.append('gasolina_transaccion_id is required')
+
+    if not isinstance(data.get('gasolina_vehiculo_id'), int) or data.get('gasolina_vehiculo_id') <= 0:
+        errors.append('gasolina_vehiculo_id is not valid')
+
+    return errors
+
+
+def measure(validate, fuel_loads, batch_size):
+    start_time = time.perf_counter()
+
+    for first_row in range(0, len(fuel_loads), batch_size):
+        validate(fuel_loads[first_row:first_row + batch_size], first_row)
+
+    return len(fuel_loads) / (time.perf_counter() - start_time)
+
+
+def per_row_validation(batch, first_row):
+    return {row_number: validate_row(data) for row_number, data in enumerate(batch, start=first_row)}
+
+
+def measure_insert(fuel_loads, batch_size):
+    r"""
+    Ingest the fuel loads twice on one rolled back transaction: the first pass inserts, the second is all retries.
+    """
+
+    from db_controller.database_backend import get_engine
+    from sqlalchemy.orm import Session
+
+    connection = get_engine().connect()
+    transaction = connection.begin()
+    session = Session(bind=connection)
+
+    try:
+        first_pass = ingest_fuel_loads(session, fuel_loads, batch_size)
+        retry_pass = ingest_fuel_loads(session, fuel_loads, batch_size)
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+
+    return first_pass, retry_pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fuel loads ingestion load benchmark')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch-sizes', default='500,2000,5000')
+    parser.add_argument('--vehicles', type=int, default=50)
+    parser.add_argument('--insert', action='store_true', help='Also ingest on the database of DATABASE_URL')
+    args = parser.parse_args()
+
+    fuel_loads = generate_fuel_loads(args.rows, args.vehicles)
+
+    print('Fuel loads: {}, invalid share: {:.0%}, retried share: {:.0%}'.format(len(fuel_loads), INVALID_SHARE,
+                                                                               RETRIED_SHARE))
+
+    for batch_size in (int(value) for value in args.batch_sizes.split(',')):
+        per_row_rate = measure(per_row_validation, fuel_loads, batch_size)
+        vectorized_rate = measure(validate_fuel_batch, fuel_loads, batch_size)
+
+        print('batch {:5d}: validation per row {:10.1f} rows/s, vectorized {:10.1f} rows/s, speedup {:.1f}x'.format(
+            batch_size, per_row_rate, vectorized_rate, vectorized_rate / per_row_rate))
+
+        if args.insert:
+            first_pass, retry_pass = measure_insert(fuel_loads, batch_size)
+
+            print('            ingestion {:10.1f} rows/s ({} inserted, {} duplicated, {} invalid), '
+                  'retry {:10.1f} rows/s ({} duplicated)'.format(
+                      first_pass['rows_per_second'], first_pass['inserted'], first_pass['duplicated'],
+                      first_pass['invalid'], retry_pass['rows_per_second'], retry_pass['duplicated']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Benchmark of the password KDF of the login, in logins per second and per core.
+
+Compares the former login (hash the password received, then verify it against that new hash) with the current one
+(verify against the stored hash) running on the bounded KDF pool, with an increasing number of concurrent logins.
+
+Usage:
+    python -m benchmarks.login_throughput [--logins 200] [--concurrency 1,2,4,8]
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from passlib.hash import pbkdf2_sha256
+from auth_controller.api_authentication import pwd_context, verify_password, cfg_app
+
+PASSWORD = 'usuario@gasmanager.com_S3cret.2021_api-key'
+
+
+def former_login():
+    # generate_hash() + verify_hash() on the hash just generated
+    password_hash = pbkdf2_sha256.hash(PASSWORD)
+
+    return pbkdf2_sha256.verify(PASSWORD, password_hash)
+
+
+def current_login(stored_hash):
+    return verify_password(PASSWORD, stored_hash)[0]
+
+
+def measure(login, logins, concurrency):
+    r"""
+    Run the logins from `concurrency` request threads and get the logins per second.
+    """
+
+    start_time = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as request_threads:
+        results = list(request_threads.map(lambda _: login(), range(logins)))
+
+    assert all(results)
+
+    return logins / (time.perf_counter() - start_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login KDF throughput benchmark')
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', default='1,2,4,8')
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    stored_hash = pwd_context.hash(PASSWORD)
+
+    print('Cores: {}, KDF pool workers: {}, pbkdf2_sha256 rounds: {}'.format(
+        cores, cfg_app.password_hash_workers, cfg_app.password_hash_rounds))
+
+    for concurrency in (int(value) for value in args.concurrency.split(',')):
+        busy_cores = min(concurrency, cores, max(1, cfg_app.password_hash_workers))
+
+        former_rate = measure(former_login, args.logins, concurrency)
+        current_rate = measure(lambda: current_login(stored_hash), args.logins, concurrency)
+
+        print('{:3d} concurrent: former {:8.1f} logins/s ({:7.1f}/core), current {:8.1f} logins/s ({:7.1f}/core), '
+              'speedup {:.1f}x'.format(concurrency, former_rate, former_rate / min(concurrency, cores),
+                                       current_rate, current_rate / busy_cores, current_rate / former_rate))
+
+
+if __name__ == '__main__':
+    main()
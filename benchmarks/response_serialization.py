@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Micro-benchmark of the serialization of a list response of 1k vehicles.
+
+Compares the former path (the model json.dumps the rows, ResponsesHandler json.loads them back and jsonify
+serializes them again) with the current one (the model returns the rows and the response is serialized once), for
+each JSON backend installed.
+
+Usage:
+    python -m benchmarks.response_serialization [--rows 1000] [--repeat 200]
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import json
+import timeit
+import argparse
+from decimal import Decimal
+from datetime import date, timedelta
+from flask import Flask, jsonify
+from handler_controller.json_encoder import dumps, set_json_backend, JSON_BACKENDS
+
+
+def build_rows(rows_count):
+    r"""
+    Build vehicle dictionaries shaped as VehicleModel.to_dict() returns them.
+    """
+
+    register_date = date(2021, 1, 1)
+
+    return [{
+        "vehiculo_id": vehicle_id,
+        "vehiculo_modelo": "Modelo {}".format(vehicle_id % 50),
+        "vehiculo_marca": "Marca {}".format(vehicle_id % 12),
+        "vehiculo_matricula": "ABC-{:05d}".format(vehicle_id),
+        "vehiculo_numero_asientos": 5,
+        "vehiculo_numero_puertas": 4,
+        "vehiculo_color": "Blanco",
+        "vehiculo_modelo_anio": 2020,
+        "vehiculo_modelo_motor": "1.6L",
+        "vehiculo_anio_motor": 2020,
+        "vehiculo_numero_chasis": "CH{:010d}".format(vehicle_id),
+        "vehiculo_transmision": "Manual",
+        "vehiculo_tipo_combustible": "Magna",
+        "vehiculo_emisiones_co2": 120,
+        "vehiculo_caballos_fuerza": 110,
+        "vehiculo_potencia": 81,
+        "vehiculo_descripcion": "Vehiculo de flotilla numero {}".format(vehicle_id),
+        "vehiculo_costo_catalogo": Decimal('289900.00'),
+        "vehiculo_costo_compra": Decimal('275000.50'),
+        "vehiculo_costo_impuesto": Decimal('44000.08'),
+        "vehiculo_fecha_registro": register_date + timedelta(days=vehicle_id % 365),
+        "vehiculo_fecha_baja": None
+    } for vehicle_id in range(rows_count)]
+
+
+def former_response(app, rows):
+    # Model: json.dumps with the dates and amounts stringified by hand
+    data = json.dumps({'results': rows}, default=str)
+
+    # ResponsesHandler: json.loads back, then jsonify serializes a third time
+    with app.app_context():
+        return jsonify({'message': 'ok', 'data': json.loads(data)}).get_data()
+
+
+def current_response(rows):
+    return dumps({'message': 'ok', 'data': {'results': rows}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Response serialization micro-benchmark')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    rows = build_rows(args.rows)
+
+    former_time = timeit.timeit(lambda: former_response(app, rows), number=args.repeat) / args.repeat
+
+    print('Rows per response: {}'.format(args.rows))
+    print('dumps -> loads -> jsonify:     {:8.3f} ms/response'.format(former_time * 1000))
+
+    for backend_name, backend_dumps in JSON_BACKENDS.items():
+        if backend_dumps is None:
+            print('single serialization {:8s}: not installed'.format(backend_name))
+            continue
+
+        set_json_backend(backend_name)
+
+        current_time = timeit.timeit(lambda: current_response(rows), number=args.repeat) / args.repeat
+
+        print('single serialization {:8s}: {:8.3f} ms/response, speedup {:.1f}x'.format(
+            backend_name, current_time * 1000, former_time / current_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Helpers of the vectorized validation of the ingestion batches (fuel loads, odometer readings).
+
+A field of a batch is converted once to a numpy column, NaN/NaT standing for the missing or invalid values, so each
+validation rule becomes a comparison over the whole column. The rows are only visited one by one when a column can
+not be converted at once, to find its invalid values.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import numpy as np
+
+# Largest value of the INTEGER (int4) id columns
+MAX_ID = 2 ** 31 - 1
+
+
+def _is_bool(value):
+    return isinstance(value, (bool, np.bool_))
+
+
+def float_column(values):
+    r"""
+    Convert a column to float64, NaN for the missing or invalid values. Booleans are invalid values, not 0 and 1.
+
+    :param values: List with the values of the field on each row.
+    :return column: The float64 array.
+    """
+
+    if not any(_is_bool(value) for value in values):
+        try:
+            column = np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            column = None
+
+        # Lists of numbers are converted too, as an extra dimension: they are invalid values of the field
+        if column is not None and column.shape == (len(values),):
+            return column
+
+    column = np.full(len(values), np.nan)
+
+    for index, value in enumerate(values):
+        if _is_bool(value):
+            continue
+
+        try:
+            column[index] = float(value)
+        except (TypeError, ValueError):
+            pass
+
+    return column
+
+
+def datetime_column(values, unit, prefix=''):
+    r"""
+    Convert a column of ISO strings to datetime64, NaT for the missing or invalid values.
+
+    :param values: List with the values of the field on each row.
+    :param unit: Unit of the datetime64 array: 'D' for dates, 's' for timestamps.
+    :param prefix: Text prepended to each value, e.g. a date to read times of the day.
+    :return column: The datetime64 array.
+    """
+
+    texts = [prefix + str(value) if value is not None else 'NaT' for value in values]
+
+    try:
+        return np.array(texts, dtype='datetime64[{}]'.format(unit))
+    except ValueError:
+        pass
+
+    column = np.full(len(texts), np.datetime64('NaT'), dtype='datetime64[{}]'.format(unit))
+
+    for index, text_value in enumerate(texts):
+        try:
+            column[index] = np.datetime64(text_value, unit)
+        except ValueError:
+            pass
+
+    return column
+
+
+def missing_mask(values):
+    r"""
+    Mask of the rows where the field was not sent.
+    """
+
+    return np.array([value is None for value in values], dtype=bool)
+
+
+def text_mask(values):
+    r"""
+    Mask of the rows where the field is a string or was not sent.
+    """
+
+    return np.array([value is None or isinstance(value, str) for value in values], dtype=bool)
+
+
+def is_id(column):
+    r"""
+    Mask of the values which are valid identifiers: finite, positive, integral and within the INTEGER columns.
+    """
+
+    with np.errstate(invalid='ignore'):
+        return np.isfinite(column) & (column > 0) & (column <= MAX_ID) & (column == np.floor(column))
+
+
+def registered_ids(cursor, model, attr_name, column):
+    r"""
+    Get, with one query, which ids of a batch column are registered on the table of the model.
+
+    :param cursor: DBAPI cursor of the ingestion transaction.
+    :param model: The model class of the table referenced.
+    :param attr_name: The attribute of the model holding the id.
+    :param column: Float array of the ids of the batch.
+    :return registered: Float array of the ids registered, to match with np.isin.
+    """
+
+    candidate_ids = np.unique(column[is_id(column)]).astype(np.int64).tolist()
+
+    if not candidate_ids:
+        return np.array([], dtype=np.float64)
+
+    column_name = model.__mapper__.columns[attr_name].name
+
+    cursor.execute('SELECT "{}" FROM "{}" WHERE "{}" = ANY(%s)'.format(column_name, model.__tablename__, column_name),
+                   (candidate_ids,))
+
+    return np.array([row[0] for row in cursor.fetchall()], dtype=np.float64)
@@ -10,27 +10,26 @@ __license__ = ""
 __history__ = """ """
 __version__ = "1.21.G02.1 ($Rev: 2 $)"
 
-import json
-import logging
-from datetime import datetime
-
-import psycopg2
-from sqlalchemy import create_engine, ForeignKey
-from sqlalchemy_utils import database_exists, create_database
-from sqlalchemy.orm import sessionmaker, relationship
+import os
+import time
+import importlib
+import threading
+
+from sqlalchemy import create_engine, event, text, func, Column, Integer, DateTime
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
 
 from sqlalchemy.engine.reflection import Inspector
 
+from flask import _app_ctx_stack
 from db_controller import mvc_exceptions as mvc_exc
+from db_controller.query_instrumentation import register_query_events
 from logger_controller.logger_control import *
 from utilities.Utility import *
 
-from flask_bcrypt import Bcrypt
-
 Base = declarative_base()
-bcrypt = Bcrypt()
 
 cfg_db = get_config_settings_db()
 cfg_app = get_config_settings_app()
@@ -38,29 +37,226 @@ cfg_app = get_config_settings_app()
 # logger = configure_logger(cfg_app.log_types[2].__str__())
 logger = configure_logger('db')
 
-logging.basicConfig()
-logging.getLogger('sqlalchemy.engine').setLevel(logging.DEBUG)
+
+# One engine (and so one connection pool) per worker process, created on first use.
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+_pool_stats_lock = threading.Lock()
+_pool_stats = {
+    'connections_created': 0,
+    'checkouts': 0,
+    'checkins': 0,
+    'invalidations': 0,
+    'checkout_count': 0,
+    'checkout_time_total': 0.0,
+    'checkout_time_max': 0.0,
+}
+
+
+def _increment_pool_stat(stat_name, value=1):
+    with _pool_stats_lock:
+        _pool_stats[stat_name] += value
+
+
+def _register_pool_events(engine):
+    r"""
+    Attach the pool listeners used to feed the pool metrics of the worker process.
+
+    :param engine: The engine whose pool will be observed.
+    """
+
+    def on_connect(dbapi_connection, connection_record):
+        _increment_pool_stat('connections_created')
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        _increment_pool_stat('checkouts')
+
+    def on_checkin(dbapi_connection, connection_record):
+        _increment_pool_stat('checkins')
+
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        _increment_pool_stat('invalidations')
+
+    event.listen(engine.pool, 'connect', on_connect)
+    event.listen(engine.pool, 'checkout', on_checkout)
+    event.listen(engine.pool, 'checkin', on_checkin)
+    event.listen(engine.pool, 'invalidate', on_invalidate)
 
 
 def create_engine_db():
+    r"""
+    Build a new engine backed by a QueuePool configured from the DB_POOL_* settings.
 
-    # For Test connection:
+    Request handlers must not call this directly, use get_engine() to share the pool of the process.
 
-    engine = create_engine(cfg_db.Development.SQLALCHEMY_DATABASE_URI.__str__(),
+    :return engine: The engine object connected to the database of the current environment.
+    """
+
+    database_uri = cfg_db.Development.SQLALCHEMY_DATABASE_URI.__str__()
+
+    if not 'development' == cfg_app.flask_api_env:
+        database_uri = cfg_db.Production.SQLALCHEMY_DATABASE_URI.__str__()
+
+    engine = create_engine(database_uri,
                            client_encoding="utf8",
+                           poolclass=QueuePool,
+                           pool_size=cfg_db.pool_size,
+                           max_overflow=cfg_db.pool_max_overflow,
+                           pool_timeout=cfg_db.pool_timeout,
+                           pool_recycle=cfg_db.pool_recycle,
+                           pool_pre_ping=cfg_db.pool_pre_ping,
                            execution_options={"isolation_level": "REPEATABLE READ"})
 
-    if not 'development' == cfg_app.flask_api_env:
-        engine = create_engine(cfg_db.Production.SQLALCHEMY_DATABASE_URI.__str__(),
-                               client_encoding="utf8",
-                               execution_options={"isolation_level": "REPEATABLE READ"})
+    _register_pool_events(engine)
+
+    # Statement count/time per request and per process; SQL echo only with DB_SQL_ECHO
+    register_query_events(engine)
 
-    logger.info("Engine Created by URL: {}".format(cfg_db.Development.SQLALCHEMY_DATABASE_URI.__str__()))
+    logger.info("Engine Created by URL: {}".format(repr(engine.url)))
 
     return engine
 
 
+def get_engine():
+    r"""
+    Get the engine of the current worker process, creating it lazily on the first call.
+
+    A forked worker (gunicorn --preload) never reuses the engine inherited from its parent, because the pooled
+    sockets would be shared between both processes.
+
+    :return engine: The engine object shared by every request of the process.
+    """
+
+    global _engine, _engine_pid
+
+    current_pid = os.getpid()
+
+    if _engine is None or _engine_pid != current_pid:
+        with _engine_lock:
+            if _engine is None or _engine_pid != current_pid:
+                _engine = create_engine_db()
+                _engine_pid = current_pid
+
+    return _engine
+
+
+def dispose_engine():
+    r"""
+    Close every pooled connection of the process and forget the engine.
+    """
+
+    global _engine, _engine_pid
+
+    with _engine_lock:
+        if _engine is not None and _engine_pid == os.getpid():
+            _engine.dispose()
+
+        _engine = None
+        _engine_pid = None
+
+
+def checkout_connection(engine_co):
+    r"""
+    Take a connection from the pool, recording the time spent checking it out.
+
+    The time includes the wait for a free connection when the pool is exhausted, and the connect of a new one.
+
+    :param engine_co: The engine which owns the pool.
+    :return connection: The connection checked out from the pool.
+    """
+
+    start_checkout = time.perf_counter()
+
+    connection = engine_co.connect()
+
+    checkout_time = time.perf_counter() - start_checkout
+
+    with _pool_stats_lock:
+        _pool_stats['checkout_count'] += 1
+        _pool_stats['checkout_time_total'] += checkout_time
+        _pool_stats['checkout_time_max'] = max(_pool_stats['checkout_time_max'], checkout_time)
+
+    return connection
+
+
+def get_pool_metrics():
+    r"""
+    Get the pool utilization and checkout counters of the current worker process.
+
+    :return pool_metrics: Dictionary with the pool metrics.
+    """
+
+    with _pool_stats_lock:
+        pool_metrics = dict(_pool_stats)
+
+    pool_metrics['checkout_time_avg'] = (pool_metrics['checkout_time_total'] / pool_metrics['checkout_count']
+                                         if pool_metrics['checkout_count'] else 0.0)
+
+    engine = _engine
+
+    if engine is not None and _engine_pid == os.getpid():
+        pool_metrics['pool_size'] = engine.pool.size()
+        pool_metrics['checked_in'] = engine.pool.checkedin()
+        pool_metrics['checked_out'] = engine.pool.checkedout()
+        pool_metrics['overflow'] = engine.pool.overflow()
+
+    return pool_metrics
+
+
+# Version of the database schema expected by this code. Bump it together with a new migration registered.
+SCHEMA_VERSION = 6
+
+# DDL statements applied, in order, to move an existing database up to each version. The model modules register
+# them with register_schema_migration(), the statements must be idempotent (IF NOT EXISTS) because a fresh
+# database already gets the latest objects from create_all.
+_SCHEMA_MIGRATIONS = {
+    1: [],
+}
+
+# Modules declaring the models of the API; they must be imported so Base.metadata knows every table.
+SCHEMA_MODEL_MODULES = [
+    'apps.vehicle.VehicleModel',
+    'apps.driver.DriverModel',
+    'apps.api_authentication.UsersAuthModel',
+    'apps.gas_manager.GasManagerModel',
+    'apps.odometer.OdometerModel',
+    'apps.gas_manager.FuelDailyModel',
+    'apps.gas_manager.FuelAnomalyModel',
+]
+
+# Arbitrary key of the advisory lock which serializes the bootstrap between workers starting together.
+_SCHEMA_LOCK_ID = 20210716
+
+
+class SchemaVersionModel(Base):
+    r"""
+    Class to instance the schema versions applied on the database by the bootstrap phase.
+    """
+
+    __tablename__ = 'api_schema_version'
+
+    version = Column('version', Integer, primary_key=True, autoincrement=False)
+    applied_date = Column('applied_date', DateTime, nullable=False, server_default=func.now())
+
+
+def register_schema_migration(version, ddl_statement):
+    r"""
+    Register a DDL statement to apply when the database is migrated up to the version given.
+
+    :param version: The schema version which introduces the statement.
+    :param ddl_statement: The idempotent DDL statement.
+    """
+
+    migration = _SCHEMA_MIGRATIONS.setdefault(version, [])
+
+    if ddl_statement not in migration:
+        migration.append(ddl_statement)
+
+
 def create_database_api(engine_session):
+    from sqlalchemy_utils import database_exists, create_database
 
     if not database_exists(engine_session.url):
         logger.info("Create the Database...")
@@ -70,85 +266,178 @@ def create_database_api(engine_session):
 
 
 def create_bd_objects(engine_obj):
+    r"""
+    Create, in a single DDL pass, the tables declared on the models which are not yet on the database.
+
+    :param engine_obj: The engine of the database to inspect.
+    """
+
     inspector = Inspector.from_engine(engine_obj)
 
-    table_names = list()
+    table_names = set(inspector.get_table_names())
+
+    missing_tables = [table for table_name, table in Base.metadata.tables.items() if table_name not in table_names]
 
-    table_names.append(cfg_db.gas_driver_table.__str__())
-    table_names.append(cfg_db.gas_manager_vehicle_table.__str__())
-    table_names.append(cfg_db.gas_vehicle_table.__str__())
-    table_names.append(cfg_db.gas_odometer_vehicle_table.__str__())
-    table_names.append(cfg_db.gas_document_vehicle_table.__str__())
-    table_names.append(cfg_db.gas_service_vehicle_table.__str__())
+    if missing_tables:
+        Base.metadata.create_all(bind=engine_obj, tables=missing_tables)
 
-    if not inspector.get_table_names():
-        Base.metadata.create_all(bind=engine_obj)
-        logger.info("Database objects created...")
+        logger.info("Database objects created: %s", ', '.join(table.name for table in missing_tables))
     else:
+        logger.info("Database objects already created...")
+
+
+def get_schema_version(connection):
+    r"""
+    Get the last schema version recorded on the database.
+
+    :param connection: Connection to the database.
+    :return version: The last version applied or 0 when the schema was never bootstrapped.
+    """
 
-        for table_name in inspector.get_table_names():
+    if not connection.dialect.has_table(connection, SchemaVersionModel.__tablename__):
+        return 0
 
-            logger.info('Table on database: %s', str(table_name))
+    version = connection.execute(
+        text('SELECT MAX(version) FROM {}'.format(SchemaVersionModel.__tablename__))
+    ).scalar()
 
-            if table_name in table_names:
+    return version or 0
 
-                logger.info('Table already created: %s', str(table_name))
-            else:
-                # Create tables
-                Base.metadata.create_all(bind=engine_obj)
 
-                logger.info("Database objects created...")
+def bootstrap_schema(engine_bs=None):
+    r"""
+    One-shot startup/migration phase: create the database and its objects and apply the pending migrations.
+
+    It is meant to run from the ``flask init-db`` command or from the app factory, never from a request handler.
+
+    :param engine_bs: The engine of the database, the engine of the process by default.
+    :return version: The schema version of the database once bootstrapped.
+    """
+
+    engine_bs = engine_bs or get_engine()
+
+    create_database_api(engine_bs)
+
+    for module_name in SCHEMA_MODEL_MODULES:
+        importlib.import_module(module_name)
+
+    with engine_bs.begin() as connection:
+        connection.execute(text('SELECT pg_advisory_xact_lock(:lock_id)'), lock_id=_SCHEMA_LOCK_ID)
 
-    # Base.metadata.create_all(bind=engine_obj)
+        current_version = get_schema_version(connection)
 
-    logger.info("Database objects created...")
+        if current_version >= SCHEMA_VERSION:
+            logger.info("Database schema up to date, version: %s", current_version)
 
+            return current_version
 
-def session_to_db(engine_se):
+        create_bd_objects(connection)
+
+        for version in range(current_version + 1, SCHEMA_VERSION + 1):
+            for ddl_statement in _SCHEMA_MIGRATIONS.get(version, []):
+                connection.execute(text(ddl_statement))
+
+            connection.execute(SchemaVersionModel.__table__.insert().values(version=version))
+
+            logger.info("Database schema migrated to version: %s", version)
+
+    return SCHEMA_VERSION
+
+
+# Sessions live as long as the Flask application context (one per request) and are removed on teardown.
+db_session = scoped_session(sessionmaker(), scopefunc=_app_ctx_stack.__ident_func__)
+
+
+def get_db_session(isolation_level=None):
     r"""
-    Get and manage the session connect to the database engine.
+    Get the session of the current request, bound to a single pooled connection with one open transaction.
 
-    :return connection: Object to connect to the database and transact on it.
+    The first call of the request checks the connection out of the pool and begins the transaction; the
+    following calls, from the handler or from any model method, reuse them.
+
+    :param isolation_level: Isolation level of the transaction begun by the first call, the one of the engine
+        (REPEATABLE READ) when None. The connection gets the level of the engine back when it returns to the pool.
+    :return session: Object to transact to the database on the request transaction.
     """
 
-    session = None
+    if not db_session.registry.has():
+
+        try:
 
-    connection = None
+            connection = checkout_connection(get_engine())
 
-    try:
+            if isolation_level is not None:
+                connection = connection.execution_options(isolation_level=isolation_level)
 
-        if engine_se:
+        except SQLAlchemyError as db_error:
+            logger.exception("Can not connect to database, verify data connection: %s", db_error)
+            raise mvc_exc.ConnectionError(
+                'Can not connect to database, verify data connection.\nOriginal Exception raised: {}'.format(db_error)
+            )
 
-            session_maker = sessionmaker(bind=engine_se, autocommit=True)
+        session = db_session(bind=connection)
+        session.info['transaction'] = connection.begin()
 
-            connection = engine_se.connect()
+    return db_session()
 
-            session = session_maker(bind=connection)
 
-            logger.info("Connection and Session objects created...")
+def commit_db_session(response):
+    r"""
+    Commit the request transaction once the handler succeeded, roll it back on error responses.
 
-        else:
-            logger.error("Database not created or some parameters with the connection to the database can't be read")
+    Running on after_request lets a failed commit still turn into an error response.
 
-    except mvc_exc.DatabaseError as db_error:
-        logger.exception("Can not connect to database, verify data connection", db_error, exc_info=True)
-        raise mvc_exc.ConnectionError(
-            'Can not connect to database, verify data connection.\nOriginal Exception raised: {}'.format(db_error)
-        )
+    :param response: The response of the request.
+    :return response: The same response.
+    """
+
+    if db_session.registry.has():
+        session = db_session()
+        transaction = session.info.get('transaction')
+
+        if transaction is not None and transaction.is_active:
+            if response.status_code < 400:
+                session.commit()
+                transaction.commit()
+            else:
+                transaction.rollback()
+
+    return response
+
+
+def remove_db_session(exception=None):
+    r"""
+    Roll back whatever was left open by the request, remove its session and give the connection back to the pool.
 
-    return connection, session
+    :param exception: The exception which ended the request, if any.
+    """
+
+    if not db_session.registry.has():
+        return
 
+    session = db_session()
+    connection = session.bind
+    transaction = session.info.pop('transaction', None)
+
+    try:
+        if transaction is not None and transaction.is_active:
+            transaction.rollback()
+    finally:
+        db_session.remove()
 
-def init_db_connection():
-    engine_db = create_engine_db()
+        if connection is not None:
+            connection.close()
 
-    create_database_api(engine_db)
 
-    create_bd_objects(engine_db)
+def init_db_session(app):
+    r"""
+    Register the request-scoped session lifecycle on the application.
 
-    connection, session = session_to_db(engine_db)
+    :param app: The Flask application.
+    """
 
-    return connection, session
+    app.after_request(commit_db_session)
+    app.teardown_appcontext(remove_db_session)
 
 
 def scrub(input_string):
@@ -246,8 +535,6 @@ def get_current_date_from_db(session, conn, cursor):
 
         result = cursor.fetchone()[0]
 
-        print("NOW() :", result)
-
         if result is not None:
             # last_updated_date = datetime.datetime.strptime(str(result), "%Y-%m-%d %H:%M:%S")
             # last_updated_date = datetime.datetime.strptime(str(result), "%Y-%m-%d %I:%M:%S")
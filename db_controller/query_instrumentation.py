@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Instrumentation of the SQL statements sent through the engine.
+
+The before/after_cursor_execute listeners time every statement. Inside a request the count, the total time and the
+slowest statements are accumulated on ``flask.g`` and returned to the client on the ``Server-Timing`` header; the
+worker process keeps the same figures aggregated for the metrics endpoint.
+
+The statements are no longer echoed by default. DB_SQL_ECHO=true sends them, with their parameters, to the 'db' log
+(DB_SQL_ECHO=debug adds the result rows).
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import time
+import heapq
+import logging
+import threading
+from flask import g, has_app_context
+from sqlalchemy import event
+from logger_controller.logger_control import *
+from utilities.Utility import *
+
+cfg_db = get_config_settings_db()
+
+logger = configure_logger('db')
+
+# Statements longer than this are truncated on the slowest statements reported
+STATEMENT_TEXT_LIMIT = 300
+
+_query_stats_lock = threading.Lock()
+_query_stats = {
+    'requests': 0,
+    'statements': 0,
+    'errors': 0,
+    'time_total': 0.0,
+    'time_max': 0.0,
+}
+
+# Heap (duration, statement) of the slowest statements of the process, the fastest one on top
+_slowest_statements = []
+
+
+class RequestQueryStats:
+    r"""
+    Class to accumulate the statements executed while serving a request.
+    """
+
+    __slots__ = ('statements', 'errors', 'time_total', 'slowest')
+
+    def __init__(self):
+        self.statements = 0
+        self.errors = 0
+        self.time_total = 0.0
+        self.slowest = []
+
+    def add(self, statement, duration):
+        self.statements += 1
+        self.time_total += duration
+
+        _push_slowest(self.slowest, duration, statement)
+
+    def to_dict(self):
+        return {
+            'statements': self.statements,
+            'errors': self.errors,
+            'time_ms': round(self.time_total * 1000, 3),
+            'slowest': _slowest_list(self.slowest)
+        }
+
+
+def _push_slowest(slowest, duration, statement):
+    r"""
+    Keep on the heap the DB_SLOWEST_STATEMENTS slowest statements seen.
+    """
+
+    entry = (duration, statement[:STATEMENT_TEXT_LIMIT])
+
+    if len(slowest) < cfg_db.slowest_statements:
+        heapq.heappush(slowest, entry)
+    elif slowest and duration > slowest[0][0]:
+        heapq.heapreplace(slowest, entry)
+
+
+def _slowest_list(slowest):
+    return [{'time_ms': round(duration * 1000, 3), 'statement': statement}
+            for duration, statement in sorted(slowest, reverse=True)]
+
+
+def _request_query_stats():
+    r"""
+    Get the statistics of the current request, None outside of an application context (bootstrap, CLI).
+    """
+
+    if not has_app_context():
+        return None
+
+    request_stats = g.get('db_query_stats')
+
+    if request_stats is None:
+        request_stats = g.db_query_stats = RequestQueryStats()
+
+    return request_stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start_time'].pop()
+
+    with _query_stats_lock:
+        _query_stats['statements'] += 1
+        _query_stats['time_total'] += duration
+        _query_stats['time_max'] = max(_query_stats['time_max'], duration)
+
+        _push_slowest(_slowest_statements, duration, statement)
+
+    request_stats = _request_query_stats()
+
+    if request_stats is not None:
+        request_stats.add(statement, duration)
+
+    if duration * 1000 >= cfg_db.slow_statement_ms:
+        logger.warning('Slow statement (%.1f ms): %s', duration * 1000, statement[:STATEMENT_TEXT_LIMIT])
+
+
+def _handle_error(exception_context):
+    r"""
+    Discard the start time of a statement which failed, after_cursor_execute is not called for it.
+    """
+
+    connection = exception_context.connection
+
+    if connection is not None and connection.info.get('query_start_time'):
+        connection.info['query_start_time'].pop()
+
+    with _query_stats_lock:
+        _query_stats['errors'] += 1
+
+    request_stats = _request_query_stats()
+
+    if request_stats is not None:
+        request_stats.errors += 1
+
+
+def register_query_events(engine):
+    r"""
+    Attach the statement listeners to the engine and apply the DB_SQL_ECHO setting.
+
+    :param engine: The engine whose statements will be observed.
+    """
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+    echo_level = {'true': logging.INFO, 'debug': logging.DEBUG}.get(cfg_db.sql_echo)
+
+    if echo_level is not None:
+        configure_logger('sqlalchemy.engine').setLevel(echo_level)
+
+        logger.warning('SQL echo enabled (DB_SQL_ECHO=%s), statements are written to the log', cfg_db.sql_echo)
+
+
+def get_query_metrics():
+    r"""
+    Get the statement counters and the slowest statements of the current worker process.
+
+    :return query_metrics: Dictionary with the statement metrics.
+    """
+
+    with _query_stats_lock:
+        query_metrics = dict(_query_stats)
+        slowest = list(_slowest_statements)
+
+    query_metrics['time_avg'] = (query_metrics['time_total'] / query_metrics['statements']
+                                 if query_metrics['statements'] else 0.0)
+    query_metrics['statements_per_request'] = (query_metrics['statements'] / query_metrics['requests']
+                                               if query_metrics['requests'] else 0.0)
+    query_metrics['slowest'] = _slowest_list(slowest)
+
+    return query_metrics
+
+
+def get_request_query_stats():
+    r"""
+    Get the statements executed so far by the current request.
+
+    :return request_stats: Dictionary with the count, the total time and the slowest statements.
+    """
+
+    return (_request_query_stats() or RequestQueryStats()).to_dict()
+
+
+def _start_request_timer():
+    g.request_start_time = time.perf_counter()
+
+
+def add_server_timing(response):
+    r"""
+    Add the database time of the request and the time of the handler to the Server-Timing header.
+
+    :param response: The response of the request.
+    :return response: The same response.
+    """
+
+    request_stats = g.get('db_query_stats')
+
+    if request_stats is None:
+        request_stats = RequestQueryStats()
+
+    with _query_stats_lock:
+        _query_stats['requests'] += 1
+
+    server_timing = ['db;dur={:.3f};desc="{} statements"'.format(request_stats.time_total * 1000,
+                                                                 request_stats.statements)]
+
+    request_start_time = g.get('request_start_time')
+
+    if request_start_time is not None:
+        server_timing.append('app;dur={:.3f}'.format((time.perf_counter() - request_start_time) * 1000))
+
+    response.headers.add('Server-Timing', ', '.join(server_timing))
+
+    return response
+
+
+def init_query_instrumentation(app):
+    r"""
+    Register the request timer and the Server-Timing header on the application.
+
+    :param app: The Flask application.
+    """
+
+    app.before_request(_start_request_timer)
+    app.after_request(add_server_timing)
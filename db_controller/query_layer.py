@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Shared query layer of the models.
+
+Lookups are issued as a single ``one_or_none()`` round trip built from baked queries, so the SQL of each
+(model, criteria) combination is compiled once per process and then reused by every request.
+
+Inserts on a natural key are issued as a single PostgreSQL ``INSERT ... ON CONFLICT ... RETURNING`` statement.
+
+List endpoints are paginated by keyset (``WHERE key > :last ORDER BY key LIMIT :n``) with opaque cursor tokens, so
+the cost of a page does not grow with its position and a request never loads the whole table.
+
+Full-table exports are read through a server-side cursor (``stream_results`` + ``yield_per``) so the rows are
+fetched in chunks while the response is being written.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import json
+import base64
+import binascii
+from types import SimpleNamespace
+from contextlib import contextmanager
+from sqlalchemy import bindparam, event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.ext import baked
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from db_controller import mvc_exceptions as mvc_exc
+from db_controller.database_backend import get_engine, checkout_connection
+from logger_controller.logger_control import *
+
+logger = configure_logger('db')
+
+bakery = baked.bakery()
+
+DEFAULT_PAGE_LIMIT = 100
+
+MAX_PAGE_LIMIT = 1000
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+def lookup_one(session, model, **criteria):
+    r"""
+    Get the only row of the model matching every criteria (column == value), in a single round trip.
+
+    :param session: Session database object.
+    :param model: The model class to query.
+    :param criteria: Attribute names of the model and the values to match; None values are matched with IS NULL.
+    :return row: The row found or None when there is no row matching.
+    """
+
+    value_fields = tuple(sorted(field for field, value in criteria.items() if value is not None))
+    null_fields = tuple(sorted(field for field, value in criteria.items() if value is None))
+
+    def filter_criteria(query):
+        for field in value_fields:
+            query = query.filter(getattr(model, field) == bindparam(field))
+
+        for field in null_fields:
+            query = query.filter(getattr(model, field).is_(None))
+
+        return query
+
+    # The model and the field names are part of the cache key, the values travel as bound parameters
+    baked_query = bakery(lambda s: s.query(model), model, value_fields, null_fields)
+    baked_query += filter_criteria
+
+    try:
+
+        row = baked_query(session).params(**{field: criteria[field] for field in value_fields}).one_or_none()
+
+    except SQLAlchemyError as exc:
+        logger.exception('An exception was occurred while execute transactions: %s', str(str(exc.args) + ':' +
+                                                                                         str(exc.code)))
+        raise mvc_exc.ItemNotStored(
+            'Can\'t read data: "{}" because it\'s not stored in "{}". Row empty: {}'.format(
+                criteria, model.__tablename__, str(str(exc.args) + ':' + str(exc.code))
+            )
+        )
+
+    return row
+
+
+def lookup_by_id(session, model, row_id):
+    r"""
+    Get a row by its primary key, served from the identity map of the session when already loaded.
+
+    :param session: Session database object.
+    :param model: The model class to query.
+    :param row_id: The primary key value.
+    :return row: The row found or None.
+    """
+
+    if row_id is None:
+        return None
+
+    return session.query(model).get(row_id)
+
+
+def model_values(instance):
+    r"""
+    Get the column attributes of a model instance which have a value, keyed by attribute name.
+
+    :param instance: The model instance, usually built from the request data.
+    :return values: Dictionary attribute name -> value, without the attributes left as None.
+    """
+
+    values = dict()
+
+    for column_attr in instance.__mapper__.column_attrs:
+        value = getattr(instance, column_attr.key)
+
+        if value is not None:
+            values[column_attr.key] = value
+
+    return values
+
+
+def insert_returning(session, model, values, conflict_attrs, update_attrs=None):
+    r"""
+    Insert a row with ``INSERT ... ON CONFLICT (natural key) DO NOTHING | DO UPDATE ... RETURNING *``.
+
+    A single statement replaces the existence check, the insert and the read back of the row, and two requests
+    inserting the same natural key can no longer race between the check and the insert.
+
+    :param session: Session database object.
+    :param model: The model class to insert.
+    :param values: Dictionary model attribute name -> value of the new row.
+    :param conflict_attrs: Attribute names of the natural key, backed by a unique index.
+    :param update_attrs: Attribute names to overwrite when the row exists (DO UPDATE); DO NOTHING when empty.
+    :return row: Namespace with the model attribute names of the row inserted/updated, None if it already existed.
+    """
+
+    mapper_columns = model.__mapper__.columns
+
+    statement = pg_insert(model.__table__).values({mapper_columns[attr].key: value for attr, value in values.items()})
+
+    conflict_columns = [mapper_columns[attr] for attr in conflict_attrs]
+
+    if update_attrs:
+        statement = statement.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_={mapper_columns[attr].key: statement.excluded[mapper_columns[attr].key] for attr in update_attrs}
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=conflict_columns)
+
+    statement = statement.returning(*model.__table__.columns)
+
+    returned_row = session.execute(statement).first()
+
+    if returned_row is None:
+        return None
+
+    return SimpleNamespace(**{attr: returned_row[column] for attr, column in mapper_columns.items()})
+
+
+@contextmanager
+def count_statements(bind):
+    r"""
+    Record every SQL statement sent through the engine or connection while the block runs.
+
+    Harness used to measure the round trips of a model method or endpoint::
+
+        with count_statements(get_engine()) as statements:
+            client.post('/api/v1/vehicle/', json=data)
+
+        assert len(statements) <= 2
+
+    :param bind: The engine or connection to observe.
+    :return statements: List filled with the SQL text of each statement executed.
+    """
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(bind, 'before_cursor_execute', before_cursor_execute)
+
+    try:
+        yield statements
+    finally:
+        event.remove(bind, 'before_cursor_execute', before_cursor_execute)
+
+
+def encode_cursor(last_key):
+    r"""
+    Build the opaque token pointing after the last row of a page.
+
+    :param last_key: The keyset value of the last row returned.
+    :return cursor: URL safe token to send back on the next request.
+    """
+
+    return base64.urlsafe_b64encode(json.dumps({'k': last_key}).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    r"""
+    Read the keyset value of a cursor token built by encode_cursor().
+
+    :param cursor: The token received on the request.
+    :return last_key: The keyset value of the last row already returned.
+    :raise ValueError: When the token is malformed.
+    """
+
+    try:
+
+        padded_cursor = cursor + '=' * (-len(cursor) % 4)
+
+        return json.loads(base64.urlsafe_b64decode(padded_cursor.encode('ascii')))['k']
+
+    except (binascii.Error, UnicodeError, TypeError, KeyError, ValueError) as exc:
+        raise ValueError('Invalid pagination cursor: {}'.format(cursor)) from exc
+
+
+def page_limit(limit):
+    r"""
+    Bound the page size requested to [1, MAX_PAGE_LIMIT], DEFAULT_PAGE_LIMIT when absent.
+    """
+
+    if not limit:
+        return DEFAULT_PAGE_LIMIT
+
+    return max(1, min(int(limit), MAX_PAGE_LIMIT))
+
+
+def keyset_page(query, key_column, limit=DEFAULT_PAGE_LIMIT, cursor=None, with_total=False):
+    r"""
+    Get one page of a query ordered by a unique, increasing key (primary key / sequence).
+
+    Only ``limit + 1`` rows are fetched: the extra row tells whether there is a next page without a COUNT.
+
+    :param query: The query, already filtered, of the rows to paginate.
+    :param key_column: The model attribute of the keyset, unique and indexed.
+    :param limit: Number of rows of the page.
+    :param cursor: Token returned as next_cursor by the previous page, None for the first page.
+    :param with_total: Also count the rows matching the query (one extra COUNT statement).
+    :return rows, next_cursor, total: Rows of the page, token of the next page or None, count or None.
+    """
+
+    limit = page_limit(limit)
+
+    total = None
+
+    if with_total:
+        total = query.order_by(None).count()
+
+    if cursor:
+        try:
+            last_key = key_column.type.python_type(decode_cursor(cursor))
+        except TypeError as exc:
+            raise ValueError('Invalid pagination cursor: {}'.format(cursor)) from exc
+
+        query = query.filter(key_column > last_key)
+
+    rows = query.order_by(key_column).limit(limit + 1).all()
+
+    next_cursor = None
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], key_column.key))
+
+    return rows, next_cursor, total
+
+
+def page_result(rows_data, next_cursor, limit, total=None):
+    r"""
+    Build the response body of a page: the rows and the pagination details the client sends back.
+
+    :param rows_data: List with the dictionaries of the rows of the page.
+    :param next_cursor: Token of the next page, None on the last page.
+    :param limit: Page size applied.
+    :param total: Count of all the rows matching, only when requested.
+    :return dict
+    """
+
+    pagination = {
+        'limit': page_limit(limit),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    }
+
+    if total is not None:
+        pagination['total'] = total
+
+    return {
+        'results': rows_data,
+        'pagination': pagination
+    }
+
+
+def stream_query(build_query, chunk_size=EXPORT_CHUNK_SIZE):
+    r"""
+    Iterate over all the rows of a query through a server-side cursor, holding one chunk in memory at a time.
+
+    The rows are read on a connection of their own, in a read-only snapshot transaction: the export is consistent
+    and is not affected by the commit of the request transaction, which happens before the response is streamed.
+
+    :param build_query: Callable receiving the export session and returning the query of the rows to export.
+    :param chunk_size: Number of rows fetched from the cursor at a time.
+    :return rows: Generator of the rows of the query.
+    """
+
+    connection = checkout_connection(get_engine())
+    transaction = connection.begin()
+    session = Session(bind=connection)
+
+    try:
+
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY'))
+
+        query = build_query(session).execution_options(stream_results=True).yield_per(chunk_size)
+
+        for row in query:
+            yield row
+
+    except SQLAlchemyError as exc:
+        logger.exception('An exception was occurred while streaming the rows: %s', str(exc))
+        raise mvc_exc.ItemNotStored('Can\'t read the rows to export: {}'.format(str(exc)))
+
+    finally:
+        session.close()
+
+        if transaction.is_active:
+            transaction.rollback()
+
+        connection.close()
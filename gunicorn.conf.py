@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Server hooks of gunicorn, read from the working directory on start up.
+
+The workers share the metrics through the files of PROMETHEUS_MULTIPROC_DIR: the files of a previous run are removed
+before the first worker starts and the live gauges of a worker are discarded when it exits.
+
+The revocation of the tokens on logout must be shared by the workers too: with JWT_REVOCATION_ENABLED and more than
+one worker, gunicorn does not start without a JWT_REVOCATION_URL.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import os
+import glob
+
+
+def on_starting(server):
+    from utilities.Utility import get_config_settings_app
+
+    cfg_app = get_config_settings_app()
+
+    # The in-memory revocation set is per process: a token revoked on a worker would be accepted by the others
+    if cfg_app.jwt_revocation_enabled and not cfg_app.jwt_revocation_url and server.cfg.workers > 1:
+        raise RuntimeError('JWT_REVOCATION_ENABLED with {} workers needs JWT_REVOCATION_URL, the in-memory '
+                           'revocation set is for a single worker'.format(server.cfg.workers))
+
+    # PROMETHEUS_MULTIPROC_DIR, from the environment or the .env file
+    multiproc_dir = cfg_app.metrics_multiproc_dir
+
+    if multiproc_dir and os.path.isdir(multiproc_dir):
+        for metrics_file in glob.glob(os.path.join(multiproc_dir, '*.db')):
+            os.remove(metrics_file)
+
+
+def child_exit(server, worker):
+    from metrics_controller.prometheus_metrics import mark_worker_dead
+
+    mark_worker_dead(worker.pid)
@@ -10,132 +10,195 @@ __license__ = ""
 __history__ = """ """
 __version__ = "1.21.G02.1 ($Rev: 2 $)"
 
-import json
-from flask import Flask, jsonify, request
+import time
+from flask import Response, g, request, stream_with_context
 from werkzeug import exceptions
-# import api_config
+from .json_encoder import dumps
 
-app = Flask(__name__)
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson'
+}
 
+# Rows serialized per chunk written to the client
+STREAM_CHUNK_ROWS = 500
 
-class ResponsesHandler(exceptions.HTTPException):
 
-    @app.errorhandler(200)
-    def response_success(self, data, msg):
+def json_response(message, status_code):
+    r"""
+    Build the response of a message, serialized once from the Python structures given.
+
+    :param message: Dictionary with the message and the data of the response.
+    :param status_code: HTTP status code of the response.
+    :return resp, status_code: The JSON response and its status code.
+    """
+
+    start_time = time.perf_counter()
+
+    body = dumps(message)
+
+    # Read by the metrics of the request (JSON serialization time)
+    g.json_serialization_time = g.get('json_serialization_time', 0.0) + time.perf_counter() - start_time
+
+    resp = Response(body, status=status_code, mimetype='application/json')
+
+    return resp, status_code
+
+
+class ResponsesHandler(exceptions.HTTPException):
 
-        if bool(data):
-            data_msg = json.loads(data)
-        else:
-            data_msg = data
+    @staticmethod
+    def response_success(msg, data=None):
+        r"""
+        Response 200 with the message and the data returned by the model, as Python structures.
+        """
 
         message = {
             'message': msg,
-            'data': data_msg
+            'data': data if data is not None else {}
         }
 
-        resp = jsonify(message)
-        status_code = 200
+        return json_response(message, 200)
 
-        return resp, status_code
-
-    @app.errorhandler(201)
-    def response_resource_created(self, data, msg):
-
-        if bool(data):
-            data_msg = json.loads(data)
-        else:
-            data_msg = data
+    @staticmethod
+    def response_resource_created(msg, data=None):
+        r"""
+        Response 201 with the message and the data returned by the model, as Python structures.
+        """
 
         message = {
             'message': msg,
-            'data': data_msg
+            'data': data if data is not None else {}
         }
 
-        resp = jsonify(message)
-        status_code = 201
+        return json_response(message, 201)
+
+    @staticmethod
+    def response_stream(rows_data, stream_format='json', filename=None):
+        r"""
+        Stream the rows as a JSON array or as NDJSON (one JSON document per line) while they are being read.
+
+        The body is written in chunks of STREAM_CHUNK_ROWS rows, so the memory used does not depend on the number of
+        rows and the first byte is sent as soon as the first chunk is read.
+
+        :param rows_data: Iterable of the dictionaries to serialize, usually a generator over a server-side cursor.
+        :param stream_format: 'json' or 'ndjson'.
+        :param filename: When given, the response is sent as an attachment with this file name.
+        :return resp: The streamed response with status code 200.
+        """
+
+        ndjson = stream_format == 'ndjson'
+
+        def generate_chunks():
+            chunk = []
+            rows_count = 0
+
+            if not ndjson:
+                yield b'['
+
+            for row_data in rows_data:
+                row_json = dumps(row_data)
 
-        return resp, status_code
+                if ndjson:
+                    chunk.append(row_json + b'\n')
+                else:
+                    chunk.append(row_json if not rows_count else b',' + row_json)
 
-    @app.errorhandler(400)
-    def bad_request(self, msg):
+                rows_count += 1
+
+                if len(chunk) >= STREAM_CHUNK_ROWS:
+                    yield b''.join(chunk)
+                    chunk = []
+
+            if chunk:
+                yield b''.join(chunk)
+
+            if not ndjson:
+                yield b']'
+
+        resp = Response(stream_with_context(generate_chunks()), status=200,
+                        mimetype=STREAM_FORMATS.get(stream_format, STREAM_FORMATS['json']))
+
+        # Proxies must not buffer the body, the client receives each chunk as soon as it is written
+        resp.headers['X-Accel-Buffering'] = 'no'
+
+        if filename:
+            resp.headers['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+
+        return resp
+
+    @staticmethod
+    def bad_request(msg):
         message = {
             'message': msg + request.url,
             'data': {}
         }
 
-        resp = jsonify(message)
-        status_code = 400
+        return json_response(message, 400)
 
-        return resp, status_code
-
-    @app.errorhandler(401)
-    def request_unauthorized(self, msg):
+    @staticmethod
+    def request_unauthorized(msg):
         message = {
             'message': msg + request.url,
             'data': {}
         }
 
-        resp = jsonify(message)
-        status_code = 401
-
-        return resp, status_code
+        return json_response(message, 401)
 
-    @app.errorhandler(404)
-    def request_not_found(self, msg):
+    @staticmethod
+    def request_not_found(msg):
         message = {
             'message': msg + request.url,
             'data': {}
         }
 
-        resp = jsonify(message)
-        status_code = 404
+        return json_response(message, 404)
 
-        return resp, status_code
-
-    @app.errorhandler(405)
-    def request_method_not_allowed(self, msg):
+    @staticmethod
+    def request_method_not_allowed(msg):
         message = {
             'message': msg + request.url,
             'data': {}
         }
 
-        resp = jsonify(message)
-        status_code = 405
-
-        return resp, status_code
+        return json_response(message, 405)
 
-    @app.errorhandler(409)
-    def request_conflict(self, msg):
+    @staticmethod
+    def request_conflict(msg):
         message = {
             'message': msg + request.url,
             'data': {}
         }
 
-        resp = jsonify(message)
-        status_code = 409
-
-        return resp, status_code
+        return json_response(message, 409)
 
-    @app.errorhandler(500)
-    def internal_server_error(self, msg):
+    @staticmethod
+    def internal_server_error(msg):
         message = {
             'message': msg + request.url,
             'data': {}
         }
 
-        resp = jsonify(message)
-        status_code = 500
+        return json_response(message, 500)
 
-        return resp, status_code
-
-    @app.errorhandler(503)
-    def service_unavailable(self, msg):
+    @staticmethod
+    def service_unavailable(msg):
         message = {
             'message': msg + request.url,
             'data': {}
         }
 
-        resp = jsonify(message)
-        status_code = 503
+        return json_response(message, 503)
+
+    @staticmethod
+    def request_unprocessable(msg, data=None):
+        r"""
+        Response 422 with the message and the validation errors of the data received.
+        """
+
+        message = {
+            'message': msg,
+            'data': data if data is not None else {}
+        }
 
-        return resp, status_code
+        return json_response(message, 422)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+JSON serialization of the API responses.
+
+The response bodies are encoded once, straight from the Python structures returned by the models, with the backend
+selected on create_app (JSON_BACKEND setting): orjson, ujson or the standard json module. 'auto' takes the fastest
+one installed. Every backend renders date, time and datetime values as ISO 8601 strings, Decimal values and numpy
+scalars as JSON numbers, numpy arrays as lists and SQLAlchemy result rows as objects, so the models do not stringify
+those fields by hand.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import sys
+import json
+from uuid import UUID
+from types import SimpleNamespace
+from decimal import Decimal
+from datetime import date, time, datetime
+from flask.json import JSONEncoder
+from sqlalchemy.engine import RowProxy
+from logger_controller.logger_control import *
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover - ujson is optional
+    ujson = None
+
+logger = configure_logger('ws')
+
+# Backends tried, in order, when JSON_BACKEND is 'auto'
+AUTO_BACKENDS = ('orjson', 'ujson', 'stdlib')
+
+
+def json_default(value):
+    r"""
+    Serialize the values the JSON encoders do not support natively.
+
+    :param value: The value to serialize.
+    :return: A value the encoder supports.
+    :raise TypeError: When the value can not be serialized.
+    """
+
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+
+    if isinstance(value, Decimal):
+        return float(value)
+
+    if isinstance(value, UUID):
+        return str(value)
+
+    if isinstance(value, RowProxy):
+        return dict(value)
+
+    # Rows of ORM queries over columns (KeyedTuple) and the namespaces returned by insert_returning
+    if hasattr(value, '_asdict'):
+        return value._asdict()
+
+    if isinstance(value, SimpleNamespace):
+        return vars(value)
+
+    # numpy is only imported by the ingestion and analytics modules: without it there are no numpy values to serialize
+    numpy = sys.modules.get('numpy')
+
+    if numpy is not None:
+        if isinstance(value, numpy.generic):
+            return value.item()
+
+        if isinstance(value, numpy.ndarray):
+            return value.tolist()
+
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+def _dumps_stdlib(data):
+    return json.dumps(data, default=json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _dumps_orjson(data):
+    return orjson.dumps(data, default=json_default)
+
+
+def _dumps_ujson(data):
+    return ujson.dumps(data, default=json_default, ensure_ascii=False).encode('utf-8')
+
+
+JSON_BACKENDS = {
+    'stdlib': _dumps_stdlib,
+    'orjson': _dumps_orjson if orjson is not None else None,
+    'ujson': _dumps_ujson if ujson is not None else None
+}
+
+_backend_name = next(name for name in AUTO_BACKENDS if JSON_BACKENDS[name] is not None)
+
+
+def set_json_backend(backend_name='auto'):
+    r"""
+    Select the backend used by dumps() in this process.
+
+    :param backend_name: 'auto', 'orjson', 'ujson' or 'stdlib'; a backend not installed falls back to 'auto'.
+    :return backend_name: The backend selected.
+    """
+
+    global _backend_name
+
+    backend_name = (backend_name or 'auto').lower()
+
+    if JSON_BACKENDS.get(backend_name) is None:
+        if backend_name != 'auto':
+            logger.warning('JSON backend "%s" is not available, selecting the fastest one installed', backend_name)
+
+        backend_name = next(name for name in AUTO_BACKENDS if JSON_BACKENDS[name] is not None)
+
+    _backend_name = backend_name
+
+    return _backend_name
+
+
+def get_json_backend():
+    r"""
+    Get the name of the backend used by dumps().
+    """
+
+    return _backend_name
+
+
+def dumps(data):
+    r"""
+    Serialize the data to a UTF-8 JSON document with the backend selected.
+
+    :param data: Python structure (dict, list, str, numbers, dates, Decimal, rows...) to serialize.
+    :return bytes: The JSON document encoded.
+    """
+
+    return JSON_BACKENDS[_backend_name](data)
+
+
+class ApiJSONEncoder(JSONEncoder):
+    r"""
+    JSON encoder of flask.json / jsonify with the same types supported as dumps().
+    """
+
+    def default(self, o):
+        try:
+            return json_default(o)
+        except TypeError:
+            return super().default(o)
+
+
+def init_json_encoder(app, backend_name='auto'):
+    r"""
+    Install the JSON serialization of the application.
+
+    :param app: The Flask application.
+    :param backend_name: Backend of dumps(), JSON_BACKEND setting.
+    :return backend_name: The backend selected.
+    """
+
+    app.json_encoder = ApiJSONEncoder
+
+    backend_name = set_json_backend(backend_name)
+
+    app.extensions['json_backend'] = backend_name
+
+    logger.info('JSON backend of the responses: %s', backend_name)
+
+    return backend_name
@@ -7,3 +7,8 @@ ERROR_REQUEST_UNAUTHORIZED = 'Solicitud No Autorizada/Falta Token de autenticaci
 ERROR_REQUEST_NOT_FOUND = "Solicitud no localizada"
 SERVER_ERROR = "Error en servidor"
 ERROR_METHOD_NOT_ALLOWED = "Método no permitido"
+ERROR_WRONG_CREDENTIALS = "Usuario o password incorrectos"
+ERROR_SERVICE_BUSY = "Servicio ocupado, intente de nuevo en unos segundos"
+ERROR_DATA_NOT_VALID = "Los datos de la solicitud no son validos"
+ERROR_REQUEST_PARAMS_NOT_VALID = "Parametros no validos en la solicitud: "
+ERROR_REQUEST_BODY_NOT_VALID = "Contenido no valido en la solicitud: "
@@ -5,3 +5,5 @@ MSG_UPDATED_RECORD = "Registro actualizado correctamente"
 MSG_GET_RECORD = "Registro obtenido correctamente"
 MSG_DELETED_RECORD = "Registro eliminado correctamente"
 MSG_RECORD_REGISTERED = "Datos ya registrados"
+MSG_LOGGED_IN = "Usuario autenticado correctamente"
+MSG_LOGGED_OUT = "Sesion cerrada correctamente"
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Reader of the rows sent to the ingestion endpoints: JSON array, NDJSON or CSV bodies.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import io
+import csv
+import json
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonlines')
+
+CSV_CONTENT_TYPES = ('text/csv', 'application/csv')
+
+
+def parse_request_rows(content_type, stream, collection_key):
+    r"""
+    Read the rows of the request body as dictionaries, without loading NDJSON or CSV bodies in memory.
+
+    :param content_type: Content-Type of the request: application/json, application/x-ndjson or text/csv.
+    :param stream: The binary stream of the request body.
+    :param collection_key: Key of the rows when the JSON body is an object instead of an array.
+    :return rows: Iterator of dictionaries with the request fields of each row.
+    :raise ValueError: When the body is not valid JSON or UTF-8, or the JSON body is not an array of rows.
+    :raise csv.Error: When the CSV body is malformed, raised while the rows are read.
+    """
+
+    content_type = (content_type or 'application/json').split(';')[0].strip().lower()
+
+    if content_type in NDJSON_CONTENT_TYPES:
+        text_stream = io.TextIOWrapper(stream, encoding='utf-8')
+
+        return (json.loads(line) for line in text_stream if line.strip())
+
+    if content_type in CSV_CONTENT_TYPES:
+        text_stream = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+        return ({key: (value if value != '' else None) for key, value in row.items()}
+                for row in csv.DictReader(text_stream, strict=True))
+
+    rows = json.load(stream)
+
+    if isinstance(rows, dict):
+        rows = rows.get(collection_key, [rows])
+
+    if not isinstance(rows, list):
+        raise ValueError('The body is not an array of rows nor an object with "{}"'.format(collection_key))
+
+    return iter(rows)
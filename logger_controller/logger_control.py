@@ -2,12 +2,36 @@
 
 """
 Requires Python 3.8 or later
+
+
+Logging of the App.
+
+The loggers of the modules only put their records on a bounded in-memory queue (QueueHandler); a background
+listener thread per process takes them from the queue and writes them to the log file and to stdout, so the
+request threads never wait on disk or console I/O.
+
+When the queue is full, the overflow policy (LOG_QUEUE_OVERFLOW setting) applies:
+    - drop: DEBUG/INFO records are dropped at once, WARNING and above wait up to LOG_QUEUE_BLOCK_TIMEOUT seconds
+      before being dropped. The records dropped are counted (get_log_queue_metrics).
+    - block: every record waits for room on the queue.
+
+Each logger type ('ws', 'db', 'api'...) is configured once per process and kept on a registry: the following
+configure_logger() calls return it as is. All the logger types share the same file and stdout handlers; the log file
+rotates by size (LOG_MAX_BYTES, LOG_BACKUP_COUNT) or by time (LOG_ROTATION_WHEN) according to LOG_ROTATION.
+
+A rotated log file is written and rotated by one process only: its name carries the pid of the process
+(gas_manager_api-<pid>.log), so the gunicorn workers never rename the file another worker writes nor overwrite its
+rotated copies. A process forked after opening its log file (gunicorn --preload) opens its own file in the child.
 """
 
 import errno
+import queue
+import atexit
 import logging
+import threading
 import os
 import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
 from utilities.Utility import *
 from datetime import datetime
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -15,45 +39,236 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 # Possible values to LOGGER: DEBUG, INFO, WARN, ERROR, and CRITICAL
 # LOG_LEVEL = logging.DEBUG
 
+LOG_FORMAT = '%(asctime)s - Module: %(module)s - Line No: %(lineno)s : %(name)s : %(levelname)s - %(message)s'
+
+# Seconds a WARNING or higher record waits for room on a full queue with the 'drop' policy
+LOG_QUEUE_BLOCK_TIMEOUT = 1.0
+
+_log_pipeline_lock = threading.Lock()
+_log_queue_handler = None
+_log_listener = None
+_log_destinations = dict()
+
+# Path of the log file written by the listener, the pid of the process in place of '{pid}'
+_log_file_template = None
+_log_file_cfg = None
+
+_logger_registry_lock = threading.Lock()
+_logger_registry = dict()
+
+
+class BoundedQueueHandler(QueueHandler):
+    r"""
+    QueueHandler over a bounded queue which applies the overflow policy instead of blocking the caller.
+    """
+
+    def __init__(self, log_queue, overflow_policy='drop'):
+        super().__init__(log_queue)
+
+        self.overflow_policy = overflow_policy
+        self.dropped_records = 0
+
+    def enqueue(self, record):
+        try:
+            if self.overflow_policy == 'block':
+                self.queue.put(record)
+            elif record.levelno >= logging.WARNING:
+                self.queue.put(record, timeout=LOG_QUEUE_BLOCK_TIMEOUT)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            # Handler.handle() holds the handler lock while enqueue() runs
+            self.dropped_records += 1
+
+
+def _start_log_listener():
+    global _log_listener
+
+    _log_listener = QueueListener(_log_queue_handler.queue, *_log_destinations.values(), respect_handler_level=True)
+    _log_listener.start()
+
+
+def _restart_log_pipeline_after_fork():
+    r"""
+    The listener thread does not survive a fork: the child process gets a new queue and its own listener.
+    """
+
+    global _log_pipeline_lock
+
+    # Another thread of the parent could hold the lock at the time of the fork
+    _log_pipeline_lock = threading.Lock()
+
+    if _log_queue_handler is None:
+        return
+
+    _log_queue_handler.queue = queue.Queue(_log_queue_handler.queue.maxsize)
+    _log_queue_handler.dropped_records = 0
+
+    # The log file of the parent is rotated by the parent only
+    if 'file' in _log_destinations and '{pid}' in _log_file_template:
+        _log_destinations['file'] = _create_file_handler(_log_file_template, _log_file_cfg)
+
+    _start_log_listener()
+
+
+def stop_log_pipeline():
+    r"""
+    Write the records still queued and stop the listener thread of the process.
+    """
+
+    global _log_listener
+
+    with _log_pipeline_lock:
+        if _log_listener is not None:
+            _log_listener.stop()
+            _log_listener = None
+
+
+def _create_file_handler(log_file_path, cfg):
+    r"""
+    Create the file handler of the log file, rotated by size or by time according to the LOG_ROTATION setting.
+
+    :param log_file_path: Path of the log file, '{pid}' is replaced by the pid of the process.
+    :param cfg: The settings of the App.
+    :return handler: The file handler.
+    """
+
+    log_file_path = log_file_path.replace('{pid}', str(os.getpid()))
+
+    if cfg.log_rotation == 'size':
+        fh = RotatingFileHandler(filename=log_file_path, mode='a', maxBytes=cfg.log_max_bytes,
+                                 backupCount=cfg.log_backup_count, encoding='utf-8')
+    elif cfg.log_rotation == 'time':
+        fh = TimedRotatingFileHandler(filename=log_file_path, when=cfg.log_rotation_when,
+                                      backupCount=cfg.log_backup_count, encoding='utf-8')
+    else:
+        fh = logging.FileHandler(filename=log_file_path, mode='a', encoding='utf-8', delay=False)
+
+    fh.setLevel(logging.DEBUG)
+    fh.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    return fh
+
+
+def _get_log_queue_handler(log_file_path=None, cfg=None):
+    r"""
+    Get the queue handler of the process, starting the pipeline the first time and adding the file destination
+    when it is requested for the first time.
+
+    :param log_file_path: Path of the log file written by the listener, None for console only. '{pid}' is replaced
+        by the pid of the process.
+    :param cfg: The settings of the App, read when not given.
+    :return handler: The BoundedQueueHandler shared by the loggers of the process.
+    """
+
+    global _log_queue_handler, _log_file_template, _log_file_cfg
+
+    if cfg is None:
+        cfg = get_config_settings_app()
+
+    with _log_pipeline_lock:
+        destinations_changed = False
+
+        if 'console' not in _log_destinations:
+            formatter = logging.Formatter(LOG_FORMAT)
+
+            sh = logging.StreamHandler(sys.stdout)
+            sh.setLevel(logging.DEBUG)
+            sh.setFormatter(formatter)
+
+            _log_destinations['console'] = sh
+            destinations_changed = True
+
+        if log_file_path is not None and 'file' not in _log_destinations:
+            _log_destinations['file'] = _create_file_handler(log_file_path, cfg)
+            _log_file_template, _log_file_cfg = log_file_path, cfg
+            destinations_changed = True
+
+        if _log_queue_handler is None:
+            _log_queue_handler = BoundedQueueHandler(queue.Queue(cfg.log_queue_size), cfg.log_queue_overflow)
+            _log_queue_handler.setLevel(logging.DEBUG)
+
+            os.register_at_fork(after_in_child=_restart_log_pipeline_after_fork)
+            atexit.register(stop_log_pipeline)
+
+        if _log_listener is None:
+            _start_log_listener()
+        elif destinations_changed:
+            _log_listener.handlers = tuple(_log_destinations.values())
+
+    return _log_queue_handler
+
+
+def get_log_file_path():
+    r"""
+    Get the path of the log file written by the process.
+
+    :return log_file_path: The path of the file, None when the process only logs to the console.
+    """
+
+    file_handler = _log_destinations.get('file')
+
+    return file_handler.baseFilename if file_handler is not None else None
+
+
+def _attach_queue_handler(_importer_logger, queue_handler):
+    _importer_logger.setLevel(logging.DEBUG)
+
+    # The records are written once, by the shared handlers, not again by the handlers of the root logger
+    _importer_logger.propagate = False
+
+    if queue_handler not in _importer_logger.handlers:
+        _importer_logger.addHandler(queue_handler)
+
+
+def get_log_queue_metrics():
+    r"""
+    Get the state of the log queue of the process.
+
+    :return dict: Records queued, queue capacity and records dropped by the overflow policy.
+    """
+
+    if _log_queue_handler is None:
+        return {'queue_size': 0, 'queue_max_size': 0, 'dropped_records': 0}
+
+    return {
+        'queue_size': _log_queue_handler.queue.qsize(),
+        'queue_max_size': _log_queue_handler.queue.maxsize,
+        'dropped_records': _log_queue_handler.dropped_records
+    }
+
 
 # Para LOG file de App principal
-def configure_logging(log_name, path_to_log_directory, logger_type):
+def configure_logging(log_name, path_to_log_directory, logger_type, cfg=None):
     """
     Configure logger
 
     :param logger_type: The type to write logger and setup on the modules of App
     :param log_name: Name of the log file saved
     :param path_to_log_directory: Path to directory to write log file in
+    :param cfg: The settings of the App, read when not given
     :return:
     """
 
-    cfg = get_config_settings_app()
+    if cfg is None:
+        cfg = get_config_settings_app()
 
-    _date_name = datetime.now().strftime('%Y-%m-%dT%H%M')
-    log_filename = str(log_name + _date_name + cfg.log_file_extension)
+    if cfg.log_rotation in ('size', 'time'):
+        # Rotated file: the same name for the life of the process, the rotated copies get the suffix. One file per
+        # process, a rotation by a worker would rename the file the other workers write
+        log_filename = str(log_name + '-{pid}' + cfg.log_file_extension)
+    else:
+        _date_name = datetime.now().strftime('%Y-%m-%dT%H%M')
+        log_filename = str(log_name + _date_name + cfg.log_file_extension)
 
     _importer_logger = logging.getLogger(logger_type)
-    _importer_logger.setLevel(logging.DEBUG)
-    formatter = logging.Formatter('%(asctime)s - Module: %(module)s - Line No: %(lineno)s : %(name)s : %(levelname)s - '
-                                  '%(message)s')
-    if not os.path.exists(path_to_log_directory):
-        fh = logging.FileHandler(filename=os.path.join(path_to_log_directory, log_filename), mode='a',
-                                 encoding='utf-8', delay=False)
-    else:
-        fh = logging.FileHandler(filename=os.path.join(path_to_log_directory, log_filename), mode='w',
-                                 encoding='utf-8', delay=False)
 
-    fh.setLevel(logging.DEBUG)
-    fh.setFormatter(formatter)
-    _importer_logger.addHandler(fh)
+    create_directory_if_not_exists(_importer_logger, path_to_log_directory)
 
-    # For Testing logging - Comment
-    sh = logging.StreamHandler(sys.stdout)
-    sh.setLevel(logging.DEBUG)
-    sh.setFormatter(formatter)
-    _importer_logger.addHandler(sh)
+    # The file and stdout handlers are written by the listener thread, the logger only enqueues
+    queue_handler = _get_log_queue_handler(os.path.join(path_to_log_directory, log_filename), cfg)
 
-    create_directory_if_not_exists(_importer_logger, path_to_log_directory)
+    _attach_queue_handler(_importer_logger, queue_handler)
 
     return _importer_logger
 
@@ -67,17 +282,11 @@ def configure_logging_console(logger_type):
     :return _imoporter_log:
     """
 
-    _date_name = datetime.now().strftime('%Y-%m-%dT%H%M')
-
     _importer_logger = logging.getLogger(logger_type)
-    _importer_logger.setLevel(logging.DEBUG)
-    formatter = logging.Formatter('%(asctime)s - Module: %(module)s - Line No: %(lineno)s : %(name)s : %(levelname)s - '
-                                  '%(message)s')
 
-    sh = logging.StreamHandler(sys.stdout)
-    sh.setLevel(logging.DEBUG)
-    sh.setFormatter(formatter)
-    _importer_logger.addHandler(sh)
+    queue_handler = _get_log_queue_handler()
+
+    _attach_queue_handler(_importer_logger, queue_handler)
 
     return _importer_logger
 
@@ -114,19 +323,31 @@ def configure_logger(logger_type):
     """
     Declare and validate existence of log directory; create and configure logger object
 
+    The logger of each type is configured once per process, the following calls get it from the registry.
+
     :return: instance of configured logger object
     """
 
-    cfg = get_config_settings_app()
-
-    log_name = cfg.log_file_app_name
-    log_dir = cfg.log_file_save_path
-
-    logger = configure_logging(log_name, log_dir, logger_type)
+    logger = _logger_registry.get(logger_type)
 
     if logger is not None:
         return logger
 
+    with _logger_registry_lock:
+        logger = _logger_registry.get(logger_type)
+
+        if logger is None:
+            cfg = get_config_settings_app()
+
+            log_name = cfg.log_file_app_name
+            log_dir = cfg.log_file_save_path
+
+            logger = configure_logging(log_name, log_dir, logger_type, cfg)
+
+            _logger_registry[logger_type] = logger
+
+    return logger
+
 
 def configure_console_logger(logger_type):
     """
@@ -136,8 +357,18 @@ def configure_console_logger(logger_type):
     :return: instance of configured logger object
     """
 
-    logger = configure_logging_console(logger_type)
+    logger = _logger_registry.get(logger_type)
 
     if logger is not None:
         return logger
 
+    with _logger_registry_lock:
+        logger = _logger_registry.get(logger_type)
+
+        if logger is None:
+            logger = configure_logging_console(logger_type)
+
+            _logger_registry[logger_type] = logger
+
+    return logger
+
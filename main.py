@@ -10,7 +10,11 @@ __license__ = ""
 __history__ = """ """
 __version__ = "1.21.G02.1 ($Rev: 2 $)"
 
-import api_config
+import re
+import time
+import sys
+import argparse
+import subprocess
 from utilities.Utility import *
 # from db_controller.database_backend import *
 from logger_controller.logger_control import *
@@ -20,8 +24,107 @@ cfg_db = get_config_settings_db()
 cfg_app = get_config_settings_app()
 
 
+# Statement timed by -X importtime on the profile of the start up: the app factory, without the schema bootstrap
+STARTUP_PROFILE_STATEMENT = 'import api_config; api_config.create_app(bootstrap_db=False)'
+
+STARTUP_PROFILE_TIMEOUT = 120
+
+# Start up time budget of a worker, asserted by the tests (interpreter, imports and create_app)
+STARTUP_BUDGET_SECONDS = 2.0
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S.*)$')
+
+
+def profile_startup(top_imports=25):
+    r"""
+    Profile the start up of a worker: import api_config and create the app in a fresh interpreter with
+    ``-X importtime`` and read the import times it reports.
+
+    :param top_imports: Number of the slowest imports to return, every import when None.
+    :return total_seconds, slowest_imports: Wall time of the start up and list (cumulative us, self us, module).
+    :raise RuntimeError: When the application fails or takes longer than STARTUP_PROFILE_TIMEOUT to start.
+    """
+
+    start_time = time.perf_counter()
+
+    try:
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_PROFILE_STATEMENT],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True,
+                                   timeout=STARTUP_PROFILE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError('The application did not start in {}s'.format(STARTUP_PROFILE_TIMEOUT))
+
+    total_seconds = time.perf_counter() - start_time
+
+    imports = []
+    errors = []
+
+    for line in completed.stderr.splitlines():
+        import_time = IMPORT_TIME_LINE.match(line)
+
+        if import_time is None:
+            errors.append(line)
+            continue
+
+        self_us, cumulative_us, module_name = import_time.groups()
+
+        imports.append((int(cumulative_us), int(self_us), module_name))
+
+    if completed.returncode != 0:
+        raise RuntimeError('The application did not start:\n{}'.format('\n'.join(errors)))
+
+    imports.sort(reverse=True)
+
+    return total_seconds, imports[:top_imports]
+
+
+def report_startup(budget_seconds=None, top_imports=25):
+    r"""
+    Print the slowest imports of the start up and check it against the time budget.
+
+    :param budget_seconds: Maximum start up time allowed, no check when None.
+    :param top_imports: Number of the slowest imports printed.
+    :return exit_code: 0 when the start up is within the budget, 1 otherwise.
+    """
+
+    try:
+        total_seconds, slowest_imports = profile_startup(top_imports)
+    except RuntimeError as exc:
+        print(str(exc))
+
+        return 1
+
+    print('{:>12} {:>12}  {}'.format('cumulative', 'self', 'module'))
+
+    for cumulative_us, self_us, module_name in slowest_imports:
+        print('{:>10.1f}ms {:>10.1f}ms  {}'.format(cumulative_us / 1000, self_us / 1000, module_name))
+
+    print('Start up (interpreter, imports and create_app): {:.3f}s'.format(total_seconds))
+
+    if budget_seconds is not None and total_seconds > budget_seconds:
+        print('Start up over the budget of {:.3f}s'.format(budget_seconds))
+
+        return 1
+
+    return 0
+
+
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(description='Gas Manager API')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Report the import times of the start up (-X importtime) instead of serving')
+    parser.add_argument('--startup-budget', type=float, default=None, metavar='SECONDS',
+                        help='With --profile-startup, exit with status 1 when the start up takes longer')
+    parser.add_argument('--top-imports', type=int, default=25,
+                        help='With --profile-startup, number of the slowest imports reported')
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        sys.exit(report_startup(args.startup_budget, args.top_imports))
+
+    import api_config
+
     app = api_config.create_app()
 
     logger_type = 'api'
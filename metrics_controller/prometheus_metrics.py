@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Prometheus metrics of the API, exported on GET /metrics.
+
+Each request updates, once, the latency histogram and the status counter of its blueprint and route, the statements
+and the database time recorded by the query instrumentation, the JSON serialization time of its body, on logins the
+hit or miss of the credential cache and, on fuel loads, the rows inserted, duplicated or invalid. The pool gauges
+follow the checkout/checkin events of the connection pools.
+
+Under gunicorn every worker writes its samples to mmap'd files of the directory named by PROMETHEUS_MULTIPROC_DIR
+and /metrics aggregates the files of all the workers, whichever worker serves the scrape. The directory must be
+emptied before the server starts (see gunicorn.conf.py). Without that variable the metrics of the process are served.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import os
+import time
+from flask import Response, g, request
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+from utilities.Utility import *
+
+cfg_app = get_config_settings_app()
+
+# The files of the workers are created along the metrics, so the directory must exist before they are declared
+if cfg_app.metrics_multiproc_dir:
+    os.makedirs(cfg_app.metrics_multiproc_dir, exist_ok=True)
+
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST,
+                               generate_latest)
+from prometheus_client import multiprocess
+
+REQUEST_LABELS = ('blueprint', 'route', 'method')
+
+REQUEST_LATENCY = Histogram(
+    'api_request_duration_seconds', 'Time to serve the request, from before_request to after_request',
+    REQUEST_LABELS
+)
+
+REQUESTS_TOTAL = Counter(
+    'api_requests_total', 'Requests served by status code', REQUEST_LABELS + ('status',)
+)
+
+REQUEST_DB_DURATION = Histogram(
+    'api_request_db_duration_seconds', 'Time spent on database statements per request', ('blueprint',)
+)
+
+REQUEST_DB_STATEMENTS = Histogram(
+    'api_request_db_statements', 'Database statements executed per request', ('blueprint',),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, float('inf'))
+)
+
+DB_STATEMENTS_TOTAL = Counter(
+    'api_db_statements_total', 'Database statements executed by the requests', ('blueprint',)
+)
+
+JSON_SERIALIZATION = Histogram(
+    'api_json_serialization_seconds', 'Time to serialize the JSON body of the response', ('blueprint',),
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, float('inf'))
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    'api_db_pool_checked_out_connections', 'Pooled connections in use', multiprocess_mode='livesum'
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    'api_db_pool_connections', 'Database connections opened by the pools', multiprocess_mode='livesum'
+)
+
+DB_POOL_CHECKOUTS = Counter(
+    'api_db_pool_checkouts_total', 'Connections checked out of the pools'
+)
+
+CREDENTIAL_CACHE_LOOKUPS = Counter(
+    'api_credential_cache_lookups_total', 'Logins looked up on the verified-credential cache', ('result',)
+)
+
+FUEL_LOADS_INGESTED = Counter(
+    'api_fuel_loads_ingested_total', 'Fuel loads received by the gas endpoints by result', ('result',)
+)
+
+_multiprocess_registry = None
+
+
+def _on_pool_connect(dbapi_connection, connection_record):
+    DB_POOL_CONNECTIONS.inc()
+
+
+def _on_pool_close(dbapi_connection, connection_record):
+    DB_POOL_CONNECTIONS.dec()
+
+
+def _on_pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_CHECKOUTS.inc()
+    DB_POOL_CHECKED_OUT.inc()
+
+
+def _on_pool_checkin(dbapi_connection, connection_record):
+    DB_POOL_CHECKED_OUT.dec()
+
+
+def _request_labels():
+    r"""
+    Labels of the current request: the route template, never the URL, keeps the series bounded.
+    """
+
+    url_rule = request.url_rule
+
+    return (request.blueprint or 'app', url_rule.rule if url_rule is not None else 'unmatched', request.method)
+
+
+def _start_metrics_timer():
+    g.metrics_start_time = time.perf_counter()
+
+
+def _observe_request(status_code):
+    r"""
+    Record the metrics of the request, once.
+
+    :param status_code: HTTP status code of the response.
+    """
+
+    if g.get('metrics_recorded') or request.endpoint == 'metrics':
+        return
+
+    g.metrics_recorded = True
+
+    labels = _request_labels()
+
+    start_time = g.get('metrics_start_time')
+
+    if start_time is not None:
+        REQUEST_LATENCY.labels(*labels).observe(time.perf_counter() - start_time)
+
+    REQUESTS_TOTAL.labels(*labels, str(status_code)).inc()
+
+    blueprint = labels[0]
+
+    request_stats = g.get('db_query_stats')
+
+    if request_stats is not None:
+        REQUEST_DB_DURATION.labels(blueprint).observe(request_stats.time_total)
+        REQUEST_DB_STATEMENTS.labels(blueprint).observe(request_stats.statements)
+        DB_STATEMENTS_TOTAL.labels(blueprint).inc(request_stats.statements)
+
+    json_serialization_time = g.get('json_serialization_time')
+
+    if json_serialization_time is not None:
+        JSON_SERIALIZATION.labels(blueprint).observe(json_serialization_time)
+
+    credential_cache_result = g.get('credential_cache_result')
+
+    if credential_cache_result is not None:
+        CREDENTIAL_CACHE_LOOKUPS.labels(credential_cache_result).inc()
+
+    for ingestion_result, rows in (g.get('fuel_ingestion_counts') or {}).items():
+        FUEL_LOADS_INGESTED.labels(ingestion_result).inc(rows or 0)
+
+
+def _after_request_metrics(response):
+    _observe_request(response.status_code)
+
+    return response
+
+
+def _teardown_request_metrics(exception=None):
+    r"""
+    Record the requests ended by an unhandled exception, after_request is not called for them.
+    """
+
+    if exception is not None:
+        _observe_request(500)
+
+
+def get_metrics_registry():
+    r"""
+    Get the registry to export: the aggregate of the files of every worker in multiprocess mode.
+
+    :return registry: The collector registry.
+    """
+
+    global _multiprocess_registry
+
+    if not cfg_app.metrics_multiproc_dir:
+        return REGISTRY
+
+    if _multiprocess_registry is None:
+        registry = CollectorRegistry()
+
+        multiprocess.MultiProcessCollector(registry)
+
+        _multiprocess_registry = registry
+
+    return _multiprocess_registry
+
+
+def metrics():
+    r"""
+    Metrics of the API on the Prometheus text format.
+    """
+
+    return Response(generate_latest(get_metrics_registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def mark_worker_dead(pid):
+    r"""
+    Discard the live gauges of a worker which exited, called from the child_exit hook of gunicorn.
+
+    :param pid: Process id of the worker.
+    """
+
+    if cfg_app.metrics_multiproc_dir:
+        multiprocess.mark_process_dead(pid, cfg_app.metrics_multiproc_dir)
+
+
+def init_metrics(app):
+    r"""
+    Register the request metrics, the pool listeners and the GET /metrics endpoint on the application.
+
+    Register it before the session lifecycle and the query instrumentation: after_request functions run in reverse
+    order, so the metrics see the statements of the commit.
+
+    :param app: The Flask application.
+    """
+
+    if not cfg_app.metrics_enabled:
+        return
+
+    if not event.contains(Pool, 'checkout', _on_pool_checkout):
+        event.listen(Pool, 'connect', _on_pool_connect)
+        event.listen(Pool, 'close', _on_pool_close)
+        event.listen(Pool, 'checkout', _on_pool_checkout)
+        event.listen(Pool, 'checkin', _on_pool_checkin)
+
+    app.before_request(_start_metrics_timer)
+    app.after_request(_after_request_metrics)
+    app.teardown_request(_teardown_request_metrics)
+
+    app.add_url_rule('/metrics', 'metrics', metrics, methods=['GET'])
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Periodic maintenance jobs of the API, registered on the scheduler when it starts.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import os
+import time
+from logger_controller.logger_control import *
+from utilities.Utility import *
+from .task_scheduler import register_job
+
+cfg_app = get_config_settings_app()
+cfg_db = get_config_settings_db()
+
+logger = configure_logger('api')
+
+
+def prune_log_files():
+    r"""
+    Remove the log files of the App (rotated copies and dated files) older than LOG_RETENTION_DAYS, except the file
+    the process is writing.
+
+    :return removed: Number of files removed.
+    """
+
+    log_dir = cfg_app.log_file_save_path
+    oldest_mtime = time.time() - cfg_app.log_retention_days * 86400
+
+    active_log_file = get_log_file_path()
+
+    removed = 0
+
+    if not os.path.isdir(log_dir):
+        return removed
+
+    for entry in os.scandir(log_dir):
+        if not entry.is_file() or not entry.name.startswith(cfg_app.log_file_app_name):
+            continue
+
+        if cfg_app.log_file_extension not in entry.name or entry.stat().st_mtime >= oldest_mtime:
+            continue
+
+        if active_log_file is not None and os.path.abspath(entry.path) == os.path.abspath(active_log_file):
+            continue
+
+        try:
+            os.remove(entry.path)
+            removed += 1
+        except OSError as exc:
+            logger.warning('Log file not removed: %s, %s', entry.path, str(exc))
+
+    if removed:
+        logger.info('Log files older than %s days removed: %s', cfg_app.log_retention_days, removed)
+
+    return removed
+
+
+def create_odometer_partitions():
+    r"""
+    Create the monthly partitions of the odometer readings up to ODOMETER_PARTITIONS_AHEAD months ahead.
+
+    :return created: Number of partitions checked, 0 when the table is not partitioned.
+    """
+
+    from db_controller.database_backend import get_engine
+    from apps.odometer.OdometerModel import create_monthly_partitions
+
+    with get_engine().begin() as connection:
+        return create_monthly_partitions(connection)
+
+
+register_job('prune_log_files', prune_log_files, cfg_app.log_prune_interval)
+
+if cfg_db.odometer_partitioning:
+    register_job('create_odometer_partitions', create_odometer_partitions, 24 * 3600)
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+In-process scheduler of the periodic maintenance jobs of the API.
+
+Every worker process starts a scheduler on its first request, but only the leader of the host runs the jobs: the
+worker holding the exclusive lock (fcntl.flock) of SCHEDULER_LOCK_FILE. The other workers retry the lock every
+SCHEDULER_LEADER_RETRY seconds, so a new leader takes over when the leader exits; the lock is released by the kernel
+with the process, even when it is killed.
+
+The jobs run on a pool of SCHEDULER_WORKERS threads, a job never overlaps with itself. Each run is planned at its
+interval plus/minus SCHEDULER_JITTER (fraction of the interval) so the jobs of several hosts do not hit the database
+together; a failed run is retried with an exponential backoff, from SCHEDULER_BACKOFF_BASE up to
+SCHEDULER_BACKOFF_MAX seconds.
+
+The modules declaring jobs register them with register_job(), as the models do with their schema migrations.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import os
+import time
+import atexit
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from logger_controller.logger_control import *
+from utilities.Utility import *
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+cfg_app = get_config_settings_app()
+
+logger = configure_logger('api')
+
+# Jobs declared by the modules of the API: name -> ScheduledJob
+_registered_jobs = dict()
+
+# One scheduler per worker process, started on its first request
+_scheduler = None
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+
+class ScheduledJob:
+    r"""
+    Class to instance a periodic job and the state of its runs.
+    """
+
+    def __init__(self, name, function, interval, jitter=None):
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.jitter = cfg_app.scheduler_jitter if jitter is None else jitter
+
+        self.next_run = None
+        self.running = False
+        self.failures = 0
+        self.runs = 0
+        self.errors = 0
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+
+    def jittered(self, delay):
+        return max(0.0, delay * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def plan_next_run(self, now):
+        r"""
+        Plan the next run: the interval after a success, the backoff delay after a failure.
+        """
+
+        if self.failures:
+            delay = min(cfg_app.scheduler_backoff_base * 2 ** (self.failures - 1), cfg_app.scheduler_backoff_max)
+        else:
+            delay = self.interval
+
+        self.next_run = now + self.jittered(delay)
+
+    def status(self):
+        return {
+            'interval': self.interval,
+            'runs': self.runs,
+            'errors': self.errors,
+            'consecutive_failures': self.failures,
+            'running': self.running,
+            'last_run': self.last_run,
+            'last_duration': self.last_duration,
+            'last_error': self.last_error,
+            'next_run_in': round(self.next_run - time.monotonic(), 1) if self.next_run is not None else None
+        }
+
+
+class HostLeaderLock:
+    r"""
+    Class to instance the lock electing the worker which runs the jobs of the host.
+    """
+
+    def __init__(self, lock_path):
+        self.lock_path = lock_path
+
+        self._lock_file = None
+
+    @property
+    def held(self):
+        return self._lock_file is not None
+
+    def try_acquire(self):
+        r"""
+        Take the lock without waiting.
+
+        :return held: Whether this process is the leader.
+        """
+
+        if self._lock_file is not None:
+            return True
+
+        if fcntl is None:
+            # Without flock every process is its own leader
+            self._lock_file = True
+
+            return True
+
+        lock_file = open(self.lock_path, 'a+')
+
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+
+            return False
+
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+
+        self._lock_file = lock_file
+
+        return True
+
+    def release(self):
+        if self._lock_file is None:
+            return
+
+        if fcntl is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            self._lock_file.close()
+
+        self._lock_file = None
+
+
+class TaskScheduler:
+    r"""
+    Class to instance the scheduler of a worker process: leader election, planning and dispatch of the jobs.
+    """
+
+    def __init__(self, jobs, lock_path=None, workers=None):
+        self.jobs = list(jobs)
+        self.leader_lock = HostLeaderLock(lock_path or cfg_app.scheduler_lock_file)
+
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers or cfg_app.scheduler_workers),
+                                            thread_name_prefix='scheduler-job')
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._dispatch_loop, name='scheduler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+        logger.info('Scheduler started with the jobs: %s', ', '.join(job.name for job in self.jobs))
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+        self._executor.shutdown(wait=False)
+        self.leader_lock.release()
+
+    def _dispatch_loop(self):
+        while not self._stopped.is_set():
+            if not self.leader_lock.held:
+                if not self.leader_lock.try_acquire():
+                    self._wakeup.wait(cfg_app.scheduler_leader_retry)
+                    self._wakeup.clear()
+                    continue
+
+                logger.info('Scheduler leader of the host: process %s', os.getpid())
+
+                # The first runs are spread over the jitter window of each job
+                now = time.monotonic()
+
+                for job in self.jobs:
+                    job.next_run = now + random.uniform(0, job.interval * job.jitter)
+
+            now = time.monotonic()
+
+            for job in self.jobs:
+                if not job.running and job.next_run <= now:
+                    job.running = True
+                    job.next_run = float('inf')
+
+                    self._executor.submit(self._run_job, job)
+
+            next_run = min((job.next_run for job in self.jobs), default=float('inf'))
+
+            self._wakeup.wait(max(0.1, min(next_run - time.monotonic(), cfg_app.scheduler_leader_retry)))
+            self._wakeup.clear()
+
+    def _run_job(self, job):
+        start_time = time.monotonic()
+
+        try:
+            job.function()
+
+            job.failures = 0
+            job.last_error = None
+
+        except Exception as exc:
+            job.failures += 1
+            job.errors += 1
+            job.last_error = str(exc)
+
+            logger.exception('Scheduled job "%s" failed (%s in a row): %s', job.name, job.failures, str(exc))
+
+        finally:
+            job.runs += 1
+            job.last_run = time.time()
+            job.last_duration = round(time.monotonic() - start_time, 3)
+            job.plan_next_run(time.monotonic())
+            job.running = False
+
+            self._wakeup.set()
+
+    def status(self):
+        r"""
+        Get the leadership of the process and the state of the runs of each job.
+
+        :return status: Dictionary with the scheduler status.
+        """
+
+        return {
+            'pid': os.getpid(),
+            'leader': self.leader_lock.held,
+            'jobs': {job.name: job.status() for job in self.jobs}
+        }
+
+
+def register_job(name, function, interval, jitter=None):
+    r"""
+    Declare a periodic job, run by the leader of each host.
+
+    :param name: Unique name of the job.
+    :param function: Callable without arguments; it opens its own connections.
+    :param interval: Seconds between two runs.
+    :param jitter: Fraction of the interval added or removed at random, SCHEDULER_JITTER by default.
+    """
+
+    _registered_jobs[name] = ScheduledJob(name, function, interval, jitter)
+
+
+def start_scheduler():
+    r"""
+    Start the scheduler of the current worker process, once; it runs the jobs only while it leads the host.
+
+    :return scheduler: The scheduler of the process, None when SCHEDULER_ENABLED is off.
+    """
+
+    global _scheduler, _scheduler_pid
+
+    if not cfg_app.scheduler_enabled:
+        return None
+
+    current_pid = os.getpid()
+
+    with _scheduler_lock:
+        if _scheduler is None or _scheduler_pid != current_pid:
+            # Imported here: the jobs register themselves on import
+            from scheduler_controller import maintenance_jobs
+
+            _scheduler = TaskScheduler(_registered_jobs.values())
+            _scheduler_pid = current_pid
+
+            _scheduler.start()
+
+    return _scheduler
+
+
+def stop_scheduler():
+    global _scheduler
+
+    if _scheduler is not None and _scheduler_pid == os.getpid():
+        _scheduler.stop()
+
+    _scheduler = None
+
+
+def get_scheduler_status():
+    if _scheduler is None or _scheduler_pid != os.getpid():
+        return {'pid': os.getpid(), 'leader': False, 'jobs': {}}
+
+    return _scheduler.status()
+
+
+def init_scheduler(app):
+    r"""
+    Start the scheduler of each worker on its first request, never on import nor on the preloading master process.
+
+    :param app: The Flask application.
+    """
+
+    app.before_first_request(start_scheduler)
+
+
+atexit.register(stop_scheduler)
@@ -2,6 +2,16 @@
 
 """
 Requires Python 3.8 or later
+
+
+Settings of the App, read from the environment and the settings/.env file.
+
+The .env file is loaded once per process, when this module is imported; the values are converted to their type
+(int, bool, list) when the settings objects are built, and the objects are read-only afterwards. The getters of
+utilities.Utility memoize the objects; reload_config_settings() loads the .env file again and rebuilds them.
+
+The table and column names of the nested classes (GasVehicle, GasDriver...) are part of the mapping of the models:
+they are resolved once, at import, from their environment variable or their default name.
 """
 
 __author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
@@ -11,17 +21,92 @@ __history__ = """ """
 __version__ = "1.21.G04.5 ($Rev: 5 $)"
 
 import os
+import tempfile
 from os.path import join, dirname
 from dotenv import load_dotenv
 
+DOTENV_PATH = join(dirname(__file__), '.env')
+
+_TRUE_VALUES = ('true', '1', 'yes', 'on')
+
+_environment_loaded = False
+
+
+def load_environment(reload=False):
+    r"""
+    Load the .env file into the environment, only the first time unless reload is requested.
+
+    :param reload: Load the file again, overriding the values already loaded.
+    """
+
+    global _environment_loaded
+
+    if _environment_loaded and not reload:
+        return
+
+    load_dotenv(DOTENV_PATH, override=reload)
+
+    _environment_loaded = True
+
+
+def env_str(name, default=None):
+    return os.getenv(name, default)
+
+
+def env_int(name, default=0):
+    value = os.getenv(name)
+
+    if value is None or value.strip() == '':
+        return default
+
+    return int(value)
+
+
+def env_float(name, default=0.0):
+    value = os.getenv(name)
+
+    if value is None or value.strip() == '':
+        return default
+
+    return float(value)
+
+
+def env_bool(name, default=False):
+    value = os.getenv(name)
+
+    if value is None or value.strip() == '':
+        return default
+
+    return value.strip().lower() in _TRUE_VALUES
+
+
+def env_list(name, default=None):
+    value = os.getenv(name)
+
+    if value is None or value.strip() == '':
+        return list(default or [])
+
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+load_environment()
+
 
 class Constants:
+
+    _frozen = False
+
     def __init__(self):
-        # Create .env_temp file path.
-        dotenv_path = join(dirname(__file__), '.env')
+        load_environment()
 
-        # Load file from the path.
-        load_dotenv(dotenv_path)
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise AttributeError('Settings are read-only, "{}" can not be set'.format(name))
+
+        super().__setattr__(name, value)
+
+    def _freeze(self):
+        object.__setattr__(self, '_frozen', True)
 
     class Development(object):
         """
@@ -47,12 +132,58 @@ class AppConstants(Constants):
     log_file_extension = str()
     log_file_app_name = str()
     log_file_save_path = str()
-    flask_api_debug = str()
+    log_queue_size = int()
+    log_queue_overflow = str()
+    log_rotation = str()
+    log_max_bytes = int()
+    log_backup_count = int()
+    log_rotation_when = str()
+    flask_api_debug = bool()
     flask_api_env = str()
     flask_api_port = int()
     app_config = {}
     date_timezone = str()
     api_key = str()
+    json_backend = str()
+    metrics_enabled = bool()
+    metrics_multiproc_dir = str()
+    password_hash_rounds = int()
+    password_hash_workers = int()
+    password_hash_queue = int()
+    password_hash_timeout = int()
+    credential_cache_size = int()
+    credential_cache_ttl = int()
+    jwt_auth_required = bool()
+    jwt_token_cache_size = int()
+    jwt_revocation_enabled = bool()
+    jwt_revocation_url = str()
+    scheduler_enabled = bool()
+    scheduler_lock_file = str()
+    scheduler_workers = int()
+    scheduler_jitter = float()
+    scheduler_backoff_base = int()
+    scheduler_backoff_max = int()
+    scheduler_leader_retry = int()
+    log_retention_days = int()
+    log_prune_interval = int()
+    fuel_batch_size = int()
+    fuel_max_liters = float()
+    fuel_min_price_liter = float()
+    fuel_max_price_liter = float()
+    odometer_batch_size = int()
+    odometer_max_speed_kmh = float()
+    odometer_max_value = float()
+    fuel_min_km_liter = float()
+    fuel_max_km_liter = float()
+    fuel_anomaly_zscore = float()
+    fuel_anomaly_min_fills = int()
+    analytics_default_days = int()
+    fuel_anomaly_detection = bool()
+    fuel_tank_capacity_liters = float()
+    fuel_tank_tolerance = float()
+    fuel_min_fill_interval_minutes = int()
+    fuel_ewma_alpha = float()
+    fuel_anomaly_history_days = int()
 
     def __init__(self):
         super().__init__()
@@ -62,17 +193,66 @@ class AppConstants(Constants):
             'production': Constants.Production,
         }
 
-        self.log_file_apply = os.getenv('APPLY_LOG_FILE')
-        self.log_types = os.getenv('LOGGER_TYPES')
-        self.log_file_extension = os.getenv('FILE_LOG_EXTENSION')
-        self.log_file_app_name = os.getenv('APP_FILE_LOG_NAME')
-        self.log_file_save_path = os.getenv('DIRECTORY_LOG_FILES')
+        self.log_file_apply = env_bool('APPLY_LOG_FILE', True)
+        self.log_types = env_list('LOGGER_TYPES', ['api', 'ws', 'db'])
+        self.log_file_extension = env_str('FILE_LOG_EXTENSION', '.log')
+        self.log_file_app_name = env_str('APP_FILE_LOG_NAME', 'gas_manager_api')
+        self.log_file_save_path = env_str('DIRECTORY_LOG_FILES', 'logs')
+        self.log_queue_size = env_int('LOG_QUEUE_SIZE', 10000)
+        self.log_queue_overflow = env_str('LOG_QUEUE_OVERFLOW', 'drop')
+        self.log_rotation = env_str('LOG_ROTATION', 'size')
+        self.log_max_bytes = env_int('LOG_MAX_BYTES', 10 * 1024 * 1024)
+        self.log_backup_count = env_int('LOG_BACKUP_COUNT', 7)
+        self.log_rotation_when = env_str('LOG_ROTATION_WHEN', 'midnight')
         self.app_config = app_config
-        self.flask_api_debug = os.getenv('FLASK_DEBUG')
-        self.flask_api_env = os.getenv('FLASK_ENV')
-        self.flask_api_port = os.getenv('FLASK_PORT')
-        self.date_timezone = os.getenv('TIMEZONE')
-        self.api_key = os.getenv('API_KEY')
+        self.flask_api_debug = env_bool('FLASK_DEBUG', False)
+        self.flask_api_env = env_str('FLASK_ENV', 'production')
+        self.flask_api_port = env_int('FLASK_PORT', 5000)
+        self.date_timezone = env_str('TIMEZONE', 'America/Mexico_City')
+        self.api_key = env_str('API_KEY', '')
+        self.json_backend = env_str('JSON_BACKEND', 'auto')
+        self.metrics_enabled = env_bool('METRICS_ENABLED', True)
+        self.metrics_multiproc_dir = env_str('PROMETHEUS_MULTIPROC_DIR', '')
+        self.password_hash_rounds = env_int('PASSWORD_HASH_ROUNDS', 29000)
+        self.password_hash_workers = env_int('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        self.password_hash_queue = env_int('PASSWORD_HASH_QUEUE', 4 * (os.cpu_count() or 1))
+        self.password_hash_timeout = env_int('PASSWORD_HASH_TIMEOUT', 5)
+        self.credential_cache_size = env_int('CREDENTIAL_CACHE_SIZE', 1024)
+        self.credential_cache_ttl = env_int('CREDENTIAL_CACHE_TTL', 60)
+        self.jwt_auth_required = env_bool('JWT_AUTH_REQUIRED', True)
+        self.jwt_token_cache_size = env_int('JWT_TOKEN_CACHE_SIZE', 4096)
+        self.jwt_revocation_enabled = env_bool('JWT_REVOCATION_ENABLED', False)
+        self.jwt_revocation_url = env_str('JWT_REVOCATION_URL', '')
+        self.scheduler_enabled = env_bool('SCHEDULER_ENABLED', True)
+        self.scheduler_lock_file = env_str('SCHEDULER_LOCK_FILE',
+                                           os.path.join(tempfile.gettempdir(), 'gas_manager_scheduler.lock'))
+        self.scheduler_workers = env_int('SCHEDULER_WORKERS', 2)
+        self.scheduler_jitter = env_float('SCHEDULER_JITTER', 0.1)
+        self.scheduler_backoff_base = env_int('SCHEDULER_BACKOFF_BASE', 30)
+        self.scheduler_backoff_max = env_int('SCHEDULER_BACKOFF_MAX', 3600)
+        self.scheduler_leader_retry = env_int('SCHEDULER_LEADER_RETRY', 30)
+        self.log_retention_days = env_int('LOG_RETENTION_DAYS', 30)
+        self.log_prune_interval = env_int('LOG_PRUNE_INTERVAL', 6 * 3600)
+        self.fuel_batch_size = env_int('FUEL_INGEST_BATCH_SIZE', 2000)
+        self.fuel_max_liters = env_float('FUEL_MAX_LITERS', 1000.0)
+        self.fuel_min_price_liter = env_float('FUEL_MIN_PRICE_LITER', 5.0)
+        self.fuel_max_price_liter = env_float('FUEL_MAX_PRICE_LITER', 100.0)
+        self.odometer_batch_size = env_int('ODOMETER_INGEST_BATCH_SIZE', 5000)
+        self.odometer_max_speed_kmh = env_float('ODOMETER_MAX_SPEED_KMH', 250.0)
+        self.odometer_max_value = env_float('ODOMETER_MAX_VALUE', 10000000.0)
+        self.fuel_min_km_liter = env_float('FUEL_MIN_KM_LITER', 1.0)
+        self.fuel_max_km_liter = env_float('FUEL_MAX_KM_LITER', 40.0)
+        self.fuel_anomaly_zscore = env_float('FUEL_ANOMALY_ZSCORE', 3.0)
+        self.fuel_anomaly_min_fills = env_int('FUEL_ANOMALY_MIN_FILLS', 5)
+        self.analytics_default_days = env_int('ANALYTICS_DEFAULT_DAYS', 30)
+        self.fuel_anomaly_detection = env_bool('FUEL_ANOMALY_DETECTION', True)
+        self.fuel_tank_capacity_liters = env_float('FUEL_TANK_CAPACITY_LITERS', 80.0)
+        self.fuel_tank_tolerance = env_float('FUEL_TANK_TOLERANCE', 0.05)
+        self.fuel_min_fill_interval_minutes = env_int('FUEL_MIN_FILL_INTERVAL_MINUTES', 60)
+        self.fuel_ewma_alpha = env_float('FUEL_EWMA_ALPHA', 0.2)
+        self.fuel_anomaly_history_days = env_int('FUEL_ANOMALY_HISTORY_DAYS', 180)
+
+        self._freeze()
 
 
 class DbConstants(Constants):
@@ -83,193 +263,163 @@ class DbConstants(Constants):
     gas_service_vehicle_table = str()  # GAS_SERVICIO_VEHICULO
     gas_odometer_vehicle_table = str() # GAS_ODOMETRO_VEHICULO
     gas_manager_vehicle_table = str()  # GAS_GASOLINA_VEHICULO
+    gas_manager_daily_table = str()    # GAS_GASOLINA_DIARIO
+    gas_manager_anomaly_table = str()  # GAS_GASOLINA_ANOMALIA
+    user_auth_table = str()            # USERS_AUTH
+    pool_size = int()                  # DB_POOL_SIZE
+    pool_max_overflow = int()          # DB_POOL_MAX_OVERFLOW
+    pool_timeout = int()               # DB_POOL_TIMEOUT
+    pool_recycle = int()               # DB_POOL_RECYCLE
+    pool_pre_ping = bool()             # DB_POOL_PRE_PING
+    bootstrap_on_startup = bool()      # DB_BOOTSTRAP_ON_STARTUP: off, the schema is migrated by flask init-db
+    sql_echo = str()                   # DB_SQL_ECHO: false, true (statements) or debug (and rows)
+    slowest_statements = int()         # DB_SLOWEST_STATEMENTS
+    slow_statement_ms = int()          # DB_SLOW_STATEMENT_MS
+    odometer_partitioning = bool()     # ODOMETER_PARTITIONING: monthly partitions of the odometer readings
+    odometer_partitions_ahead = int()  # ODOMETER_PARTITIONS_AHEAD: months created in advance
 
     def __init__(self):
         super().__init__()
 
-        self.gas_vehicle_table = os.getenv('GAS_VEHICULO').__str__()
-        self.gas_driver_table = os.getenv('GAS_CONDUCTOR').__str__()
-        self.gas_document_vehicle_table = os.getenv('GAS_DOCUMENTO_VEHICULO').__str__()
-        self.gas_service_vehicle_table = os.getenv('GAS_SERVICIO_VEHICULO').__str__()
-        self.gas_odometer_vehicle_table = os.getenv('GAS_ODOMETRO_VEHICULO').__str__()
-        self.gas_manager_vehicle_table = os.getenv('GAS_GASOLINA_VEHICULO').__str__()
+        self.gas_vehicle_table = env_str('GAS_VEHICULO', 'gas_vehiculo')
+        self.gas_driver_table = env_str('GAS_CONDUCTOR', 'gas_conductor')
+        self.gas_document_vehicle_table = env_str('GAS_DOCUMENTO_VEHICULO', 'gas_documento_vehiculo')
+        self.gas_service_vehicle_table = env_str('GAS_SERVICIO_VEHICULO', 'gas_servicio_vehiculo')
+        self.gas_odometer_vehicle_table = env_str('GAS_ODOMETRO_VEHICULO', 'gas_odometro_vehiculo')
+        self.gas_manager_vehicle_table = env_str('GAS_GASOLINA_VEHICULO', 'gas_gasolina_vehiculo')
+        self.gas_manager_daily_table = env_str('GAS_GASOLINA_DIARIO', 'gas_gasolina_diario')
+        self.gas_manager_anomaly_table = env_str('GAS_GASOLINA_ANOMALIA', 'gas_gasolina_anomalia')
+        self.user_auth_table = env_str('USERS_AUTH', 'users_auth')
+        self.pool_size = env_int('DB_POOL_SIZE', 5)
+        self.pool_max_overflow = env_int('DB_POOL_MAX_OVERFLOW', 10)
+        self.pool_timeout = env_int('DB_POOL_TIMEOUT', 30)
+        self.pool_recycle = env_int('DB_POOL_RECYCLE', 1800)
+        self.pool_pre_ping = env_bool('DB_POOL_PRE_PING', True)
+        self.bootstrap_on_startup = env_bool('DB_BOOTSTRAP_ON_STARTUP', False)
+        self.sql_echo = env_str('DB_SQL_ECHO', 'false').strip().lower()
+        self.slowest_statements = env_int('DB_SLOWEST_STATEMENTS', 5)
+        self.slow_statement_ms = env_int('DB_SLOW_STATEMENT_MS', 500)
+        self.odometer_partitioning = env_bool('ODOMETER_PARTITIONING', False)
+        self.odometer_partitions_ahead = env_int('ODOMETER_PARTITIONS_AHEAD', 3)
+
+        self._freeze()
 
     class GasVehicle:
 
-        vehiculo_id = int()                # VEHICULO_ID
-        vehiculo_modelo = str()            # VEHICULO_MODELO
-        vehiculo_marca = str()             # VEHICULO_MARCA
-        vehiculo_matricula = str()         # VEHICULO_MATRICULA
-        vehiculo_numero_asientos = int()   # VEHICULO_NUM_ASIENTOS
-        vehiculo_numero_puertas = int()    # VEHICULO_NUM_PUERTAS
-        vehiculo_color = str()             # VEHICULO_COLOR
-        vehiculo_anio_modelo = int()       # VEHICULO_ANIO_MODELO
-        vehiculo_modelo_motor = str()      # VEHICULO_MOTOR_MODELO
-        vehiculo_anio_motor = int()        # VEHICULO_MOTOR_ANIO
-        vehiculo_numero_chasis = str()     # VEHICULO_NUMERO_CHASIS
-        vehiculo_transmision = str()       # VEHICULO_TRANSMISION
-        vehiculo_tipo_combustible = str()  # VEHICULO_TIPO_COMBUSTIBLE
-        vehiculo_emisiones_co2 = float()   # VEHICULO_EMISIONES_CO2
-        vehiculo_caballos_fuerza = int()   # VEHICULO_CABALLOS_FUERZA
-        vehiculo_potencia = int()          # VEHICULO_POTENCIA
-        vehiculo_descripcion = str()       # VEHICULO_DESCRIPCION
-        vehiculo_costo_catalogo = float()  # VEHICULO_VALOR_CATALOGO
-        vehiculo_costo_compra = float()    # VEHICULO_VALOR_COMPRA
-        vehiculo_costo_impuesto = int()    # VEHICULO_IMPUESTO_APLICADO
-        vehiculo_fecha_registro = str()    # VEHICULO_FECHA_REGISTRO
-        vehiculo_fecha_baja = str()        # VEHICULO_FECHA_BAJA
-
-        def __init__(self):
-
-            self.vehiculo_id = os.getenv('VEHICULO_ID').__str__()
-            self.vehiculo_modelo = os.getenv('VEHICULO_MODELO').__str__()
-            self.vehiculo_marca = os.getenv('VEHICULO_MARCA').__str__()
-            self.vehiculo_matricula = os.getenv('VEHICULO_MATRICULA').__str__()
-            self.vehiculo_numero_asientos = os.getenv('VEHICULO_NUM_ASIENTOS').__str__()
-            self.vehiculo_numero_puertas = os.getenv('VEHICULO_NUM_PUERTAS').__str__()
-            self.vehiculo_color = os.getenv('VEHICULO_COLOR').__str__()
-            self.vehiculo_anio_modelo = os.getenv('VEHICULO_ANIO_MODELO').__str__()
-            self.vehiculo_modelo_motor = os.getenv('VEHICULO_MOTOR_MODELO').__str__()
-            self.vehiculo_anio_motor = os.getenv('VEHICULO_MOTOR_ANIO').__str__()
-            self.vehiculo_numero_chasis = os.getenv('VEHICULO_NUMERO_CHASIS').__str__()
-            self.vehiculo_transmision = os.getenv('VEHICULO_TRANSMISION').__str__()
-            self.vehiculo_tipo_combustible = os.getenv('VEHICULO_TIPO_COMBUSTIBLE').__str__()
-            self.vehiculo_emisiones_co2 = os.getenv('VEHICULO_EMISIONES_CO2').__str__()
-            self.vehiculo_caballos_fuerza = os.getenv('VEHICULO_CABALLOS_FUERZA').__str__()
-            self.vehiculo_potencia = os.getenv('VEHICULO_POTENCIA').__str__()
-            self.vehiculo_descripcion = os.getenv('VEHICULO_DESCRIPCION').__str__()
-            self.vehiculo_costo_catalogo = os.getenv('VEHICULO_VALOR_CATALOGO').__str__()
-            self.vehiculo_costo_compra = os.getenv('VEHICULO_VALOR_COMPRA').__str__()
-            self.vehiculo_costo_impuesto = os.getenv('VEHICULO_IMPUESTO_APLICADO').__str__()
-            self.vehiculo_fecha_registro = os.getenv('VEHICULO_FECHA_REGISTRO').__str__()
-            self.vehiculo_fecha_baja = os.getenv('VEHICULO_FECHA_BAJA').__str__()
+        vehiculo_id = env_str('VEHICULO_ID', 'vehiculo_id')
+        vehiculo_modelo = env_str('VEHICULO_MODELO', 'vehiculo_modelo')
+        vehiculo_marca = env_str('VEHICULO_MARCA', 'vehiculo_marca')
+        vehiculo_matricula = env_str('VEHICULO_MATRICULA', 'vehiculo_matricula')
+        vehiculo_numero_asientos = env_str('VEHICULO_NUM_ASIENTOS', 'vehiculo_num_asientos')
+        vehiculo_numero_puertas = env_str('VEHICULO_NUM_PUERTAS', 'vehiculo_num_puertas')
+        vehiculo_color = env_str('VEHICULO_COLOR', 'vehiculo_color')
+        vehiculo_anio_modelo = env_str('VEHICULO_ANIO_MODELO', 'vehiculo_anio_modelo')
+        vehiculo_modelo_motor = env_str('VEHICULO_MOTOR_MODELO', 'vehiculo_motor_modelo')
+        vehiculo_anio_motor = env_str('VEHICULO_MOTOR_ANIO', 'vehiculo_motor_anio')
+        vehiculo_numero_chasis = env_str('VEHICULO_NUMERO_CHASIS', 'vehiculo_numero_chasis')
+        vehiculo_transmision = env_str('VEHICULO_TRANSMISION', 'vehiculo_transmision')
+        vehiculo_tipo_combustible = env_str('VEHICULO_TIPO_COMBUSTIBLE', 'vehiculo_tipo_combustible')
+        vehiculo_emisiones_co2 = env_str('VEHICULO_EMISIONES_CO2', 'vehiculo_emisiones_co2')
+        vehiculo_caballos_fuerza = env_str('VEHICULO_CABALLOS_FUERZA', 'vehiculo_caballos_fuerza')
+        vehiculo_potencia = env_str('VEHICULO_POTENCIA', 'vehiculo_potencia')
+        vehiculo_descripcion = env_str('VEHICULO_DESCRIPCION', 'vehiculo_descripcion')
+        vehiculo_costo_catalogo = env_str('VEHICULO_VALOR_CATALOGO', 'vehiculo_valor_catalogo')
+        vehiculo_costo_compra = env_str('VEHICULO_VALOR_COMPRA', 'vehiculo_valor_compra')
+        vehiculo_costo_impuesto = env_str('VEHICULO_IMPUESTO_APLICADO', 'vehiculo_impuesto_aplicado')
+        vehiculo_fecha_registro = env_str('VEHICULO_FECHA_REGISTRO', 'vehiculo_fecha_registro')
+        vehiculo_fecha_baja = env_str('VEHICULO_FECHA_BAJA', 'vehiculo_fecha_baja')
+        vehiculo_capacidad_tanque = env_str('VEHICULO_CAPACIDAD_TANQUE', 'vehiculo_capacidad_tanque')
 
     class GasDriver:
 
-        driver_id = int()               # CONDUCTOR_ID
-        driver_name = str()             # CONDUCTOR_NOMBRE
-        driver_last_name = str()        # CONDUCTOR_APELLIDO_PAT
-        driver_last_name_last = str()   # CONDUCTOR_APELLIDO_MAT
-        driver_address = str()          # CONDUCTOR_DOMICILIO
-        driver_date_assignment = str()  # CONDUCTOR_DATE_ASSIGNMENT
-        driver_status = str()           # CONDUCTOR_ESTATUS
-        driver_vehicle_id = int()       # CONDUCTOR_VEHICULO_ID
-
-        def __init__(self):
-
-            self.driver_id = os.getenv('CONDUCTOR_ID').__str__()
-            self.driver_name = os.getenv('CONDUCTOR_NOMBRE').__str__()
-            self.driver_last_name = os.getenv('CONDUCTOR_APELLIDO_PAT').__str__()
-            self.driver_last_name_last = os.getenv('CONDUCTOR_APELLIDO_MAT').__str__()
-            self.driver_address = os.getenv('CONDUCTOR_DOMICILIO').__str__()
-            self.driver_date_assignment = os.getenv('CONDUCTOR_DATE_ASSIGNMENT').__str__()
-            self.driver_status = os.getenv('CONDUCTOR_ESTATUS').__str__()
-            self.driver_vehicle_id = os.getenv('CONDUCTOR_VEHICULO_ID').__str__()
+        driver_id = env_str('CONDUCTOR_ID', 'conductor_id')
+        driver_name = env_str('CONDUCTOR_NOMBRE', 'conductor_nombre')
+        driver_last_name = env_str('CONDUCTOR_APELLIDO_PAT', 'conductor_apellido_pat')
+        driver_last_name_last = env_str('CONDUCTOR_APELLIDO_MAT', 'conductor_apellido_mat')
+        driver_address = env_str('CONDUCTOR_DOMICILIO', 'conductor_domicilio')
+        driver_date_assignment = env_str('CONDUCTOR_DATE_ASSIGNMENT', 'conductor_date_assignment')
+        driver_status = env_str('CONDUCTOR_ESTATUS', 'conductor_estatus')
+        driver_vehicle_id = env_str('CONDUCTOR_VEHICULO_ID', 'conductor_vehiculo_id')
+
+        # Names used by DriverModel
+        driver_lastname1 = driver_last_name
+        driver_lastname2 = driver_last_name_last
+        vehicle_id_fk = driver_vehicle_id
 
     class GasDocument:
 
-        document_id = int()               # DOCUMENTO_ID
-        document_name = str()             # DOCUMENTO_NOMBRE
-        document_start_date = str()       # DOCUMENTO_FECHA_INICIO
-        document_expiration_date = str()  # DOCUMENTO_FECHA_FIN
-        document_provider = str()         # DOCUMENTO_PROVEEDOR
-        document_cost = float()           # DOCUMENTO_COSTO
-        document_tax_rate = int()         # DOCUMENTO_COSTO_IMPUESTO
-        document_frecuency_date = str()   # DOCUMENTO_FECHA_FRECUENCIA
-        document_status = str()           # DOCUMENTO_ESTATUS
-        document_file = bytes()           # DOCUMENTO_ARCHIVO
-        document_driver_id = int()        # DOCUMENTO_CONDUCTOR_ID
-        document_vehicle_id = int()       # DOCUMENTO_VEHICULO_ID
-
-        def __init__(self):
-
-            self.document_id = os.getenv('DOCUMENTO_ID').__str__()
-            self.document_name = os.getenv('DOCUMENTO_NOMBRE').__str__()
-            self.document_start_date = os.getenv('DOCUMENTO_FECHA_INICIO').__str__()
-            self.document_expiration_date = os.getenv('DOCUMENTO_FECHA_FIN').__str__()
-            self.document_provider = os.getenv('DOCUMENTO_PROVEEDOR').__str__()
-            self.document_cost = os.getenv('DOCUMENTO_COSTO').__str__()
-            self.document_tax_rate = os.getenv('DOCUMENTO_COSTO_IMPUESTO').__str__()
-            self.document_frecuency_date = os.getenv('DOCUMENTO_FECHA_FRECUENCIA').__str__()
-            self.document_status = os.getenv('DOCUMENTO_ESTATUS').__str__()
-            self.document_file = os.getenv('DOCUMENTO_ARCHIVO').__str__()
-            self.document_driver_id = os.getenv('DOCUMENTO_CONDUCTOR_ID').__str__()
-            self.document_vehicle_id = os.getenv('DOCUMENTO_VEHICULO_ID').__str__()
+        document_id = env_str('DOCUMENTO_ID', 'documento_id')
+        document_name = env_str('DOCUMENTO_NOMBRE', 'documento_nombre')
+        document_start_date = env_str('DOCUMENTO_FECHA_INICIO', 'documento_fecha_inicio')
+        document_expiration_date = env_str('DOCUMENTO_FECHA_FIN', 'documento_fecha_fin')
+        document_provider = env_str('DOCUMENTO_PROVEEDOR', 'documento_proveedor')
+        document_cost = env_str('DOCUMENTO_COSTO', 'documento_costo')
+        document_tax_rate = env_str('DOCUMENTO_COSTO_IMPUESTO', 'documento_costo_impuesto')
+        document_frecuency_date = env_str('DOCUMENTO_FECHA_FRECUENCIA', 'documento_fecha_frecuencia')
+        document_status = env_str('DOCUMENTO_ESTATUS', 'documento_estatus')
+        document_file = env_str('DOCUMENTO_ARCHIVO', 'documento_archivo')
+        document_driver_id = env_str('DOCUMENTO_CONDUCTOR_ID', 'documento_conductor_id')
+        document_vehicle_id = env_str('DOCUMENTO_VEHICULO_ID', 'documento_vehiculo_id')
 
     class GasService:
 
-        service_id = int()           # SERVICIO_ID
-        service_name = str()         # SERVICIO_NOMBRE
-        service_description = str()  # SERVICIO_DESCRIPCION
-        service_start_date = str()   # SERVICIO_FECHA_INICIO
-        service_end_date = str()     # SERVICIO_FECHA_FIN
-        service_type = str()         # SERVICIO_TIPO
-        service_provider = str()     # SERVICIO_PROVEEDOR
-        service_notes = str()        # SERVICIO_NOTAS
-        service_cost = float()       # SERVICIO_COSTO
-        service_tax_rate = int()     # SERVICIO_COSTO_IMPUESTO
-        service_status = str()       # SERVICIO_ESTATUS
-        service_driver_id = int()    # SERVICIO_CONDUCTOR_ID
-        service_vehicle_id = int()   # SERVICIO_VEHICULO_ID
-
-        def __init__(self):
-
-            self.service_id = os.getenv('SERVICIO_ID').__str__()
-            self.service_name = os.getenv('SERVICIO_NOMBRE').__str__()
-            self.service_description = os.getenv('SERVICIO_DESCRIPCION').__str__()
-            self.service_start_date = os.getenv('SERVICIO_FECHA_INICIO').__str__()
-            self.service_end_date = os.getenv('SERVICIO_FECHA_FIN').__str__()
-            self.service_type = os.getenv('SERVICIO_TIPO').__str__()
-            self.service_provider = os.getenv('SERVICIO_PROVEEDOR').__str__()
-            self.service_notes = os.getenv('SERVICIO_NOTAS').__str__()
-            self.service_cost = os.getenv('SERVICIO_COSTO').__str__()
-            self.service_tax_rate = os.getenv('SERVICIO_COSTO_IMPUESTO').__str__()
-            self.service_status = os.getenv('SERVICIO_ESTATUS').__str__()
-            self.service_driver_id = os.getenv('SERVICIO_CONDUCTOR_ID').__str__()
-            self.service_vehicle_id = os.getenv('SERVICIO_VEHICULO_ID').__str__()
+        service_id = env_str('SERVICIO_ID', 'servicio_id')
+        service_name = env_str('SERVICIO_NOMBRE', 'servicio_nombre')
+        service_description = env_str('SERVICIO_DESCRIPCION', 'servicio_descripcion')
+        service_start_date = env_str('SERVICIO_FECHA_INICIO', 'servicio_fecha_inicio')
+        service_end_date = env_str('SERVICIO_FECHA_FIN', 'servicio_fecha_fin')
+        service_type = env_str('SERVICIO_TIPO', 'servicio_tipo')
+        service_provider = env_str('SERVICIO_PROVEEDOR', 'servicio_proveedor')
+        service_notes = env_str('SERVICIO_NOTAS', 'servicio_notas')
+        service_cost = env_str('SERVICIO_COSTO', 'servicio_costo')
+        service_tax_rate = env_str('SERVICIO_COSTO_IMPUESTO', 'servicio_costo_impuesto')
+        service_status = env_str('SERVICIO_ESTATUS', 'servicio_estatus')
+        service_driver_id = env_str('SERVICIO_CONDUCTOR_ID', 'servicio_conductor_id')
+        service_vehicle_id = env_str('SERVICIO_VEHICULO_ID', 'servicio_vehiculo_id')
 
     class GasOdometer:
 
-        odometer_id = int()             # ODOMETRO_ID
-        odometer_register_date = str()  # ODOMETRO_FECHA_REGISTRO
-        odometer_value = str()          # ODOMETRO_VALOR
-        odometer_unit_mesure = str()    # ODOMETRO_UNIDAD_MEDIDA
-        odometer_driver_id = int()      # ODOMETRO_CONDUCTOR_ID
-        odometer_vehicle_id = int()     # ODOMETRO_VEHICULO_ID
-
-        def __init__(self):
-
-            self.odometer_id = os.getenv('ODOMETRO_ID').__str__()
-            self.odometer_register_date = os.getenv('ODOMETRO_FECHA_REGISTRO').__str__()
-            self.odometer_value = os.getenv('ODOMETRO_VALOR').__str__()
-            self.odometer_unit_mesure = os.getenv('ODOMETRO_UNIDAD_MEDIDA').__str__()
-            self.odometer_driver_id = os.getenv('ODOMETRO_CONDUCTOR_ID').__str__()
-            self.odometer_vehicle_id = os.getenv('ODOMETRO_VEHICULO_ID').__str__()
+        odometer_id = env_str('ODOMETRO_ID', 'odometro_id')
+        odometer_register_date = env_str('ODOMETRO_FECHA_REGISTRO', 'odometro_fecha_registro')
+        odometer_value = env_str('ODOMETRO_VALOR', 'odometro_valor')
+        odometer_unit_mesure = env_str('ODOMETRO_UNIDAD_MEDIDA', 'odometro_unidad_medida')
+        odometer_driver_id = env_str('ODOMETRO_CONDUCTOR_ID', 'odometro_conductor_id')
+        odometer_vehicle_id = env_str('ODOMETRO_VEHICULO_ID', 'odometro_vehiculo_id')
 
     class GasManager:
 
-        gas_registro_id = int()         # GASOLINA_REGISTRO_ID
-        gas_registro_date = str()       # GASOLINA_REGISTRO_FECHA
-        gas_registro_hour = str()       # GASOLINA_REGISTRO_HORA
-        gas_registro_liters = float()   # GASOLINA_REGISTRO_LITROS
-        gas_registro_cost = float()     # GASOLINA_REGISTRO_COSTO
-        gas_registro_tax_rate = int()   # GASOLINA_REGISTRO_IMPUESTO
-        gas_gasolinera_name = str()     # GASOLINA_NOMBRE_GASOLINERA
-        gas_gasolinera_address = str()  # GASOLINA_UBICACION_GASOLINERA
-        gas_driver_id = int()           # GASOLINA_CONDUCTOR_ID
-        gas_vehicle_id = int()          # GASOLINA_VEHICULO_ID
-        gas_document_id = int()         # GASSOLINA_DOCUMENTO_ID
-
-        def __init__(self):
-
-            self.gas_registro_id = os.getenv('GASOLINA_REGISTRO_ID').__str__()
-            self.gas_registro_date = os.getenv('GASOLINA_REGISTRO_FECHA').__str__()
-            self.gas_registro_hour = os.getenv('GASOLINA_REGISTRO_HORA').__str__()
-            self.gas_registro_liters = os.getenv('GASOLINA_REGISTRO_LITROS').__str__()
-            self.gas_registro_cost = os.getenv('GASOLINA_REGISTRO_COSTO').__str__()
-            self.gas_registro_tax_rate = os.getenv('GASOLINA_REGISTRO_IMPUESTO').__str__()
-            self.gas_gasolinera_name = os.getenv('GASOLINA_NOMBRE_GASOLINERA').__str__()
-            self.gas_gasolinera_address = os.getenv('GASOLINA_UBICACION_GASOLINERA').__str__()
-            self.gas_driver_id = os.getenv('GASOLINA_CONDUCTOR_ID').__str__()
-            self.gas_vehicle_id = os.getenv('GASOLINA_VEHICULO_ID').__str__()
-            self.gas_document_id = os.getenv('GASSOLINA_DOCUMENTO_ID').__str__()
+        gas_registro_id = env_str('GASOLINA_REGISTRO_ID', 'gasolina_registro_id')
+        gas_registro_date = env_str('GASOLINA_REGISTRO_FECHA', 'gasolina_registro_fecha')
+        gas_registro_hour = env_str('GASOLINA_REGISTRO_HORA', 'gasolina_registro_hora')
+        gas_registro_liters = env_str('GASOLINA_REGISTRO_LITROS', 'gasolina_registro_litros')
+        gas_registro_cost = env_str('GASOLINA_REGISTRO_COSTO', 'gasolina_registro_costo')
+        gas_registro_tax_rate = env_str('GASOLINA_REGISTRO_IMPUESTO', 'gasolina_registro_impuesto')
+        gas_gasolinera_name = env_str('GASOLINA_NOMBRE_GASOLINERA', 'gasolina_nombre_gasolinera')
+        gas_gasolinera_address = env_str('GASOLINA_UBICACION_GASOLINERA', 'gasolina_ubicacion_gasolinera')
+        gas_driver_id = env_str('GASOLINA_CONDUCTOR_ID', 'gasolina_conductor_id')
+        gas_vehicle_id = env_str('GASOLINA_VEHICULO_ID', 'gasolina_vehiculo_id')
+        gas_document_id = env_str('GASSOLINA_DOCUMENTO_ID', 'gasolina_documento_id')
+        gas_transaction_id = env_str('GASOLINA_TRANSACCION_ID', 'gasolina_transaccion_id')
+
+    class GasManagerDaily:
+
+        daily_date = env_str('GASOLINA_DIARIO_FECHA', 'gasolina_diario_fecha')
+        daily_vehicle_id = env_str('GASOLINA_DIARIO_VEHICULO_ID', 'gasolina_diario_vehiculo_id')
+        daily_station_name = env_str('GASOLINA_DIARIO_GASOLINERA', 'gasolina_diario_gasolinera')
+        daily_loads = env_str('GASOLINA_DIARIO_CARGAS', 'gasolina_diario_cargas')
+        daily_liters = env_str('GASOLINA_DIARIO_LITROS', 'gasolina_diario_litros')
+        daily_cost = env_str('GASOLINA_DIARIO_COSTO', 'gasolina_diario_costo')
+        daily_tax = env_str('GASOLINA_DIARIO_IMPUESTO', 'gasolina_diario_impuesto')
+
+    class GasManagerAnomaly:
+
+        anomaly_id = env_str('ANOMALIA_ID', 'anomalia_id')
+        anomaly_gas_record_id = env_str('ANOMALIA_GASOLINA_REGISTRO_ID', 'anomalia_gasolina_registro_id')
+        anomaly_vehicle_id = env_str('ANOMALIA_VEHICULO_ID', 'anomalia_vehiculo_id')
+        anomaly_driver_id = env_str('ANOMALIA_CONDUCTOR_ID', 'anomalia_conductor_id')
+        anomaly_type = env_str('ANOMALIA_TIPO', 'anomalia_tipo')
+        anomaly_score = env_str('ANOMALIA_PUNTAJE', 'anomalia_puntaje')
+        anomaly_detail = env_str('ANOMALIA_DETALLE', 'anomalia_detalle')
+        anomaly_fill_date = env_str('ANOMALIA_FECHA_CARGA', 'anomalia_fecha_carga')
+        anomaly_detected_date = env_str('ANOMALIA_FECHA_DETECCION', 'anomalia_fecha_deteccion')
+        anomaly_status = env_str('ANOMALIA_ESTATUS', 'anomalia_estatus')
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Fixtures of the test suite.
+
+The settings are read once per process, so the environment of the tests is set here, before any module of the
+application is imported. The tests of the endpoints and models run against the PostgreSQL database of
+TEST_DATABASE_URL, migrated once per session, and are skipped when it is not set; the rest need no database.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import os
+import uuid
+import tempfile
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+if TEST_DATABASE_URL:
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+
+os.environ.setdefault('DATABASE_URL', 'postgresql://localhost/gas_manager_test')
+os.environ.setdefault('DIRECTORY_LOG_FILES', tempfile.mkdtemp(prefix='gas_manager_logs_'))
+os.environ.setdefault('APP_FILE_LOG_NAME', 'gas_manager_test')
+os.environ.setdefault('FILE_LOG_EXTENSION', '.log')
+os.environ.setdefault('FLASK_ENV', 'development')
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def app():
+    import api_config
+
+    app = api_config.create_app(bootstrap_db=False)
+    app.config['TESTING'] = True
+
+    return app
+
+
+@pytest.fixture(scope='session')
+def db_engine(app):
+    if not TEST_DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL is not set')
+
+    from db_controller.database_backend import bootstrap_schema, get_engine
+
+    bootstrap_schema()
+
+    return get_engine()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(app):
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        access_token = create_access_token(identity='usuario.pruebas')
+
+    return {'Authorization': 'Bearer {}'.format(access_token)}
+
+
+@pytest.fixture
+def vehicle_data():
+    return {
+        'vehiculo_modelo': 'Aveo',
+        'vehiculo_marca': 'Chevrolet',
+        'vehiculo_matricula': 'PRB-' + uuid.uuid4().hex[:8].upper(),
+        'vehiculo_numero_asientos': 5,
+        'vehiculo_numero_puertas': 4,
+        'vehiculo_tipo_combustible': 'gasolina',
+        'vehiculo_costo_catalogo': 250000.0,
+        'vehiculo_costo_compra': 240000.0,
+        'vehiculo_costo_impuesto': 16,
+        'vehiculo_fecha_baja': '2030-12-31',
+        'vehiculo_capacidad_tanque': 45.0
+    }
+
+
+@pytest.fixture
+def vehicle_id(db_engine, client, auth_headers, vehicle_data):
+    response = client.post('/api/v1/vehicle/', json=vehicle_data, headers=auth_headers)
+
+    assert response.status_code == 200
+
+    return response.get_json()['data']['vehiculo_id']
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Login and registration of the users of the API.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import uuid
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from apps.api_authentication.UsersAuthModel import UsersAuthModel
+
+LOGIN_URL = '/api/v1/manager/user/login/'
+REGISTER_URL = '/api/v1/manager/user/register/'
+
+
+@pytest.fixture
+def credentials():
+    return {'username': 'usuario.{}@pruebas.com'.format(uuid.uuid4().hex[:8]), 'password': 'Clave.Prueba1'}
+
+
+def test_login_of_unknown_user_is_unauthorized(db_engine, client, credentials):
+    response = client.post(LOGIN_URL, json=credentials)
+
+    assert response.status_code == 401
+
+    session = Session(bind=db_engine)
+
+    try:
+        assert UsersAuthModel.get_user_by_id(session, credentials) is None
+    finally:
+        session.close()
+
+
+def test_register_sets_the_privileges(db_engine, client, auth_headers, credentials):
+    response = client.post(REGISTER_URL, headers=auth_headers,
+                           json=dict(credentials, is_superuser=True, is_staff=True, is_active=False))
+
+    assert response.status_code == 201
+
+    user_data = response.get_json()['data']
+
+    assert (user_data['Username'], user_data['IsActive'], user_data['IsStaff'], user_data['IsSuperUser']) == \
+        (credentials['username'], True, False, False)
+    assert 'Password' not in user_data
+
+    response = client.post(REGISTER_URL, headers=auth_headers, json=credentials)
+
+    assert response.status_code == 409
+
+
+def test_register_needs_a_token(db_engine, client, credentials):
+    response = client.post(REGISTER_URL, json=credentials)
+
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize('data', [{'username': 'no es un email', 'password': 'Clave.Prueba1'},
+                                  {'username': ['usuario@pruebas.com'], 'password': 'Clave.Prueba1'},
+                                  {'username': 'usuario@pruebas.com'}, ['usuario@pruebas.com']])
+def test_register_credentials_not_valid(db_engine, client, auth_headers, data):
+    response = client.post(REGISTER_URL, headers=auth_headers, json=data)
+
+    assert response.status_code == 409
+
+
+def test_login_of_registered_user(db_engine, client, auth_headers, credentials):
+    client.post(REGISTER_URL, headers=auth_headers, json=credentials)
+
+    response = client.post(LOGIN_URL, json=dict(credentials, password='Otra.Clave1'))
+
+    assert response.status_code == 401
+
+    response = client.post(LOGIN_URL, json=credentials)
+
+    assert response.status_code == 200
+
+    login = response.get_json()['data']
+
+    assert login['access_token'] and login['refresh_token']
+    assert login['data'] == {'Username': credentials['username'], 'IsActive': True, 'IsStaff': False,
+                             'IsSuperUser': False}
+
+
+def test_login_of_inactive_user_is_unauthorized(db_engine, client, auth_headers, credentials):
+    client.post(REGISTER_URL, headers=auth_headers, json=credentials)
+
+    with db_engine.begin() as connection:
+        connection.execute(update(UsersAuthModel.__table__)
+                           .where(UsersAuthModel.__table__.c.user_name == credentials['username'])
+                           .values(is_active=False))
+
+    response = client.post(LOGIN_URL, json=credentials)
+
+    assert response.status_code == 401
+
+
+def test_user_list_without_passwords(db_engine, client, auth_headers, credentials):
+    client.post(REGISTER_URL, headers=auth_headers, json=credentials)
+
+    response = client.get('/api/v1/manager/user/list', headers=auth_headers)
+
+    assert response.status_code == 200
+
+    users = [user['AuthUser'] for user in response.get_json()['data']['results']]
+
+    assert users and all('Password' not in user for user in users)
+
+
+def test_create_user_command(db_engine, app, client, credentials):
+    result = app.test_cli_runner().invoke(args=['create-user', credentials['username'], '--superuser'],
+                                          input='{0}\n{0}\n'.format(credentials['password']))
+
+    assert result.exit_code == 0
+    assert 'User registered' in result.output
+
+    response = client.post(LOGIN_URL, json=credentials)
+
+    assert response.status_code == 200
+    assert response.get_json()['data']['data']['IsSuperUser'] is True
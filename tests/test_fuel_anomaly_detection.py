@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Scoring of the fuel loads and catch up of the rolling statistics of the fuel anomaly detection.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import math
+from datetime import date, timedelta
+import pytest
+from apps.gas_manager import fuel_anomaly_detection
+from apps.gas_manager.fuel_anomaly_detection import VehicleFuelState, rebuild_fuel_state, get_fuel_state
+from test_fuel_ingestion import fuel_load
+from test_odometer_ingestion import reading
+
+HOUR = 3600
+
+
+def score_fills(state, slot, fills, tank_capacity=math.nan):
+    return [[anomaly for anomaly, _, _ in state.score(slot, fill_id, fill_at, liters, odometer_km, tank_capacity)]
+            for fill_id, (fill_at, liters, odometer_km) in enumerate(fills, 1)]
+
+
+def test_regular_fills_build_the_statistics():
+    state = VehicleFuelState()
+    slot = state.slot(7)
+
+    assert score_fills(state, slot, [(0, 40.0, 1000.0), (HOUR * 5, 40.0, 1400.0), (HOUR * 10, 40.0, 1800.0)]) == \
+        [[], [], []]
+    assert state.position(slot) == (HOUR * 10, 3)
+    assert int(state.samples[slot]) == 2
+    assert float(state.ewma_mean[slot]) == pytest.approx(10.0)
+    assert float(state.last_odometer[slot]) == 1800.0
+
+
+def test_over_tank_capacity():
+    state = VehicleFuelState()
+
+    ((anomaly, score, _),) = state.score(state.slot(7), 1, 0, 60.0, math.nan, 45.0)
+
+    assert (anomaly, score) == ('over_tank_capacity', pytest.approx(60.0 / 45.0))
+
+    # FUEL_TANK_CAPACITY_LITERS when the tank capacity is not registered
+    assert state.score(state.slot(8), 2, 0, 60.0, math.nan, math.nan) == []
+
+
+def test_fills_too_close():
+    state = VehicleFuelState()
+    slot = state.slot(7)
+
+    state.score(slot, 1, 0, 30.0, math.nan, math.nan)
+
+    ((anomaly, score, _),) = state.score(slot, 2, 20 * 60, 30.0, math.nan, math.nan)
+
+    assert (anomaly, score) == ('fills_too_close', pytest.approx(20.0))
+
+
+@pytest.mark.parametrize('odometer_km, expected_score', [(1000.0, 0.0), (900.0, -2.5)])
+def test_no_distance_is_scored_in_km_per_liter(odometer_km, expected_score):
+    state = VehicleFuelState()
+    slot = state.slot(7)
+
+    state.score(slot, 1, 0, 40.0, 1000.0, math.nan)
+
+    ((anomaly, score, detail),) = state.score(slot, 2, HOUR * 5, 40.0, odometer_km, math.nan)
+
+    assert (anomaly, score) == ('no_distance', pytest.approx(expected_score))
+    assert detail == '{:.1f} km since the previous fuel load'.format(odometer_km - 1000.0)
+
+
+def test_efficiency_out_of_range():
+    state = VehicleFuelState()
+    slot = state.slot(7)
+
+    assert score_fills(state, slot, [(0, 40.0, 1000.0), (HOUR * 5, 40.0, 1010.0), (HOUR * 10, 10.0, 1900.0)]) == \
+        [[], ['efficiency_out_of_range'], ['efficiency_out_of_range']]
+    assert int(state.samples[slot]) == 0
+
+
+def test_efficiency_outlier_does_not_move_the_statistics():
+    state = VehicleFuelState()
+    slot = state.slot(7)
+
+    fills = [(HOUR * 5 * fill, 40.0, 1000.0 + 400.0 * fill) for fill in range(7)]
+
+    assert score_fills(state, slot, fills) == [[]] * 7
+
+    mean = float(state.ewma_mean[slot])
+
+    ((anomaly, score, _),) = state.score(slot, 8, HOUR * 40, 40.0, 3400.0 + 1200.0, math.nan)
+
+    assert anomaly == 'efficiency_outlier'
+    assert score == pytest.approx((30.0 - 10.0) / (0.1 * 10.0))
+    assert float(state.ewma_mean[slot]) == mean
+    assert int(state.samples[slot]) == 6
+
+
+def test_older_fill_leaves_the_statistics():
+    state = VehicleFuelState()
+    slot = state.slot(7)
+
+    score_fills(state, slot, [(HOUR * 5, 40.0, 1000.0)])
+
+    assert state.score(slot, 2, 0, 40.0, 900.0, math.nan) == []
+    assert state.position(slot) == (HOUR * 5, 1)
+    assert float(state.last_odometer[slot]) == 1000.0
+
+
+def test_slots_grow():
+    state = VehicleFuelState(size=2)
+
+    slots = [state.slot(vehicle_id) for vehicle_id in range(5)]
+
+    assert slots == [0, 1, 2, 3, 4]
+    assert state.samples.size >= 5
+    assert state.position(4) == (-1, 0)
+
+
+def ingest(client, auth_headers, vehicle_id, hour, odometer_km):
+    yesterday = date.today() - timedelta(days=1)
+
+    response = client.post('/api/v1/odometer/', headers=auth_headers, json=reading(
+        vehicle_id, '{}T{:02d}:00:00'.format(yesterday.isoformat(), hour - 1), odometer_km))
+
+    assert response.status_code == 201
+
+    response = client.post('/api/v1/gas/bulk', headers=auth_headers, json=[fuel_load(
+        gasolina_vehiculo_id=vehicle_id, gasolina_registro_fecha=yesterday.isoformat(),
+        gasolina_registro_hora='{:02d}:00'.format(hour))])
+
+    (result,) = response.get_json()['data']['results']
+
+    return result['id_gas_record']
+
+
+def vehicle_statistics(state, vehicle_id):
+    slot = state.slots[vehicle_id]
+
+    return (state.position(slot), int(state.samples[slot]), round(float(state.ewma_mean[slot]), 6),
+            round(float(state.ewma_var[slot]), 6), float(state.last_odometer[slot]))
+
+
+@pytest.mark.parametrize('last_scored', ['stored', 'rolled_back'])
+def test_state_catches_up_with_the_fills_stored(db_engine, client, auth_headers, vehicle_id, monkeypatch,
+                                                last_scored):
+    first_fill = ingest(client, auth_headers, vehicle_id, 6, 1000.0)
+    ingest(client, auth_headers, vehicle_id, 9, 1400.0)
+
+    # A process which scored the first fuel load only: the second one was loaded by another worker
+    state = VehicleFuelState()
+
+    with db_engine.connect() as connection:
+        rebuild_fuel_state(connection, [vehicle_id], state=state)
+
+        slot = state.slots[vehicle_id]
+        fill_at = state.position(slot)[0] - 3 * HOUR
+
+        if last_scored == 'stored':
+            state.reset(slot)
+            state.score(slot, first_fill, fill_at, 40.0, 1000.0, 45.0)
+        else:
+            state.score(slot, 2 ** 31 - 1, fill_at + 4 * HOUR, 40.0, 1600.0, 45.0)
+
+    monkeypatch.setattr(fuel_anomaly_detection, '_state', state)
+    assert get_fuel_state() is state
+
+    last_fill = ingest(client, auth_headers, vehicle_id, 12, 1800.0)
+
+    rebuilt_state = VehicleFuelState()
+
+    with db_engine.connect() as connection:
+        rebuild_fuel_state(connection, [vehicle_id], state=rebuilt_state)
+
+    assert vehicle_statistics(state, vehicle_id) == vehicle_statistics(rebuilt_state, vehicle_id)
+    assert vehicle_statistics(state, vehicle_id)[0][1] == last_fill
+    assert int(state.samples[state.slots[vehicle_id]]) == 2
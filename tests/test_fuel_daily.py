@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Daily totals of the fuel loads, added up on the transaction which inserts them.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+from datetime import date, timedelta
+import pytest
+from apps.gas_manager.FuelDailyModel import FuelDailyModel
+from test_fuel_ingestion import fuel_load
+
+FIRST_DAY = date.today() - timedelta(days=3)
+SECOND_DAY = FIRST_DAY + timedelta(days=1)
+
+
+@pytest.fixture
+def fuel_loads(db_engine, client, auth_headers, vehicle_id):
+    first_day, second_day = FIRST_DAY.isoformat(), SECOND_DAY.isoformat()
+
+    response = client.post('/api/v1/gas/bulk', headers=auth_headers, json=[
+        fuel_load(gasolina_vehiculo_id=vehicle_id, gasolina_registro_fecha=first_day, gasolina_registro_hora='07:00',
+                  gasolina_registro_litros=40.0, gasolina_registro_costo=928.0, gasolina_registro_impuesto=16),
+        fuel_load(gasolina_vehiculo_id=vehicle_id, gasolina_registro_fecha=first_day, gasolina_registro_hora='12:00',
+                  gasolina_registro_litros=20.0, gasolina_registro_costo=464.0, gasolina_registro_impuesto=16),
+        fuel_load(gasolina_vehiculo_id=vehicle_id, gasolina_registro_fecha=first_day, gasolina_registro_hora='18:00',
+                  gasolina_registro_litros=30.0, gasolina_registro_costo=660.0, gasolina_registro_impuesto=None,
+                  gasolina_nombre_gasolinera='Gasolinera Norte'),
+        fuel_load(gasolina_vehiculo_id=vehicle_id, gasolina_registro_fecha=first_day, gasolina_registro_hora='20:00',
+                  gasolina_registro_litros=-1.0),
+    ])
+
+    assert response.get_json()['data']['inserted'] == 3
+
+    # A single fuel load is added up too, and a transaction sent again only once
+    second_load = fuel_load(gasolina_vehiculo_id=vehicle_id, gasolina_registro_fecha=second_day,
+                            gasolina_registro_hora='09:00', gasolina_registro_litros=10.0,
+                            gasolina_registro_costo=232.0, gasolina_registro_impuesto=16,
+                            gasolina_nombre_gasolinera=None)
+
+    for _ in range(2):
+        response = client.post('/api/v1/gas/', json=second_load, headers=auth_headers)
+
+        assert response.status_code in (200, 201)
+
+    return vehicle_id
+
+
+def test_totals_rolled_up(db_engine, fuel_loads):
+    date_to = SECOND_DAY + timedelta(days=1)
+
+    with db_engine.connect() as connection:
+        by_station = FuelDailyModel.get_totals(connection, FIRST_DAY, date_to, vehicle_id=fuel_loads)
+        by_day = FuelDailyModel.get_totals(connection, FIRST_DAY, date_to, ('dia',), vehicle_id=fuel_loads)
+        whole_range = FuelDailyModel.get_totals(connection, FIRST_DAY, date_to, (), vehicle_id=fuel_loads)
+        first_day = FuelDailyModel.get_totals(connection, FIRST_DAY, SECOND_DAY, ('vehiculo',),
+                                              vehicle_id=fuel_loads, station_name='Gasolinera Centro')
+
+    assert [dict(row) for row in by_station] == [
+        {'dia': FIRST_DAY, 'vehiculo': fuel_loads, 'gasolinera': 'Gasolinera Centro', 'cargas': 2, 'litros': 60.0,
+         'costo': 1392.0, 'impuesto': 192.0},
+        {'dia': FIRST_DAY, 'vehiculo': fuel_loads, 'gasolinera': 'Gasolinera Norte', 'cargas': 1, 'litros': 30.0,
+         'costo': 660.0, 'impuesto': 0.0},
+        {'dia': SECOND_DAY, 'vehiculo': fuel_loads, 'gasolinera': '', 'cargas': 1, 'litros': 10.0,
+         'costo': 232.0, 'impuesto': 32.0},
+    ]
+    assert [(row['dia'], row['cargas'], row['litros']) for row in by_day] == [(FIRST_DAY, 3, 90.0),
+                                                                               (SECOND_DAY, 1, 10.0)]
+    assert [(row['cargas'], row['costo'], row['impuesto']) for row in whole_range] == [(4, 2284.0, 224.0)]
+    assert [(row['vehiculo'], row['cargas']) for row in first_day] == [(fuel_loads, 2)]
+
+
+def test_totals_unknown_group():
+    with pytest.raises(ValueError):
+        FuelDailyModel.get_totals(None, FIRST_DAY, SECOND_DAY, ('mes',))
+
+
+def test_daily_endpoint(db_engine, client, auth_headers, fuel_loads):
+    response = client.get('/api/v1/gas/daily?fecha_inicio={}&fecha_fin={}&vehiculo={}&agrupar=gasolinera'.format(
+        FIRST_DAY.isoformat(), SECOND_DAY.isoformat(), fuel_loads), headers=auth_headers)
+
+    assert response.status_code == 200
+    assert [(row['gasolinera'], row['cargas']) for row in response.get_json()['data']['results']] == \
+        [('', 1), ('Gasolinera Centro', 2), ('Gasolinera Norte', 1)]
+
+    response = client.get('/api/v1/gas/daily?agrupar=semana', headers=auth_headers)
+
+    assert response.status_code == 400
+
+
+def test_daily_endpoint_vehicle_not_valid(db_engine, client, auth_headers):
+    response = client.get('/api/v1/gas/daily?vehiculo=abc', headers=auth_headers)
+
+    assert response.status_code == 400
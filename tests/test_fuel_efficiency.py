@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Date range and fuel efficiency of the analytics.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+from datetime import date, timedelta
+import pytest
+from apps.fuel_analytics.fuel_efficiency import date_range, get_efficiency_by_vehicle, get_fuel_anomalies, cfg_app
+from test_fuel_anomaly_detection import ingest
+
+
+def test_date_range_defaults():
+    tomorrow = date.today() + timedelta(days=1)
+
+    assert date_range() == (tomorrow - timedelta(days=cfg_app.analytics_default_days), tomorrow)
+    assert date_range(date_to='2021-03-10') == (date(2021, 3, 10) - timedelta(days=cfg_app.analytics_default_days),
+                                                date(2021, 3, 10))
+
+
+def test_date_range_given():
+    assert date_range('2021-03-01', '2021-03-10') == (date(2021, 3, 1), date(2021, 3, 10))
+    assert date_range(date(2021, 3, 1), date(2021, 3, 2)) == (date(2021, 3, 1), date(2021, 3, 2))
+
+
+@pytest.mark.parametrize('date_from, date_to', [
+    ('2021-03-10', '2021-03-10'),
+    ('2021-03-11', '2021-03-10'),
+    ('2021-02-30', '2021-03-10'),
+    ('01/03/2021', None),
+])
+def test_date_range_not_valid(date_from, date_to):
+    with pytest.raises(ValueError):
+        date_range(date_from, date_to)
+
+
+def test_endpoint_date_range_not_valid_is_bad_request(db_engine, client, auth_headers):
+    response = client.get('/api/v1/analytics/efficiency/vehicles?desde=2021-03-10&hasta=2021-03-01',
+                          headers=auth_headers)
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('url', ['/api/v1/analytics/efficiency/vehicles?vehiculo=abc',
+                                 '/api/v1/analytics/efficiency/drivers?conductor=1.5',
+                                 '/api/v1/analytics/efficiency/anomalies?vehiculo=abc'])
+def test_endpoint_id_not_valid_is_bad_request(db_engine, client, auth_headers, url):
+    assert client.get(url, headers=auth_headers).status_code == 400
+
+
+def test_efficiency_by_vehicle(db_engine, client, auth_headers, vehicle_id):
+    # 40 L each, 400 km between the first three fuel loads, none before the last one
+    fill_ids = [ingest(client, auth_headers, vehicle_id, hour, odometer_km)
+                for hour, odometer_km in ((6, 1000.0), (9, 1400.0), (12, 1800.0), (15, 1800.0))]
+
+    date_from, date_to = date_range()
+
+    with db_engine.connect() as connection:
+        (summary,) = get_efficiency_by_vehicle(connection, date_from, date_to, vehicle_id)
+        anomalies = get_fuel_anomalies(connection, date_from, date_to, vehicle_id)
+
+    assert summary['group_id'] == vehicle_id
+    assert (summary['fuel_loads'], summary['liters'], summary['anomalies']) == (4, 160.0, 1)
+    assert (summary['distance_km'], summary['km_per_liter'], summary['cost_per_km']) == (800.0, 10.0, 2.2)
+    assert summary['cost_per_liter'] == 22.0
+
+    assert [(anomaly['fill_id'], anomaly['anomaly'], anomaly['distance_km']) for anomaly in anomalies] == \
+        [(fill_ids[-1], 'no_distance', 0.0)]
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Validation and ingestion of the fuel loads.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import uuid
+from datetime import date, timedelta
+import numpy as np
+import pytest
+from apps.gas_manager.fuel_ingestion import validate_fuel_batch, FUEL_INGEST_FIELDS
+
+
+def fuel_load(**fields):
+    data = {
+        'gasolina_transaccion_id': 'TX-' + uuid.uuid4().hex,
+        'gasolina_registro_fecha': (date.today() - timedelta(days=1)).isoformat(),
+        'gasolina_registro_hora': '08:30',
+        'gasolina_registro_litros': 40.0,
+        'gasolina_registro_costo': 880.0,
+        'gasolina_registro_impuesto': 16,
+        'gasolina_nombre_gasolinera': 'Gasolinera Centro',
+        'gasolina_ubicacion_gasolinera': 'Av. Juarez 10',
+        'gasolina_vehiculo_id': 7,
+        'gasolina_conductor_id': None,
+        'gasolina_documento_id': None
+    }
+    data.update(fields)
+
+    return data
+
+
+def test_valid_row_is_converted():
+    fuel_batch = validate_fuel_batch([fuel_load(gasolina_transaccion_id='TX-1', gasolina_conductor_id='3')], 1)
+
+    assert fuel_batch.errors == {}
+    assert fuel_batch.duplicated == {}
+
+    row_values = dict(zip(('row',) + tuple(field_name for field_name, _ in FUEL_INGEST_FIELDS), fuel_batch.rows[0]))
+
+    assert row_values['row'] == 1
+    assert row_values['gasolina_transaccion_id'] == 'TX-1'
+    assert row_values['gasolina_registro_hora'] == '08:30:00'
+    assert row_values['gasolina_vehiculo_id'] == 7
+    assert row_values['gasolina_conductor_id'] == 3
+    assert row_values['gasolina_documento_id'] is None
+
+
+def test_mixed_valid_and_invalid_rows():
+    batch = [
+        fuel_load(),
+        fuel_load(gasolina_registro_litros=-5),
+        'no es un objeto',
+        fuel_load(gasolina_registro_costo=5000.0),
+        fuel_load(gasolina_registro_fecha=(date.today() + timedelta(days=2)).isoformat()),
+        fuel_load(gasolina_registro_hora='25:00'),
+        fuel_load(),
+    ]
+
+    fuel_batch = validate_fuel_batch(batch, 10)
+
+    assert [row_values[0] for row_values in fuel_batch.rows] == [10, 16]
+    assert fuel_batch.errors == {
+        11: ['gasolina_registro_litros out of range', 'price per liter out of range'],
+        12: ['Row is not an object'],
+        13: ['price per liter out of range'],
+        14: ['gasolina_registro_fecha must be a past date (YYYY-MM-DD)'],
+        15: ['gasolina_registro_hora must be a time (HH:MM[:SS])'],
+    }
+
+
+@pytest.mark.parametrize('field_name', ['gasolina_vehiculo_id', 'gasolina_conductor_id', 'gasolina_documento_id'])
+@pytest.mark.parametrize('value', [True, False, 0, -3, 2.5, 2 ** 31, 'siete', [7], {'id': 7}])
+def test_invalid_ids(field_name, value):
+    fuel_batch = validate_fuel_batch([fuel_load(**{field_name: value})], 1)
+
+    assert fuel_batch.errors == {1: ['{} is not valid'.format(field_name)]}
+
+
+@pytest.mark.parametrize('field_name', ['gasolina_nombre_gasolinera', 'gasolina_ubicacion_gasolinera'])
+@pytest.mark.parametrize('value', [{'nombre': 'Centro'}, ['Centro'], 15, True])
+def test_station_fields_must_be_strings(field_name, value):
+    fuel_batch = validate_fuel_batch([fuel_load(**{field_name: value}), fuel_load()], 1)
+
+    assert fuel_batch.errors == {1: ['{} must be a string'.format(field_name)]}
+    assert [row_values[0] for row_values in fuel_batch.rows] == [2]
+
+
+@pytest.mark.parametrize('value', [True, {'id': 1}, ['TX'], 1.5])
+def test_transaction_id_type(value):
+    fuel_batch = validate_fuel_batch([fuel_load(gasolina_transaccion_id=value)], 1)
+
+    assert fuel_batch.errors == {1: ['gasolina_transaccion_id must be a string']}
+
+
+def test_numeric_transaction_id_is_accepted():
+    fuel_batch = validate_fuel_batch([fuel_load(gasolina_transaccion_id=123456)], 1)
+
+    assert fuel_batch.errors == {}
+    assert fuel_batch.rows[0][1] == '123456'
+
+
+def test_transaction_repeated_on_the_batch():
+    fuel_batch = validate_fuel_batch([fuel_load(gasolina_transaccion_id='TX-9', gasolina_registro_litros=0),
+                                      fuel_load(gasolina_transaccion_id='TX-9'),
+                                      fuel_load(gasolina_transaccion_id='TX-9')], 1)
+
+    assert list(fuel_batch.errors) == [1]
+    assert [row_values[0] for row_values in fuel_batch.rows] == [2]
+    assert fuel_batch.duplicated == {3: 'TX-9'}
+
+
+def test_registered_vehicles_and_drivers():
+    fuel_batch = validate_fuel_batch([fuel_load(gasolina_vehiculo_id=7, gasolina_conductor_id=1),
+                                      fuel_load(gasolina_vehiculo_id=8),
+                                      fuel_load(gasolina_vehiculo_id=7, gasolina_conductor_id=2)], 1,
+                                     np.array([7.0]), np.array([1.0]))
+
+    assert fuel_batch.errors == {2: ['gasolina_vehiculo_id is not registered'],
+                                 3: ['gasolina_conductor_id is not registered']}
+
+
+def test_bulk_mixed_rows(db_engine, client, auth_headers, vehicle_id):
+    stored_load = fuel_load(gasolina_vehiculo_id=vehicle_id)
+
+    batch = [stored_load, fuel_load(gasolina_vehiculo_id=vehicle_id, gasolina_nombre_gasolinera={'a': 1}),
+             fuel_load(gasolina_vehiculo_id=True), dict(stored_load)]
+
+    # Batches of two rows: the row numbers carry on across the batches
+    response = client.post('/api/v1/gas/bulk?batch_size=2', json=batch, headers=auth_headers)
+
+    assert response.status_code == 200
+
+    summary = response.get_json()['data']
+
+    assert (summary['total'], summary['inserted'], summary['duplicated'], summary['invalid']) == (4, 1, 1, 2)
+    assert [(result['row'], result['status']) for result in summary['results']] == [
+        (1, 'inserted'), (2, 'invalid'), (3, 'invalid'), (4, 'duplicated')
+    ]
+
+    # The transaction stored is reported as duplicated when it is sent again
+    response = client.post('/api/v1/gas/bulk', json=[stored_load], headers=auth_headers)
+
+    assert response.get_json()['data']['duplicated'] == 1
+
+
+@pytest.mark.parametrize('content_type, body', [
+    ('application/json', b'{"cargas": '),
+    ('application/json', b'12'),
+    ('application/x-ndjson', b'{"gasolina_transaccion_id": "TX-1"}\n{no es json\n'),
+    ('text/csv', b'gasolina_transaccion_id,gasolina_registro_litros\n"TX-1,40\n'),
+    ('text/csv', b'\xff\xfe\x00'),
+])
+def test_bulk_malformed_body_is_bad_request(db_engine, client, auth_headers, content_type, body):
+    response = client.post('/api/v1/gas/bulk', data=body, content_type=content_type, headers=auth_headers)
+
+    assert response.status_code == 400
+
+
+def test_post_invalid_row_is_unprocessable(db_engine, client, auth_headers, vehicle_id):
+    response = client.post('/api/v1/gas/', json=fuel_load(gasolina_vehiculo_id=vehicle_id,
+                                                          gasolina_ubicacion_gasolinera=['Av. Juarez']),
+                           headers=auth_headers)
+
+    assert response.status_code == 422
+    assert response.get_json()['data']['errors'] == ['gasolina_ubicacion_gasolinera must be a string']
+
+
+def test_post_fuel_load_and_send_it_again(db_engine, client, auth_headers, vehicle_id):
+    data = fuel_load(gasolina_vehiculo_id=vehicle_id)
+
+    response = client.post('/api/v1/gas/', json=data, headers=auth_headers)
+
+    assert response.status_code == 201
+
+    stored = response.get_json()['data']
+
+    assert (stored['liters_gas_record'], stored['anomalies']) == (40.0, [])
+
+    response = client.post('/api/v1/gas/', json=data, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.get_json()['data']['id_gas_record'] == stored['id_gas_record']
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Serialization of the responses with every JSON backend installed.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import json
+from decimal import Decimal
+from datetime import date, datetime
+import numpy as np
+import pytest
+from handler_controller.json_encoder import JSON_BACKENDS, json_default
+
+BACKENDS_INSTALLED = [name for name, dumps in JSON_BACKENDS.items() if dumps is not None]
+
+
+@pytest.mark.parametrize('backend_name', BACKENDS_INSTALLED)
+def test_dumps_numpy_values(backend_name):
+    data = {
+        'fuel_loads': np.int64(3),
+        'liters': np.float64(41.5),
+        'flagged': np.bool_(True),
+        'scores': np.array([1.5, 2.0])
+    }
+
+    document = json.loads(JSON_BACKENDS[backend_name](data))
+
+    assert document == {'fuel_loads': 3, 'liters': 41.5, 'flagged': True, 'scores': [1.5, 2.0]}
+    assert type(document['fuel_loads']) is int
+
+
+@pytest.mark.parametrize('backend_name', BACKENDS_INSTALLED)
+def test_dumps_dates_and_decimals(backend_name):
+    data = {'date': date(2021, 3, 1), 'at': datetime(2021, 3, 1, 8, 30), 'cost': Decimal('812.40')}
+
+    document = json.loads(JSON_BACKENDS[backend_name](data))
+
+    assert document == {'date': '2021-03-01', 'at': '2021-03-01T08:30:00', 'cost': 812.4}
+
+
+def test_default_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        json_default(object())
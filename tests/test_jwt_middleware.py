@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Authentication of the requests by the JWT middleware, and revocation of the tokens on logout.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import time
+import runpy
+from types import SimpleNamespace
+from datetime import timedelta
+import pytest
+from flask_jwt_extended import create_access_token, create_refresh_token
+from auth_controller import jwt_middleware
+from auth_controller.token_revocation import create_revocation_set, InMemoryRevocationStore
+from utilities import Utility
+
+# Protected endpoint answered without the database: 400 once the token is accepted
+PROTECTED_URL = '/api/v1/vehicle/export?format=xml'
+LOGOUT_URL = '/api/v1/manager/user/logout/'
+
+
+def bearer(encoded_token):
+    return {'Authorization': 'Bearer {}'.format(encoded_token)}
+
+
+@pytest.fixture
+def revocation_set(monkeypatch):
+    revocation_set = create_revocation_set()
+
+    monkeypatch.setattr(jwt_middleware, 'revocation_set', revocation_set)
+
+    return revocation_set
+
+
+def test_valid_token(client, auth_headers):
+    assert client.get(PROTECTED_URL, headers=auth_headers).status_code == 400
+
+
+@pytest.mark.parametrize('headers', [
+    {},
+    {'Authorization': 'Bearer'},
+    {'Authorization': 'Token abc'},
+    {'Authorization': 'Bearer no.es.un.token'},
+])
+def test_missing_or_invalid_token(client, headers):
+    assert client.get(PROTECTED_URL, headers=headers).status_code == 401
+
+
+def test_expired_token(app, client):
+    with app.app_context():
+        encoded_token = create_access_token(identity='usuario.pruebas', expires_delta=timedelta(seconds=-1))
+
+    assert client.get(PROTECTED_URL, headers=bearer(encoded_token)).status_code == 401
+
+
+def test_refresh_token_is_not_an_access_token(app, client):
+    with app.app_context():
+        encoded_token = create_refresh_token(identity='usuario.pruebas')
+
+    assert client.get(PROTECTED_URL, headers=bearer(encoded_token)).status_code == 401
+
+
+def test_token_of_another_key(app, client, monkeypatch):
+    with app.app_context():
+        monkeypatch.setitem(app.config, 'JWT_SECRET_KEY', 'otra-clave')
+
+        encoded_token = create_access_token(identity='usuario.pruebas')
+
+    monkeypatch.undo()
+
+    assert client.get(PROTECTED_URL, headers=bearer(encoded_token)).status_code == 401
+
+
+def test_exempt_endpoints(client):
+    assert client.get('/metrics').status_code == 200
+
+
+def test_database_metrics_need_a_token(client, auth_headers):
+    assert client.get('/api/v1/metrics/db').status_code == 401
+
+    response = client.get('/api/v1/metrics/db', headers=auth_headers)
+
+    assert response.status_code == 200
+    assert set(response.get_json()['data']) == {'pool', 'queries'}
+
+
+def test_login_is_exempt(db_engine, client):
+    response = client.post('/api/v1/manager/user/login/', json={'username': 'usuario.desconocido@pruebas.com',
+                                                                'password': 'Clave.Prueba1'})
+
+    assert response.status_code == 401
+    assert response.get_json()['message'].startswith('Usuario o password incorrectos')
+
+
+def test_logout_revokes_the_token(client, auth_headers, revocation_set):
+    assert client.get(LOGOUT_URL, headers=auth_headers).status_code == 405
+
+    response = client.post(LOGOUT_URL, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.get_json()['data'] == {'revoked': True}
+
+    # Verified and cached before the logout, rejected after it
+    assert client.get(PROTECTED_URL, headers=auth_headers).status_code == 401
+    assert client.post(LOGOUT_URL, headers=auth_headers).status_code == 401
+
+
+def test_logout_needs_a_token(client, revocation_set):
+    assert client.post(LOGOUT_URL).status_code == 401
+
+
+def test_logout_without_revocation(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(jwt_middleware, 'revocation_set', None)
+
+    response = client.post(LOGOUT_URL, headers=auth_headers)
+
+    assert response.get_json()['data'] == {'revoked': False}
+
+
+def test_in_memory_store_expires_the_entries():
+    store = InMemoryRevocationStore()
+
+    store.setex('jwt:revoked:a', 60, 1)
+
+    assert store.exists('jwt:revoked:a') == 1
+    assert store.exists('jwt:revoked:b') == 0
+
+    store._expiry['jwt:revoked:a'] = time.time() - 1
+
+    assert store.exists('jwt:revoked:a') == 0
+
+    store.setex('jwt:revoked:b', 60, 1)
+
+    assert 'jwt:revoked:a' not in store._expiry
+
+
+@pytest.mark.parametrize('workers, revocation_url, refused', [
+    (4, '', True),
+    (1, '', False),
+    (4, 'redis://localhost:6379/0', False),
+])
+def test_gunicorn_refuses_workers_without_shared_revocation(monkeypatch, workers, revocation_url, refused):
+    cfg_app = SimpleNamespace(jwt_revocation_enabled=True, jwt_revocation_url=revocation_url, metrics_multiproc_dir='')
+
+    monkeypatch.setattr(Utility, 'get_config_settings_app', lambda: cfg_app)
+
+    on_starting = runpy.run_path('gunicorn.conf.py')['on_starting']
+    server = SimpleNamespace(cfg=SimpleNamespace(workers=workers))
+
+    if refused:
+        with pytest.raises(RuntimeError):
+            on_starting(server)
+    else:
+        on_starting(server)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Log file of each process: the gunicorn workers never write nor rotate the same file.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import os
+from logger_controller.logger_control import configure_logger, get_log_file_path
+from utilities.Utility import get_config_settings_app
+
+
+def test_log_file_of_the_process():
+    cfg_app = get_config_settings_app()
+
+    configure_logger('api')
+
+    assert cfg_app.log_rotation == 'size'
+    assert os.path.basename(get_log_file_path()) == '{}-{}{}'.format(cfg_app.log_file_app_name, os.getpid(),
+                                                                     cfg_app.log_file_extension)
+
+
+def test_forked_process_opens_its_own_log_file():
+    configure_logger('api')
+
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        try:
+            os.close(read_end)
+            os.write(write_end, get_log_file_path().encode('utf-8'))
+        finally:
+            os._exit(0)
+
+    os.close(write_end)
+
+    with os.fdopen(read_end, 'rb') as child_output:
+        child_log_file = child_output.read().decode('utf-8')
+
+    os.waitpid(pid, 0)
+
+    assert child_log_file == get_log_file_path().replace(str(os.getpid()), str(pid))
+    assert os.path.isfile(child_log_file)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Maintenance jobs run by the scheduler.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import os
+import time
+from logger_controller.logger_control import get_log_file_path
+from scheduler_controller.maintenance_jobs import prune_log_files, cfg_app
+
+
+def _log_file(name, age_days):
+    path = os.path.join(cfg_app.log_file_save_path, name)
+
+    with open(path, 'a'):
+        pass
+
+    mtime = time.time() - age_days * 86400
+    os.utime(path, (mtime, mtime))
+
+    return path
+
+
+def test_prune_log_files_keeps_active_and_recent_files():
+    active_log_file = get_log_file_path()
+    age_days = cfg_app.log_retention_days + 1
+
+    old_log_file = _log_file(cfg_app.log_file_app_name + '.old' + cfg_app.log_file_extension, age_days)
+    recent_log_file = _log_file(cfg_app.log_file_app_name + '.recent' + cfg_app.log_file_extension, 0)
+    other_file = _log_file('other' + cfg_app.log_file_extension, age_days)
+
+    # The process has not written its log file for longer than the retention
+    os.utime(active_log_file, (time.time() - age_days * 86400,) * 2)
+
+    assert prune_log_files() == 1
+
+    assert not os.path.exists(old_log_file)
+    assert os.path.exists(recent_log_file)
+    assert os.path.exists(other_file)
+    assert os.path.exists(active_log_file)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Validation and ingestion of the odometer readings.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import threading
+import numpy as np
+import pytest
+from sqlalchemy.orm import Session
+from apps.odometer.odometer_ingestion import (LastReadings, validate_odometer_batch, ingest_odometer_readings,
+                                              _segmented_running_max, cfg_app,
+                                              INGEST_ISOLATION_LEVEL)
+
+
+def reading(vehicle_id, register_date, value, **fields):
+    data = {'odometro_vehiculo_id': vehicle_id, 'odometro_fecha_registro': register_date, 'odometro_valor': value}
+    data.update(fields)
+
+    return data
+
+
+def test_segmented_running_max():
+    values = np.array([5.0, 3.0, 7.0, 1.0, 0.5, 2.0, 9.0])
+    first_in_group = np.array([True, False, False, True, False, True, False])
+
+    np.testing.assert_array_equal(_segmented_running_max(values, first_in_group),
+                                  [5.0, 5.0, 7.0, 1.0, 1.0, 2.0, 9.0])
+
+
+def test_segmented_running_max_extreme_values():
+    values = np.array([1e308, 0.0, 1e308, 0.0, 1.0])
+    first_in_group = np.array([True, False, True, True, False])
+
+    np.testing.assert_array_equal(_segmented_running_max(values, first_in_group), [1e308, 1e308, 1e308, 0.0, 1.0])
+
+
+def test_segmented_running_max_empty():
+    assert _segmented_running_max(np.array([]), np.array([], dtype=bool)).size == 0
+
+
+def test_last_readings_lookup():
+    last_readings = LastReadings([9, 4], ['2021-03-02T10:00:00', '2021-03-01T08:00:00'], [1500.0, 200.0])
+
+    timestamps, kilometers = last_readings.lookup(np.array([4.0, 5.0, 9.0, 12.0]))
+
+    np.testing.assert_array_equal(kilometers, [200.0, -np.inf, 1500.0, -np.inf])
+    assert timestamps[0] == np.datetime64('2021-03-01T08:00:00')
+    assert np.isnat(timestamps[1]) and np.isnat(timestamps[3])
+
+
+def test_last_readings_empty():
+    timestamps, kilometers = LastReadings().lookup(np.array([1.0]))
+
+    assert np.isnat(timestamps[0]) and kilometers[0] == -np.inf
+
+
+def test_mixed_valid_and_invalid_readings():
+    batch = [
+        reading(1, '2021-03-01T08:00:00', 1000),
+        reading(1, '2021-03-01T09:00:00', 990),
+        reading(2, '2021-03-01T08:00:00', 1e308),
+        reading(1, '2021-03-01T10:00:00', 1100),
+        reading(True, '2021-03-01T08:00:00', 10),
+        reading(2, '2021-03-01T09:00:00', 500, odometro_unidad_medida='leguas'),
+        reading(1, '2021-03-01T08:00:00', 1000),
+        reading(1, '2021-03-01T11:00:00', 2000),
+    ]
+
+    odometer_batch = validate_odometer_batch(batch, 1)
+
+    assert [row_values[0] for row_values in odometer_batch.rows] == [1, 4]
+    assert odometer_batch.duplicated == [7]
+    assert odometer_batch.errors == {
+        2: ['odometro_valor lower than a previous reading of the vehicle'],
+        3: ['odometro_valor out of range'],
+        5: ['odometro_vehiculo_id is not valid'],
+        6: ['odometro_unidad_medida must be one of: km, mi'],
+        8: ['odometro_valor too far from the previous reading of the vehicle'],
+    }
+
+
+def test_max_value_in_the_unit_reported():
+    batch = [reading(1, '2021-03-01T08:00:00', cfg_app.odometer_max_value),
+             reading(2, '2021-03-01T08:00:00', cfg_app.odometer_max_value + 1, odometro_unidad_medida='mi')]
+
+    odometer_batch = validate_odometer_batch(batch, 1)
+
+    assert [row_values[0] for row_values in odometer_batch.rows] == [1]
+    assert odometer_batch.errors == {2: ['odometro_valor out of range']}
+
+
+def test_readings_compared_with_the_last_stored():
+    last_readings = LastReadings([1], ['2021-03-01T12:00:00'], [5000.0])
+
+    batch = [reading(1, '2021-03-01T11:00:00', 5100), reading(1, '2021-03-01T13:00:00', 4900),
+             reading(1, '2021-03-01T14:00:00', 5050)]
+
+    odometer_batch = validate_odometer_batch(batch, 1, last_readings)
+
+    assert [row_values[0] for row_values in odometer_batch.rows] == [3]
+    assert odometer_batch.errors == {
+        1: ['odometro_fecha_registro older than the last reading stored of the vehicle'],
+        2: ['odometro_valor lower than a previous reading of the vehicle'],
+    }
+
+
+def test_concurrent_appends_are_serialized(db_engine, vehicle_id):
+    first_connection = db_engine.connect().execution_options(isolation_level=INGEST_ISOLATION_LEVEL)
+    first_transaction = first_connection.begin()
+
+    summary = ingest_odometer_readings(Session(bind=first_connection),
+                                       [reading(vehicle_id, '2021-03-01T08:00:00', 1000)])
+
+    assert summary['inserted'] == 1
+
+    results = dict()
+
+    def second_ingestion():
+        with db_engine.connect().execution_options(isolation_level=INGEST_ISOLATION_LEVEL) as connection:
+            with connection.begin():
+                results['summary'] = ingest_odometer_readings(Session(bind=connection),
+                                                              [reading(vehicle_id, '2021-03-01T09:00:00', 900)])
+
+    second_thread = threading.Thread(target=second_ingestion)
+    second_thread.start()
+
+    # The second ingestion waits for the lock of the vehicle until the first one commits
+    second_thread.join(0.5)
+    assert second_thread.is_alive()
+
+    first_transaction.commit()
+    first_connection.close()
+
+    second_thread.join(10)
+
+    assert results['summary']['inserted'] == 0
+    assert results['summary']['errors'] == [
+        {'row': 1, 'errors': ['odometro_valor lower than a previous reading of the vehicle']}
+    ]
+
+
+@pytest.mark.parametrize('content_type, body', [
+    ('application/json', b'[{"odometro_vehiculo_id": 1'),
+    ('text/csv', b'odometro_vehiculo_id,odometro_valor\n"1,40\n'),
+])
+def test_bulk_malformed_body_is_bad_request(db_engine, client, auth_headers, content_type, body):
+    response = client.post('/api/v1/odometer/bulk', data=body, content_type=content_type, headers=auth_headers)
+
+    assert response.status_code == 400
+
+
+def test_post_and_bulk_readings(db_engine, client, auth_headers, vehicle_id):
+    response = client.post('/api/v1/odometer/', json=reading(vehicle_id, '2021-04-01T08:00:00', 100),
+                           headers=auth_headers)
+
+    assert response.status_code == 201
+
+    # Batches of two rows: the row numbers carry on across the batches
+    response = client.post('/api/v1/odometer/bulk?batch_size=2', headers=auth_headers, json=[
+        reading(vehicle_id, '2021-04-01T09:00:00', 150),
+        reading(vehicle_id, '2021-04-01T07:00:00', 90),
+        reading(vehicle_id, '2021-04-01T10:00:00', 1e308),
+    ])
+
+    summary = response.get_json()['data']
+
+    assert (summary['inserted'], summary['invalid']) == (1, 2)
+    assert [error['row'] for error in summary['errors']] == [2, 3]
+
+    response = client.post('/api/v1/odometer/', json=reading(vehicle_id, '2021-04-01T11:00:00', 120),
+                           headers=auth_headers)
+
+    assert response.status_code == 422
+    assert response.get_json()['data']['errors'] == ['odometro_valor lower than a previous reading of the vehicle']
+
+
+def test_series_vehicle_not_valid_is_bad_request(db_engine, client, auth_headers):
+    response = client.get('/api/v1/odometer/series?vehiculo=abc', headers=auth_headers)
+
+    assert response.status_code == 400
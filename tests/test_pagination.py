@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Keyset pagination params of the list endpoints.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import pytest
+from werkzeug.datastructures import MultiDict
+from utilities.Utility import get_pagination_args
+from db_controller.query_layer import decode_cursor, encode_cursor
+
+LIST_ENDPOINTS = (
+    '/api/v1/manager/user/list',
+    '/api/v1/vehicle/',
+    '/api/v1/driver/',
+    '/api/v1/gas/',
+    '/api/v1/gas/anomalies',
+    '/api/v1/odometer/',
+)
+
+
+def test_pagination_args():
+    assert get_pagination_args(MultiDict({'limit': '25', 'cursor': 'abc', 'total': 'true'})) == (25, 'abc', True)
+    assert get_pagination_args(MultiDict()) == (None, None, False)
+
+
+def test_pagination_args_reject_malformed_limit():
+    with pytest.raises(ValueError):
+        get_pagination_args(MultiDict({'limit': 'diez'}))
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(1234)) == 1234
+
+
+@pytest.mark.parametrize('endpoint', LIST_ENDPOINTS)
+@pytest.mark.parametrize('params', ({'cursor': 'no-es-un-cursor'}, {'limit': 'diez'}))
+def test_malformed_pagination_is_bad_request(db_engine, client, auth_headers, endpoint, params):
+    response = client.get(endpoint, query_string=params, headers=auth_headers)
+
+    assert response.status_code == 400
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Parsing of the settings read from the environment.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import pytest
+from settings.settings import env_bool, env_float, env_int, env_list
+
+
+def test_env_float(monkeypatch):
+    monkeypatch.setenv('FUEL_MAX_LITERS', ' 850.5 ')
+
+    assert env_float('FUEL_MAX_LITERS', 1000.0) == 850.5
+
+
+@pytest.mark.parametrize('value', [None, '', '  '])
+def test_env_float_default(monkeypatch, value):
+    if value is None:
+        monkeypatch.delenv('FUEL_MAX_LITERS', raising=False)
+    else:
+        monkeypatch.setenv('FUEL_MAX_LITERS', value)
+
+    assert env_float('FUEL_MAX_LITERS', 1000.0) == 1000.0
+
+
+def test_env_float_malformed(monkeypatch):
+    monkeypatch.setenv('FUEL_MAX_LITERS', 'mil')
+
+    with pytest.raises(ValueError):
+        env_float('FUEL_MAX_LITERS', 1000.0)
+
+
+def test_env_int_bool_list(monkeypatch):
+    monkeypatch.setenv('DB_POOL_SIZE', '8')
+    monkeypatch.setenv('SCHEDULER_ENABLED', 'Yes')
+    monkeypatch.setenv('JWT_EXEMPT', 'a, b,,c')
+
+    assert env_int('DB_POOL_SIZE', 5) == 8
+    assert env_bool('SCHEDULER_ENABLED') is True
+    assert env_list('JWT_EXEMPT') == ['a', 'b', 'c']
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Start up of a worker: the app boots under the time budget and the blueprints defer their heavy imports.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import os
+import sys
+import shlex
+import subprocess
+from main import profile_startup, STARTUP_BUDGET_SECONDS
+
+# Imported by the models and the login, on the first request which needs them
+DEFERRED_IMPORTS = ('sqlalchemy_filters', 'passlib', 'pytz', 'flask_bcrypt', 'numpy', 'db_controller.query_layer')
+
+
+def test_startup_within_budget():
+    total_seconds, _ = profile_startup()
+
+    assert total_seconds <= STARTUP_BUDGET_SECONDS
+
+
+def test_startup_defers_heavy_imports():
+    _, imports = profile_startup(top_imports=None)
+
+    modules_imported = {module_name.strip() for _, _, module_name in imports}
+
+    assert not modules_imported.intersection(DEFERRED_IMPORTS)
+
+
+def test_release_phase_finds_the_app():
+    with open('Procfile') as procfile:
+        processes = dict(line.split(':', 1) for line in procfile.read().splitlines() if line.strip())
+
+    arguments = shlex.split(processes['release'])
+    env = dict(os.environ)
+
+    while '=' in arguments[0]:
+        env.update([arguments.pop(0).split('=', 1)])
+
+    assert arguments == ['flask', 'init-db']
+
+    # --help of the command loads the app of FLASK_APP to find it, without connecting to the database
+    completed = subprocess.run([sys.executable, '-m'] + arguments + ['--help'], env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=120)
+
+    assert completed.returncode == 0, completed.stderr
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Round trips of the endpoints: the SQL statements each request sends to the database.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import uuid
+import pytest
+from passlib.hash import pbkdf2_sha256
+from sqlalchemy import update
+from db_controller.query_layer import count_statements
+from apps.api_authentication.UsersAuthModel import UsersAuthModel
+from apps.api_authentication.credential_cache import credential_cache
+from auth_controller.api_authentication import api_password
+
+LOGIN_URL = '/api/v1/manager/user/login/'
+
+
+def test_vehicle_post(db_engine, client, auth_headers, vehicle_data):
+    with count_statements(db_engine) as statements:
+        response = client.post('/api/v1/vehicle/', json=vehicle_data, headers=auth_headers)
+
+    assert response.get_json()['data']['vehiculo_id']
+    assert len(statements) == 1
+
+    # The plate already registered: the same INSERT ... ON CONFLICT DO NOTHING, no lookup before it
+    with count_statements(db_engine) as statements:
+        response = client.post('/api/v1/vehicle/', json=vehicle_data, headers=auth_headers)
+
+    assert response.get_json()['data'] == {}
+    assert len(statements) == 1
+
+
+def test_driver_post(db_engine, client, auth_headers, vehicle_id):
+    with count_statements(db_engine) as statements:
+        response = client.post('/api/v1/driver/', headers=auth_headers, json={
+            'nombre_conductor': 'Juan {}'.format(uuid.uuid4().hex[:8]),
+            'apellido_paterno_conductor': 'Perez',
+            'apellido_materno_conductor': 'Lopez',
+            'domicilio_conductor': 'Av. Juarez 10',
+            'estatus_conductor': 'activo',
+            'vehiculo': vehicle_id
+        })
+
+    assert response.get_json()['data']['id_driver']
+    assert len(statements) == 1
+
+
+@pytest.fixture
+def credentials(db_engine, client, auth_headers):
+    credentials = {'username': 'usuario.{}@pruebas.com'.format(uuid.uuid4().hex[:8]), 'password': 'Clave.Prueba1'}
+
+    response = client.post('/api/v1/manager/user/register/', headers=auth_headers, json=credentials)
+
+    assert response.status_code == 201
+
+    return credentials
+
+
+def test_login(db_engine, client, credentials):
+    with count_statements(db_engine) as statements:
+        response = client.post(LOGIN_URL, json=credentials)
+
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+    # Answered from the credential cache
+    with count_statements(db_engine) as statements:
+        response = client.post(LOGIN_URL, json=credentials)
+
+    assert response.status_code == 200
+    assert len(statements) == 0
+
+
+def test_login_upgrading_the_hash(db_engine, client, credentials):
+    user_name = credentials['username']
+
+    weak_hash = pbkdf2_sha256.using(rounds=1000).hash(api_password(user_name, credentials['password']))
+
+    with db_engine.begin() as connection:
+        connection.execute(update(UsersAuthModel.__table__)
+                           .where(UsersAuthModel.__table__.c.user_name == user_name)
+                           .values(password_hash=weak_hash))
+
+    credential_cache.invalidate(user_name)
+
+    with count_statements(db_engine) as statements:
+        response = client.post(LOGIN_URL, json=credentials)
+
+    assert response.status_code == 200
+    assert len(statements) == 2
+    assert statements[1].startswith('UPDATE')
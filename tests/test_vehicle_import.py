@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+Requires Python 3.8 or later
+
+
+Bulk import of vehicles and the conflicts of the vehicle and driver endpoints.
+"""
+
+__author__ = "Jorge Morfinez Mojica (jorge.morfinez.m@gmail.com)"
+__copyright__ = "Copyright 2021"
+__license__ = ""
+__history__ = """ """
+__version__ = "1.21.G02.1 ($Rev: 2 $)"
+
+import uuid
+from datetime import date
+import pytest
+from apps.vehicle.bulk_import import validate_batch, _import_columns
+
+
+def validate_vehicle(vehicle_data, **fields):
+    data = dict(vehicle_data, **fields)
+
+    valid_rows, errors = validate_batch([data], _import_columns(), 1)
+
+    return valid_rows[0] if valid_rows else None, errors.get(1)
+
+
+def test_values_converted(vehicle_data):
+    row_values, errors = validate_vehicle(vehicle_data, vehiculo_numero_asientos='5', vehiculo_numero_puertas=4.0,
+                                          vehiculo_costo_catalogo='250000.5', vehiculo_fecha_baja=date(2030, 12, 31))
+
+    assert errors is None
+
+    values = dict(zip(['row'] + [field_name for field_name, _, _, _ in _import_columns()], row_values))
+
+    assert (values['vehiculo_numero_asientos'], values['vehiculo_numero_puertas']) == (5, 4)
+    assert values['vehiculo_costo_catalogo'] == 250000.5
+    assert values['vehiculo_fecha_baja'] == date(2030, 12, 31)
+
+
+@pytest.mark.parametrize('field_name, value', [
+    ('vehiculo_matricula', {'placa': 'ABC'}),
+    ('vehiculo_modelo', ['Aveo']),
+    ('vehiculo_marca', 12),
+    ('vehiculo_numero_asientos', True),
+    ('vehiculo_numero_asientos', 4.5),
+    ('vehiculo_numero_asientos', '4.5'),
+    ('vehiculo_numero_puertas', 2 ** 31),
+    ('vehiculo_costo_impuesto', [16]),
+    ('vehiculo_costo_catalogo', False),
+    ('vehiculo_costo_catalogo', 'nan'),
+    ('vehiculo_costo_compra', {'monto': 1}),
+    ('vehiculo_fecha_baja', 20301231),
+    ('vehiculo_fecha_baja', '31/12/2030'),
+])
+def test_values_of_other_types_are_invalid(vehicle_data, field_name, value):
+    row_values, errors = validate_vehicle(vehicle_data, **{field_name: value})
+
+    assert row_values is None
+    assert errors == ['{} has an invalid value: {}'.format(field_name, value)]
+
+
+def test_bulk_mixed_rows(db_engine, client, auth_headers, vehicle_data):
+    rows = [vehicle_data, dict(vehicle_data, vehiculo_matricula='PRB-X' + vehicle_data['vehiculo_matricula'][4:],
+                               vehiculo_numero_asientos=True), dict(vehicle_data)]
+
+    # Batches of two rows: the row numbers carry on across the batches
+    response = client.post('/api/v1/vehicle/bulk?batch_size=2', json={'vehiculos': rows}, headers=auth_headers)
+
+    assert response.status_code == 200
+
+    summary = response.get_json()['data']
+
+    assert (summary['total'], summary['inserted'], summary['duplicated'], summary['invalid']) == (3, 1, 1, 1)
+    assert [(result['row'], result['status']) for result in summary['results']] == [(1, 'inserted'), (2, 'invalid'),
+                                                                                    (3, 'duplicated')]
+
+
+@pytest.mark.parametrize('content_type, body', [
+    ('application/json', b'[{"vehiculo_matricula": '),
+    ('application/json', b'"vehiculos"'),
+    ('application/x-ndjson', b'{"vehiculo_matricula": "ABC"}\n{no es json\n'),
+    ('text/csv', b'vehiculo_matricula,vehiculo_modelo\n"ABC,Aveo\n'),
+])
+def test_bulk_malformed_body_is_bad_request(db_engine, client, auth_headers, content_type, body):
+    response = client.post('/api/v1/vehicle/bulk', data=body, content_type=content_type, headers=auth_headers)
+
+    assert response.status_code == 400
+
+
+def test_vehicle_not_stored_is_conflict(db_engine, client, auth_headers, vehicle_data):
+    del vehicle_data['vehiculo_marca']
+
+    response = client.post('/api/v1/vehicle/', json=vehicle_data, headers=auth_headers)
+
+    assert response.status_code == 409
+
+
+def test_driver_of_unknown_vehicle_is_conflict(db_engine, client, auth_headers):
+    # A name not registered yet: ON CONFLICT on the name would answer before the foreign key
+    response = client.post('/api/v1/driver/', headers=auth_headers, json={
+        'nombre_conductor': 'Juan {}'.format(uuid.uuid4().hex[:8]),
+        'apellido_paterno_conductor': 'Perez',
+        'apellido_materno_conductor': 'Lopez',
+        'domicilio_conductor': 'Av. Juarez 10',
+        'estatus_conductor': 'activo',
+        'vehiculo': 2 ** 31 - 1
+    })
+
+    assert response.status_code == 409
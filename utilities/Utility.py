@@ -11,15 +11,18 @@ __history__ = """ """
 __version__ = "1.21.G02.1 ($Rev: 2 $)"
 
 from settings.settings import *
+from functools import lru_cache
 from datetime import datetime
-import pytz
 
 
 # Define y obtiene el configurador para las constantes generales del sistema
+@lru_cache(maxsize=None)
 def get_config_settings_app():
     """
     Get the config object to charge the settings configurator.
 
+    The object is built once per process and is read-only, see reload_config_settings().
+
     :return object: cfg object, contain the Match to the settings allowed in Constants file configuration.
     """
 
@@ -29,10 +32,13 @@ def get_config_settings_app():
 
 
 # Define y obtiene el configurador para las constantes de la base de datos
+@lru_cache(maxsize=None)
 def get_config_settings_db():
     """
     Get the config object to charge the settings database configurator.
 
+    The object is built once per process and is read-only, see reload_config_settings().
+
     :return object: cfg object, contain the Match to the settings allowed in Constants file configuration.
     """
 
@@ -41,8 +47,25 @@ def get_config_settings_db():
     return settings_db
 
 
+# Vuelve a cargar el archivo .env y las constantes del sistema
+def reload_config_settings():
+    """
+    Load the .env file again and rebuild the settings objects on the next call of the getters.
+
+    The modules which kept a reference to the former objects keep reading them; the table and column names of
+    the models are not reloaded.
+    """
+
+    load_environment(reload=True)
+
+    get_config_settings_app.cache_clear()
+    get_config_settings_db.cache_clear()
+
+
 # Cambia fecha-hora en datos a timezone UTC desde el dato y timezone definido
 def set_utc_date_data(data_date, timezone_date):
+    import pytz
+
     utc_date_convert = ""
     utc_hour_convert = ""
 
@@ -56,11 +79,56 @@ def set_utc_date_data(data_date, timezone_date):
 
     utc_dt = local_dt.astimezone(pytz.utc)
 
-    print(utc_dt)
-
     date_on_utc = str(utc_dt).split()
 
     utc_date_convert = date_on_utc[0]
     utc_hour_convert = date_on_utc[1]
 
     return utc_date_convert, utc_hour_convert
+
+
+# Obtiene los parametros de paginacion (limit, cursor, total) del query string de la peticion
+def get_pagination_args(request_args):
+    """
+    Get the keyset pagination params of a list request.
+
+    :param request_args: The request.args of the list request.
+    :return tuple: (limit, cursor, with_total), limit None to apply the default page size.
+    :raise ValueError: When the limit is not an integer.
+    """
+
+    limit = request_args.get('limit') or None
+
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('Invalid pagination limit: {}'.format(limit))
+
+    cursor = request_args.get('cursor') or None
+
+    with_total = str(request_args.get('total', '')).lower() in ('1', 'true', 'yes')
+
+    return limit, cursor, with_total
+
+
+# Obtiene un parametro entero opcional (id de vehiculo, conductor...) del query string de la peticion
+def get_int_arg(request_args, name):
+    """
+    Get an optional integer param of a request.
+
+    :param request_args: The request.args of the request.
+    :param name: Name of the param.
+    :return int: The value of the param, None when it is not given.
+    :raise ValueError: When the param is not an integer.
+    """
+
+    value = request_args.get(name) or None
+
+    if value is not None:
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError('Invalid {} param: {}'.format(name, value))
+
+    return value
@@ -3,5 +3,8 @@ import logging
 logging.basicConfig(stream=sys.stderr)
 sys.path.insert(0, "/")
 
-from main import app
+import api_config
+
+# Served by gunicorn (Procfile web) and loaded by the flask CLI of the release phase (FLASK_APP=wsgi)
+app = api_config.create_app()
 application = app